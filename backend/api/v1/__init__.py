@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from api.v1 import auth, users, family, messages, medicine, health, ai_chat, ai_voice, emergency, radio
+from api.v1 import auth, users, family, messages, medicine, health, ai_chat, ai_voice, emergency, radio, search, admin
 
 router = APIRouter(prefix="/api/v1")
 
@@ -14,3 +14,5 @@ router.include_router(ai_chat.router)
 router.include_router(ai_voice.router)
 router.include_router(emergency.router)
 router.include_router(radio.router)
+router.include_router(search.router)
+router.include_router(admin.router)
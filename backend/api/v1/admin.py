@@ -0,0 +1,57 @@
+"""运维监控模块 — LLM 用量、调度与缓存指标（仅限 staff）。"""
+
+from fastapi import APIRouter, Depends, Query
+
+from core.middleware import require_staff
+from services.asr_jobs import asr_jobs
+from services.asr_pipeline import asr_metrics
+from services.broadcast_cf import broadcast_cf
+from services.broadcast_counters import broadcast_counters
+from services.broadcast_index import broadcast_index
+from services.broadcast_pipeline import broadcast_pipeline
+from services.conversation_memory import conversation_memory
+from services.doubao_service import doubao_service
+from services.llm_scheduler import llm_scheduler
+from services.llm_usage import llm_usage
+from services.medication_reminder import medication_reminder_speech
+from services.radio_recommender import radio_recommender
+from services.text_search import broadcast_search, conversation_search
+from services.transcode import opus_transcoder
+from services.tts_cache import tts_cache
+from services.voice_turn import voice_turn_metrics
+
+router = APIRouter(prefix="/admin", tags=["运维监控"])
+
+
+# ---------------------------------------------------------------------------
+# GET /admin/metrics — LLM 用量与运行指标
+# ---------------------------------------------------------------------------
+
+
+@router.get("/metrics")
+async def get_metrics(
+    _staff: dict = Depends(require_staff),
+    top_users: int = Query(default=20, ge=1, le=200),
+):
+    """运行指标：LLM 用量与各后台组件的运行状态（仅限工作人员）。"""
+    return {
+        "llm_usage": llm_usage.snapshot(top_users=top_users),
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_coalescing": doubao_service.coalescing_stats(),
+        "conversation_memory": conversation_memory.stats(),
+        "tts_cache": tts_cache.stats(),
+        "medication_reminder_speech": medication_reminder_speech.stats(),
+        "streaming_asr": asr_metrics.stats(),
+        "voice_turns": voice_turn_metrics.stats(),
+        "asr_jobs": asr_jobs.stats(),
+        "opus_transcoding": opus_transcoder.stats(),
+        "radio_index": broadcast_index.stats(),
+        "radio_counters": broadcast_counters.stats(),
+        "radio_cf": broadcast_cf.stats(),
+        "radio_recommendations": radio_recommender.stats(),
+        "radio_pipeline": broadcast_pipeline.stats(),
+        "search": {
+            "conversations": conversation_search.stats(),
+            "broadcasts": broadcast_search.stats(),
+        },
+    }
@@ -3,22 +3,28 @@
 Endpoints:
 - POST /ai/chat          — 文字对话
 - POST /ai/intent        — 意图识别
+- POST /ai/turn          — 语音轮次：一次调用同时返回意图与回复
 - GET  /ai/summary/{user_id} — 获取对话摘要
-- WebSocket /ai/voice-session — 实时语音交互会话
+- WebSocket /ai/voice-session — 实时语音交互会话（文本或全双工语音）
 
 Requirements: 4.1, 4.2, 4.3, 4.4, 4.5, 4.6, 4.7, 17.1
 """
 
+import json
 import logging
 import uuid
-from typing import Optional
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel, Field
 
 from core.middleware import require_auth
+from services.conversation_memory import conversation_memory
 from services.doubao_service import doubao_service
+from services.llm_scheduler import LLMShedError
 from services.supabase_client import postgrest
+from services.text_search import conversation_search
+from services.voice_turn import VoiceTurnSession
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +56,8 @@ class ChatMessage(BaseModel):
 
 
 class ChatRequest(BaseModel):
+    # With a known session_id only the new turn(s) need to be sent; history
+    # is kept server-side.  Resending the full history is still accepted.
     messages: list[ChatMessage]
     session_id: Optional[str] = None
 
@@ -74,46 +82,137 @@ class SummaryResponse(BaseModel):
     message_count: int
 
 
+class TurnRequest(BaseModel):
+    messages: list[ChatMessage]
+    session_id: Optional[str] = None
+    # combined: one LLM call returns intent + reply
+    # speculative: intent and chat run concurrently; chat is cancelled when
+    #              the intent is actionable (reply is then null)
+    mode: Literal["combined", "speculative"] = "combined"
+
+
+class TurnResponse(BaseModel):
+    reply: Optional[str] = None
+    intent: str
+    entities: dict
+    confidence: float
+    session_id: str
+
+
 # ---------------------------------------------------------------------------
-# POST /ai/chat
+# Conversation memory helpers
 # ---------------------------------------------------------------------------
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def ai_chat(req: ChatRequest, user: dict = Depends(require_auth)):
-    """文字对话：将用户消息发送给豆包LLM，保存对话记录。"""
-    user_id = user["user_id"]
-    session_id = req.session_id or str(uuid.uuid4())
+def _ensure_session_loaded(session_id: str, user_id: str) -> None:
+    """Lazily hydrate a session's memory from ai_conversations on first use.
 
-    # Build messages list for LLM
-    messages = [{"role": m.role, "content": m.content} for m in req.messages]
+    Memory is keyed by (user_id, session_id), so a session_id belonging to
+    another user only ever loads the caller's own (empty) history.
+    """
+    if conversation_memory.has_session((user_id, session_id)):
+        return
+
+    try:
+        result = (
+            postgrest.from_("ai_conversations")
+            .select("role,content")
+            .eq("session_id", session_id)
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(conversation_memory.max_turns)
+            .execute()
+        )
+        rows = list(result.data or [])
+    except Exception as exc:
+        logger.warning("Failed to load conversation history: session=%s error=%s", session_id, exc)
+        rows = []
+
+    conversation_memory.load((user_id, session_id), list(reversed(rows)))
+
+
+def _build_messages(
+    memory_key: tuple[Optional[str], str],
+    req_messages: list[ChatMessage],
+) -> tuple[list[dict[str, str]], str]:
+    """Merge request messages into session memory and build the LLM context.
+
+    Returns:
+        (messages for the LLM, content of the last user message)
+    """
+    incoming = [{"role": m.role, "content": m.content} for m in req_messages]
+    system_messages = [m for m in incoming if m["role"] == "system"]
+    turns = [m for m in incoming if m["role"] != "system"]
 
     # Get the last user message for saving
     last_user_content = ""
-    for m in reversed(req.messages):
-        if m.role == "user":
-            last_user_content = m.content
+    for m in reversed(turns):
+        if m["role"] == "user":
+            last_user_content = m["content"]
             break
 
-    # Call doubao LLM
-    reply = await doubao_service.chat(messages, user_id)
+    # Record only the turns the server has not seen yet, then build a
+    # token-budgeted context window from the session's history
+    for m in conversation_memory.merge_incoming(memory_key, turns):
+        conversation_memory.append(memory_key, m["role"], m["content"])
+    messages = system_messages + conversation_memory.build_context(memory_key)
+    return messages, last_user_content
+
+
+def _save_turn(
+    user_id: str,
+    session_id: str,
+    user_content: str,
+    reply: Optional[str],
+) -> None:
+    """Save the user message and assistant reply to ai_conversations.
 
-    # Save user message to ai_conversations
-    if last_user_content:
-        postgrest.from_("ai_conversations").insert({
+    Saved rows are also added to the user's search index (if loaded).
+    """
+    if user_content:
+        result = postgrest.from_("ai_conversations").insert({
             "user_id": user_id,
             "role": "user",
-            "content": last_user_content,
+            "content": user_content,
+            "session_id": session_id,
+        }).execute()
+        conversation_search.add(user_id, result.data or [])
+
+    if reply is not None:
+        result = postgrest.from_("ai_conversations").insert({
+            "user_id": user_id,
+            "role": "assistant",
+            "content": reply,
             "session_id": session_id,
         }).execute()
+        conversation_search.add(user_id, result.data or [])
 
-    # Save assistant response to ai_conversations
-    postgrest.from_("ai_conversations").insert({
-        "user_id": user_id,
-        "role": "assistant",
-        "content": reply,
-        "session_id": session_id,
-    }).execute()
+
+# ---------------------------------------------------------------------------
+# POST /ai/chat
+# ---------------------------------------------------------------------------
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def ai_chat(req: ChatRequest, user: dict = Depends(require_auth)):
+    """文字对话：将用户消息发送给豆包LLM，保存对话记录。"""
+    user_id = user["user_id"]
+    session_id = req.session_id or str(uuid.uuid4())
+
+    if req.session_id:
+        _ensure_session_loaded(session_id, user_id)
+
+    messages, last_user_content = _build_messages((user_id, session_id), req.messages)
+
+    # Call doubao LLM
+    reply = await doubao_service.chat(
+        messages,
+        user_id,
+        summary=conversation_memory.summary((user_id, session_id)),
+    )
+    conversation_memory.append((user_id, session_id), "assistant", reply)
+
+    _save_turn(user_id, session_id, last_user_content, reply)
 
     return ChatResponse(reply=reply, session_id=session_id)
 
@@ -137,6 +236,52 @@ async def ai_intent(req: IntentRequest, user: dict = Depends(require_auth)):
     )
 
 
+# ---------------------------------------------------------------------------
+# POST /ai/turn
+# ---------------------------------------------------------------------------
+
+
+@router.post("/turn", response_model=TurnResponse)
+async def ai_turn(req: TurnRequest, user: dict = Depends(require_auth)):
+    """语音轮次：意图识别与回复合并处理，省去一次串行的LLM往返。"""
+    user_id = user["user_id"]
+    session_id = req.session_id or str(uuid.uuid4())
+
+    if req.session_id:
+        _ensure_session_loaded(session_id, user_id)
+
+    messages, last_user_content = _build_messages((user_id, session_id), req.messages)
+    result = await _run_turn(req.mode, messages, user_id, session_id)
+
+    _save_turn(user_id, session_id, last_user_content, result["reply"])
+
+    return TurnResponse(
+        reply=result["reply"],
+        intent=result["intent"],
+        entities=result["entities"],
+        confidence=result["confidence"],
+        session_id=session_id,
+    )
+
+
+async def _run_turn(
+    mode: str,
+    messages: list[dict[str, str]],
+    user_id: Optional[str],
+    session_id: str,
+) -> dict:
+    """Run a combined or speculative turn and record the reply in memory."""
+    summary = conversation_memory.summary((user_id, session_id))
+    if mode == "speculative":
+        result = await doubao_service.speculative_turn(messages, user_id, summary=summary)
+    else:
+        result = await doubao_service.chat_with_intent(messages, user_id, summary=summary)
+
+    if result["reply"]:
+        conversation_memory.append((user_id, session_id), "assistant", result["reply"])
+    return result
+
+
 # ---------------------------------------------------------------------------
 # GET /ai/summary/{user_id}
 # ---------------------------------------------------------------------------
@@ -167,7 +312,10 @@ async def ai_summary(user_id: str, user: dict = Depends(require_auth)):
         for row in reversed(rows)
     ]
 
-    summary = await doubao_service.generate_summary(conversations, user_id)
+    try:
+        summary = await doubao_service.generate_summary(conversations, user_id)
+    except LLMShedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
 
     return SummaryResponse(summary=summary, message_count=message_count)
 
@@ -179,22 +327,53 @@ async def ai_summary(user_id: str, user: dict = Depends(require_auth)):
 
 @router.websocket("/voice-session")
 async def ai_voice_session(websocket: WebSocket):
-    """实时语音交互会话（基础版本：接收文本消息，返回AI回复）。
+    """实时语音交互会话：文本轮次，或全双工语音轮次（识别 → LLM → 合成）。
 
     Protocol:
-    - Client sends JSON: {"type": "text", "content": str, "session_id": str?}
+    - Client sends JSON: {"type": "text", "content": str, "session_id": str?,
+      "mode": "combined"|"speculative"?}
     - Server responds JSON: {"type": "reply", "content": str, "session_id": str}
+      With ``mode`` set the reply also carries ``intent``, ``entities`` and
+      ``confidence``; ``content`` is null when a speculative turn is actionable.
+    - Client sends binary frames of 16kHz mono 16-bit PCM for spoken turns
+      (see ``services.voice_turn``).  Server responds with JSON
+      ``speech_start`` / ``asr`` / ``intent`` / ``llm_token`` / ``tts_start`` /
+      ``barge_in`` / ``turn_end`` messages and binary MP3 frames of the reply.
+    - Client sends JSON: {"type": "audio_end"} to end the utterance early.
     - Client sends JSON: {"type": "end"} to close session
     """
     await websocket.accept()
     session_id = str(uuid.uuid4())
     user_id: Optional[str] = None
+    voice: Optional[VoiceTurnSession] = None
 
     logger.info("WebSocket voice-session opened: session=%s", session_id)
 
+    def _persist_voice_turn(user_text: str, reply: Optional[str]) -> None:
+        if voice is not None and voice.user_id:
+            _save_turn(voice.user_id, voice.session_id, user_text, reply)
+
     try:
         while True:
-            data = await websocket.receive_json()
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes") is not None:
+                if voice is None:
+                    if user_id:
+                        _ensure_session_loaded(session_id, user_id)
+                    voice = VoiceTurnSession(
+                        websocket.send_json,
+                        websocket.send_bytes,
+                        session_id=session_id,
+                        user_id=user_id,
+                        on_turn_complete=_persist_voice_turn,
+                    )
+                await voice.feed_audio(message["bytes"])
+                continue
+
+            data = json.loads(message.get("text") or "{}")
             msg_type = data.get("type", "")
 
             if msg_type == "end":
@@ -204,9 +383,16 @@ async def ai_voice_session(websocket: WebSocket):
                 })
                 break
 
+            if msg_type == "audio_end":
+                if voice is not None:
+                    await voice.end_utterance()
+                continue
+
             if msg_type == "auth":
                 # Optional auth message to identify user
                 user_id = data.get("user_id")
+                if voice is not None:
+                    voice.user_id = user_id
                 await websocket.send_json({
                     "type": "auth_ok",
                     "session_id": session_id,
@@ -216,6 +402,8 @@ async def ai_voice_session(websocket: WebSocket):
             if msg_type == "text":
                 content = data.get("content", "")
                 session_id = data.get("session_id", session_id)
+                if voice is not None:
+                    voice.session_id = session_id
 
                 if not content.strip():
                     await websocket.send_json({
@@ -224,29 +412,39 @@ async def ai_voice_session(websocket: WebSocket):
                     })
                     continue
 
-                # Call doubao LLM
-                messages = [{"role": "user", "content": content}]
-                reply = await doubao_service.chat(messages, user_id)
+                if user_id:
+                    _ensure_session_loaded(session_id, user_id)
+
+                # Call doubao LLM with the session's token-budgeted history
+                conversation_memory.append((user_id, session_id), "user", content)
+                messages = conversation_memory.build_context((user_id, session_id))
+                mode = data.get("mode")
+                if mode in ("combined", "speculative"):
+                    result = await _run_turn(mode, messages, user_id, session_id)
+                    reply = result["reply"]
+                    extra = {
+                        "intent": result["intent"],
+                        "entities": result["entities"],
+                        "confidence": result["confidence"],
+                    }
+                else:
+                    reply = await doubao_service.chat(
+                        messages,
+                        user_id,
+                        summary=conversation_memory.summary((user_id, session_id)),
+                    )
+                    conversation_memory.append((user_id, session_id), "assistant", reply)
+                    extra = {}
 
                 # Save conversation if user is identified
                 if user_id:
-                    postgrest.from_("ai_conversations").insert({
-                        "user_id": user_id,
-                        "role": "user",
-                        "content": content,
-                        "session_id": session_id,
-                    }).execute()
-                    postgrest.from_("ai_conversations").insert({
-                        "user_id": user_id,
-                        "role": "assistant",
-                        "content": reply,
-                        "session_id": session_id,
-                    }).execute()
+                    _save_turn(user_id, session_id, content, reply)
 
                 await websocket.send_json({
                     "type": "reply",
                     "content": reply,
                     "session_id": session_id,
+                    **extra,
                 })
             else:
                 await websocket.send_json({
@@ -265,3 +463,6 @@ async def ai_voice_session(websocket: WebSocket):
             })
         except Exception:
             pass
+    finally:
+        if voice is not None:
+            await voice.close()
@@ -2,6 +2,9 @@
 
 - POST /voice/tts          — Text-to-speech (returns audio/mpeg stream)
 - POST /voice/transcribe   — Audio file transcription (豆包录音文件识别2.0)
+- POST /voice/transcribe-jobs — Queue a transcription job (fast tier)
+- GET  /voice/transcribe-jobs/{job_id} — Job status and result
+- POST /voice/asr-callback/{job_id} — Volcano batch ASR completion callback
 - WebSocket /voice/stream-asr — Real-time streaming ASR
 
 Requirements: 5.6, 5.7, 19.4
@@ -12,22 +15,27 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+from pathlib import Path
 from typing import Optional
 
 from fastapi import (
     APIRouter,
     Depends,
-    File,
     HTTPException,
-    UploadFile,
+    Query,
+    Request,
+    Response,
     WebSocket,
     WebSocketDisconnect,
     status,
 )
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 from core.middleware import require_auth
+from services.asr_jobs import ASRQueueFull, ASRTier, asr_jobs
+from services.audio_normalize import prepare_for_asr, sniff_format
+from services.audio_upload import AudioUploadError, AudioUploadTooLarge, spool_audio_upload
 from services.voice_service import voice_service
 
 logger = logging.getLogger(__name__)
@@ -49,6 +57,14 @@ class TranscribeResponse(BaseModel):
     text: str = Field(..., description="转写后的文本")
 
 
+class TranscribeJobResponse(BaseModel):
+    job_id: str
+    tier: str = Field(..., description="识别资源档位 (fast/standard/idle)")
+    status: str = Field(..., description="queued | running | done | failed")
+    text: Optional[str] = None
+    error: Optional[str] = None
+
+
 # ---------------------------------------------------------------------------
 # POST /voice/tts
 # ---------------------------------------------------------------------------
@@ -69,13 +85,23 @@ async def text_to_speech(
 ):
     """Convert text to speech audio.
 
-    Returns an MP3 audio stream via ``StreamingResponse``.
+    Audio chunks are passed through to the client as the TTS service
+    synthesises them, so playback can start on the first chunk.  The first
+    chunk is awaited before responding so request and service errors still
+    map to 400 / 500.  Clips in the TTS disk cache are sent as files.
     """
     try:
-        audio_bytes = await voice_service.text_to_speech(
+        source = await voice_service.open_text_to_speech(
             text=body.text,
             speed=body.speed,
         )
+        if isinstance(source, Path):
+            return FileResponse(
+                source,
+                media_type="audio/mpeg",
+                headers={"Content-Disposition": "inline; filename=tts_output.mp3"},
+            )
+        first_chunk = await source.__anext__()
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
     except Exception:
@@ -86,7 +112,15 @@ async def text_to_speech(
         )
 
     async def _stream():
-        yield audio_bytes
+        try:
+            yield first_chunk
+            async for chunk in source:
+                yield chunk
+        except Exception:
+            # Headers are already sent; the client sees a truncated stream
+            logger.exception("TTS stream interrupted")
+        finally:
+            await source.aclose()
 
     return StreamingResponse(
         _stream(),
@@ -100,62 +134,180 @@ async def text_to_speech(
 # ---------------------------------------------------------------------------
 
 
+# Accepted upload content types
+_ALLOWED_AUDIO_TYPES = frozenset({
+    "audio/mpeg",
+    "audio/mp3",
+    "audio/wav",
+    "audio/x-wav",
+    "audio/pcm",
+    "audio/webm",
+    "audio/ogg",
+    "application/octet-stream",
+})
+
+# OpenAPI description of the multipart upload (parsed by spool_audio_upload)
+_AUDIO_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {
+                            "type": "string",
+                            "format": "binary",
+                            "description": "音频文件 (mp3/wav/pcm/webm/ogg)",
+                        },
+                    },
+                },
+            },
+        },
+    },
+}
+
+
 @router.post(
     "/transcribe",
     summary="录音文件转写",
     response_model=TranscribeResponse,
+    responses={413: {"description": "音频文件过大或时长超限"}},
+    openapi_extra=_AUDIO_UPLOAD_BODY,
 )
 async def transcribe_audio(
-    file: UploadFile = File(..., description="音频文件 (mp3/wav/pcm)"),
+    request: Request,
     _user: dict = Depends(require_auth),
 ):
-    """Transcribe an uploaded audio file to text using 豆包录音文件识别2.0."""
-    # Validate content type loosely — accept common audio types
-    allowed_types = {
-        "audio/mpeg",
-        "audio/mp3",
-        "audio/wav",
-        "audio/x-wav",
-        "audio/pcm",
-        "audio/webm",
-        "audio/ogg",
-        "application/octet-stream",
-    }
-    content_type = (file.content_type or "application/octet-stream").lower()
-    if content_type not in allowed_types:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"不支持的音频格式: {content_type}",
-        )
-
-    audio_data = await file.read()
-    if not audio_data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="上传的音频文件为空",
-        )
+    """Transcribe an uploaded audio file to text using 豆包录音文件识别2.0.
 
-    # Determine format from filename extension
-    filename = file.filename or "audio.mp3"
-    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "mp3"
+    The upload is streamed off the request into a spooled temporary file
+    (memory below ``VOICE_UPLOAD_SPOOL_BYTES``, disk above) and rejected
+    with 413 as soon as it exceeds the size or duration limit.  The spooled
+    audio is then decoded to 16 kHz mono PCM (container sniffed from its
+    magic bytes) and streamed to the ASR backend in chunks.
+    """
+    try:
+        audio = await spool_audio_upload(request, allowed_types=_ALLOWED_AUDIO_TYPES)
+    except AudioUploadTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except AudioUploadError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
     try:
-        text = await voice_service.transcribe_file(
-            audio_data=audio_data,
-            audio_format=ext,
-        )
+        if audio.size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="上传的音频文件为空",
+            )
+        pcm, audio_format = await prepare_for_asr(audio.chunks(), audio.audio_format)
+        text = await voice_service.transcribe_stream(pcm, audio_format=audio_format)
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    except HTTPException:
+        raise
     except Exception:
         logger.exception("ASR transcription error")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="语音转写服务暂时不可用",
         )
+    finally:
+        audio.close()
 
     return TranscribeResponse(text=text)
 
 
+# ---------------------------------------------------------------------------
+# POST /voice/transcribe-jobs, GET /voice/transcribe-jobs/{job_id}
+# ---------------------------------------------------------------------------
+
+
+@router.post(
+    "/transcribe-jobs",
+    summary="提交录音文件转写任务",
+    response_model=TranscribeJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={
+        413: {"description": "音频文件过大或时长超限"},
+        503: {"description": "转写队列已满"},
+    },
+    openapi_extra=_AUDIO_UPLOAD_BODY,
+)
+async def submit_transcribe_job(
+    request: Request,
+    current_user: dict = Depends(require_auth),
+):
+    """Queue an uploaded audio file for transcription and return its job id.
+
+    Interactive uploads run on the fast (极速版) tier; poll
+    ``GET /voice/transcribe-jobs/{job_id}`` for the text.
+    """
+    try:
+        audio = await spool_audio_upload(request, allowed_types=_ALLOWED_AUDIO_TYPES)
+    except AudioUploadTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except AudioUploadError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+    try:
+        if audio.size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="上传的音频文件为空",
+            )
+        audio.file.seek(0)
+        audio_format = sniff_format(audio.file.read(16)) or audio.audio_format
+        # The job reads the file only when a worker runs it
+        path = await audio.persist()
+    finally:
+        audio.close()
+
+    try:
+        job = asr_jobs.submit(
+            ASRTier.FAST,
+            audio_path=path,
+            audio_format=audio_format,
+            user_id=current_user["user_id"],
+        )
+    except ASRQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="转写任务较多，请稍后重试",
+        )
+    return TranscribeJobResponse(**job.as_dict())
+
+
+@router.get("/transcribe-jobs/{job_id}", response_model=TranscribeJobResponse)
+async def get_transcribe_job(
+    job_id: str,
+    current_user: dict = Depends(require_auth),
+):
+    """Return the status of a transcription job (and its text once done)."""
+    job = asr_jobs.get(job_id)
+    if job is None or job.user_id != current_user["user_id"]:
+        raise HTTPException(status_code=404, detail="转写任务不存在")
+    return TranscribeJobResponse(**job.as_dict())
+
+
+# ---------------------------------------------------------------------------
+# POST /voice/asr-callback/{job_id}
+# ---------------------------------------------------------------------------
+
+
+@router.post("/asr-callback/{job_id}", status_code=status.HTTP_204_NO_CONTENT, include_in_schema=False)
+async def asr_callback(job_id: str, token: str = Query(...)):
+    """Completion callback from Volcano batch ASR.
+
+    Authenticated by the per-job token in the callback URL.  The body is
+    ignored; the job's worker queries the result itself.
+    """
+    if not asr_jobs.notify(job_id, token):
+        raise HTTPException(status_code=404, detail="转写任务不存在")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 # ---------------------------------------------------------------------------
 # WebSocket /voice/stream-asr
 # ---------------------------------------------------------------------------
@@ -171,6 +323,9 @@ async def stream_asr(websocket: WebSocket):
         ``{"text": "...", "is_final": false, "sequence": 1}``
     - Client sends a text message ``"END"`` to signal end of audio.
     - Server sends the final transcription result and closes.
+
+    Audio is read from the socket only as fast as the recognizer keeps up;
+    pending partial results are merged if the client reads slowly.
     """
     await websocket.accept()
     logger.info("Stream-ASR WebSocket connected")
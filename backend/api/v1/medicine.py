@@ -1,12 +1,13 @@
-"""用药管理模块 — 用药计划CRUD、今日时间线、服药记录、通知家属。
+"""用药管理模块 — 用药计划CRUD、提醒语音、今日时间线、服药记录、通知家属。
 
 需求: 6.9, 6.10, 6.6
 """
 
+import logging
 from datetime import date, datetime, timezone
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel
 
 from core.middleware import require_auth
@@ -17,8 +18,11 @@ from models.medicine import (
     MedicationRecordCreate,
     MedicationRecordResponse,
 )
+from services.medication_reminder import medication_reminder_speech
 from services.supabase_client import postgrest
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/medicine", tags=["用药管理"])
 
 
@@ -147,6 +151,47 @@ async def update_plan(
     return MedicationPlanResponse(**rows[0])
 
 
+# ---------------------------------------------------------------------------
+# GET /medicine/plans/{plan_id}/reminder-audio
+# ---------------------------------------------------------------------------
+
+
+@router.get(
+    "/plans/{plan_id}/reminder-audio",
+    response_class=Response,
+    responses={200: {"content": {"audio/mpeg": {}}, "description": "MP3 提醒语音"}},
+)
+async def get_reminder_audio(
+    plan_id: str,
+    current_user: dict = Depends(require_auth),
+):
+    """获取用药提醒语音（模板分段合成后按帧拼接，命中缓存时无需 TTS 调用）。"""
+    plans = (
+        postgrest.from_("medication_plans")
+        .select("*")
+        .eq("id", plan_id)
+        .execute()
+    ).data or []
+    if not plans:
+        raise HTTPException(status_code=404, detail="用药计划不存在")
+    plan = plans[0]
+
+    users = (
+        postgrest.from_("users")
+        .select("id, name, voice_speed")
+        .eq("id", plan["user_id"])
+        .execute()
+    ).data or []
+
+    try:
+        audio = await medication_reminder_speech.render_plan(plan, users[0] if users else None)
+    except Exception:
+        logger.exception("Medication reminder speech error")
+        raise HTTPException(status_code=500, detail="语音合成服务暂时不可用")
+
+    return Response(content=audio, media_type="audio/mpeg")
+
+
 # ---------------------------------------------------------------------------
 # GET /medicine/today
 # ---------------------------------------------------------------------------
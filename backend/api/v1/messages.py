@@ -3,19 +3,41 @@
 需求: 9.3, 9.4, 9.9
 """
 
+import asyncio
+import logging
 from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 
+from core.config import settings
 from core.middleware import require_auth
 from models.message import (
     MessageCreate,
     MessageResponse,
     VoiceMessageCreate,
 )
+from services.asr_jobs import ASRJob, ASRQueueFull, ASRTier, asr_jobs
+from services.audio_probe import probe_storage_url
 from services.supabase_client import postgrest
+from services.supabase_storage import (
+    StorageObject,
+    download,
+    parse_object_url,
+    storage_object_url,
+    upload,
+)
+from services.transcode import (
+    OPUS_CONTENT_TYPE,
+    RENDITION_VARY,
+    client_accepts_opus,
+    opus_transcoder,
+    pick_audio_url,
+)
+from services.waveform import storage_waveform
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/messages", tags=["捂话消息"])
 
@@ -29,6 +51,11 @@ class UnreadCountResponse(BaseModel):
     count: int
 
 
+def _message_response(row: dict, opus: bool) -> MessageResponse:
+    """按客户端能力选择音频版本（Opus 或原始 MP3）。"""
+    return MessageResponse(**{**row, "audio_url": pick_audio_url(row, opus)})
+
+
 # ---------------------------------------------------------------------------
 # GET /messages/unread-count
 # ---------------------------------------------------------------------------
@@ -61,11 +88,16 @@ async def get_unread_count(
 @router.get("/{user_id}", response_model=list[MessageResponse])
 async def get_messages(
     user_id: str,
+    request: Request,
+    response: Response,
     current_user: dict = Depends(require_auth),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
 ):
-    """获取当前用户与指定用户之间的消息列表（按时间正序）。"""
+    """获取当前用户与指定用户之间的消息列表（按时间正序）。
+
+    客户端声明支持 Opus（X-Audio-Codecs / Accept）时，语音消息返回低码率 Opus 版本。
+    """
     current_id = current_user["user_id"]
 
     # Supabase PostgREST supports `or` filter
@@ -82,7 +114,9 @@ async def get_messages(
     )
 
     rows = result.data or []
-    return [MessageResponse(**row) for row in rows]
+    opus = client_accepts_opus(request.headers)
+    response.headers["Vary"] = RENDITION_VARY
+    return [_message_response(row, opus) for row in rows]
 
 
 # ---------------------------------------------------------------------------
@@ -126,16 +160,40 @@ async def send_voice_message(
     body: VoiceMessageCreate,
     current_user: dict = Depends(require_auth),
 ):
-    """发送语音消息。sender_id 从认证 Token 中获取。"""
+    """发送语音消息。sender_id 从认证 Token 中获取。
+
+    音频位于本项目 Supabase Storage 时，必须在语音消息桶内发送者自己的目录下
+    (``{VOICE_MESSAGE_BUCKET}/{sender_id}/...``)，否则返回 403——服务端以
+    service-role 读取这些文件，不能替用户读取他人的私有音频。
+    时长从文件头（及 Ogg 末页）解析，不再采信客户端上报的 audio_duration；
+    解析失败时才沿用客户端的值。同时解码音频生成波形峰值 (waveform_peaks)，
+    消息列表无需下载音频即可绘制。
+
+    没有文字内容的语音消息提交闲时档 (idle) 转写任务，转写完成后回填 content。
+    低码率 Opus 版本在后台转码，不阻塞发送。
+    """
     now = datetime.now(timezone.utc).isoformat()
 
+    source = _own_voice_object(body.audio_url, current_user["user_id"]) if body.audio_url else None
+
+    duration = body.audio_duration
+    peaks = None
+    if source is not None:
+        info, peaks = await asyncio.gather(
+            probe_storage_url(body.audio_url),
+            storage_waveform(body.audio_url),
+        )
+        if info is not None:
+            duration = round(info.duration, 1)
+
     record = {
         "sender_id": current_user["user_id"],
         "receiver_id": body.receiver_id,
         "type": "voice",
         "content": body.content,
         "audio_url": body.audio_url,
-        "audio_duration": body.audio_duration,
+        "audio_duration": duration,
+        "waveform_peaks": peaks,
         "is_ai_generated": body.is_ai_generated or False,
         "is_read": False,
         "created_at": now,
@@ -146,9 +204,89 @@ async def send_voice_message(
     if not rows:
         raise HTTPException(status_code=500, detail="发送语音消息失败")
 
+    if body.audio_url and not body.content and asr_jobs.configured(ASRTier.IDLE):
+        _queue_transcription(rows[0]["id"], body.audio_url, current_user["user_id"])
+    if source is not None:
+        _queue_opus_rendition(rows[0]["id"], source)
+
     return MessageResponse(**rows[0])
 
 
+def _own_voice_object(audio_url: str, sender_id: str) -> Optional[StorageObject]:
+    """校验语音文件地址：本项目存储中的文件须属于发送者。
+
+    Returns:
+        对应的存储对象；地址不在本项目 Storage 中时为 None（服务端不读取）。
+
+    Raises:
+        HTTPException(403): 指向其他桶或他人目录。
+    """
+    if not storage_object_url(audio_url):
+        return None
+    source = parse_object_url(audio_url)
+    parts = source.path.split("/") if source is not None else []
+    if (
+        source is None
+        or source.bucket != settings.VOICE_MESSAGE_BUCKET
+        or len(parts) < 2
+        or parts[0] != sender_id
+        or "%" in source.path
+        or any(part in ("", ".", "..") for part in parts)
+    ):
+        raise HTTPException(status_code=403, detail="只能发送自己上传的语音文件")
+    return source
+
+
+def _queue_opus_rendition(message_id: str, source: StorageObject) -> None:
+    """后台转码为 Opus，存到原文件旁并回填 audio_opus_url。
+
+    *source* 须已通过 :func:`_own_voice_object` 校验。
+    """
+    if source.path.endswith((".ogg", ".opus")):
+        return
+    target = source._replace(path=f"{source.path.rsplit('.', 1)[0]}.opus.ogg")
+
+    async def _fetch() -> bytes:
+        return await download(source.url(), settings.VOICE_UPLOAD_MAX_BYTES)
+
+    async def _store(opus: bytes) -> None:
+        url = await upload(target, opus, OPUS_CONTENT_TYPE)
+        await asyncio.to_thread(
+            lambda: postgrest.from_("elder_care_messages")
+            .update({"audio_opus_url": url})
+            .eq("id", message_id)
+            .execute()
+        )
+
+    opus_transcoder.enqueue(f"message:{message_id}", _fetch, _store)
+
+
+def _queue_transcription(message_id: str, audio_url: str, user_id: str) -> None:
+    """提交闲时转写任务；失败不影响消息发送。"""
+
+    async def _fill_content(job: ASRJob) -> None:
+        if job.status != "done" or not job.text:
+            return
+        await asyncio.to_thread(
+            lambda: postgrest.from_("elder_care_messages")
+            .update({"content": job.text})
+            .eq("id", message_id)
+            .execute()
+        )
+
+    audio_format = audio_url.rsplit(".", 1)[-1].lower() if "." in audio_url else "mp3"
+    try:
+        asr_jobs.submit(
+            ASRTier.IDLE,
+            audio_url=audio_url,
+            audio_format=audio_format,
+            user_id=user_id,
+            on_complete=_fill_content,
+        )
+    except ASRQueueFull:
+        logger.warning("Voice message %s not queued for transcription: queue full", message_id)
+
+
 # ---------------------------------------------------------------------------
 # PATCH /messages/{message_id}/read
 # ---------------------------------------------------------------------------
@@ -157,6 +295,8 @@ async def send_voice_message(
 @router.patch("/{message_id}/read", response_model=MessageResponse)
 async def mark_as_read(
     message_id: str,
+    request: Request,
+    response: Response,
     current_user: dict = Depends(require_auth),
 ):
     """标记消息为已读。仅消息接收者可以标记。"""
@@ -188,4 +328,5 @@ async def mark_as_read(
     if not updated_rows:
         raise HTTPException(status_code=500, detail="标记已读失败")
 
-    return MessageResponse(**updated_rows[0])
+    response.headers["Vary"] = RENDITION_VARY
+    return _message_response(updated_rows[0], client_accepts_opus(request.headers))
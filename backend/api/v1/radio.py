@@ -1,29 +1,46 @@
-"""健康广播模块 — 个性化推荐、分类查询、播放记录、内容生成。
+"""健康广播模块 — 个性化推荐、分类查询、音频播放、播放记录、内容生成任务。
 
 需求: 11.1, 11.2, 11.3, 11.4, 11.8
 """
 
+import asyncio
+import os
 from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
 
+from core.config import settings
 from core.middleware import require_auth
 from models.broadcast import (
     BroadcastGenerateRequest,
+    BroadcastJobResponse,
     BroadcastResponse,
     PlayRecordCreate,
     PlayRecordResponse,
 )
-from services.health_broadcast import (
-    BROADCAST_CATEGORIES,
-    health_broadcast_service,
+from services.broadcast_audio import (
+    audio_content_type,
+    broadcast_audio_store,
+    file_validators,
+    not_modified,
 )
+from services.broadcast_counters import broadcast_counters
+from services.broadcast_pipeline import BroadcastQueueFull, broadcast_pipeline
+from services.health_broadcast import BROADCAST_CATEGORIES
+from services.radio_recommender import radio_recommender
 from services.supabase_client import postgrest
+from services.transcode import RENDITION_VARY, client_accepts_opus, pick_audio_url
 
 router = APIRouter(prefix="/radio", tags=["健康广播"])
 
 
+def _broadcast_response(row: dict, opus: bool) -> BroadcastResponse:
+    """按客户端能力选择音频版本（Opus 或原始 MP3）。"""
+    return BroadcastResponse(**{**row, "audio_url": pick_audio_url(row, opus)})
+
+
 # ---------------------------------------------------------------------------
 # GET /radio/recommend — 获取个性化推荐广播
 # ---------------------------------------------------------------------------
@@ -31,43 +48,22 @@ router = APIRouter(prefix="/radio", tags=["健康广播"])
 
 @router.get("/recommend", response_model=list[BroadcastResponse])
 async def get_recommendations(
+    request: Request,
+    response: Response,
     current_user: dict = Depends(require_auth),
     limit: int = Query(default=10, ge=1, le=50),
 ):
-    """根据用户年龄、慢性病、季节等获取个性化推荐广播。"""
-    user_id = current_user["user_id"]
-
-    # 获取用户信息
-    user_result = (
-        postgrest.from_("users")
-        .select("id,name,birth_date,chronic_diseases,role")
-        .eq("id", user_id)
-        .execute()
-    )
-    user_rows = user_result.data or []
-    user_info = user_rows[0] if user_rows else {}
+    """根据用户年龄、慢性病、季节等获取个性化推荐广播。
 
-    # 构建推荐过滤条件
-    filters = health_broadcast_service.build_recommend_filters(user_info)
+    候选广播来自内存推荐索引（见 services.broadcast_index），按匹配度、热度、
+    新鲜度排序，并排除用户已播放过的内容。排序结果按人群分段缓存（见
+    services.radio_recommender），缓存命中时不查询数据库。
+    """
+    rows = await radio_recommender.recommend(current_user["user_id"], limit)
 
-    # 查询已发布的广播
-    query = (
-        postgrest.from_("health_broadcasts")
-        .select("*")
-        .eq("is_published", True)
-    )
-
-    # 按季节过滤（包含当前季节或无季节限制的）
-    if filters["season"]:
-        query = query.or_(
-            f"target_season.eq.{filters['season']},target_season.is.null"
-        )
-
-    query = query.order("created_at", desc=True).limit(limit)
-    result = query.execute()
-    rows = result.data or []
-
-    return [BroadcastResponse(**row) for row in rows]
+    opus = client_accepts_opus(request.headers)
+    response.headers["Vary"] = RENDITION_VARY
+    return [_broadcast_response(row, opus) for row in rows]
 
 
 # ---------------------------------------------------------------------------
@@ -81,6 +77,52 @@ async def get_categories():
     return BROADCAST_CATEGORIES
 
 
+# ---------------------------------------------------------------------------
+# GET /radio/audio/{key} — 广播音频（支持 Range 与条件请求）
+# ---------------------------------------------------------------------------
+
+
+@router.api_route(
+    "/audio/{key}",
+    methods=["GET", "HEAD"],
+    response_class=FileResponse,
+    responses={
+        206: {"description": "部分内容（Range 请求）"},
+        304: {"description": "未修改（If-None-Match / If-Modified-Since）"},
+        307: {"description": "音频存于对象存储，重定向到其 URL"},
+        404: {"description": "音频不存在"},
+        416: {"description": "Range 超出文件长度"},
+    },
+)
+async def get_broadcast_audio(key: str, request: Request):
+    """返回广播音频文件（MP3 或 Opus 版本）。
+
+    支持 ``Range`` / ``If-Range`` 拖动与断点续听，``ETag`` / ``Last-Modified``
+    条件请求返回 304；文件以零拷贝方式发送（见 services.broadcast_audio）。
+    广播音频为公开内容，与对象存储的公开 bucket 一致，无需认证。
+    """
+    try:
+        location = await broadcast_audio_store.locate(key)
+    except ValueError:
+        location = None
+    if location is None:
+        raise HTTPException(status_code=404, detail="音频不存在")
+    if isinstance(location, str):
+        return RedirectResponse(location, status_code=307)
+
+    try:
+        stat = await asyncio.to_thread(os.stat, location)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="音频不存在")
+    headers = {
+        **file_validators(stat),
+        "Cache-Control": f"public, max-age={settings.BROADCAST_AUDIO_MAX_AGE_SECONDS}",
+    }
+    if not_modified(request.headers, headers["ETag"], stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(location, media_type=audio_content_type(key), headers=headers, stat_result=stat)
+
+
 # ---------------------------------------------------------------------------
 # POST /radio/play-record — 记录播放历史
 # ---------------------------------------------------------------------------
@@ -108,63 +150,50 @@ async def create_play_record(
     rows = result.data or []
     if not rows:
         raise HTTPException(status_code=500, detail="记录播放历史失败")
+    radio_recommender.record_play(
+        current_user["user_id"], body.broadcast_id, completed=bool(body.completed), liked=bool(body.liked)
+    )
 
-    # 更新广播播放次数
-    try:
-        postgrest.from_("health_broadcasts").update(
-            {"play_count": "play_count + 1"}
-        ).eq("id", body.broadcast_id).execute()
-    except Exception:
-        pass  # 播放计数更新失败不影响主流程
+    # 播放/完播/点赞计数批量累加，定期原子写入 health_broadcasts
+    broadcast_counters.record(body.broadcast_id, completed=bool(body.completed), liked=bool(body.liked))
 
     return PlayRecordResponse(**rows[0])
 
 
 # ---------------------------------------------------------------------------
-# POST /radio/generate — 生成个性化广播内容
+# POST /radio/generate, GET /radio/generate/{job_id} — 生成个性化广播内容
 # ---------------------------------------------------------------------------
 
 
-@router.post("/generate", response_model=BroadcastResponse, status_code=201)
+@router.post(
+    "/generate",
+    response_model=BroadcastJobResponse,
+    status_code=202,
+    responses={503: {"description": "生成队列已满"}},
+)
 async def generate_broadcast(
     body: BroadcastGenerateRequest,
     current_user: dict = Depends(require_auth),
 ):
-    """使用豆包LLM生成个性化广播内容，并通过TTS合成音频。"""
-    now = datetime.now(timezone.utc).isoformat()
-
-    # 1. 使用LLM生成广播文本
-    text_result = await health_broadcast_service.generate_broadcast_text(
-        category=body.category,
-        topic=body.topic,
-        target_diseases=body.target_diseases,
-    )
-
-    # 2. 使用TTS生成音频
-    audio_bytes, duration = await health_broadcast_service.generate_audio(
-        text_result["content"]
-    )
+    """提交广播生成任务（豆包LLM生成文本、TTS合成音频），立即返回任务 ID。
 
-    # 3. 保存广播记录到数据库
-    record = {
-        "title": text_result["title"],
-        "content": text_result["content"],
-        "category": body.category,
-        "audio_duration": duration,
-        "is_published": True,
-        "target_age_min": body.target_age_min,
-        "target_age_max": body.target_age_max,
-        "target_diseases": body.target_diseases,
-        "ai_prompt": text_result["ai_prompt"],
-        "generated_by": "doubao",
-        "play_count": 0,
-        "created_at": now,
-        "updated_at": now,
-    }
+    生成在后台流水线中进行（见 services.broadcast_pipeline），轮询
+    ``GET /radio/generate/{job_id}`` 获取生成的广播。
+    """
+    try:
+        job = broadcast_pipeline.submit(body.model_dump(), user_id=current_user["user_id"])
+    except BroadcastQueueFull:
+        raise HTTPException(status_code=503, detail="广播生成任务较多，请稍后重试")
+    return BroadcastJobResponse(**job.as_dict())
 
-    result = postgrest.from_("health_broadcasts").insert(record).execute()
-    rows = result.data or []
-    if not rows:
-        raise HTTPException(status_code=500, detail="保存广播内容失败")
 
-    return BroadcastResponse(**rows[0])
+@router.get("/generate/{job_id}", response_model=BroadcastJobResponse)
+async def get_generate_job(
+    job_id: str,
+    current_user: dict = Depends(require_auth),
+):
+    """返回广播生成任务的状态（完成后附带广播内容）。"""
+    job = broadcast_pipeline.get(job_id)
+    if job is None or job.user_id != current_user["user_id"]:
+        raise HTTPException(status_code=404, detail="生成任务不存在")
+    return BroadcastJobResponse(**job.as_dict())
@@ -0,0 +1,132 @@
+"""全文搜索模块 — 搜索广播目录与老人的对话记录。
+
+- GET /search/broadcasts     — 搜索已发布的健康广播
+- GET /search/conversations  — 搜索自己或已绑定老人的 AI 对话记录
+
+索引在内存中按字二元组建立并以 BM25 排序（见 services.text_search），
+查询不对数据库做 LIKE 扫描。
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel
+
+from core.middleware import require_auth
+from models.broadcast import BroadcastResponse
+from services.supabase_client import postgrest
+from services.text_search import (
+    broadcast_search,
+    broadcast_text,
+    conversation_search,
+    conversation_text,
+    snippet,
+)
+from services.transcode import RENDITION_VARY, client_accepts_opus, pick_audio_url
+
+router = APIRouter(prefix="/search", tags=["搜索"])
+
+
+# ---------------------------------------------------------------------------
+# Response models (endpoint-specific)
+# ---------------------------------------------------------------------------
+
+
+class BroadcastSearchHit(BaseModel):
+    broadcast: BroadcastResponse
+    score: float
+    snippet: str
+
+
+class ConversationSearchHit(BaseModel):
+    id: str
+    session_id: Optional[str] = None
+    role: Optional[str] = None
+    content: str
+    created_at: Optional[datetime] = None
+    score: float
+    snippet: str
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _can_view_conversations(viewer_id: str, elder_id: str) -> bool:
+    """本人，或已绑定且有查看健康数据权限的家属。"""
+    if viewer_id == elder_id:
+        return True
+    binds = (
+        postgrest.from_("elder_family_binds")
+        .select("permissions")
+        .eq("elder_id", elder_id)
+        .eq("family_id", viewer_id)
+        .eq("status", "active")
+        .execute()
+    ).data or []
+    return any((bind.get("permissions") or {}).get("view_health_data", False) for bind in binds)
+
+
+# ---------------------------------------------------------------------------
+# GET /search/broadcasts
+# ---------------------------------------------------------------------------
+
+
+@router.get("/broadcasts", response_model=list[BroadcastSearchHit])
+async def search_broadcasts(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100, description="搜索词"),
+    limit: int = Query(default=20, ge=1, le=50),
+    _user: dict = Depends(require_auth),
+):
+    """按标题、分类、适用慢性病与正文搜索已发布的健康广播。
+
+    音频版本与 /radio/recommend 一致：按客户端能力选择 Opus 或原始 MP3。
+    """
+    hits = await broadcast_search.search(q, limit)
+
+    opus = client_accepts_opus(request.headers)
+    response.headers["Vary"] = RENDITION_VARY
+    return [
+        BroadcastSearchHit(
+            broadcast=BroadcastResponse(**{**row, "audio_url": pick_audio_url(row, opus)}),
+            score=round(score, 4),
+            snippet=snippet(row.get("content") or broadcast_text(row), q),
+        )
+        for row, score in hits
+    ]
+
+
+# ---------------------------------------------------------------------------
+# GET /search/conversations
+# ---------------------------------------------------------------------------
+
+
+@router.get("/conversations", response_model=list[ConversationSearchHit])
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=100, description="搜索词"),
+    user_id: Optional[str] = Query(default=None, description="老人 ID，默认为本人"),
+    limit: int = Query(default=20, ge=1, le=50),
+    current_user: dict = Depends(require_auth),
+):
+    """搜索 AI 对话记录。家属可搜索已绑定老人的对话（需查看健康数据权限）。"""
+    elder_id = user_id or current_user["user_id"]
+    if not _can_view_conversations(current_user["user_id"], elder_id):
+        raise HTTPException(status_code=403, detail="无权查看该用户的对话记录")
+
+    hits = await conversation_search.search(elder_id, q, limit)
+    return [
+        ConversationSearchHit(
+            id=row["id"],
+            session_id=row.get("session_id"),
+            role=row.get("role"),
+            content=conversation_text(row),
+            created_at=row.get("created_at"),
+            score=round(score, 4),
+            snippet=snippet(conversation_text(row), q),
+        )
+        for row, score in hits
+    ]
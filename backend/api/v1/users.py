@@ -9,6 +9,7 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from core.middleware import require_auth
 from models.user import UserResponse, UserUpdate, UserRoleUpdate
+from services.radio_recommender import radio_recommender
 from services.supabase_client import postgrest
 
 router = APIRouter(prefix="/users", tags=["用户"])
@@ -53,6 +54,8 @@ async def update_me(
     if not rows:
         raise HTTPException(status_code=404, detail="用户不存在")
 
+    # 出生日期、慢性病影响广播推荐
+    radio_recommender.forget_user(user_id)
     return UserResponse(**rows[0])
 
 
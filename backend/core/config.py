@@ -37,5 +37,132 @@ class Settings(BaseSettings):
     VOLCANO_TTS_WS_URL: str = "wss://openspeech.bytedance.com/api/v1/tts/ws"
     VOLCANO_ASR_WS_URL: str = "wss://openspeech.bytedance.com/api/v2/asr"
 
+    # AI conversation memory
+    AI_MEMORY_MAX_TURNS: int = 40  # ring buffer size per session
+    AI_MEMORY_MAX_SESSIONS: int = 2000
+    AI_MEMORY_IDLE_TTL_SECONDS: int = 3600
+    AI_CONTEXT_TOKEN_BUDGET: int = 2000  # approx. tokens of history per LLM call
+    AI_MEMORY_SUMMARIZE: bool = True  # fold truncated turns into a summary
+
+    # LLM scheduler (concurrent Ark requests, per priority class)
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_CONCURRENCY_EMERGENCY: int = 16
+    LLM_CONCURRENCY_INTERACTIVE: int = 12
+    LLM_CONCURRENCY_SUMMARY: int = 4
+    LLM_CONCURRENCY_BROADCAST: int = 2
+    LLM_QUEUE_DEADLINE_SUMMARY_SECONDS: float = 15.0
+    LLM_QUEUE_DEADLINE_BROADCAST_SECONDS: float = 30.0
+
+    # LLM usage accounting (flushed to llm_usage_stats)
+    LLM_USAGE_FLUSH_INTERVAL_SECONDS: float = 60.0
+
+    # TTS audio cache (memory LRU + disk tier)
+    TTS_CACHE_DIR: str = "data/tts_cache"
+    TTS_CACHE_MEMORY_MAX_BYTES: int = 32 * 1024 * 1024
+    TTS_CACHE_MEMORY_ITEM_MAX_BYTES: int = 512 * 1024
+    TTS_CACHE_DISK_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Voice uploads (/voice/transcribe)
+    VOICE_UPLOAD_MAX_BYTES: int = 50 * 1024 * 1024
+    VOICE_UPLOAD_MAX_SECONDS: float = 600.0
+    VOICE_UPLOAD_SPOOL_BYTES: int = 1024 * 1024  # in memory below, on disk above
+
+    # Voice message audio: {bucket}/{sender_id}/... in Supabase Storage
+    VOICE_MESSAGE_BUCKET: str = "voice-messages"
+
+    # Voice message waveform peaks (/messages/send-voice)
+    VOICE_WAVEFORM_BUCKETS: int = 128  # int8 peaks stored per message
+    VOICE_WAVEFORM_TIMEOUT_SECONDS: float = 10.0
+
+    # Opus renditions of voice messages and broadcast audio (needs ffmpeg with libopus)
+    TRANSCODE_ENABLED: bool = True
+    TRANSCODE_WORKERS: int = 2
+    TRANSCODE_QUEUE_SIZE: int = 100
+    TRANSCODE_OPUS_BITRATE: str = "24k"  # vs. 128 kbps MP3
+
+    # Broadcast audio storage (MP3 and Opus renditions)
+    BROADCAST_AUDIO_STORE: str = "local"  # local | supabase
+    BROADCAST_AUDIO_DIR: str = "data/broadcast_audio"  # local store
+    BROADCAST_AUDIO_URL_PREFIX: str = "/api/v1/radio/audio"  # URL of the serving endpoint (local store)
+    BROADCAST_AUDIO_BUCKET: str = "health-broadcast-audio"  # Supabase Storage bucket (supabase store)
+    BROADCAST_AUDIO_MAX_AGE_SECONDS: int = 86400  # Cache-Control max-age; revalidated with ETag
+
+    # Radio recommendations (in-memory index over published health_broadcasts)
+    RADIO_INDEX_REFRESH_SECONDS: float = 900.0  # full rebuild in the background when older
+    RADIO_RECENCY_HALF_LIFE_DAYS: float = 30.0
+    RADIO_WEIGHT_MATCH: float = 0.6  # season / age / disease match
+    RADIO_WEIGHT_POPULARITY: float = 0.25  # log play_count
+    RADIO_WEIGHT_RECENCY: float = 0.15
+    RADIO_PLAYED_HISTORY_LIMIT: int = 500  # most recent plays excluded from recommendations
+    RADIO_SEGMENT_CACHE_TTL_SECONDS: float = 300.0  # ranked list per (season, age band, diseases)
+    RADIO_SEGMENT_DEPTH: int = 100  # candidates kept per segment before per-user filtering
+    RADIO_SEGMENT_CACHE_MAX: int = 1000
+    RADIO_USER_CACHE_TTL_SECONDS: float = 600.0  # profile filters and played list per user
+    RADIO_USER_CACHE_MAX: int = 10000
+
+    # Item-item collaborative filtering over broadcast_play_history
+    RADIO_CF_ENABLED: bool = True
+    RADIO_CF_INTERVAL_SECONDS: float = 600.0  # incremental refresh from new plays
+    RADIO_CF_NEIGHBORS: int = 20  # similar broadcasts kept per broadcast
+    RADIO_CF_USER_HISTORY: int = 200  # most recent plays per user in the model
+    RADIO_CF_SEEDS: int = 20  # recent plays a user's scores are looked up from
+    RADIO_CF_WEIGHT: float = 0.3  # blend weight against the content score
+
+    # Broadcast play / completion / like counters (batched increments)
+    BROADCAST_COUNTER_FLUSH_INTERVAL_SECONDS: float = 30.0
+    BROADCAST_COUNTER_LOG_DIR: str = "data/broadcast_counters"  # unflushed deltas survive restarts
+
+    # Broadcast pre-generation pipeline (LLM text + TTS audio in the background)
+    # Planned broadcasts are published directly: enable on ONE process only (in-flight
+    # counts are per process), and only with real Ark + TTS credentials
+    BROADCAST_PIPELINE_ENABLED: bool = False
+    BROADCAST_PIPELINE_CONCURRENCY: int = 2  # broadcasts generated at once
+    BROADCAST_PIPELINE_QUEUE_SIZE: int = 100  # pending jobs, interactive and planned
+    BROADCAST_PIPELINE_INTERVAL_SECONDS: float = 6 * 3600.0  # catalogue gap planning
+    BROADCAST_PIPELINE_SEASON_LEAD_DAYS: int = 30  # also fill the next season this early
+    BROADCAST_PIPELINE_TOP_DISEASES: int = 5  # most common chronic diseases among elders
+    BROADCAST_PIPELINE_PER_SLOT: int = 3  # target broadcasts per (season, disease)
+    BROADCAST_PIPELINE_MAX_PER_RUN: int = 10
+    BROADCAST_PIPELINE_RESULT_TTL_SECONDS: float = 3600.0
+
+    # Full-text search (character-bigram BM25 over conversations and broadcasts)
+    SEARCH_BM25_K1: float = 1.2
+    SEARCH_BM25_B: float = 0.75  # document length normalization
+    SEARCH_CONVERSATION_USERS_MAX: int = 1000  # per-user conversation indexes kept in memory (LRU)
+    SEARCH_CONVERSATION_HISTORY_LIMIT: int = 5000  # most recent conversation rows indexed per user
+
+    # Streaming ASR pipeline (/voice/stream-asr)
+    ASR_AUDIO_QUEUE_SIZE: int = 32  # audio chunks buffered before reading the client pauses
+    ASR_RESULT_QUEUE_SIZE: int = 4  # pending results; partials merge, finals block
+
+    # Batch ASR jobs (录音文件识别 fast / standard / idle tiers)
+    VOLCANO_ASR_BATCH_URL: str = "https://openspeech.bytedance.com/api/v3/auc/bigmodel"
+    ASR_BATCH_CONCURRENCY_FAST: int = 4
+    ASR_BATCH_CONCURRENCY_STANDARD: int = 4
+    ASR_BATCH_CONCURRENCY_IDLE: int = 2
+    ASR_BATCH_QUEUE_SIZE: int = 200  # pending jobs per tier
+    ASR_BATCH_POLL_INITIAL_SECONDS: float = 2.0  # doubles up to the max
+    ASR_BATCH_POLL_MAX_SECONDS: float = 120.0
+    ASR_BATCH_TIMEOUT_SECONDS: float = 6 * 3600.0  # idle-tier jobs may take hours
+    ASR_BATCH_RESULT_TTL_SECONDS: float = 3600.0
+    ASR_BATCH_CALLBACK_URL: str = ""  # public URL of /api/v1/voice/asr-callback; empty = poll only
+
+    # Upload decoding for ASR (16 kHz mono PCM, loudness-normalized)
+    AUDIO_FFMPEG_PATH: str = "ffmpeg"  # decoder for mp3/ogg/webm; empty disables
+    AUDIO_TARGET_LEVEL_DB: float = -20.0  # speech level in dBFS
+    AUDIO_MAX_GAIN_DB: float = 20.0
+
+    # Voice activity detection (PCM input to ASR)
+    VAD_ENABLED: bool = True
+    VAD_FRAME_MS: int = 20
+    VAD_ENERGY_THRESHOLD_DB: float = -45.0  # frame RMS in dBFS
+    VAD_PADDING_MS: int = 200  # kept before and after speech
+    VAD_MAX_PAUSE_MS: int = 600  # longer pauses inside speech are compacted
+    VAD_ENDPOINT_SILENCE_MS: int = 1500  # silence that ends a streaming utterance
+
+    # Medication reminder speech (template-spliced TTS)
+    MEDICATION_REMINDER_TEMPLATE: str = "{name}，该吃{medicine_name}了，{dosage}"
+    MEDICATION_REMINDER_PREWARM: bool = True  # pre-render active plans at startup
+
 
 settings = Settings()
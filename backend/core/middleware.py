@@ -74,3 +74,21 @@ async def optional_auth(
             detail="Invalid authentication token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+async def require_staff(user: dict = Depends(require_auth)) -> dict:
+    """Dependency that only admits authenticated staff (operators/admins).
+
+    Returns:
+        ``{"user_id": str, "role": str}``
+
+    Raises:
+        HTTPException 401: If the token is missing, expired, or invalid.
+        HTTPException 403: If the user's role is not ``staff``.
+    """
+    if user.get("role") != "staff":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Staff access required",
+        )
+    return user
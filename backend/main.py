@@ -1,10 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from api.v1 import router as api_v1_router
+from core.config import settings
+from services.asr_jobs import asr_jobs
+from services.broadcast_cf import broadcast_cf
+from services.broadcast_counters import broadcast_counters
+from services.broadcast_pipeline import broadcast_pipeline
+from services.llm_usage import llm_usage
+from services.medication_reminder import medication_reminder_speech
+from services.transcode import opus_transcoder
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    llm_usage.start()
+    broadcast_counters.start()
+    if settings.RADIO_CF_ENABLED:
+        broadcast_cf.start()
+    if settings.BROADCAST_PIPELINE_ENABLED:
+        broadcast_pipeline.start()
+    prewarm = None
+    if settings.MEDICATION_REMINDER_PREWARM:
+        prewarm = asyncio.create_task(medication_reminder_speech.prewarm_active_plans())
+    try:
+        yield
+    finally:
+        if prewarm is not None:
+            prewarm.cancel()
+        await asr_jobs.stop()
+        await opus_transcoder.stop()
+        await llm_usage.stop()
+        await broadcast_counters.stop()
+        await broadcast_cf.stop()
+        await broadcast_pipeline.stop()
+
 
-app = FastAPI(title="桑梓智护 API", version="0.1.0")
+app = FastAPI(title="桑梓智护 API", version="0.1.0", lifespan=lifespan)
 
 # CORS middleware — allow all origins for development
 app.add_middleware(
@@ -13,7 +13,7 @@ from pydantic import BaseModel
 
 
 class BroadcastResponse(BaseModel):
-    """健康广播响应模型"""
+    """健康广播响应模型（audio_url 为客户端可播放的版本）"""
     id: str
     title: str
     content: str
@@ -21,6 +21,8 @@ class BroadcastResponse(BaseModel):
     audio_url: Optional[str] = None
     audio_duration: Optional[float] = None
     play_count: Optional[int] = None
+    completion_count: Optional[int] = None
+    like_count: Optional[int] = None
     is_published: Optional[bool] = None
     target_age_min: Optional[int] = None
     target_age_max: Optional[int] = None
@@ -55,7 +57,7 @@ class PlayRecordResponse(BaseModel):
     created_at: Optional[datetime] = None
 
 
-# ---------- 广播生成请求 ----------
+# ---------- 广播生成任务 ----------
 
 
 class BroadcastGenerateRequest(BaseModel):
@@ -65,3 +67,12 @@ class BroadcastGenerateRequest(BaseModel):
     target_age_min: Optional[int] = None
     target_age_max: Optional[int] = None
     target_diseases: Optional[list[str]] = None
+    target_season: Optional[str] = None
+
+
+class BroadcastJobResponse(BaseModel):
+    """广播生成任务状态（完成后附带生成的广播）"""
+    job_id: str
+    status: str
+    broadcast: Optional[BroadcastResponse] = None
+    error: Optional[str] = None
@@ -27,6 +27,7 @@ class VoiceMessageCreate(MessageBase):
 
 
 class MessageResponse(BaseModel):
+    """audio_url 为客户端可播放的版本（支持 Opus 时为低码率 Opus）"""
     id: str
     sender_id: str
     receiver_id: str
@@ -34,6 +35,7 @@ class MessageResponse(BaseModel):
     content: Optional[str] = None
     audio_url: Optional[str] = None
     audio_duration: Optional[float] = None
+    waveform_peaks: Optional[list[int]] = None  # 0..127 振幅峰值，用于绘制波形
     is_ai_generated: Optional[bool] = None
     is_read: Optional[bool] = None
     read_at: Optional[datetime] = None
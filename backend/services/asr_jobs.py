@@ -0,0 +1,447 @@
+"""Asynchronous batch transcription jobs on the Volcano 录音文件识别 tiers.
+
+A submitted job gets an id straight away; a per-tier worker pool runs it
+against the Volcano Engine big-model file recognition API and keeps the
+result for later lookup.  Three resource tiers are used:
+
+- ``fast`` (极速版): one synchronous ``recognize/flash`` request with the
+  audio inline — for interactive uploads where the user is waiting.  The
+  upload waits in the queue as a temporary file and is only read (and
+  base64-encoded) when a worker picks the job up, so queued jobs cost no
+  memory.
+- ``standard``: ``submit`` + ``query`` on an audio URL.
+- ``idle`` (闲时版): same protocol, far cheaper, but results may take
+  hours — for voice messages whose text nobody is waiting on.
+
+Each tier has its own bounded queue and worker count, so a backlog of idle
+jobs never delays interactive ones.  Submitted jobs are polled with
+exponential backoff; when ``ASR_BATCH_CALLBACK_URL`` is set, Volcano's
+completion callback wakes the poller immediately (the callback only
+triggers a query, its payload is not trusted).
+
+A tier whose resource id is not configured runs against a placeholder that
+returns fixed text, like the rest of the voice service.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import inspect
+import logging
+import secrets
+import time
+import uuid
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable
+
+import httpx
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# X-Api-Status-Code values of the big-model file recognition API
+_STATUS_OK = "20000000"
+_STATUS_PROCESSING = "20000001"
+_STATUS_QUEUED = "20000002"
+_STATUS_SILENT = "20000003"
+
+_PLACEHOLDER_TEXT = "这是语音转写的占位文本"
+
+
+class ASRTier(str, Enum):
+    """Volcano file recognition resource tiers."""
+
+    FAST = "fast"
+    STANDARD = "standard"
+    IDLE = "idle"
+
+
+class BatchASRError(RuntimeError):
+    """The recognition API rejected a request or reported a failed job."""
+
+    def __init__(self, code: str, message: str) -> None:
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+class ASRQueueFull(RuntimeError):
+    """The tier's job queue is full; the caller should retry later."""
+
+
+class ASRJob:
+    """One transcription job and its result."""
+
+    def __init__(
+        self,
+        tier: ASRTier,
+        audio_url: str | None = None,
+        audio_path: str | Path | None = None,
+        audio_format: str = "mp3",
+        user_id: str | None = None,
+        on_complete: Callable[["ASRJob"], Any] | None = None,
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.tier = tier
+        self.audio_url = audio_url
+        self.audio_path = Path(audio_path) if audio_path is not None else None
+        self.audio_format = audio_format
+        self.user_id = user_id
+        self.on_complete = on_complete
+        self.callback_token = secrets.token_urlsafe(16)
+        self.status = "queued"  # queued | running | done | failed
+        self.text: str | None = None
+        self.error: str | None = None
+        self.polls = 0
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self.done = asyncio.Event()
+        self.wake = asyncio.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "tier": self.tier.value,
+            "status": self.status,
+            "text": self.text,
+            "error": self.error,
+        }
+
+    def discard_audio(self) -> None:
+        """Delete the job's temporary audio file; results are kept, audio is not."""
+        if self.audio_path is not None:
+            self.audio_path.unlink(missing_ok=True)
+            self.audio_path = None
+
+    def fail(self, error: str) -> None:
+        self.status = "failed"
+        self.error = error
+        self.finished_at = time.time()
+        self.discard_audio()
+        self.done.set()
+
+
+# ---------------------------------------------------------------------------
+# API clients
+# ---------------------------------------------------------------------------
+
+
+class VolcanoBatchASRClient:
+    """HTTP client for the big-model file recognition API of one tier."""
+
+    def __init__(self, resource_id: str, base_url: str = settings.VOLCANO_ASR_BATCH_URL) -> None:
+        self.resource_id = resource_id
+        self.base_url = base_url.rstrip("/")
+
+    def _headers(self, job: ASRJob) -> dict[str, str]:
+        return {
+            "X-Api-App-Key": settings.VOLCANO_APP_ID,
+            "X-Api-Access-Key": settings.VOLCANO_ACCESS_TOKEN,
+            "X-Api-Resource-Id": self.resource_id,
+            "X-Api-Request-Id": job.id,
+            "X-Api-Sequence": "-1",
+        }
+
+    async def _payload(self, job: ASRJob) -> dict:
+        audio: dict[str, str] = {"format": job.audio_format}
+        if job.audio_path is not None:
+            audio["data"] = await asyncio.to_thread(_encode_file, job.audio_path)
+        else:
+            audio["url"] = job.audio_url or ""
+        return {
+            "user": {"uid": job.user_id or "sangzi"},
+            "audio": audio,
+            "request": {"model_name": "bigmodel", "enable_itn": True, "enable_punc": True},
+        }
+
+    async def _post(self, path: str, job: ASRJob, payload: dict) -> tuple[str, dict]:
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            resp = await client.post(f"{self.base_url}/{path}", headers=self._headers(job), json=payload)
+        code = resp.headers.get("X-Api-Status-Code", "")
+        if resp.status_code >= 400 or code not in (_STATUS_OK, _STATUS_PROCESSING, _STATUS_QUEUED, _STATUS_SILENT):
+            message = resp.headers.get("X-Api-Message", resp.reason_phrase)
+            raise BatchASRError(code or str(resp.status_code), message)
+        return code, (resp.json() if resp.content else {})
+
+    async def recognize(self, job: ASRJob) -> str:
+        """Transcribe inline audio in one request (fast tier)."""
+        code, body = await self._post("recognize/flash", job, await self._payload(job))
+        return "" if code == _STATUS_SILENT else body.get("result", {}).get("text", "")
+
+    async def submit(self, job: ASRJob, callback_url: str | None = None) -> None:
+        payload = await self._payload(job)
+        if callback_url:
+            payload["callback"] = callback_url
+        await self._post("submit", job, payload)
+
+    async def query(self, job: ASRJob) -> str | None:
+        """Return the text when the job is finished, None while it runs."""
+        code, body = await self._post("query", job, {})
+        if code in (_STATUS_PROCESSING, _STATUS_QUEUED):
+            return None
+        return "" if code == _STATUS_SILENT else body.get("result", {}).get("text", "")
+
+
+def _encode_file(path: Path) -> str:
+    return base64.b64encode(path.read_bytes()).decode("ascii")
+
+
+class PlaceholderBatchASRClient:
+    """Stand-in used when a tier is not configured."""
+
+    async def recognize(self, job: ASRJob) -> str:
+        return _PLACEHOLDER_TEXT
+
+    async def submit(self, job: ASRJob, callback_url: str | None = None) -> None:
+        return None
+
+    async def query(self, job: ASRJob) -> str | None:
+        return _PLACEHOLDER_TEXT
+
+
+def _default_clients() -> dict[ASRTier, Any]:
+    resource_ids = {
+        ASRTier.FAST: settings.VOLCANO_ASR_BATCH_FAST_RESOURCE_ID,
+        ASRTier.STANDARD: settings.VOLCANO_ASR_BATCH_STANDARD_RESOURCE_ID,
+        ASRTier.IDLE: settings.VOLCANO_ASR_BATCH_IDLE_RESOURCE_ID,
+    }
+    credentials = bool(settings.VOLCANO_APP_ID and settings.VOLCANO_ACCESS_TOKEN)
+    return {
+        tier: VolcanoBatchASRClient(rid) if credentials and rid else PlaceholderBatchASRClient()
+        for tier, rid in resource_ids.items()
+    }
+
+
+# ---------------------------------------------------------------------------
+# Job queue
+# ---------------------------------------------------------------------------
+
+
+class BatchASRQueue:
+    """Per-tier job queues drained by bounded worker pools."""
+
+    def __init__(
+        self,
+        clients: dict[ASRTier, Any] | None = None,
+        concurrency: dict[ASRTier, int] | None = None,
+        queue_size: int = settings.ASR_BATCH_QUEUE_SIZE,
+        poll_initial: float = settings.ASR_BATCH_POLL_INITIAL_SECONDS,
+        poll_max: float = settings.ASR_BATCH_POLL_MAX_SECONDS,
+        timeout: float = settings.ASR_BATCH_TIMEOUT_SECONDS,
+        result_ttl: float = settings.ASR_BATCH_RESULT_TTL_SECONDS,
+        callback_url: str = settings.ASR_BATCH_CALLBACK_URL,
+    ) -> None:
+        self.clients = clients if clients is not None else _default_clients()
+        self.concurrency = concurrency or {
+            ASRTier.FAST: settings.ASR_BATCH_CONCURRENCY_FAST,
+            ASRTier.STANDARD: settings.ASR_BATCH_CONCURRENCY_STANDARD,
+            ASRTier.IDLE: settings.ASR_BATCH_CONCURRENCY_IDLE,
+        }
+        self.queue_size = queue_size
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.callback_url = callback_url.rstrip("/")
+
+        self._jobs: dict[str, ASRJob] = {}
+        self._queues: dict[ASRTier, asyncio.Queue[ASRJob]] = {}
+        self._workers: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._running: dict[ASRTier, int] = {tier: 0 for tier in ASRTier}
+        self._counts: dict[ASRTier, dict[str, int]] = {
+            tier: {"submitted": 0, "done": 0, "failed": 0, "rejected": 0} for tier in ASRTier
+        }
+
+    def configured(self, tier: ASRTier) -> bool:
+        """Return True if *tier* runs against the real API."""
+        return not isinstance(self.clients.get(tier), PlaceholderBatchASRClient)
+
+    # ------------------------------------------------------------------
+    # Submission and lookup
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        tier: ASRTier,
+        audio_url: str | None = None,
+        audio_path: str | Path | None = None,
+        audio_format: str = "mp3",
+        user_id: str | None = None,
+        on_complete: Callable[[ASRJob], Any] | None = None,
+    ) -> ASRJob:
+        """Queue a job and return it immediately.
+
+        Args:
+            audio_path: A temporary file with the audio to send inline.
+                The queue takes ownership and deletes it once the job has
+                run (or is rejected).
+            on_complete: Called (or awaited) with the job once it is done
+                or failed.
+
+        Raises:
+            ValueError: If neither (or both) of *audio_url* and
+                *audio_path* are given, or inline audio is sent to a tier
+                other than fast.
+            ASRQueueFull: If the tier's queue is full.
+        """
+        if (audio_url is None) == (audio_path is None):
+            raise ValueError("exactly one of audio_url and audio_path is required")
+        if audio_path is not None and tier is not ASRTier.FAST:
+            raise ValueError("inline audio is only accepted by the fast tier")
+
+        self._ensure_workers()
+        self._evict_expired()
+        job = ASRJob(tier, audio_url, audio_path, audio_format, user_id, on_complete)
+        try:
+            self._queues[tier].put_nowait(job)
+        except asyncio.QueueFull:
+            job.discard_audio()
+            self._counts[tier]["rejected"] += 1
+            raise ASRQueueFull(f"{tier.value} transcription queue is full") from None
+        self._jobs[job.id] = job
+        self._counts[tier]["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> ASRJob | None:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float | None = None) -> ASRJob:
+        """Wait until the job is done or failed."""
+        job = self._jobs[job_id]
+        await asyncio.wait_for(job.done.wait(), timeout)
+        return job
+
+    def notify(self, job_id: str, token: str) -> bool:
+        """Handle a completion callback: wake the job's poller.
+
+        Returns:
+            False if the job is unknown or the token does not match.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or not secrets.compare_digest(job.callback_token, token):
+            return False
+        job.wake.set()
+        return True
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not all(task.done() for task in self._workers):
+            return
+        if self._loop is not loop:
+            # Queues are bound to the loop that created them
+            self._abandon_queued("transcription service restarted")
+            self._queues = {tier: asyncio.Queue(maxsize=self.queue_size) for tier in ASRTier}
+        self._loop = loop
+        self._workers = [
+            loop.create_task(self._worker(tier))
+            for tier in ASRTier
+            for _ in range(self.concurrency[tier])
+        ]
+
+    def _abandon_queued(self, reason: str) -> None:
+        """Fail every job still waiting in a queue (completion handlers are not run)."""
+        for tier, queue in self._queues.items():
+            while not queue.empty():
+                queue.get_nowait().fail(reason)
+                self._counts[tier]["failed"] += 1
+
+    async def _worker(self, tier: ASRTier) -> None:
+        queue = self._queues[tier]
+        while True:
+            job = await queue.get()
+            self._running[tier] += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running[tier] -= 1
+
+    async def _run(self, job: ASRJob) -> None:
+        job.status = "running"
+        client = self.clients[job.tier]
+        try:
+            if job.tier is ASRTier.FAST:
+                text = await client.recognize(job)
+            else:
+                text = await asyncio.wait_for(self._submit_and_poll(client, job), self.timeout)
+        except asyncio.CancelledError:
+            job.fail("transcription service stopped")
+            self._counts[job.tier]["failed"] += 1
+            raise
+        except Exception as exc:
+            logger.warning("ASR job %s (%s) failed: %s", job.id, job.tier.value, exc)
+            job.fail(str(exc) if not isinstance(exc, asyncio.TimeoutError) else "timed out")
+            self._counts[job.tier]["failed"] += 1
+        else:
+            job.status = "done"
+            job.text = text
+            job.finished_at = time.time()
+            job.discard_audio()
+            job.done.set()
+            self._counts[job.tier]["done"] += 1
+
+        if job.on_complete is not None:
+            try:
+                result = job.on_complete(job)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("ASR job %s completion handler failed", job.id)
+
+    async def _submit_and_poll(self, client: Any, job: ASRJob) -> str:
+        callback = None
+        if self.callback_url:
+            callback = f"{self.callback_url}/{job.id}?token={job.callback_token}"
+        await client.submit(job, callback)
+        delay = self.poll_initial
+        while True:
+            job.polls += 1
+            text = await client.query(job)
+            if text is not None:
+                return text
+            try:
+                await asyncio.wait_for(job.wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            job.wake.clear()
+            delay = min(delay * 2, self.poll_max)
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued and running jobs are marked failed."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._abandon_queued("transcription service stopped")
+        self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            tier.value: {
+                "configured": self.configured(tier),
+                "concurrency": self.concurrency[tier],
+                "running": self._running[tier],
+                "queued": self._queues[tier].qsize() if tier in self._queues else 0,
+                **self._counts[tier],
+            }
+            for tier in ASRTier
+        }
+
+
+# Module-level singleton
+asr_jobs = BatchASRQueue()
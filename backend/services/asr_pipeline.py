@@ -0,0 +1,437 @@
+"""Streaming ASR pipeline with bounded queues and backpressure.
+
+A session runs as concurrent stages connected by bounded queues:
+
+    receive    client audio -> audio queue
+    recognize  audio queue  -> recognizer -> result queue
+    send       result queue -> caller (the WebSocket handler)
+
+A full audio queue stops the receive stage from reading the client socket,
+so a slow recognizer pushes back on the client instead of buffering audio
+without bound.
+
+Partial results from the Volcano streaming ASR are cumulative (each carries
+the whole utterance so far), so a partial still waiting in the result queue
+is superseded by the next one: consecutive partials merge into the newest,
+and a partial that finds the queue full of finals is dropped.  Final results
+are never dropped; when the result queue is full they block the recognizer.
+
+With a :class:`~services.vad.StreamingVAD` attached, the receive stage
+only forwards speech and ends the audio at the first ``speech_end``
+endpoint, so the final result does not wait for the client's END.
+
+Per-stage latencies are aggregated in :data:`asr_metrics`, including the
+time from end of speech (the VAD endpoint or the end of the client's audio)
+to the final text.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Protocol
+
+import websockets
+
+from core.config import settings
+from services.vad import SPEECH_END, StreamingVAD
+from services.volcano_protocol import (
+    VolcanoProtocolError,
+    decode_frame,
+    encode_audio,
+    encode_json_request,
+)
+
+logger = logging.getLogger(__name__)
+
+# Volcano streaming ASR success code
+_ASR_OK = 1000
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+
+class StageStats:
+    """Count, mean and max of one latency stage."""
+
+    __slots__ = ("count", "total_ms", "max_ms")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class ASRMetrics:
+    """Per-stage latency and queue-policy counters of streaming ASR sessions.
+
+    Stages:
+        receive_wait: time the receive stage blocked on a full audio queue.
+        recognize: time from the latest audio sent to the recognizer to the
+            next result it returned.
+        send: time the caller took to deliver one result to the client.
+        end_to_final: time from the end of speech (VAD endpoint or end of
+            the client's audio) to the final result being delivered.
+    """
+
+    STAGES = ("receive_wait", "recognize", "send", "end_to_final")
+
+    def __init__(self) -> None:
+        self._stages = {name: StageStats() for name in self.STAGES}
+        self.sessions = 0
+        self.errors = 0
+        self.chunks = 0
+        self.partials_merged = 0
+        self.partials_dropped = 0
+        self.endpoints = 0
+        self.seconds_in = 0.0
+        self.seconds_trimmed = 0.0
+
+    def observe(self, stage: str, ms: float) -> None:
+        self._stages[stage].add(ms)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "errors": self.errors,
+            "chunks": self.chunks,
+            "partials_merged": self.partials_merged,
+            "partials_dropped": self.partials_dropped,
+            "endpoints": self.endpoints,
+            "seconds_in": round(self.seconds_in, 2),
+            "seconds_trimmed": round(self.seconds_trimmed, 2),
+            "stages": {name: s.as_dict() for name, s in self._stages.items()},
+        }
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.monotonic() - start) * 1000
+
+
+# ---------------------------------------------------------------------------
+# Result queue
+# ---------------------------------------------------------------------------
+
+
+class _ResultQueue:
+    """Bounded result queue that merges partials and blocks on finals."""
+
+    def __init__(self, maxsize: int, metrics: ASRMetrics) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self._items: deque[dict] = deque()
+        self._maxsize = maxsize
+        self._metrics = metrics
+        self._cond = asyncio.Condition()
+        self._closed = False
+        self._error: BaseException | None = None
+
+    async def put(self, result: dict) -> None:
+        async with self._cond:
+            if not result["is_final"]:
+                if self._items and not self._items[-1]["is_final"]:
+                    self._items[-1] = result
+                    self._metrics.partials_merged += 1
+                elif len(self._items) >= self._maxsize:
+                    self._metrics.partials_dropped += 1
+                    return
+                else:
+                    self._items.append(result)
+            else:
+                await self._cond.wait_for(lambda: len(self._items) < self._maxsize)
+                self._items.append(result)
+            self._cond.notify_all()
+
+    async def close(self, error: BaseException | None = None) -> None:
+        """Mark the end of results; *error* is raised after pending items."""
+        async with self._cond:
+            if not self._closed:
+                self._closed = True
+                self._error = error
+            self._cond.notify_all()
+
+    async def get(self) -> dict | None:
+        """Return the next result, or None once closed and drained."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._items or self._closed)
+            if self._items:
+                item = self._items.popleft()
+                self._cond.notify_all()
+                return item
+            if self._error is not None:
+                raise self._error
+            return None
+
+
+# ---------------------------------------------------------------------------
+# Recognizers
+# ---------------------------------------------------------------------------
+
+
+class Recognizer(Protocol):
+    """A streaming speech recognizer session (used as an async context manager)."""
+
+    async def __aenter__(self) -> "Recognizer": ...
+
+    async def __aexit__(self, *exc_info) -> None: ...
+
+    async def send(self, chunk: bytes) -> None:
+        """Forward one chunk of audio."""
+
+    async def finish(self) -> None:
+        """Signal the end of the audio."""
+
+    def results(self) -> AsyncIterator[dict]:
+        """Yield ``{"text", "is_final"}`` dicts, ending after the final one."""
+
+
+class PlaceholderRecognizer:
+    """Offline stand-in used when Volcano credentials are not configured."""
+
+    def __init__(self) -> None:
+        self._results: asyncio.Queue[dict] = asyncio.Queue()
+        self._chunks = 0
+
+    async def __aenter__(self) -> "PlaceholderRecognizer":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+    async def send(self, chunk: bytes) -> None:
+        self._chunks += 1
+        await self._results.put({"text": f"识别中... (片段 {self._chunks})", "is_final": False})
+
+    async def finish(self) -> None:
+        await self._results.put({"text": "这是流式语音识别的占位结果", "is_final": True})
+
+    async def results(self) -> AsyncIterator[dict]:
+        while True:
+            result = await self._results.get()
+            yield result
+            if result["is_final"]:
+                return
+
+
+class VolcanoRecognizer:
+    """One session against the Volcano streaming ASR WebSocket."""
+
+    def __init__(
+        self,
+        *,
+        url: str,
+        app_id: str,
+        access_token: str,
+        cluster: str,
+        audio_format: str = "pcm",
+        sample_rate: int = 16000,
+        language: str = "zh-CN",
+    ) -> None:
+        self.url = url
+        self.app_id = app_id
+        self.access_token = access_token
+        self.cluster = cluster
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.language = language
+        self._ws = None
+
+    async def __aenter__(self) -> "VolcanoRecognizer":
+        self._ws = await websockets.connect(
+            self.url,
+            additional_headers={"Authorization": f"Bearer; {self.access_token}"},
+            max_size=None,
+        )
+        try:
+            await self._ws.send(encode_json_request(self._full_request()))
+        except BaseException:
+            await self._ws.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._ws.close()
+
+    def _full_request(self) -> dict:
+        # Raw PCM is "raw" in the Volcano audio config
+        fmt = "raw" if self.audio_format == "pcm" else self.audio_format
+        return {
+            "app": {"appid": self.app_id, "cluster": self.cluster, "token": self.access_token},
+            "user": {"uid": "sangzi_care"},
+            "audio": {
+                "format": fmt,
+                "codec": "raw" if fmt == "raw" else self.audio_format,
+                "rate": self.sample_rate,
+                "bits": 16,
+                "channel": 1,
+                "language": self.language,
+            },
+            "request": {
+                "reqid": str(uuid.uuid4()),
+                "sequence": 1,
+                "nbest": 1,
+                "result_type": "full",
+            },
+        }
+
+    async def send(self, chunk: bytes) -> None:
+        await self._ws.send(encode_audio(chunk))
+
+    async def finish(self) -> None:
+        await self._ws.send(encode_audio(b"", last=True))
+
+    async def results(self) -> AsyncIterator[dict]:
+        async for raw in self._ws:
+            if isinstance(raw, str):
+                continue
+            frame = decode_frame(raw)
+            body = frame.json()
+            code = body.get("code", _ASR_OK)
+            if code != _ASR_OK:
+                raise VolcanoProtocolError(code, body.get("message", ""))
+            text = ((body.get("result") or [{}])[0]).get("text", "")
+            if frame.is_last or body.get("sequence", 0) < 0:
+                yield {"text": text, "is_final": True}
+                return
+            if text:
+                yield {"text": text, "is_final": False}
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+
+class StreamingASRPipeline:
+    """Run one streaming ASR session through bounded, concurrent stages."""
+
+    def __init__(
+        self,
+        recognizer: Recognizer,
+        audio_queue_size: int = settings.ASR_AUDIO_QUEUE_SIZE,
+        result_queue_size: int = settings.ASR_RESULT_QUEUE_SIZE,
+        metrics: ASRMetrics | None = None,
+        vad: StreamingVAD | None = None,
+    ) -> None:
+        self.recognizer = recognizer
+        self.vad = vad
+        self.audio_queue_size = audio_queue_size
+        self.result_queue_size = result_queue_size
+        self.metrics = metrics or asr_metrics
+        self._last_audio_at: float | None = None
+        self._end_of_speech_at: float | None = None
+
+    async def results(self, audio_chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+        """Yield ``{"text", "is_final", "sequence"}`` dicts for *audio_chunks*.
+
+        The time the caller spends between results (sending to the client)
+        is the send stage; recognizer errors are raised here.
+        """
+        self.metrics.sessions += 1
+        audio_queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=self.audio_queue_size)
+        result_queue = _ResultQueue(self.result_queue_size, self.metrics)
+
+        try:
+            async with self.recognizer as recognizer:
+                tasks = [
+                    asyncio.create_task(self._receive(audio_chunks, audio_queue, result_queue)),
+                    asyncio.create_task(self._feed(recognizer, audio_queue, result_queue)),
+                    asyncio.create_task(self._collect(recognizer, result_queue)),
+                ]
+                try:
+                    while (result := await result_queue.get()) is not None:
+                        sent_at = time.monotonic()
+                        yield result
+                        self.metrics.observe("send", _elapsed_ms(sent_at))
+                        if result["is_final"] and self._end_of_speech_at is not None:
+                            self.metrics.observe("end_to_final", _elapsed_ms(self._end_of_speech_at))
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+
+    async def _receive(
+        self,
+        audio_chunks: AsyncIterator[bytes],
+        audio_queue: asyncio.Queue,
+        result_queue: _ResultQueue,
+    ) -> None:
+        try:
+            async for chunk in audio_chunks:
+                events: list[str] = []
+                if self.vad is not None and chunk:
+                    chunk, events = self.vad.process(chunk)
+                if chunk:
+                    waited_at = time.monotonic()
+                    await audio_queue.put(chunk)
+                    self.metrics.observe("receive_wait", _elapsed_ms(waited_at))
+                if SPEECH_END in events:
+                    self.metrics.endpoints += 1
+                    break
+            else:
+                if self.vad is not None:
+                    tail, _events = self.vad.finish()
+                    if tail:
+                        await audio_queue.put(tail)
+            self._end_of_speech_at = time.monotonic()
+            if self.vad is not None:
+                self.metrics.seconds_in += self.vad.seconds_in
+                self.metrics.seconds_trimmed += self.vad.seconds_in - self.vad.seconds_out
+            await audio_queue.put(None)
+        except Exception as exc:
+            await result_queue.close(exc)
+
+    async def _feed(
+        self,
+        recognizer: Recognizer,
+        audio_queue: asyncio.Queue,
+        result_queue: _ResultQueue,
+    ) -> None:
+        try:
+            while (chunk := await audio_queue.get()) is not None:
+                await recognizer.send(chunk)
+                self._last_audio_at = time.monotonic()
+                self.metrics.chunks += 1
+            await recognizer.finish()
+        except Exception as exc:
+            await result_queue.close(exc)
+
+    async def _collect(self, recognizer: Recognizer, result_queue: _ResultQueue) -> None:
+        sequence = 0
+        try:
+            async for result in recognizer.results():
+                if self._last_audio_at is not None:
+                    self.metrics.observe("recognize", _elapsed_ms(self._last_audio_at))
+                sequence += 1
+                await result_queue.put({
+                    "text": result["text"],
+                    "is_final": result["is_final"],
+                    "sequence": sequence,
+                })
+            await result_queue.close()
+        except Exception as exc:
+            await result_queue.close(exc)
+
+
+# Module-level singleton
+asr_metrics = ASRMetrics()
@@ -0,0 +1,420 @@
+"""Decode uploaded audio to 16 kHz mono 16-bit PCM for ASR.
+
+The container is sniffed from its magic bytes rather than trusted from the
+filename.  WAV (integer or float samples, any rate and channel count) and
+raw PCM are decoded in Python; MP3/Ogg/WebM/FLAC are decoded by an
+``ffmpeg`` subprocess when one is configured, and otherwise forwarded
+unchanged under their sniffed format.
+
+Decoded audio flows through the pipeline in blocks, so memory stays bounded
+for long recordings:
+
+    decode -> downmix -> resample (FIR low-pass + linear interpolation)
+           -> loudness normalization -> int16 PCM
+
+Loudness normalization is a slow automatic gain control: the level of
+frames above a noise gate is tracked and scaled towards
+``AUDIO_TARGET_LEVEL_DB``; frames below the gate keep unity gain so
+background noise in pauses is not amplified.  :func:`decode_mono` stops
+before that stage for callers that need the original level.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import shutil
+import struct
+from typing import AsyncIterator
+
+import numpy as np
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TARGET_RATE = 16000
+
+# Largest WAV header (up to the data chunk) searched before giving up
+_MAX_WAV_HEADER = 64 * 1024
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Block size read from the ffmpeg decoder
+_FFMPEG_READ_BYTES = 64 * 1024
+
+
+class AudioDecodeError(ValueError):
+    """The audio cannot be decoded."""
+
+
+def sniff_format(head: bytes) -> str | None:
+    """Return the container format from the first bytes, if recognised."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# DSP stages
+# ---------------------------------------------------------------------------
+
+
+class StreamingResampler:
+    """Block-wise sample-rate conversion of mono float audio.
+
+    Downsampling applies a windowed-sinc low-pass first; samples are then
+    taken by linear interpolation.  Filter history and the fractional read
+    position carry over between blocks, so the output does not depend on
+    how the input is split.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int = TARGET_RATE, taps: int = 63) -> None:
+        if src_rate <= 0 or dst_rate <= 0:
+            raise AudioDecodeError(f"无效的采样率: {src_rate}")
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self._step = src_rate / dst_rate
+        self._filter: np.ndarray | None = None
+        if src_rate > dst_rate:
+            cutoff = 0.45 * dst_rate / src_rate  # cycles per input sample
+            n = np.arange(taps) - (taps - 1) / 2
+            h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+            self._filter = (h / h.sum()).astype(np.float32)
+            self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._t = 0.0  # next output position, in input samples from block start
+        self._last = 0.0  # last input sample of the previous block
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        if self.src_rate == self.dst_rate or not len(x):
+            return x
+        if self._filter is not None:
+            padded = np.concatenate((self._history, x))
+            self._history = padded[-(len(self._filter) - 1):]
+            x = np.convolve(padded, self._filter, mode="valid").astype(np.float32)
+
+        last_index = len(x) - 1
+        if self._t > last_index:
+            self._t -= len(x)
+            self._last = float(x[-1])
+            return np.zeros(0, dtype=np.float32)
+        count = int((last_index - self._t) // self._step) + 1
+        times = self._t + np.arange(count) * self._step
+        # Index 0 of the buffer is the previous block's last sample (time -1)
+        buffer = np.concatenate(([self._last], x))
+        out = np.interp(times + 1, np.arange(len(buffer)), buffer).astype(np.float32)
+        self._t = times[-1] + self._step - len(x)
+        self._last = float(x[-1])
+        return out
+
+
+class LoudnessNormalizer:
+    """Gated automatic gain control over 20 ms frames of mono float audio."""
+
+    def __init__(
+        self,
+        sample_rate: int = TARGET_RATE,
+        target_db: float = settings.AUDIO_TARGET_LEVEL_DB,
+        max_gain_db: float = settings.AUDIO_MAX_GAIN_DB,
+        gate_db: float = -50.0,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.frame = sample_rate // 50
+        self.target_db = target_db
+        self.max_gain_db = max_gain_db
+        self.gate_db = gate_db
+        self.smoothing = smoothing
+        self._level_db: float | None = None
+        self._gain = 1.0
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """Normalize the complete frames of *x*; the remainder waits for more."""
+        data = np.concatenate((self._pending, x)) if len(self._pending) else x
+        n_frames = len(data) // self.frame
+        self._pending = data[n_frames * self.frame:]
+        if not n_frames:
+            return np.zeros(0, dtype=np.float32)
+        return self._apply(data[:n_frames * self.frame].reshape(n_frames, self.frame))
+
+    def flush(self) -> np.ndarray:
+        """Normalize any remainder with the current gain."""
+        rest, self._pending = self._pending, np.zeros(0, dtype=np.float32)
+        return np.clip(rest * self._gain, -1.0, 1.0) if len(rest) else rest
+
+    def _apply(self, frames: np.ndarray) -> np.ndarray:
+        level_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+        voiced = level_db > self.gate_db
+        if voiced.any():
+            block_db = 10 * np.log10(np.mean(10 ** (level_db[voiced] / 10)))
+            if self._level_db is None:
+                self._level_db = block_db
+            else:
+                self._level_db += self.smoothing * (block_db - self._level_db)
+            gain_db = min(self.target_db - self._level_db, self.max_gain_db)
+            self._gain = 10 ** (gain_db / 20)
+
+        # Per-frame gain, interpolated across samples to avoid steps
+        frame_gain = np.where(voiced, self._gain, 1.0)
+        centres = (np.arange(len(frames)) + 0.5) * self.frame
+        samples = np.arange(frames.size)
+        gain = np.interp(samples, centres, frame_gain)
+        return np.clip(frames.reshape(-1) * gain, -1.0, 1.0).astype(np.float32)
+
+
+def _to_int16(x: np.ndarray) -> bytes:
+    return (x * 32767).astype("<i2").tobytes()
+
+
+# ---------------------------------------------------------------------------
+# Decoders (yield float32 mono blocks at TARGET_RATE)
+# ---------------------------------------------------------------------------
+
+
+def _parse_wav_header(head: bytes) -> tuple[int, int, int, int, int, int | None] | None:
+    """Parse a WAV header up to the data chunk.
+
+    Returns:
+        ``(format_tag, channels, sample_rate, bits, data_offset, data_size)``,
+        or None if *head* does not yet contain the data chunk header.
+    """
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(head):
+        chunk_id = head[offset:offset + 4]
+        (size,) = struct.unpack("<I", head[offset + 4:offset + 8])
+        if chunk_id == b"fmt ":
+            if offset + 8 + 16 > len(head):
+                return None
+            tag, channels, rate, _byte_rate, _align, bits = struct.unpack(
+                "<HHIIHH", head[offset + 8:offset + 24]
+            )
+            if tag == _WAVE_FORMAT_EXTENSIBLE and size >= 40 and offset + 34 <= len(head):
+                (tag,) = struct.unpack("<H", head[offset + 32:offset + 34])
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("WAV 文件缺少 fmt 块")
+            # Streamed WAVs leave the size at 0 or 0xFFFFFFFF
+            data_size = size if 0 < size < 0xFFFFFFFF else None
+            return (*fmt, offset + 8, data_size)
+        offset += 8 + size + (size & 1)
+    return None
+
+
+def _wav_samples(raw: bytes, tag: int, bits: int) -> np.ndarray:
+    """Convert interleaved WAV sample bytes to float32 in [-1, 1]."""
+    if tag == _WAVE_FORMAT_FLOAT and bits == 32:
+        return np.frombuffer(raw, dtype="<f4")
+    if tag != _WAVE_FORMAT_PCM:
+        raise AudioDecodeError(f"不支持的 WAV 编码: {tag}")
+    if bits == 16:
+        return np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    if bits == 8:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if bits == 32:
+        return np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    if bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        return values.astype(np.float32) / 8388608
+    raise AudioDecodeError(f"不支持的 WAV 位深: {bits}")
+
+
+async def _decode_wav(chunks: AsyncIterator[bytes]) -> AsyncIterator[np.ndarray]:
+    head = b""
+    header = None
+    async for chunk in chunks:
+        head += chunk
+        header = _parse_wav_header(head)
+        if header is not None:
+            break
+        if len(head) > _MAX_WAV_HEADER:
+            break
+    if header is None:
+        raise AudioDecodeError("无法解析 WAV 文件头")
+
+    tag, channels, rate, bits, data_offset, remaining = header
+    if not channels or bits % 8:
+        raise AudioDecodeError("无效的 WAV 参数")
+    block_align = channels * bits // 8
+    resampler = StreamingResampler(rate)
+    carry = head[data_offset:]
+
+    async def _data() -> AsyncIterator[bytes]:
+        yield carry
+        async for chunk in chunks:
+            yield chunk
+
+    pending = b""
+    async for chunk in _data():
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        data = pending + chunk
+        usable = len(data) - len(data) % block_align
+        pending = data[usable:]
+        if usable:
+            samples = _wav_samples(data[:usable], tag, bits).reshape(-1, channels).mean(axis=1)
+            yield resampler.process(samples.astype(np.float32))
+        if remaining == 0:
+            break
+
+
+async def _decode_pcm16(chunks: AsyncIterator[bytes]) -> AsyncIterator[np.ndarray]:
+    """Raw uploads are 16 kHz, 16-bit mono already."""
+    pending = b""
+    async for chunk in chunks:
+        data = pending + chunk
+        usable = len(data) - len(data) % 2
+        pending = data[usable:]
+        if usable:
+            yield np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768
+
+
+async def _decode_ffmpeg(chunks: AsyncIterator[bytes], ffmpeg: str) -> AsyncIterator[np.ndarray]:
+    process = await asyncio.create_subprocess_exec(
+        ffmpeg, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-ar", str(TARGET_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def _feed() -> None:
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(_feed())
+    try:
+        pending = b""
+        while block := await process.stdout.read(_FFMPEG_READ_BYTES):
+            data = pending + block
+            usable = len(data) - len(data) % 2
+            pending = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768
+        await feeder
+        stderr = await process.stderr.read()
+        if await process.wait() != 0:
+            logger.warning("ffmpeg decode failed: %s", stderr.decode("utf-8", "replace").strip())
+            raise AudioDecodeError("音频解码失败")
+    finally:
+        feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def _normalized_pcm(blocks: AsyncIterator[np.ndarray]) -> AsyncIterator[bytes]:
+    normalizer = LoudnessNormalizer()
+    async for block in blocks:
+        out = normalizer.process(block)
+        if len(out):
+            yield _to_int16(out)
+    rest = normalizer.flush()
+    if len(rest):
+        yield _to_int16(rest)
+
+
+# ---------------------------------------------------------------------------
+# Public entry point
+# ---------------------------------------------------------------------------
+
+
+async def _open(
+    chunks: AsyncIterator[bytes],
+    declared_format: str,
+    ffmpeg: str | None,
+) -> tuple[AsyncIterator[np.ndarray] | None, AsyncIterator[bytes], str]:
+    """Sniff *chunks* and pick a decoder.
+
+    Returns:
+        ``(blocks, original, format)``: decoded 16 kHz mono float blocks
+        (None when no decoder applies), the untouched byte stream and the
+        sniffed format.  Only one of the two streams may be consumed.
+    """
+    first = b""
+    async for chunk in chunks:
+        if chunk:
+            first = chunk
+            break
+    audio_format = sniff_format(first) or declared_format
+
+    async def _original() -> AsyncIterator[bytes]:
+        if first:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+
+    if audio_format == "wav":
+        return _decode_wav(_original()), _original(), audio_format
+    if audio_format == "pcm":
+        return _decode_pcm16(_original()), _original(), audio_format
+
+    if ffmpeg is None and settings.AUDIO_FFMPEG_PATH:
+        ffmpeg = shutil.which(settings.AUDIO_FFMPEG_PATH)
+    if ffmpeg:
+        return _decode_ffmpeg(_original(), ffmpeg), _original(), audio_format
+    return None, _original(), audio_format
+
+
+async def prepare_for_asr(
+    chunks: AsyncIterator[bytes],
+    declared_format: str = "mp3",
+    ffmpeg: str | None = None,
+) -> tuple[AsyncIterator[bytes], str]:
+    """Sniff the container of *chunks* and decode it for ASR.
+
+    Args:
+        chunks: The uploaded file's bytes.
+        declared_format: Format from the filename, used when sniffing fails.
+        ffmpeg: Decoder executable for compressed formats; defaults to
+            ``AUDIO_FFMPEG_PATH`` when it is on PATH.
+
+    Returns:
+        ``(stream, format)``: 16 kHz mono 16-bit PCM and ``"pcm"`` when the
+        audio could be decoded, otherwise the original bytes and the
+        sniffed format.
+    """
+    blocks, original, audio_format = await _open(chunks, declared_format, ffmpeg)
+    if blocks is None:
+        return original, audio_format
+    return _normalized_pcm(blocks), "pcm"
+
+
+async def decode_mono(
+    chunks: AsyncIterator[bytes],
+    declared_format: str = "mp3",
+    ffmpeg: str | None = None,
+) -> AsyncIterator[np.ndarray]:
+    """Decode *chunks* to 16 kHz mono float32 blocks in [-1, 1].
+
+    Unlike :func:`prepare_for_asr` the level is left untouched.
+
+    Raises:
+        AudioDecodeError: If the format needs ffmpeg and none is available,
+            or decoding fails.
+    """
+    blocks, _original, audio_format = await _open(chunks, declared_format, ffmpeg)
+    if blocks is None:
+        raise AudioDecodeError(f"没有可用的 {audio_format} 解码器")
+    return blocks
@@ -0,0 +1,253 @@
+"""Audio duration and metadata probe for MP3, WAV and Ogg files.
+
+Durations are read from the container rather than guessed from text length
+or trusted from the client:
+
+- MP3: the Xing/Info (LAME) or VBRI frame count when present, minus the
+  LAME encoder delay and padding; otherwise every frame header is walked.
+  When only the start of a larger file is available, a file without a tag
+  is assumed to be CBR and sized from the first frame's bitrate.
+- WAV: the ``data`` chunk size over the ``fmt `` byte rate.
+- Ogg (Opus/Vorbis): the granule position of the last page, less the Opus
+  pre-skip, over the rate from the identification header.
+
+Parsing works on ``memoryview`` slices and ``struct.unpack_from`` so no
+audio payload is copied.  :func:`probe_url` fetches only the first (and for
+Ogg, the last) 64 KB of a stored file with HTTP range requests.
+"""
+
+from __future__ import annotations
+
+import logging
+import struct
+from typing import NamedTuple
+
+import httpx
+
+from services.mp3_frames import id3v2_size, iter_frames, parse_frame_header, read_info_tag
+from services.supabase_storage import storage_headers, storage_object_url
+
+logger = logging.getLogger(__name__)
+
+# Bytes fetched from each end of a remote file
+_HEAD_BYTES = 64 * 1024
+_TAIL_BYTES = 64 * 1024
+
+_FETCH_TIMEOUT = 5.0
+
+# Frames are searched for this far past the ID3 tag before giving up
+_MP3_SYNC_WINDOW = 8 * 1024
+
+_OGG_NO_GRANULE = 0xFFFFFFFFFFFFFFFF
+_OPUS_RATE = 48000
+
+
+class AudioInfo(NamedTuple):
+    """Probed properties of an encoded audio file."""
+
+    format: str  # mp3 | wav | ogg
+    duration: float  # seconds
+    sample_rate: int
+    channels: int
+    bitrate: int | None  # average bits per second, if the size is known
+
+
+def probe(data: bytes, total_size: int | None = None, tail: bytes | None = None) -> AudioInfo | None:
+    """Probe an audio file from its bytes.
+
+    Args:
+        data: The whole file, or its first bytes when *total_size* is larger.
+        total_size: Size of the whole file (defaults to ``len(data)``).
+        tail: The last bytes of the file, needed for Ogg when *data* is
+            only the head.
+
+    Returns:
+        None if the format is not recognised or the file is malformed.
+    """
+    total = total_size if total_size is not None else len(data)
+    if tail is None and total <= len(data):
+        tail = data
+    view = memoryview(data)
+    try:
+        if view[:4] == b"RIFF" and view[8:12] == b"WAVE":
+            return _probe_wav(view, total)
+        if view[:4] == b"OggS":
+            return _probe_ogg(view, tail, total)
+        return _probe_mp3(view, total)
+    except struct.error:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# MP3
+# ---------------------------------------------------------------------------
+
+
+def _probe_mp3(view: memoryview, total: int) -> AudioInfo | None:
+    start = id3v2_size(view)
+    limit = min(len(view) - 4, start + _MP3_SYNC_WINDOW)
+    offset = start
+    while offset <= limit:
+        header = parse_frame_header(view, offset)
+        # A real frame is followed by another frame (or the end of the data)
+        if header is not None and header.length >= 4:
+            following = offset + header.length
+            if following + 4 > len(view) or parse_frame_header(view, following) is not None:
+                break
+        offset += 1
+    else:
+        return None
+
+    tag = read_info_tag(view, offset, header)
+    if tag is not None and tag.frames:
+        samples = tag.frames * header.samples - tag.delay - tag.padding
+        duration = max(samples, 0) / header.sample_rate
+        size = tag.size or (total - offset)
+    elif total > len(view):
+        # Only the head is here: assume constant bitrate
+        size = total - offset
+        duration = size * 8 / header.bitrate
+    else:
+        samples = size = 0
+        for index, (_offset, frame) in enumerate(iter_frames(view[offset:])):
+            if index == 0 and tag is not None:
+                continue
+            samples += frame.samples
+            size += frame.length
+        duration = samples / header.sample_rate
+
+    bitrate = round(size * 8 / duration) if duration > 0 else None
+    return AudioInfo("mp3", duration, header.sample_rate, header.channels, bitrate)
+
+
+# ---------------------------------------------------------------------------
+# WAV
+# ---------------------------------------------------------------------------
+
+
+def _probe_wav(view: memoryview, total: int) -> AudioInfo | None:
+    offset = 12
+    fmt: tuple[int, int, int] | None = None
+    while offset + 8 <= len(view):
+        chunk_id = view[offset:offset + 4]
+        (chunk_size,) = struct.unpack_from("<I", view, offset + 4)
+        if chunk_id == b"fmt ":
+            _tag, channels, rate, byte_rate = struct.unpack_from("<HHII", view, offset + 8)
+            fmt = (channels, rate, byte_rate)
+        elif chunk_id == b"data":
+            if fmt is None or not fmt[2]:
+                return None
+            channels, rate, byte_rate = fmt
+            available = total - offset - 8
+            # Streaming writers leave the size as 0 or 0xFFFFFFFF
+            if chunk_size in (0, 0xFFFFFFFF) or chunk_size > available:
+                chunk_size = available
+            return AudioInfo("wav", chunk_size / byte_rate, rate, channels, byte_rate * 8)
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Ogg
+# ---------------------------------------------------------------------------
+
+
+def _probe_ogg(view: memoryview, tail: bytes | None, total: int) -> AudioInfo | None:
+    if len(view) < 27:
+        return None
+    (serial,) = struct.unpack_from("<I", view, 14)
+    segments = view[26]
+    payload = 27 + segments
+    if view[payload:payload + 8] == b"OpusHead":
+        channels = view[payload + 9]
+        (pre_skip,) = struct.unpack_from("<H", view, payload + 10)
+        rate = _OPUS_RATE
+    elif view[payload:payload + 7] == b"\x01vorbis":
+        channels = view[payload + 11]
+        (rate,) = struct.unpack_from("<I", view, payload + 12)
+        pre_skip = 0
+    else:
+        return None
+    if not rate or tail is None:
+        return None
+
+    granule = _last_granule(tail, serial)
+    if granule is None:
+        return None
+    duration = max(granule - pre_skip, 0) / rate
+    bitrate = round(total * 8 / duration) if duration > 0 else None
+    return AudioInfo("ogg", duration, rate, channels, bitrate)
+
+
+def _last_granule(tail: bytes, serial: int) -> int | None:
+    """Granule position of the last complete page of stream *serial*."""
+    view = memoryview(tail)
+    end = len(tail)
+    while (pos := tail.rfind(b"OggS", 0, end)) >= 0:
+        end = pos
+        if pos + 27 > len(view) or view[pos + 4] != 0:
+            continue
+        granule, page_serial = struct.unpack_from("<QI", view, pos + 6)
+        if page_serial != serial or granule == _OGG_NO_GRANULE:
+            continue
+        segments = view[pos + 26]
+        if pos + 27 + segments > len(view):
+            continue
+        if pos + 27 + segments + sum(view[pos + 27:pos + 27 + segments]) > len(view):
+            continue  # truncated page
+        return granule
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Remote files
+# ---------------------------------------------------------------------------
+
+
+def _total_size(response: httpx.Response) -> int | None:
+    content_range = response.headers.get("content-range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("content-length", "")
+    return int(length) if response.status_code == 200 and length.isdigit() else None
+
+
+async def _fetch_range(
+    client: httpx.AsyncClient, url: str, byte_range: str, limit: int,
+) -> tuple[bytes, int | None, bool]:
+    """GET *byte_range* of *url*; returns (data, total size, is partial)."""
+    async with client.stream("GET", url, headers={"Range": byte_range}) as response:
+        response.raise_for_status()
+        data = bytearray()
+        async for chunk in response.aiter_bytes():
+            data += chunk
+            if len(data) >= limit:
+                break
+        return bytes(data[:limit]), _total_size(response), response.status_code == 206
+
+
+async def probe_url(url: str, headers: dict[str, str] | None = None) -> AudioInfo | None:
+    """Probe a remote audio file using range requests for its head and tail.
+
+    Returns None (and logs) if the file cannot be fetched or recognised.
+    """
+    try:
+        async with httpx.AsyncClient(timeout=_FETCH_TIMEOUT, headers=headers) as client:
+            head, total, _partial = await _fetch_range(client, url, f"bytes=0-{_HEAD_BYTES - 1}", _HEAD_BYTES)
+            tail = None
+            if head[:4] == b"OggS" and total is not None and total > len(head):
+                tail, _total, partial = await _fetch_range(client, url, f"bytes=-{_TAIL_BYTES}", _TAIL_BYTES)
+                if not partial:
+                    tail = None  # server ignored the range: that is the head again
+    except httpx.HTTPError as exc:
+        logger.warning("Audio probe failed for %s: %s", url, exc)
+        return None
+    return probe(head, total_size=total, tail=tail)
+
+
+async def probe_storage_url(url: str) -> AudioInfo | None:
+    """Probe a file in Supabase Storage; other hosts are never fetched."""
+    if not storage_object_url(url):
+        return None
+    return await probe_url(url, headers=storage_headers())
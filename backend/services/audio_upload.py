@@ -0,0 +1,240 @@
+"""Streaming, size-limited spooling of uploaded audio files.
+
+``multipart/form-data`` uploads are parsed straight off the request stream.
+The file part is written into a ``SpooledTemporaryFile`` that stays in
+memory up to a threshold and rolls over to disk beyond it, so peak memory
+per request is bounded by the threshold plus one network chunk no matter how
+long the recording is.
+
+Limits are enforced as early as possible: the declared ``Content-Length``
+is checked before any body is read, and the byte count and estimated
+duration (from the WAV header, the first MP3 frame's bitrate, or the raw
+PCM rate) are checked while the body streams in.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.requests import Request
+
+from core.config import settings
+from services.mp3_frames import iter_frames
+
+# Allowance for multipart boundaries and part headers on top of the file
+_MULTIPART_OVERHEAD = 16 * 1024
+
+# Bytes of file data needed before the duration can be estimated
+_PROBE_BYTES = 4096
+
+# Raw PCM uploads are assumed to be 16 kHz, 16-bit mono
+_PCM_BYTE_RATE = 16000 * 2
+
+
+class AudioUploadError(ValueError):
+    """The upload is malformed or not an accepted audio file."""
+
+
+class AudioUploadTooLarge(AudioUploadError):
+    """The upload exceeds the configured size or duration limit."""
+
+
+def estimate_byte_rate(head: bytes, audio_format: str) -> float | None:
+    """Estimate the encoded bytes per second of audio from its first bytes.
+
+    Returns None when the rate cannot be determined cheaply (e.g. Ogg/WebM);
+    only the byte limit then applies.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        offset = 12
+        while offset + 8 <= len(head):
+            chunk_id = head[offset:offset + 4]
+            (chunk_size,) = struct.unpack("<I", head[offset + 4:offset + 8])
+            if chunk_id == b"fmt " and offset + 20 <= len(head):
+                (byte_rate,) = struct.unpack("<I", head[offset + 16:offset + 20])
+                return float(byte_rate) or None
+            offset += 8 + chunk_size + (chunk_size & 1)
+        return None
+    if audio_format == "pcm":
+        return float(_PCM_BYTE_RATE)
+    for _offset, header in iter_frames(head):
+        return header.bitrate / 8
+    return None
+
+
+class SpooledAudio:
+    """An uploaded audio file held in a spooled temporary file."""
+
+    def __init__(self, spool_threshold: int) -> None:
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+        self.filename = ""
+        self.content_type = "application/octet-stream"
+        self.size = 0
+        self.byte_rate: float | None = None
+
+    @property
+    def audio_format(self) -> str:
+        """File extension of the upload (defaults to mp3)."""
+        name = self.filename or "audio.mp3"
+        return name.rsplit(".", 1)[-1].lower() if "." in name else "mp3"
+
+    @property
+    def duration(self) -> float | None:
+        """Estimated duration in seconds, if the byte rate is known."""
+        return self.size / self.byte_rate if self.byte_rate else None
+
+    async def chunks(self, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Yield the spooled audio in *chunk_size* pieces."""
+        self.file.seek(0)
+        while chunk := self.file.read(chunk_size):
+            yield chunk
+            # Let other requests run between chunks of a long recording
+            await asyncio.sleep(0)
+
+    async def persist(self) -> Path:
+        """Copy the upload to a named temporary file on disk and return its path.
+
+        For work that outlives the request (e.g. queued transcription jobs):
+        the caller owns the file and must delete it.
+        """
+        return await asyncio.to_thread(self._persist)
+
+    def _persist(self) -> Path:
+        fd, name = tempfile.mkstemp(prefix="upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                self.file.seek(0)
+                shutil.copyfileobj(self.file, out, 64 * 1024)
+        except BaseException:
+            Path(name).unlink(missing_ok=True)
+            raise
+        return Path(name)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+async def spool_audio_upload(
+    request: Request,
+    field: str = "file",
+    allowed_types: frozenset[str] | None = None,
+    max_bytes: int = settings.VOICE_UPLOAD_MAX_BYTES,
+    max_seconds: float = settings.VOICE_UPLOAD_MAX_SECONDS,
+    spool_threshold: int = settings.VOICE_UPLOAD_SPOOL_BYTES,
+) -> SpooledAudio:
+    """Stream the *field* file part of a multipart request into a spool.
+
+    Raises:
+        AudioUploadTooLarge: As soon as the declared length, the received
+            bytes or the estimated duration exceed the limits.
+        AudioUploadError: If the body is not multipart, the part is missing
+            or its content type is not in *allowed_types*.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise AudioUploadError("请使用 multipart/form-data 上传音频文件")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + _MULTIPART_OVERHEAD:
+        raise AudioUploadTooLarge(f"音频文件超过大小上限 ({max_bytes // (1024 * 1024)}MB)")
+
+    audio = SpooledAudio(spool_threshold)
+    head = bytearray()
+    state = {"in_file": False, "found": False, "header_field": b"", "headers": {}}
+
+    def on_part_begin() -> None:
+        state["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        key = state["header_field"].lower()
+        state["headers"][key] = state["headers"].get(key, b"") + data[start:end]
+
+    def on_header_end() -> None:
+        state["header_field"] = b""
+
+    def on_headers_finished() -> None:
+        _disposition, options = parse_options_header(
+            state["headers"].get(b"content-disposition", b"")
+        )
+        is_target = options.get(b"name", b"").decode("utf-8", "replace") == field
+        state["in_file"] = is_target and not state["found"]
+        if state["in_file"]:
+            state["found"] = True
+            audio.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+            part_type = state["headers"].get(b"content-type", b"application/octet-stream")
+            audio.content_type = part_type.decode("latin-1").lower()
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if not state["in_file"]:
+            return
+        piece = data[start:end]
+        audio.file.write(piece)
+        audio.size += len(piece)
+        if len(head) < _PROBE_BYTES:
+            head.extend(piece[:_PROBE_BYTES - len(head)])
+
+    def on_part_end() -> None:
+        state["in_file"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state["found"] and allowed_types is not None \
+                    and audio.content_type not in allowed_types:
+                raise AudioUploadError(f"不支持的音频格式: {audio.content_type}")
+            _check_limits(audio, head, declared, max_bytes, max_seconds)
+        parser.finalize()
+        if not state["found"]:
+            raise AudioUploadError("缺少音频文件")
+        _check_limits(audio, head, declared, max_bytes, max_seconds, final=True)
+    except BaseException:
+        audio.close()
+        raise
+
+    return audio
+
+
+def _check_limits(
+    audio: SpooledAudio,
+    head: bytearray,
+    declared: str | None,
+    max_bytes: int,
+    max_seconds: float,
+    final: bool = False,
+) -> None:
+    if audio.size > max_bytes:
+        raise AudioUploadTooLarge(f"音频文件超过大小上限 ({max_bytes // (1024 * 1024)}MB)")
+
+    if audio.byte_rate is None and (len(head) >= _PROBE_BYTES or (final and head)):
+        audio.byte_rate = estimate_byte_rate(bytes(head), audio.audio_format)
+    if not audio.byte_rate:
+        return
+
+    # Use the declared length as an early upper bound on the file size
+    expected = audio.size
+    if declared and declared.isdigit() and not final:
+        expected = max(expected, int(declared) - _MULTIPART_OVERHEAD)
+    if expected / audio.byte_rate > max_seconds:
+        raise AudioUploadTooLarge(f"音频时长超过上限 ({int(max_seconds)}秒)")
@@ -0,0 +1,183 @@
+"""Storage for synthesized broadcast audio (MP3 and Opus renditions).
+
+Broadcast audio is written once when a broadcast is generated and then read
+many times, usually with ``Range`` requests as elders seek or resume a
+broadcast on a weak connection.  Stores implement a small interface
+(:class:`AudioStore`) so the backend can be switched with
+``BROADCAST_AUDIO_STORE``:
+
+- ``local`` (default): files under ``BROADCAST_AUDIO_DIR``, served by
+  ``GET /radio/audio/{key}`` as ``FileResponse`` — byte ranges, ``If-Range``
+  and the server's zero-copy ``pathsend`` transfer come from Starlette,
+  ``ETag`` / ``Last-Modified`` validators and ``304 Not Modified`` from
+  :func:`not_modified`.
+- ``supabase``: public objects in ``BROADCAST_AUDIO_BUCKET``; the serving
+  endpoint redirects there and Supabase Storage handles ranges itself.
+
+Any other object store only needs ``url``, ``put`` and ``locate``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import tempfile
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Mapping, Protocol
+
+from core.config import settings
+from services.supabase_storage import StorageObject, upload
+
+# Object keys are flat file names such as "<broadcast id>.mp3"
+_KEY_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+
+_CONTENT_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+}
+
+
+def audio_content_type(key: str) -> str:
+    """Return the media type of an audio object from its extension."""
+    return _CONTENT_TYPES.get(Path(key).suffix.lower(), "application/octet-stream")
+
+
+def _check_key(key: str) -> str:
+    if not _KEY_RE.match(key):
+        raise ValueError(f"invalid audio key: {key!r}")
+    return key
+
+
+# ---------------------------------------------------------------------------
+# Conditional requests
+# ---------------------------------------------------------------------------
+
+
+def file_validators(stat: os.stat_result) -> dict[str, str]:
+    """``ETag`` and ``Last-Modified`` headers for a stored file.
+
+    The ETag changes whenever the file is replaced (size or mtime), and is
+    cheap to compute because it needs no read of the file.
+    """
+    return {
+        "ETag": f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+    }
+
+
+def not_modified(request_headers: Mapping[str, str], etag: str, modified: float) -> bool:
+    """Return True if a conditional GET can be answered with 304.
+
+    ``If-None-Match`` (weak comparison) takes precedence over
+    ``If-Modified-Since``, as required by RFC 9110.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return int(modified) <= since.timestamp()
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+
+
+class AudioStore(Protocol):
+    """Where broadcast audio objects live."""
+
+    def url(self, key: str) -> str:
+        """Return the URL clients play *key* from."""
+
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        """Create or replace *key* and return its URL."""
+
+    async def locate(self, key: str) -> Path | str | None:
+        """Return a local file to serve, a URL to redirect to, or None if missing.
+
+        Raises:
+            ValueError: If *key* is not a valid object key.
+        """
+
+
+class LocalAudioStore:
+    """Audio files in a local directory, served by ``GET /radio/audio/{key}``."""
+
+    def __init__(
+        self,
+        directory: str | Path = settings.BROADCAST_AUDIO_DIR,
+        url_prefix: str = settings.BROADCAST_AUDIO_URL_PREFIX,
+    ) -> None:
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{_check_key(key)}"
+
+    def path(self, key: str) -> Path:
+        return self.directory / _check_key(key)
+
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        path = self.path(key)
+        await asyncio.to_thread(self._write, path, data)
+        return self.url(key)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        # Write to a temp file and rename, so readers never see a partial file
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    async def locate(self, key: str) -> Path | None:
+        path = self.path(key)
+        return path if await asyncio.to_thread(path.is_file) else None
+
+
+class SupabaseAudioStore:
+    """Public objects in a Supabase Storage bucket."""
+
+    def __init__(self, bucket: str = settings.BROADCAST_AUDIO_BUCKET) -> None:
+        self.bucket = bucket
+
+    def _object(self, key: str) -> StorageObject:
+        return StorageObject(self.bucket, _check_key(key), public=True)
+
+    def url(self, key: str) -> str:
+        return self._object(key).url()
+
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        return await upload(self._object(key), data, content_type)
+
+    async def locate(self, key: str) -> str:
+        return self.url(key)
+
+
+def _default_store() -> AudioStore:
+    if settings.BROADCAST_AUDIO_STORE == "supabase":
+        return SupabaseAudioStore()
+    if settings.BROADCAST_AUDIO_STORE == "local":
+        return LocalAudioStore()
+    raise ValueError(f"unknown BROADCAST_AUDIO_STORE: {settings.BROADCAST_AUDIO_STORE!r}")
+
+
+# Module-level singleton
+broadcast_audio_store = _default_store()
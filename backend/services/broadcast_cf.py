@@ -0,0 +1,283 @@
+"""健康广播协同过滤 — 基于共同收听的物品相似度 (item-item)。
+
+离线部分：后台任务定期增量读取 broadcast_play_history（按 created_at 水位线），
+维护每个用户最近 ``RADIO_CF_USER_HISTORY`` 条收听的权重（播放 1，完播 +1，
+点赞 +2，同一广播取最大值），并据此维护稀疏共现矩阵 C = Σ_u x_u x_uᵀ。
+
+C 以排序后的 int64 键（行 << 31 | 列）和值数组保存。新播放只影响少数用户，
+按可加性增量更新：C += Σ_受影响用户 (x_新 x_新ᵀ − x_旧 x_旧ᵀ)，用户内的物品
+对用 numpy 一次性展开并用 bincount 聚合，不逐对循环。之后按余弦相似度
+C[i,j] / sqrt(C[i,i]·C[j,j]) 为每个广播保留前 ``RADIO_CF_NEIGHBORS`` 个近邻。
+
+在线部分：:meth:`CollaborativeFilter.scores` 只查询用户最近收听（种子）的近邻
+表，代价为 O(种子数 × k)，与用户量和广播量无关。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Iterable
+
+import numpy as np
+
+from core.config import settings
+from services.supabase_client import postgrest
+
+logger = logging.getLogger(__name__)
+
+_COL_BITS = 31
+_COL_MASK = (1 << _COL_BITS) - 1
+_PAGE_SIZE = 1000
+# 单次展开的物品对上限，控制内存
+_MAX_PAIRS_PER_CHUNK = 2_000_000
+
+
+def play_weight(completed: bool | None, liked: bool | None) -> float:
+    """一次收听的隐式反馈权重。"""
+    return 1.0 + (1.0 if completed else 0.0) + (2.0 if liked else 0.0)
+
+
+def cooccurrence(users: np.ndarray, items: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """计算 Σ_u x_u x_uᵀ 的非零项（含对角线）。
+
+    Args:
+        users / items / weights: 等长数组，每个 (用户, 物品) 至多出现一次。
+
+    Returns:
+        (排序后的键 行 << 31 | 列, 对应的值)。
+    """
+    if len(users) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    order = np.argsort(users, kind="stable")
+    users, items, weights = users[order], items[order].astype(np.int64), weights[order]
+    _, starts, sizes = np.unique(users, return_index=True, return_counts=True)
+
+    keys_parts, vals_parts = [], []
+    # 按用户分块，每块展开的物品对数受限
+    pair_counts = sizes.astype(np.int64) ** 2
+    block_start = 0
+    while block_start < len(sizes):
+        budget = np.cumsum(pair_counts[block_start:])
+        block_end = block_start + max(1, int(np.searchsorted(budget, _MAX_PAIRS_PER_CHUNK, side="right")))
+        g_starts, g_sizes = starts[block_start:block_end], sizes[block_start:block_end]
+
+        # 排序后同一用户的记录相邻：每个元素与同组所有元素配对
+        elem = np.arange(g_starts[0], g_starts[-1] + g_sizes[-1])
+        partners = np.repeat(g_sizes, g_sizes)
+        left = np.repeat(elem, partners)
+        block_offsets = np.repeat(np.cumsum(partners) - partners, partners)
+        right = np.repeat(np.repeat(g_starts, g_sizes), partners) + (np.arange(len(left)) - block_offsets)
+
+        keys_parts.append((items[left] << _COL_BITS) | items[right])
+        vals_parts.append(weights[left] * weights[right])
+        block_start = block_end
+
+    return _aggregate(np.concatenate(keys_parts), np.concatenate(vals_parts))
+
+
+def _aggregate(keys: np.ndarray, vals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """合并相同键的值，去掉（增量相减后）为零的项。"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=vals, minlength=len(unique))
+    keep = np.abs(summed) > 1e-9
+    return unique[keep], summed[keep]
+
+
+def top_neighbors(keys: np.ndarray, vals: np.ndarray, k: int) -> dict[int, list[tuple[int, float]]]:
+    """由共现矩阵计算每个物品余弦相似度最高的 *k* 个近邻。"""
+    rows, cols = keys >> _COL_BITS, keys & _COL_MASK
+    diagonal = rows == cols
+    size = int(max(rows.max(initial=-1), cols.max(initial=-1))) + 1
+    norms = np.zeros(size)
+    norms[rows[diagonal]] = vals[diagonal]
+
+    rows, cols, vals = rows[~diagonal], cols[~diagonal], vals[~diagonal]
+    sims = vals / np.sqrt(norms[rows] * norms[cols])
+    positive = sims > 0
+    rows, cols, sims = rows[positive], cols[positive], sims[positive]
+
+    order = np.lexsort((-sims, rows))
+    rows, cols, sims = rows[order], cols[order], sims[order]
+    _, row_starts, row_sizes = np.unique(rows, return_index=True, return_counts=True)
+    rank = np.arange(len(rows)) - np.repeat(row_starts, row_sizes)
+    keep = rank < k
+    rows, cols, sims = rows[keep], cols[keep], sims[keep]
+
+    neighbors: dict[int, list[tuple[int, float]]] = {}
+    for row, col, sim in zip(rows.tolist(), cols.tolist(), sims.tolist()):
+        neighbors.setdefault(row, []).append((col, sim))
+    return neighbors
+
+
+class CollaborativeFilter:
+    """增量维护的 item-item 协同过滤模型。"""
+
+    def __init__(
+        self,
+        neighbors: int = settings.RADIO_CF_NEIGHBORS,
+        user_history: int = settings.RADIO_CF_USER_HISTORY,
+        interval: float = settings.RADIO_CF_INTERVAL_SECONDS,
+    ) -> None:
+        self.k = neighbors
+        self.user_history = user_history
+        self.interval = interval
+
+        self._item_ids: list[str] = []
+        self._item_index: dict[str, int] = {}
+        self._user_index: dict[str, int] = {}
+        # 用户最近收听：物品序号 -> 权重（按收听先后排列）
+        self._profiles: dict[str, dict[int, float]] = {}
+        self._keys = np.empty(0, dtype=np.int64)
+        self._vals = np.empty(0)
+        self._neighbors: dict[str, list[tuple[str, float]]] = {}
+        self._watermark: str | None = None
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.plays_seen = 0
+
+    # ------------------------------------------------------------------
+    # 离线：增量更新
+    # ------------------------------------------------------------------
+
+    def _item(self, broadcast_id: str) -> int:
+        index = self._item_index.get(broadcast_id)
+        if index is None:
+            index = self._item_index[broadcast_id] = len(self._item_ids)
+            self._item_ids.append(broadcast_id)
+        return index
+
+    def _user(self, user_id: str) -> int:
+        return self._user_index.setdefault(user_id, len(self._user_index))
+
+    def _triplets(self, profiles: dict[str, dict[int, float]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        users, items, weights = [], [], []
+        for user_id, profile in profiles.items():
+            code = self._user(user_id)
+            users.extend([code] * len(profile))
+            items.extend(profile.keys())
+            weights.extend(profile.values())
+        return np.array(users, dtype=np.int64), np.array(items, dtype=np.int64), np.array(weights, dtype=float)
+
+    def apply(self, plays: Iterable[dict]) -> int:
+        """合并一批播放记录并更新相似度。
+
+        重复的记录不会重复计数（同一用户、同一广播取最大权重）。
+
+        Returns:
+            受影响的用户数。
+        """
+        old: dict[str, dict[int, float]] = {}
+        for play in plays:
+            user_id, broadcast_id = play.get("user_id"), play.get("broadcast_id")
+            if not user_id or not broadcast_id:
+                continue
+            self.plays_seen += 1
+            profile = self._profiles.setdefault(user_id, {})
+            if user_id not in old:
+                old[user_id] = dict(profile)
+            item = self._item(broadcast_id)
+            weight = max(profile.pop(item, 0.0), play_weight(play.get("completed"), play.get("liked")))
+            profile[item] = weight
+            while len(profile) > self.user_history:
+                del profile[next(iter(profile))]
+        changed = {u: p for u, p in old.items() if p != self._profiles[u]}
+        if not changed:
+            return 0
+
+        new_keys, new_vals = cooccurrence(*self._triplets({u: self._profiles[u] for u in changed}))
+        old_keys, old_vals = cooccurrence(*self._triplets(changed))
+        self._keys, self._vals = _aggregate(
+            np.concatenate([self._keys, new_keys, old_keys]),
+            np.concatenate([self._vals, new_vals, -old_vals]),
+        )
+        ids = self._item_ids
+        self._neighbors = {
+            ids[item]: [(ids[other], sim) for other, sim in near]
+            for item, near in top_neighbors(self._keys, self._vals, self.k).items()
+        }
+        return len(changed)
+
+    async def refresh(self) -> int:
+        """读取水位线之后的播放记录并增量更新模型。"""
+        plays = await asyncio.to_thread(self._fetch_since, self._watermark)
+        if not plays:
+            return 0
+        affected = await asyncio.to_thread(self.apply, plays)
+        # 以 gte 读取，边界上的记录会再读一次；权重取最大值，重复读取无副作用
+        stamps = [p["created_at"] for p in plays if p.get("created_at")]
+        if stamps:
+            self._watermark = max(stamps)
+        self.runs += 1
+        return affected
+
+    @staticmethod
+    def _fetch_since(watermark: str | None) -> list[dict]:
+        plays: list[dict] = []
+        while True:
+            query = postgrest.from_("broadcast_play_history").select(
+                "user_id,broadcast_id,completed,liked,created_at"
+            )
+            if watermark:
+                query = query.gte("created_at", watermark)
+            page = (
+                query.order("created_at")
+                .range(len(plays), len(plays) + _PAGE_SIZE - 1)
+                .execute()
+                .data
+                or []
+            )
+            plays.extend(page)
+            if len(page) < _PAGE_SIZE:
+                return plays
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as exc:
+                logger.warning("Collaborative filtering refresh failed: %s", exc)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """在当前事件循环上启动定期增量更新。"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ------------------------------------------------------------------
+    # 在线：打分
+    # ------------------------------------------------------------------
+
+    def neighbors(self, broadcast_id: str) -> list[tuple[str, float]]:
+        return self._neighbors.get(broadcast_id, [])
+
+    def scores(self, seeds: dict[str, float]) -> dict[str, float]:
+        """按用户收听过的广播（种子，值为反馈权重）汇总近邻相似度。"""
+        scores: dict[str, float] = {}
+        for seed, weight in seeds.items():
+            for other, sim in self._neighbors.get(seed, ()):
+                scores[other] = scores.get(other, 0.0) + weight * sim
+        return scores
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "plays_seen": self.plays_seen,
+            "users": len(self._profiles),
+            "items": len(self._item_ids),
+            "nonzeros": int(len(self._keys)),
+            "items_with_neighbors": len(self._neighbors),
+        }
+
+
+# Module-level singleton
+broadcast_cf = CollaborativeFilter()
@@ -0,0 +1,295 @@
+"""Batched play / completion / like counters for health broadcasts.
+
+Each play record adds deltas to in-memory per-broadcast counters instead of
+writing ``health_broadcasts`` on every play.  A background loop flushes the
+deltas every ``BROADCAST_COUNTER_FLUSH_INTERVAL_SECONDS`` through the
+``increment_broadcast_counters`` RPC, which applies the whole batch in one
+``UPDATE ... SET play_count = play_count + d.plays`` statement, so concurrent
+flushes from several workers never lose increments.
+
+Deltas are also appended to a small on-disk log made of numbered segments.
+Each process writes to its own subdirectory of ``BROADCAST_COUNTER_LOG_DIR``
+and holds an exclusive lock on it while it runs, so several workers can share
+the directory.  A flush seals the current segment and deletes the sealed
+segments once the RPC succeeds.  Subdirectories whose lock can be taken
+belong to a process that crashed or stopped before flushing; their segments
+are moved into this process's log and replayed into the next flush, while
+segments of live processes are never touched.  Delivery is at-least-once: a
+crash between a successful RPC and the deletion replays that batch.
+
+Flushed deltas are also added to the in-memory recommendation index so
+popularity ranking follows plays without waiting for an index rebuild.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, TextIO
+
+from core.config import settings
+from services.broadcast_index import broadcast_index
+from services.supabase_client import postgrest
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_GLOB = "counters-*.log"
+_LOCK_FILE = "owner.lock"
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock(path: Path) -> BinaryIO | None:
+    """Open *path* and take an exclusive lock on it without waiting.
+
+    Returns:
+        The open lock file (the lock lasts until it is closed), or None if
+        another process holds the lock.
+    """
+    f = path.open("a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+# (plays, completions, likes)
+Deltas = dict[str, list[int]]
+
+
+def _merge(into: Deltas, deltas: Deltas) -> None:
+    for broadcast_id, (plays, completions, likes) in deltas.items():
+        counts = into.setdefault(broadcast_id, [0, 0, 0])
+        counts[0] += plays
+        counts[1] += completions
+        counts[2] += likes
+
+
+class BroadcastCounters:
+    """Aggregates broadcast counter deltas and flushes them in batches."""
+
+    def __init__(
+        self,
+        log_dir: str | Path = settings.BROADCAST_COUNTER_LOG_DIR,
+        flush_interval: float = settings.BROADCAST_COUNTER_FLUSH_INTERVAL_SECONDS,
+        rpc: str = "increment_broadcast_counters",
+    ) -> None:
+        self.log_dir = Path(log_dir)
+        self.flush_interval = flush_interval
+        self.rpc = rpc
+        # This process's segments; locked while the process runs
+        self.own_dir = self.log_dir / f"proc-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._pending: Deltas = {}
+        self._sealed: list[Path] = []
+        self._segment: TextIO | None = None
+        self._segment_path: Path | None = None
+        self._seq = 0
+        self._lock: BinaryIO | None = None
+        self._task: asyncio.Task | None = None
+        self.recorded = 0
+        self.flushed = 0
+        self.failures = 0
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def record(self, broadcast_id: str, completed: bool = False, liked: bool = False) -> None:
+        """Count one play of *broadcast_id*."""
+        delta = [1, int(bool(completed)), int(bool(liked))]
+        _merge(self._pending, {broadcast_id: delta})
+        self.recorded += 1
+        try:
+            segment = self._current_segment()
+            segment.write(json.dumps([broadcast_id, *delta]) + "\n")
+            segment.flush()
+        except OSError as exc:
+            logger.warning("Broadcast counter log write failed: %s", exc)
+
+    def pending(self) -> Deltas:
+        """Deltas not yet flushed to the database."""
+        return {broadcast_id: list(counts) for broadcast_id, counts in self._pending.items()}
+
+    # ------------------------------------------------------------------
+    # Durable log
+    # ------------------------------------------------------------------
+
+    def _claim_own_dir(self) -> None:
+        if self._lock is None:
+            self.own_dir.mkdir(parents=True, exist_ok=True)
+            self._lock = _try_lock(self.own_dir / _LOCK_FILE)
+            if self._lock is None:
+                raise OSError(f"broadcast counter log {self.own_dir} is locked")
+
+    def _next_segment_path(self) -> Path:
+        self._seq += 1
+        return self.own_dir / f"counters-{self._seq:010d}.log"
+
+    def _current_segment(self) -> TextIO:
+        if self._segment is None:
+            self._claim_own_dir()
+            self._segment_path = self._next_segment_path()
+            self._segment = self._segment_path.open("a", encoding="utf-8")
+        return self._segment
+
+    def _seal(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._sealed.append(self._segment_path)
+            self._segment = None
+            self._segment_path = None
+
+    def _replay(self) -> None:
+        """Adopt the segments of processes that are gone into the pending deltas."""
+        if not self.log_dir.is_dir():
+            return
+        adopted = 0
+        try:
+            # Segments written straight into the directory by older versions
+            adopted += self._adopt_segments(sorted(self.log_dir.glob(_SEGMENT_GLOB)))
+        except OSError as exc:
+            logger.warning("Cannot adopt broadcast counter log %s: %s", self.log_dir, exc)
+        for directory in sorted(self.log_dir.iterdir()):
+            if directory == self.own_dir or not directory.is_dir():
+                continue
+            try:
+                lock = _try_lock(directory / _LOCK_FILE)
+            except OSError:
+                continue  # removed by another process adopting it
+            if lock is None:
+                continue  # its owner is still running
+            try:
+                adopted += self._adopt(directory)
+            except OSError as exc:
+                logger.warning("Cannot adopt broadcast counter log %s: %s", directory, exc)
+            finally:
+                lock.close()
+        if adopted:
+            logger.info("Replayed %d broadcast counter log segment(s)", adopted)
+
+    def _adopt(self, directory: Path) -> int:
+        """Adopt the segments of the orphaned log *directory* and remove it."""
+        adopted = self._adopt_segments(sorted(directory.glob(_SEGMENT_GLOB)))
+        (directory / _LOCK_FILE).unlink(missing_ok=True)
+        directory.rmdir()
+        return adopted
+
+    def _adopt_segments(self, segments: list[Path]) -> int:
+        """Move *segments* into this process's log and load their deltas."""
+        adopted = 0
+        for path in segments:
+            self._claim_own_dir()
+            # The rename is atomic, so each segment is adopted by one process
+            # only; loading after it means a crash leaves the segment in a log
+            # that is adopted again later
+            try:
+                moved = path.rename(self._next_segment_path())
+            except FileNotFoundError:
+                continue
+            for line in moved.read_text(encoding="utf-8").splitlines():
+                try:
+                    broadcast_id, plays, completions, likes = json.loads(line)
+                except ValueError:
+                    continue  # torn last line after a crash
+                _merge(self._pending, {broadcast_id: [plays, completions, likes]})
+            self._sealed.append(moved)
+            adopted += 1
+        return adopted
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Apply the pending deltas through the increment RPC.
+
+        Returns:
+            Number of broadcasts updated.  On failure the deltas and their
+            log segments are kept and retried with the next flush.
+        """
+        self._replay()
+        if not self._pending:
+            return 0
+
+        self._seal()
+        pending, self._pending = self._pending, {}
+        sealed = list(self._sealed)
+        deltas = [
+            {"id": broadcast_id, "plays": plays, "completions": completions, "likes": likes}
+            for broadcast_id, (plays, completions, likes) in pending.items()
+        ]
+        try:
+            await asyncio.to_thread(
+                lambda: postgrest.rpc(self.rpc, {"deltas": deltas}).execute()
+            )
+        except Exception as exc:
+            logger.warning("Broadcast counter flush failed (%d broadcasts kept): %s", len(deltas), exc)
+            self.failures += 1
+            _merge(self._pending, pending)
+            return 0
+
+        for path in sealed:
+            path.unlink(missing_ok=True)
+        self._sealed = [path for path in self._sealed if path not in sealed]
+        self.flushed += len(deltas)
+        broadcast_index.add_counts(pending)
+        return len(deltas)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Adopt leftover log segments and start the periodic flush loop."""
+        self._replay()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write any remaining deltas."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self.close()
+
+    def close(self) -> None:
+        """Close the log and release its lock; unflushed segments are left
+        for another process to adopt."""
+        self._seal()
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "pending_broadcasts": len(self._pending),
+            "pending_plays": sum(counts[0] for counts in self._pending.values()),
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "log_segments": len(self._sealed) + (self._segment is not None),
+        }
+
+
+# Module-level singleton
+broadcast_counters = BroadcastCounters()
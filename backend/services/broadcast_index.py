@@ -0,0 +1,362 @@
+"""健康广播推荐索引 — 已发布广播在内存中按季节、年龄段、慢性病预分桶。
+
+已发布的 health_broadcasts 在首次推荐时分页加载一次，之后发布新广播时增量
+写入 (:meth:`BroadcastIndex.upsert`)，推荐请求不再扫描广播表。索引超过
+``RADIO_INDEX_REFRESH_SECONDS`` 后在后台整体重建一次，以同步播放次数、下架等
+在别处发生的变更；重建期间继续使用旧索引，期间的增量更新在新索引载入后重放。
+
+候选集：季节匹配（或不限季节）且年龄落在目标区间（或不限年龄）的广播。
+打分 = 匹配度 + 热度 + 新鲜度，权重见 ``RADIO_WEIGHT_*`` 配置：
+
+- 匹配度：季节精确匹配、年龄区间命中、慢性病重合比例三项的平均；
+- 热度：log(1 + play_count)，按索引内最大值归一化；
+- 新鲜度：按 ``RADIO_RECENCY_HALF_LIFE_DAYS`` 半衰期指数衰减。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+
+from core.config import settings
+from services.supabase_client import postgrest
+
+logger = logging.getLogger(__name__)
+
+_AGE_BAND_YEARS = 10
+_MAX_AGE = 120
+_PAGE_SIZE = 1000
+
+# 不限季节 / 不限年龄的广播所在的桶
+_ANY = None
+
+
+def age_band(age: int) -> int:
+    """年龄所在的年龄段（每 10 岁一段）。"""
+    return min(max(age, 0), _MAX_AGE) // _AGE_BAND_YEARS
+
+
+def _age_bands(row: dict) -> Iterable[int | None]:
+    """广播目标年龄区间覆盖的年龄段。"""
+    low, high = row.get("target_age_min"), row.get("target_age_max")
+    if low is None and high is None:
+        return [_ANY]
+    return range(age_band(low or 0), age_band(_MAX_AGE if high is None else high) + 1)
+
+
+def age_matches(row: dict, age: int) -> bool:
+    """年龄是否落在广播的目标年龄区间内。"""
+    low, high = row.get("target_age_min"), row.get("target_age_max")
+    return (low is None or age >= low) and (high is None or age <= high)
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class BroadcastIndex:
+    """已发布广播的内存推荐索引。"""
+
+    def __init__(
+        self,
+        refresh_seconds: float = settings.RADIO_INDEX_REFRESH_SECONDS,
+        half_life_days: float = settings.RADIO_RECENCY_HALF_LIFE_DAYS,
+        weights: tuple[float, float, float] = (
+            settings.RADIO_WEIGHT_MATCH,
+            settings.RADIO_WEIGHT_POPULARITY,
+            settings.RADIO_WEIGHT_RECENCY,
+        ),
+    ) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.half_life_days = half_life_days
+        self.weights = weights
+
+        self._rows: dict[str, dict] = {}
+        self._created: dict[str, float] = {}
+        self._by_season: dict[str | None, set[str]] = defaultdict(set)
+        self._by_age: dict[int | None, set[str]] = defaultdict(set)
+        self._by_disease: dict[str, set[str]] = defaultdict(set)
+        self._max_plays = 0
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._refresh: asyncio.Task | None = None
+        # 进行中的重建各自记录的增量更新 (方法, 参数)
+        self._reloads: list[list[tuple]] = []
+        self.loads = 0
+        self.upserts = 0
+        # 每次内容变化加一，供推荐缓存判断失效
+        self.version = 0
+
+    # ------------------------------------------------------------------
+    # 加载与增量更新
+    # ------------------------------------------------------------------
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    async def ensure_loaded(self) -> None:
+        """首次使用时加载索引；过期时在后台重建。
+
+        Raises:
+            Exception: 首次加载时数据库查询失败。
+        """
+        if not self.loaded:
+            async with self._lock:
+                if not self.loaded:
+                    await self.reload()
+            return
+        stale = time.monotonic() - self._loaded_at > self.refresh_seconds
+        if stale and (self._refresh is None or self._refresh.done()):
+            self._refresh = asyncio.create_task(self._background_reload())
+
+    async def reload(self) -> None:
+        """分页读取全部已发布广播并重建索引。
+
+        读取期间发生的 upsert / update / remove 可能不在读到的快照里，
+        载入快照后按顺序重放。
+        """
+        changes: list[tuple] = []
+        self._reloads.append(changes)
+        try:
+            rows = await asyncio.to_thread(self._fetch_published)
+        finally:
+            self._reloads.remove(changes)
+        self.load(rows)
+        for method, *args in changes:
+            method(*args)
+
+    async def _background_reload(self) -> None:
+        try:
+            await self.reload()
+        except Exception as exc:
+            logger.warning("Broadcast index refresh failed, keeping the old index: %s", exc)
+
+    @staticmethod
+    def _fetch_published() -> list[dict]:
+        rows: list[dict] = []
+        while True:
+            page = (
+                postgrest.from_("health_broadcasts")
+                .select("*")
+                .eq("is_published", True)
+                .order("created_at", desc=True)
+                .range(len(rows), len(rows) + _PAGE_SIZE - 1)
+                .execute()
+                .data
+                or []
+            )
+            rows.extend(page)
+            if len(page) < _PAGE_SIZE:
+                return rows
+
+    def load(self, rows: Iterable[dict]) -> None:
+        """用给定的广播记录整体替换索引。"""
+        self._rows = {}
+        self._created = {}
+        self._by_season = defaultdict(set)
+        self._by_age = defaultdict(set)
+        self._by_disease = defaultdict(set)
+        self._max_plays = 0
+        for row in rows:
+            self._add(row)
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+        self.version += 1
+
+    def _record(self, *change) -> None:
+        for changes in self._reloads:
+            changes.append(change)
+
+    def upsert(self, row: dict) -> None:
+        """发布或更新一条广播；未发布的记录会从索引中移除。"""
+        self._record(self._upsert, row)
+        self._upsert(row)
+
+    def _upsert(self, row: dict) -> None:
+        self._remove(row["id"])
+        if row.get("is_published"):
+            self._add(row)
+        self.upserts += 1
+        self.version += 1
+
+    def update(self, broadcast_id: str, **fields) -> None:
+        """更新已索引广播的非分桶字段（如 audio_opus_url）。"""
+        self._record(self._update, broadcast_id, fields)
+        self._update(broadcast_id, fields)
+
+    def _update(self, broadcast_id: str, fields: dict) -> None:
+        row = self._rows.get(broadcast_id)
+        if row is not None:
+            self._upsert({**row, **fields})
+
+    def add_counts(self, deltas: dict[str, list[int]]) -> None:
+        """累加已写入数据库的播放 / 完播 / 点赞增量。
+
+        只影响热度分，不改变分桶，因此不使推荐缓存失效。
+        """
+        for broadcast_id, (plays, completions, likes) in deltas.items():
+            row = self._rows.get(broadcast_id)
+            if row is None:
+                continue
+            row = self._rows[broadcast_id] = {
+                **row,
+                "play_count": (row.get("play_count") or 0) + plays,
+                "completion_count": (row.get("completion_count") or 0) + completions,
+                "like_count": (row.get("like_count") or 0) + likes,
+            }
+            self._max_plays = max(self._max_plays, row["play_count"])
+
+    def remove(self, broadcast_id: str) -> None:
+        self._record(self._remove, broadcast_id)
+        self._remove(broadcast_id)
+
+    def _remove(self, broadcast_id: str) -> None:
+        row = self._rows.pop(broadcast_id, None)
+        if row is None:
+            return
+        self.version += 1
+        del self._created[broadcast_id]
+        self._by_season[row.get("target_season")].discard(broadcast_id)
+        for band in _age_bands(row):
+            self._by_age[band].discard(broadcast_id)
+        for disease in row.get("target_diseases") or []:
+            self._by_disease[disease].discard(broadcast_id)
+
+    def _add(self, row: dict) -> None:
+        broadcast_id = row["id"]
+        self._rows[broadcast_id] = row
+        self._created[broadcast_id] = _timestamp(row.get("created_at"))
+        self._by_season[row.get("target_season")].add(broadcast_id)
+        for band in _age_bands(row):
+            self._by_age[band].add(broadcast_id)
+        for disease in row.get("target_diseases") or []:
+            self._by_disease[disease].add(broadcast_id)
+        self._max_plays = max(self._max_plays, row.get("play_count") or 0)
+
+    # ------------------------------------------------------------------
+    # 推荐
+    # ------------------------------------------------------------------
+
+    def row(self, broadcast_id: str) -> dict | None:
+        return self._rows.get(broadcast_id)
+
+    def rows(self) -> list[dict]:
+        """全部已索引广播的当前记录。"""
+        return list(self._rows.values())
+
+    def segment_candidates(self, season: str | None, band: int | None) -> set[str]:
+        """季节适用、目标年龄区间与年龄段 *band* 有交集的广播 ID。"""
+        if season:
+            ids = self._by_season[season] | self._by_season[_ANY]
+        else:
+            ids = set(self._rows)
+        if band is not None:
+            ids &= self._by_age[band] | self._by_age[_ANY]
+        return ids
+
+    def candidates(self, season: str | None, age: int | None) -> set[str]:
+        """季节与年龄都适用的广播 ID。"""
+        if age is None:
+            return self.segment_candidates(season, None)
+        ids = self.segment_candidates(season, age_band(age))
+        return {i for i in ids if age_matches(self._rows[i], age)}
+
+    def rank(
+        self,
+        filters: dict,
+        exclude: Iterable[str] = (),
+        limit: int = 10,
+        now: float | None = None,
+    ) -> list[dict]:
+        """按匹配度、热度、新鲜度返回前 *limit* 条广播。
+
+        Args:
+            filters: ``build_recommend_filters`` 的结果（age, diseases, season）。
+            exclude: 不推荐的广播 ID（如用户已播放过的）。
+        """
+        ids = self.candidates(filters.get("season"), filters.get("age")) - set(exclude)
+        return [self._rows[i] for i in self.top(ids, filters, limit, now)]
+
+    def eligible(self, broadcast_id: str, season: str | None, age: int | None) -> bool:
+        """广播是否在 :meth:`candidates` 的范围内（单条判断）。"""
+        row = self._rows.get(broadcast_id)
+        if row is None:
+            return False
+        if season and row.get("target_season") not in (season, None):
+            return False
+        return age is None or age_matches(row, age)
+
+    def coverage(self, season: str, disease: str | None = None) -> int:
+        """专门面向 *season* 的已发布广播数。
+
+        给出 *disease* 时只计针对该慢性病的广播，否则只计不限慢性病的通用广播。
+        """
+        ids = self._by_season.get(season, set())
+        if disease is not None:
+            return len(ids & self._by_disease.get(disease, set()))
+        return sum(1 for i in ids if not self._rows[i].get("target_diseases"))
+
+    def top(self, ids: set[str], filters: dict, limit: int, now: float | None = None) -> list[str]:
+        """对候选广播打分，返回得分最高的 *limit* 个 ID。"""
+        return [broadcast_id for broadcast_id, _score in self.top_scored(ids, filters, limit, now)]
+
+    def top_scored(
+        self, ids: set[str], filters: dict, limit: int, now: float | None = None
+    ) -> list[tuple[str, float]]:
+        """同 :meth:`top`，同时返回内容得分（0~1）。"""
+        if not ids:
+            return []
+        season, age_known = filters.get("season"), filters.get("age") is not None
+
+        overlap: dict[str, int] = defaultdict(int)
+        for disease in set(filters.get("diseases") or []):
+            for broadcast_id in self._by_disease.get(disease, ()):
+                overlap[broadcast_id] += 1
+
+        now = time.time() if now is None else now
+        w_match, w_pop, w_recency = self.weights
+        plays_norm = math.log1p(self._max_plays) or 1.0
+        decay = math.log(2) / (self.half_life_days * 86400)
+
+        def score(broadcast_id: str) -> float:
+            row = self._rows[broadcast_id]
+            targeted = row.get("target_diseases") or []
+            targets_age = row.get("target_age_min") is not None or row.get("target_age_max") is not None
+            match = (
+                (1.0 if season and row.get("target_season") == season else 0.0)
+                + (1.0 if age_known and targets_age else 0.0)
+                + (overlap.get(broadcast_id, 0) / len(targeted) if targeted else 0.0)
+            ) / 3
+            popularity = math.log1p(row.get("play_count") or 0) / plays_norm
+            recency = math.exp(-decay * max(now - self._created[broadcast_id], 0.0))
+            return w_match * match + w_pop * popularity + w_recency * recency
+
+        scored = [(broadcast_id, score(broadcast_id)) for broadcast_id in ids]
+        return heapq.nlargest(limit, scored, key=lambda item: (item[1], self._created[item[0]]))
+
+    def stats(self) -> dict:
+        return {
+            "broadcasts": len(self._rows),
+            "loads": self.loads,
+            "upserts": self.upserts,
+            "version": self.version,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self.loaded else None,
+        }
+
+
+# Module-level singleton
+broadcast_index = BroadcastIndex()
@@ -0,0 +1,399 @@
+"""健康广播预生成流水线 — 在后台生成广播文本、合成音频并发布。
+
+LLM 生成文本加 TTS 合成音频需要十几秒，不再在请求内同步完成：
+
+- 交互生成：``POST /radio/generate`` 只提交任务并返回任务 ID，客户端轮询
+  ``GET /radio/generate/{job_id}`` 获取结果；
+- 定期预生成：每隔 ``BROADCAST_PIPELINE_INTERVAL_SECONDS`` 规划一次，对当前
+  季节（以及 ``BROADCAST_PIPELINE_SEASON_LEAD_DAYS`` 天内将到来的下一季节）的
+  通用内容和老人中最常见的 ``BROADCAST_PIPELINE_TOP_DISEASES`` 种慢性病，
+  按推荐索引统计现有广播数，不足 ``BROADCAST_PIPELINE_PER_SLOT`` 条的缺口按
+  影响人数排序后提交，让推荐目录始终有货。
+
+两类任务共用一个有界优先队列和 ``BROADCAST_PIPELINE_CONCURRENCY`` 个工作协程，
+交互任务排在预生成任务之前。合成的 MP3 先写入广播音频存储（见
+services.broadcast_audio），再写入 health_broadcasts（带 audio_url），随后写入
+推荐索引并排队转码 Opus 版本。
+
+预生成的广播直接发布，因此定期规划默认关闭（``BROADCAST_PIPELINE_ENABLED``），
+且豆包 LLM 或 TTS 未配置时跳过——否则占位文本和静音音频会进入正式目录。
+排队中的缺口只在本进程内计数，多进程部署时只能有一个进程开启规划。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from core.config import settings
+from services.broadcast_audio import broadcast_audio_store
+from services.broadcast_index import broadcast_index
+from services.doubao_service import doubao_service
+from services.health_broadcast import (
+    BROADCAST_CATEGORIES,
+    health_broadcast_service,
+    upcoming_seasons,
+)
+from services.supabase_client import postgrest
+from services.transcode import OPUS_CONTENT_TYPE, opus_transcoder
+from services.voice_service import voice_service
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = 1000
+_INTERACTIVE, _PLANNED = 0, 1
+_MP3_CONTENT_TYPE = "audio/mpeg"
+
+# 季节通用内容轮换使用的分类（慢病内容固定为「慢病管理」）
+_GENERAL_CATEGORIES = [c["key"] for c in BROADCAST_CATEGORIES if c["key"] != "慢病管理"]
+
+# (季节, 慢性病)；慢性病为 None 表示该季节的通用内容
+Slot = tuple[str, str | None]
+
+
+class BroadcastQueueFull(RuntimeError):
+    """生成队列已满，调用方应稍后重试。"""
+
+
+class BroadcastJob:
+    """一次广播生成任务及其结果。"""
+
+    def __init__(self, spec: dict, user_id: str | None = None, slot: Slot | None = None) -> None:
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.user_id = user_id
+        self.slot = slot
+        self.status = "queued"  # queued | running | done | failed
+        self.broadcast: dict | None = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self.done = asyncio.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "broadcast": self.broadcast,
+            "error": self.error,
+        }
+
+
+class BroadcastPipeline:
+    """广播生成任务队列与目录缺口规划。"""
+
+    def __init__(
+        self,
+        concurrency: int = settings.BROADCAST_PIPELINE_CONCURRENCY,
+        queue_size: int = settings.BROADCAST_PIPELINE_QUEUE_SIZE,
+        interval: float = settings.BROADCAST_PIPELINE_INTERVAL_SECONDS,
+        lead_days: int = settings.BROADCAST_PIPELINE_SEASON_LEAD_DAYS,
+        top_diseases: int = settings.BROADCAST_PIPELINE_TOP_DISEASES,
+        per_slot: int = settings.BROADCAST_PIPELINE_PER_SLOT,
+        max_per_run: int = settings.BROADCAST_PIPELINE_MAX_PER_RUN,
+        result_ttl: float = settings.BROADCAST_PIPELINE_RESULT_TTL_SECONDS,
+    ) -> None:
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.interval = interval
+        self.lead_days = lead_days
+        self.top_diseases = top_diseases
+        self.per_slot = per_slot
+        self.max_per_run = max_per_run
+        self.result_ttl = result_ttl
+
+        self._jobs: dict[str, BroadcastJob] = {}
+        self._queue: asyncio.PriorityQueue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._planner: asyncio.Task | None = None
+        self._seq = itertools.count()
+        # 已排队或正在生成的预生成任务数，规划时计入现有数量
+        self._inflight: Counter[Slot] = Counter()
+        self._running = 0
+        self.plans = 0
+        self._counts = {"submitted": 0, "planned": 0, "done": 0, "failed": 0, "rejected": 0}
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+
+    def submit(self, spec: dict, user_id: str | None = None, slot: Slot | None = None) -> BroadcastJob:
+        """提交一个生成任务并立即返回。
+
+        Args:
+            spec: 生成参数（category, topic, target_diseases, target_season,
+                target_age_min, target_age_max）。
+            slot: 预生成任务所填补的缺口；为 None 时按交互任务优先处理。
+
+        Raises:
+            BroadcastQueueFull: 队列已满。
+        """
+        self._ensure_workers()
+        self._evict_expired()
+        job = BroadcastJob(spec, user_id, slot)
+        priority = _INTERACTIVE if slot is None else _PLANNED
+        try:
+            self._queue.put_nowait((priority, next(self._seq), job))
+        except asyncio.QueueFull:
+            self._counts["rejected"] += 1
+            raise BroadcastQueueFull("broadcast generation queue is full") from None
+        self._jobs[job.id] = job
+        if slot is not None:
+            self._inflight[slot] += 1
+            self._counts["planned"] += 1
+        self._counts["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> BroadcastJob | None:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float | None = None) -> BroadcastJob:
+        """等待任务完成或失败。"""
+        job = self._jobs[job_id]
+        await asyncio.wait_for(job.done.wait(), timeout)
+        return job
+
+    # ------------------------------------------------------------------
+    # 生成
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not all(task.done() for task in self._workers):
+            return
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self._inflight.clear()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def _worker(self) -> None:
+        while True:
+            _priority, _seq, job = await self._queue.get()
+            self._running += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running -= 1
+
+    async def _run(self, job: BroadcastJob) -> None:
+        job.status = "running"
+        try:
+            job.broadcast = await self.produce(job.spec)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Broadcast generation job %s failed: %s", job.id, exc)
+            job.status = "failed"
+            job.error = str(exc)
+            self._counts["failed"] += 1
+        else:
+            job.status = "done"
+            self._counts["done"] += 1
+        finally:
+            if job.slot is not None:
+                self._inflight[job.slot] -= 1
+                if self._inflight[job.slot] <= 0:
+                    del self._inflight[job.slot]
+        job.finished_at = time.time()
+        job.done.set()
+
+    async def produce(self, spec: dict) -> dict:
+        """生成文本与音频、保存音频并发布广播，返回 health_broadcasts 记录。
+
+        Raises:
+            LLMShedError: LLM 繁忙，广播优先级的请求被丢弃。
+            RuntimeError: 保存广播记录失败。
+        """
+        text = await health_broadcast_service.generate_broadcast_text(
+            category=spec["category"],
+            topic=spec.get("topic"),
+            target_diseases=spec.get("target_diseases"),
+        )
+        audio_bytes, duration = await health_broadcast_service.generate_audio(text["content"])
+
+        broadcast_id = str(uuid.uuid4())
+        audio_url = await broadcast_audio_store.put(f"{broadcast_id}.mp3", audio_bytes, _MP3_CONTENT_TYPE)
+
+        now = datetime.now(timezone.utc).isoformat()
+        record = {
+            "id": broadcast_id,
+            "title": text["title"],
+            "content": text["content"],
+            "category": spec["category"],
+            "audio_url": audio_url,
+            "audio_duration": duration,
+            "is_published": True,
+            "target_age_min": spec.get("target_age_min"),
+            "target_age_max": spec.get("target_age_max"),
+            "target_diseases": spec.get("target_diseases"),
+            "target_season": spec.get("target_season"),
+            "ai_prompt": text["ai_prompt"],
+            "generated_by": "doubao",
+            "play_count": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        rows = await asyncio.to_thread(
+            lambda: postgrest.from_("health_broadcasts").insert(record).execute().data or []
+        )
+        if not rows:
+            raise RuntimeError("保存广播内容失败")
+
+        broadcast_index.upsert(rows[0])
+        _queue_opus_rendition(rows[0]["id"], audio_bytes)
+        return rows[0]
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    # ------------------------------------------------------------------
+    # 目录缺口规划
+    # ------------------------------------------------------------------
+
+    async def plan(self, now: datetime | None = None) -> list[tuple[Slot, dict]]:
+        """计算需要预生成的广播，按影响人数 × 缺口数排序，最多 ``max_per_run`` 条。"""
+        await broadcast_index.ensure_loaded()
+        prevalence, elders = await asyncio.to_thread(self._fetch_prevalence)
+        diseases = [disease for disease, _ in prevalence.most_common(self.top_diseases)]
+
+        gaps: list[tuple[float, Slot, int, int]] = []
+        for season in upcoming_seasons(self.lead_days, now):
+            for disease in [None, *diseases]:
+                have = broadcast_index.coverage(season, disease) + self._inflight[(season, disease)]
+                missing = self.per_slot - have
+                if missing > 0:
+                    reach = elders if disease is None else prevalence[disease]
+                    gaps.append((reach * missing, (season, disease), have, missing))
+        gaps.sort(key=lambda gap: -gap[0])
+
+        # 各缺口轮流取一条，避免单个缺口占满一次规划
+        planned: list[tuple[Slot, dict]] = []
+        for round_ in range(self.per_slot):
+            for _weight, slot, have, missing in gaps:
+                if round_ < missing and len(planned) < self.max_per_run:
+                    planned.append((slot, _spec(slot, have + round_)))
+        return planned
+
+    async def run_once(self, now: datetime | None = None) -> int:
+        """规划一次并提交预生成任务，返回提交的任务数。
+
+        LLM 或 TTS 未配置时不规划（生成结果只会是占位内容）。
+        """
+        if not _backends_configured():
+            logger.warning("Broadcast pre-generation skipped: Doubao LLM or TTS not configured")
+            return 0
+        submitted = 0
+        for slot, spec in await self.plan(now):
+            try:
+                self.submit(spec, slot=slot)
+            except BroadcastQueueFull:
+                break
+            submitted += 1
+        self.plans += 1
+        if submitted:
+            logger.info("Queued %d broadcast(s) to fill catalogue gaps", submitted)
+        return submitted
+
+    @staticmethod
+    def _fetch_prevalence() -> tuple[Counter[str], int]:
+        """老人用户中各慢性病的人数，以及老人总数。"""
+        prevalence: Counter[str] = Counter()
+        elders = 0
+        while True:
+            page = (
+                postgrest.from_("users")
+                .select("chronic_diseases")
+                .eq("role", "elder")
+                .range(elders, elders + _PAGE_SIZE - 1)
+                .execute()
+                .data
+                or []
+            )
+            elders += len(page)
+            for user in page:
+                prevalence.update(set(user.get("chronic_diseases") or []))
+            if len(page) < _PAGE_SIZE:
+                return prevalence, elders
+
+    async def _plan_loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.warning("Broadcast pre-generation planning failed: %s", exc)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """在当前事件循环上启动工作协程与定期规划。"""
+        self._ensure_workers()
+        if self._planner is None or self._planner.done():
+            self._planner = asyncio.get_running_loop().create_task(self._plan_loop())
+
+    async def stop(self) -> None:
+        """取消规划与工作协程；排队和进行中的任务被放弃。"""
+        tasks = [*self._workers, *([self._planner] if self._planner else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._planner = None
+        self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            **self._counts,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "planned_inflight": sum(self._inflight.values()),
+            "plans": self.plans,
+        }
+
+
+def _backends_configured() -> bool:
+    return doubao_service._is_configured and voice_service.tts_configured
+
+
+def _spec(slot: Slot, index: int) -> dict:
+    """缺口对应的生成参数；同一缺口的第 *index* 条轮换分类。"""
+    season, disease = slot
+    if disease is None:
+        category = _GENERAL_CATEGORIES[index % len(_GENERAL_CATEGORIES)]
+        return {"category": category, "topic": f"{season}{category}", "target_season": season}
+    return {
+        "category": "慢病管理",
+        "topic": f"{season}{disease}患者的调养要点",
+        "target_diseases": [disease],
+        "target_season": season,
+    }
+
+
+def _queue_opus_rendition(broadcast_id: str, audio_bytes: bytes) -> None:
+    """转码为 Opus 存入广播音频存储，并回填 audio_opus_url。"""
+
+    async def _store(opus: bytes) -> None:
+        url = await broadcast_audio_store.put(f"{broadcast_id}.opus.ogg", opus, OPUS_CONTENT_TYPE)
+        await asyncio.to_thread(
+            lambda: postgrest.from_("health_broadcasts")
+            .update({"audio_opus_url": url})
+            .eq("id", broadcast_id)
+            .execute()
+        )
+        broadcast_index.update(broadcast_id, audio_opus_url=url)
+
+    opus_transcoder.enqueue(f"broadcast:{broadcast_id}", audio_bytes, _store)
+
+
+# Module-level singleton
+broadcast_pipeline = BroadcastPipeline()
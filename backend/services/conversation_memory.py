@@ -0,0 +1,246 @@
+"""Server-side conversation memory for AI chat sessions.
+
+Keeps a bounded per-session ring buffer of recent turns so clients no longer
+need to resend the whole history every turn, and builds the LLM context from
+it within an approximate token budget.  Turns that no longer fit the budget
+are truncated and, when enabled, folded into a running summary generated in
+the background with ``doubao_service.generate_summary``.
+
+Sessions live in process memory only.  The durable record remains the
+``ai_conversations`` table: callers hydrate a session lazily from it the
+first time a known ``session_id`` is seen (see :meth:`ConversationMemory.load`).
+
+Sessions are keyed by ``(user_id, session_id)``, never by the client-chosen
+``session_id`` alone, so one user cannot read or extend another user's
+session by sending its id.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from core.config import settings
+from services.doubao_service import doubao_service
+from services.tokens import estimate_message_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# (user_id, session_id); user_id is None for anonymous sessions
+SessionKey = tuple[str | None, str]
+
+
+class _Session:
+    """In-memory state of a single conversation session."""
+
+    __slots__ = ("turns", "summary", "last_access", "summarizing")
+
+    def __init__(self, max_turns: int) -> None:
+        self.turns: deque[dict[str, str]] = deque(maxlen=max_turns)
+        self.summary = ""
+        self.last_access = time.monotonic()
+        self.summarizing = False
+
+
+class ConversationMemory:
+    """Per-session ring buffers of chat turns with token-budgeted context."""
+
+    def __init__(
+        self,
+        max_turns: int = settings.AI_MEMORY_MAX_TURNS,
+        max_sessions: int = settings.AI_MEMORY_MAX_SESSIONS,
+        idle_ttl: float = settings.AI_MEMORY_IDLE_TTL_SECONDS,
+        token_budget: int = settings.AI_CONTEXT_TOKEN_BUDGET,
+        summarize: bool = settings.AI_MEMORY_SUMMARIZE,
+    ) -> None:
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self._sessions: OrderedDict[SessionKey, _Session] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    # ------------------------------------------------------------------
+    # Session bookkeeping
+    # ------------------------------------------------------------------
+
+    def has_session(self, key: SessionKey) -> bool:
+        """Return True if *key* is currently held in memory."""
+        return key in self._sessions
+
+    def _touch(self, key: SessionKey) -> _Session:
+        """Return the session, creating it and evicting stale ones as needed."""
+        now = time.monotonic()
+        session = self._sessions.get(key)
+        if session is None:
+            session = _Session(self.max_turns)
+            self._sessions[key] = session
+        else:
+            self._sessions.move_to_end(key)
+        session.last_access = now
+        self._evict(now)
+        return session
+
+    def _evict(self, now: float) -> None:
+        """Drop idle sessions and enforce the session-count limit (LRU)."""
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            expired = now - oldest.last_access > self.idle_ttl
+            if not expired and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[oldest_id]
+
+    def load(self, key: SessionKey, turns: list[dict[str, Any]]) -> None:
+        """Hydrate a session from persisted turns (chronological order).
+
+        Only rows with a ``user`` or ``assistant`` role and non-empty content
+        are kept; at most ``max_turns`` of the newest survive.
+        """
+        session = self._touch(key)
+        session.turns.clear()
+        for row in turns:
+            role = row.get("role")
+            content = row.get("content") or ""
+            if role in ("user", "assistant") and content:
+                session.turns.append({"role": role, "content": content})
+
+    def drop(self, key: SessionKey) -> None:
+        """Forget a session entirely."""
+        self._sessions.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Turns
+    # ------------------------------------------------------------------
+
+    def append(self, key: SessionKey, role: str, content: str) -> None:
+        """Append a turn to the session's ring buffer."""
+        if not content:
+            return
+        self._touch(key).turns.append({"role": role, "content": content})
+
+    def history(self, key: SessionKey) -> list[dict[str, str]]:
+        """Return a copy of the buffered turns (chronological order)."""
+        session = self._sessions.get(key)
+        return list(session.turns) if session else []
+
+    def summary(self, key: SessionKey) -> str:
+        """Return the running summary of truncated turns (may be empty)."""
+        session = self._sessions.get(key)
+        return session.summary if session else ""
+
+    def merge_incoming(
+        self,
+        key: SessionKey,
+        messages: list[dict[str, str]],
+    ) -> list[dict[str, str]]:
+        """Return the part of *messages* not already held in memory.
+
+        Clients that still resend the full history send a prefix that
+        overlaps the tail of the buffer; that overlap is skipped so it is
+        neither stored twice nor sent to the LLM twice.
+        """
+        buffered = self.history(key)
+        max_overlap = min(len(buffered), len(messages))
+        for k in range(max_overlap, 0, -1):
+            if buffered[-k:] == messages[:k]:
+                return messages[k:]
+        return list(messages)
+
+    # ------------------------------------------------------------------
+    # Context building
+    # ------------------------------------------------------------------
+
+    def build_context(
+        self,
+        key: SessionKey,
+        token_budget: int | None = None,
+    ) -> list[dict[str, str]]:
+        """Return the newest turns that fit within the token budget.
+
+        The running summary (if any) counts against the budget.  When older
+        turns have to be truncated and summarisation is enabled, they are
+        folded into the summary in the background so later turns can still
+        refer back to them.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        session = self._sessions.get(key)
+        if session is None:
+            return []
+
+        remaining = budget - estimate_tokens(session.summary)
+        window: list[dict[str, str]] = []
+        for turn in reversed(session.turns):
+            cost = estimate_message_tokens(turn)
+            # Always keep the newest turn, even if it alone exceeds the budget
+            if window and cost > remaining:
+                break
+            window.append(turn)
+            remaining -= cost
+        window.reverse()
+
+        overflow = list(session.turns)[: len(session.turns) - len(window)]
+        if overflow and self.summarize:
+            self._schedule_summary(key, session, overflow)
+
+        return [dict(turn) for turn in window]
+
+    def _schedule_summary(
+        self,
+        key: SessionKey,
+        session: _Session,
+        overflow: list[dict[str, str]],
+    ) -> None:
+        """Start a background task folding *overflow* into the summary."""
+        if session.summarizing:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        session.summarizing = True
+        task = loop.create_task(self._summarize(key, session, overflow))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(
+        self,
+        key: SessionKey,
+        session: _Session,
+        overflow: list[dict[str, str]],
+    ) -> None:
+        """Summarise *overflow* turns and drop them from the buffer."""
+        conversations = list(overflow)
+        if session.summary:
+            conversations.insert(0, {"role": "summary", "content": session.summary})
+        try:
+            summary = await doubao_service.generate_summary(conversations)
+        except Exception as exc:
+            logger.warning("Conversation summary failed: session=%s error=%s", key, exc)
+            summary = ""
+        finally:
+            session.summarizing = False
+
+        if not summary:
+            return
+        session.summary = summary
+        # Remove exactly the summarised turns (identity check — the buffer
+        # may have received new turns while the summary was generated).
+        summarized = {id(turn) for turn in overflow}
+        while session.turns and id(session.turns[0]) in summarized:
+            session.turns.popleft()
+
+    def stats(self) -> dict[str, int]:
+        """Return simple occupancy metrics."""
+        return {
+            "sessions": len(self._sessions),
+            "turns": sum(len(s.turns) for s in self._sessions.values()),
+            "summarizing": sum(1 for s in self._sessions.values() if s.summarizing),
+        }
+
+
+# Module-level singleton
+conversation_memory = ConversationMemory()
@@ -4,23 +4,39 @@ Provides:
 - chat: multi-turn conversation with the Doubao LLM
 - recognize_intent: analyse user text to identify intent and entities
 - generate_summary: summarise a list of conversation messages
+- chat_with_intent: one structured-output call returning intent + reply
+- speculative_turn: intent and chat concurrently, chat cancelled when the
+  intent is actionable
+- chat_stream: the chat reply streamed token by token (Ark SSE)
 
 The Volcano Engine Ark API is OpenAI-compatible (POST /chat/completions).
 Current implementation uses httpx for async HTTP calls and falls back to
 placeholder responses when the API key is not configured.
 
+Identical concurrent requests (same messages, temperature and max_tokens)
+are coalesced into a single in-flight Ark call whose result is shared.
+Every Ark call goes through ``llm_scheduler`` and is tagged with a priority
+class (emergency > interactive > summary > broadcast).  Token usage, latency
+and outcome of each call are recorded per feature and user in ``llm_usage``.
+
 Requirements: 19.4
 """
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
-from typing import Any
+import time
+from typing import Any, AsyncIterator
 
 import httpx
 
 from core.config import settings
+from services.llm_scheduler import LLMPriority, LLMShedError, llm_scheduler
+from services.llm_usage import llm_usage
+from services.tokens import estimate_message_tokens, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +60,12 @@ _INTENT_TYPES = [
     "general_chat",
 ]
 
+# Phrases that make an intent check jump the LLM queue as a possible emergency
+_EMERGENCY_KEYWORDS = (
+    "救命", "救救", "摔倒", "摔了", "跌倒", "晕倒", "头晕", "胸口疼", "胸口痛",
+    "喘不上气", "喘不过气", "呼吸困难", "不舒服", "疼得厉害", "打120", "急救",
+)
+
 _INTENT_PROMPT = (
     "你是一个意图识别引擎。分析用户输入文本，识别用户意图和关键实体。\n"
     "支持的意图类型：{intents}\n\n"
@@ -72,6 +94,23 @@ _SUMMARY_PROMPT = (
 )
 
 
+_TURN_PROMPT = (
+    "除了回复老人之外，你还需要同时识别老人最后一句话的意图。\n"
+    "支持的意图类型：{intents}\n"
+    "实体提取规则与意图识别相同（如 record_type、values、medicine_name、"
+    "target_relation、message_content、time_range、topic）。\n\n"
+    "请严格按以下JSON格式返回，不要包含其他内容：\n"
+    '{{"intent": "<意图类型>", "entities": {{<提取的实体>}}, '
+    '"confidence": <0-1的置信度>, "reply": "<对老人说的话>"}}'
+).format(intents=", ".join(_INTENT_TYPES))
+
+# Intents that trigger a client-side action instead of a chat reply
+_ACTIONABLE_INTENTS = frozenset(_INTENT_TYPES) - {"general_chat"}
+_ACTIONABLE_CONFIDENCE = 0.6
+
+_HISTORY_SUMMARY_PROMPT = "以下是此前对话的摘要，请结合它回答老人：\n{summary}"
+
+
 class DoubaoService:
     """Encapsulates Volcano Engine Ark (Doubao) LLM API calls."""
 
@@ -79,6 +118,11 @@ class DoubaoService:
         self.api_key = settings.VOLCANO_ARK_API_KEY
         self.base_url = settings.VOLCANO_ARK_BASE_URL
         self.model_endpoint = settings.VOLCANO_ARK_MODEL_ENDPOINT
+        # Single-flight: coalescing key -> shared in-flight Ark call
+        self._inflight: dict[str, asyncio.Future[str]] = {}
+        self._inflight_waiters: dict[str, int] = {}
+        self.llm_calls_total = 0
+        self.llm_calls_coalesced = 0
 
     @property
     def _is_configured(self) -> bool:
@@ -94,6 +138,9 @@ class DoubaoService:
         messages: list[dict[str, str]],
         temperature: float = 0.7,
         max_tokens: int = 1024,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        feature: str = "chat",
+        user_id: str | None = None,
     ) -> str:
         """Send messages to the Doubao LLM and return the assistant reply.
 
@@ -103,6 +150,13 @@ class DoubaoService:
             Body: { model, messages, temperature, max_tokens }
 
         Falls back to a placeholder when the API key is not configured.
+        Concurrent calls with the same coalescing key share one request,
+        which waits for a ``llm_scheduler`` slot of the given *priority*.
+        Usage is accounted to *feature* and *user_id*; a coalesced call is
+        billed to the caller that started it.
+
+        Raises:
+            LLMShedError: If low-priority work is shed while Ark is saturated.
         """
         if not self._is_configured:
             logger.warning(
@@ -111,6 +165,119 @@ class DoubaoService:
             )
             return self._placeholder_chat_response(messages)
 
+        self.llm_calls_total += 1
+        key = self._coalesce_key(messages, temperature, max_tokens)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.llm_calls_coalesced += 1
+            llm_usage.record(feature, user_id, outcome="coalesced")
+            logger.debug("Doubao LLM request coalesced: key=%s", key[:12])
+        else:
+            task = asyncio.ensure_future(
+                self._scheduled_chat_completion(
+                    messages, temperature, max_tokens, priority, feature, user_id
+                )
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._release_inflight(key, t))
+
+        # shield: a cancelled waiter must not cancel the call for the others;
+        # the shared call is only cancelled once its last waiter is gone.
+        self._inflight_waiters[key] = self._inflight_waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight_waiters.get(key) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            remaining = self._inflight_waiters.get(key, 1) - 1
+            if remaining > 0:
+                self._inflight_waiters[key] = remaining
+            else:
+                self._inflight_waiters.pop(key, None)
+
+    async def _scheduled_chat_completion(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        priority: LLMPriority,
+        feature: str,
+        user_id: str | None,
+    ) -> str:
+        """Run one Ark request inside a scheduler slot and record its usage."""
+        start = time.monotonic()
+        sent = None
+        reply, usage, outcome = "", None, "error"
+        try:
+            async with llm_scheduler.slot(priority):
+                sent = time.monotonic()
+                reply, usage = await self._post_chat_completion(messages, temperature, max_tokens)
+            outcome = "ok"
+            return reply
+        except LLMShedError:
+            outcome = "shed"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            end = time.monotonic()
+            self._record_usage(
+                feature,
+                user_id,
+                messages,
+                reply,
+                usage,
+                outcome,
+                latency_ms=(end - sent) * 1000 if sent is not None else 0.0,
+                queue_ms=((sent if sent is not None else end) - start) * 1000,
+            )
+
+    @staticmethod
+    def _record_usage(
+        feature: str,
+        user_id: str | None,
+        messages: list[dict[str, str]],
+        reply: str,
+        usage: dict[str, Any] | None,
+        outcome: str,
+        latency_ms: float,
+        queue_ms: float,
+    ) -> None:
+        """Account one Ark call, estimating tokens when Ark omits ``usage``."""
+        prompt_tokens = completion_tokens = 0
+        estimated = False
+        if usage:
+            prompt_tokens = int(usage.get("prompt_tokens") or 0)
+            completion_tokens = int(usage.get("completion_tokens") or 0)
+        elif outcome == "ok":
+            prompt_tokens = sum(estimate_message_tokens(m) for m in messages)
+            completion_tokens = estimate_tokens(reply)
+            estimated = True
+        llm_usage.record(
+            feature,
+            user_id,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=latency_ms,
+            queue_ms=queue_ms,
+            outcome=outcome,
+            estimated=estimated,
+        )
+
+    async def _post_chat_completion(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+    ) -> tuple[str, dict[str, Any] | None]:
+        """POST one chat/completions request to Ark.
+
+        Returns:
+            (reply text, the response's ``usage`` block or None)
+        """
         url = f"{self.base_url}/chat/completions"
         headers = {
             "Content-Type": "application/json",
@@ -128,7 +295,7 @@ class DoubaoService:
                 resp = await client.post(url, headers=headers, json=payload)
                 resp.raise_for_status()
                 data = resp.json()
-                return data["choices"][0]["message"]["content"]
+                return data["choices"][0]["message"]["content"], data.get("usage")
         except httpx.HTTPStatusError as exc:
             logger.error("Doubao LLM HTTP error: %s %s", exc.response.status_code, exc.response.text)
             raise RuntimeError(f"豆包LLM服务请求失败: {exc.response.status_code}") from exc
@@ -136,6 +303,97 @@ class DoubaoService:
             logger.error("Doubao LLM request error: %s", exc)
             raise RuntimeError("豆包LLM服务不可用") from exc
 
+    async def _stream_chat_completion(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        usage: dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """POST one streaming chat/completions request and yield content deltas.
+
+        The final chunk's ``usage`` block (requested via ``stream_options``)
+        is copied into *usage*.
+        """
+        url = f"{self.base_url}/chat/completions"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+        payload = {
+            "model": self.model_endpoint,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+
+        try:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                async with client.stream("POST", url, headers=headers, json=payload) as resp:
+                    if resp.status_code >= 400:
+                        body = await resp.aread()
+                        logger.error("Doubao LLM HTTP error: %s %s", resp.status_code, body[:500])
+                        raise RuntimeError(f"豆包LLM服务请求失败: {resp.status_code}")
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if chunk.get("usage"):
+                            usage.update(chunk["usage"])
+                        for choice in chunk.get("choices") or []:
+                            delta = (choice.get("delta") or {}).get("content")
+                            if delta:
+                                yield delta
+        except httpx.RequestError as exc:
+            logger.error("Doubao LLM request error: %s", exc)
+            raise RuntimeError("豆包LLM服务不可用") from exc
+
+    # ------------------------------------------------------------------
+    # Internal: single-flight request coalescing
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _coalesce_key(
+        messages: list[dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        """Return a stable key for (canonicalised messages, temperature, max_tokens)."""
+        canonical = json.dumps(
+            {
+                "messages": [
+                    {"role": m.get("role", ""), "content": (m.get("content") or "").strip()}
+                    for m in messages
+                ],
+                "temperature": round(float(temperature), 4),
+                "max_tokens": int(max_tokens),
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _release_inflight(self, key: str, task: asyncio.Future[str]) -> None:
+        """Forget a finished in-flight call and mark its exception as retrieved."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def coalescing_stats(self) -> dict[str, int]:
+        """Return single-flight metrics: total calls, calls saved, in flight."""
+        return {
+            "llm_calls_total": self.llm_calls_total,
+            "llm_calls_coalesced": self.llm_calls_coalesced,
+            "llm_calls_inflight": len(self._inflight),
+        }
+
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
@@ -144,6 +402,9 @@ class DoubaoService:
         self,
         messages: list[dict[str, str]],
         user_id: str | None = None,
+        summary: str | None = None,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        feature: str = "chat",
     ) -> str:
         """Send chat messages to the Doubao LLM and return the reply.
 
@@ -151,18 +412,82 @@ class DoubaoService:
             messages: List of {"role": "system"|"user"|"assistant", "content": str}.
                       If no system message is present, the default elderly-care
                       system prompt is prepended automatically.
-            user_id: Optional user identifier for logging/tracing.
+            user_id: Optional user identifier for logging and usage accounting.
+            summary: Optional summary of earlier, truncated turns.  Inserted
+                     as a system message right after the system prompt.
+            priority: Scheduler class; background callers (e.g. broadcast
+                      generation) pass a lower priority.
+            feature: Usage-accounting tag (e.g. ``"broadcast"``).
 
         Returns:
             The assistant's response text.
         """
         logger.info("Doubao chat request: user=%s turns=%d", user_id, len(messages))
 
-        # Ensure a system prompt is present
-        if not messages or messages[0].get("role") != "system":
-            messages = [{"role": "system", "content": _SYSTEM_PROMPT}] + list(messages)
+        messages = self._with_system_prompt(messages, summary)
+        return await self._call_llm(messages, priority=priority, feature=feature, user_id=user_id)
 
-        return await self._call_llm(messages)
+    async def chat_stream(
+        self,
+        messages: list[dict[str, str]],
+        user_id: str | None = None,
+        summary: str | None = None,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        feature: str = "chat",
+    ) -> AsyncIterator[str]:
+        """Stream the reply to chat messages as it is generated.
+
+        Arguments are as for :meth:`chat`.  Streams are never coalesced; the
+        scheduler slot is held until the stream ends or the consumer closes
+        it (e.g. on barge-in), which is recorded as a cancelled call.
+
+        Yields:
+            Content deltas of the assistant's response.
+        """
+        logger.info("Doubao chat stream: user=%s turns=%d", user_id, len(messages))
+        messages = self._with_system_prompt(messages, summary)
+
+        if not self._is_configured:
+            logger.warning(
+                "Doubao LLM not configured (missing API key or model endpoint). "
+                "Returning placeholder response."
+            )
+            reply = self._placeholder_chat_response(messages)
+            for i in range(0, len(reply), 4):
+                yield reply[i:i + 4]
+            return
+
+        self.llm_calls_total += 1
+        start = time.monotonic()
+        sent = None
+        parts: list[str] = []
+        usage: dict[str, Any] = {}
+        outcome = "error"
+        try:
+            async with llm_scheduler.slot(priority):
+                sent = time.monotonic()
+                async for delta in self._stream_chat_completion(messages, 0.7, 1024, usage):
+                    parts.append(delta)
+                    yield delta
+            outcome = "ok"
+        except LLMShedError:
+            outcome = "shed"
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            end = time.monotonic()
+            self._record_usage(
+                feature,
+                user_id,
+                messages,
+                "".join(parts),
+                usage or None,
+                outcome,
+                latency_ms=(end - sent) * 1000 if sent is not None else 0.0,
+                queue_ms=((sent if sent is not None else end) - start) * 1000,
+            )
 
     async def recognize_intent(
         self,
@@ -188,7 +513,14 @@ class DoubaoService:
             {"role": "user", "content": text},
         ]
 
-        raw = await self._call_llm(messages, temperature=0.1, max_tokens=512)
+        raw = await self._call_llm(
+            messages,
+            temperature=0.1,
+            max_tokens=512,
+            priority=self._intent_priority(text),
+            feature="intent",
+            user_id=user_id,
+        )
         return self._parse_intent_response(raw)
 
     async def generate_summary(
@@ -225,7 +557,124 @@ class DoubaoService:
             {"role": "user", "content": "请生成对话摘要。"},
         ]
 
-        return await self._call_llm(messages, temperature=0.5, max_tokens=512)
+        return await self._call_llm(
+            messages,
+            temperature=0.5,
+            max_tokens=512,
+            priority=LLMPriority.SUMMARY,
+            feature="summary",
+            user_id=user_id,
+        )
+
+    async def chat_with_intent(
+        self,
+        messages: list[dict[str, str]],
+        user_id: str | None = None,
+        summary: str | None = None,
+    ) -> dict[str, Any]:
+        """Recognise intent and generate the spoken reply in a single LLM call.
+
+        Args:
+            messages: Conversation turns, as for :meth:`chat`.
+            user_id: Optional user identifier for logging/tracing.
+            summary: Optional summary of earlier, truncated turns.
+
+        Returns:
+            {"intent": str, "entities": dict, "confidence": float, "reply": str}
+        """
+        text = self._last_user_text(messages)
+        logger.info("Doubao combined turn: user=%s turns=%d", user_id, len(messages))
+
+        messages = self._with_system_prompt(messages, summary)
+        messages = [messages[0], {"role": "system", "content": _TURN_PROMPT}] + messages[1:]
+
+        raw = await self._call_llm(
+            messages,
+            temperature=0.3,
+            max_tokens=1024,
+            priority=self._intent_priority(text),
+            feature="turn",
+            user_id=user_id,
+        )
+        return self._parse_turn_response(raw)
+
+    async def speculative_turn(
+        self,
+        messages: list[dict[str, str]],
+        user_id: str | None = None,
+        summary: str | None = None,
+    ) -> dict[str, Any]:
+        """Run intent recognition and chat concurrently for one voice turn.
+
+        When the intent is actionable (anything but ``general_chat`` with
+        sufficient confidence) the in-flight chat call is cancelled and
+        ``reply`` is ``None`` — the client performs the action instead.
+
+        Returns:
+            {"intent": str, "entities": dict, "confidence": float, "reply": str | None}
+        """
+        text = self._last_user_text(messages)
+        chat_task = asyncio.ensure_future(self.chat(messages, user_id, summary=summary))
+        try:
+            intent = await self.recognize_intent(text, user_id)
+        except BaseException:
+            chat_task.cancel()
+            raise
+
+        if self.is_actionable(intent):
+            chat_task.cancel()
+            logger.info(
+                "Speculative chat cancelled: user=%s intent=%s",
+                user_id,
+                intent["intent"],
+            )
+            return {**intent, "reply": None}
+
+        return {**intent, "reply": await chat_task}
+
+    # ------------------------------------------------------------------
+    # Message helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _with_system_prompt(
+        messages: list[dict[str, str]],
+        summary: str | None = None,
+    ) -> list[dict[str, str]]:
+        """Ensure a system prompt leads *messages* and insert the history summary."""
+        if not messages or messages[0].get("role") != "system":
+            messages = [{"role": "system", "content": _SYSTEM_PROMPT}] + list(messages)
+        else:
+            messages = list(messages)
+
+        if summary:
+            messages = [
+                messages[0],
+                {"role": "system", "content": _HISTORY_SUMMARY_PROMPT.format(summary=summary)},
+            ] + messages[1:]
+        return messages
+
+    @staticmethod
+    def _last_user_text(messages: list[dict[str, str]]) -> str:
+        for msg in reversed(messages):
+            if msg.get("role") == "user":
+                return msg.get("content", "")
+        return ""
+
+    @staticmethod
+    def _intent_priority(text: str) -> LLMPriority:
+        """Queue possible emergencies ahead of all other LLM work."""
+        if any(word in text for word in _EMERGENCY_KEYWORDS):
+            return LLMPriority.EMERGENCY
+        return LLMPriority.INTERACTIVE
+
+    @staticmethod
+    def is_actionable(intent: dict[str, Any]) -> bool:
+        """True when *intent* should trigger a client action instead of a chat reply."""
+        return (
+            intent.get("intent") in _ACTIONABLE_INTENTS
+            and intent.get("confidence", 0.0) >= _ACTIONABLE_CONFIDENCE
+        )
 
     # ------------------------------------------------------------------
     # Placeholder / fallback helpers
@@ -246,12 +695,8 @@ class DoubaoService:
         )
 
     @staticmethod
-    def _parse_intent_response(raw: str) -> dict[str, Any]:
-        """Parse the LLM's JSON response into a structured intent dict.
-
-        Handles cases where the LLM wraps JSON in markdown code fences
-        or returns slightly malformed output.
-        """
+    def _load_json_object(raw: str) -> dict[str, Any] | None:
+        """Parse a JSON object from LLM output, tolerating markdown code fences."""
         cleaned = raw.strip()
         # Strip markdown code fences if present
         if cleaned.startswith("```"):
@@ -263,14 +708,12 @@ class DoubaoService:
         try:
             parsed = json.loads(cleaned)
         except json.JSONDecodeError:
-            logger.warning("Failed to parse intent JSON: %r", raw[:200])
-            return {
-                "intent": "general_chat",
-                "entities": {},
-                "confidence": 0.0,
-            }
+            return None
+        return parsed if isinstance(parsed, dict) else None
 
-        # Validate and normalise
+    @staticmethod
+    def _normalize_intent(parsed: dict[str, Any]) -> dict[str, Any]:
+        """Validate intent, entities and confidence fields of a parsed response."""
         intent = parsed.get("intent", "general_chat")
         if intent not in _INTENT_TYPES:
             intent = "general_chat"
@@ -292,6 +735,45 @@ class DoubaoService:
             "confidence": confidence,
         }
 
+    @classmethod
+    def _parse_intent_response(cls, raw: str) -> dict[str, Any]:
+        """Parse the LLM's JSON response into a structured intent dict.
+
+        Handles cases where the LLM wraps JSON in markdown code fences
+        or returns slightly malformed output.
+        """
+        parsed = cls._load_json_object(raw)
+        if parsed is None:
+            logger.warning("Failed to parse intent JSON: %r", raw[:200])
+            return {
+                "intent": "general_chat",
+                "entities": {},
+                "confidence": 0.0,
+            }
+        return cls._normalize_intent(parsed)
+
+    @classmethod
+    def _parse_turn_response(cls, raw: str) -> dict[str, Any]:
+        """Parse a combined intent + reply response.
+
+        If the model ignored the JSON format, the raw text is used as the
+        reply with a ``general_chat`` intent so the elder still gets an answer.
+        """
+        parsed = cls._load_json_object(raw)
+        if parsed is None:
+            logger.warning("Failed to parse combined turn JSON: %r", raw[:200])
+            return {
+                "intent": "general_chat",
+                "entities": {},
+                "confidence": 0.0,
+                "reply": raw.strip(),
+            }
+
+        result = cls._normalize_intent(parsed)
+        reply = parsed.get("reply")
+        result["reply"] = reply.strip() if isinstance(reply, str) else ""
+        return result
+
 
 # Module-level singleton
 doubao_service = DoubaoService()
@@ -9,9 +9,11 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
+from services.audio_probe import probe
 from services.doubao_service import doubao_service
+from services.llm_scheduler import LLMPriority
 from services.voice_service import voice_service
 
 logger = logging.getLogger(__name__)
@@ -27,9 +29,8 @@ BROADCAST_CATEGORIES = [
 ]
 
 
-def _get_current_season() -> str:
-    """根据当前月份返回季节名称。"""
-    month = datetime.now(timezone.utc).month
+def _season_of(month: int) -> str:
+    """月份对应的季节名称。"""
     if month in (3, 4, 5):
         return "春季"
     elif month in (6, 7, 8):
@@ -40,6 +41,21 @@ def _get_current_season() -> str:
         return "冬季"
 
 
+def _get_current_season() -> str:
+    """根据当前月份返回季节名称。"""
+    return _season_of(datetime.now(timezone.utc).month)
+
+
+def upcoming_seasons(lead_days: int, now: datetime | None = None) -> list[str]:
+    """当前季节，以及 *lead_days* 天内将要到来的下一个季节。"""
+    now = now or datetime.now(timezone.utc)
+    seasons = [_season_of(now.month)]
+    ahead = _season_of((now + timedelta(days=lead_days)).month)
+    if ahead not in seasons:
+        seasons.append(ahead)
+    return seasons
+
+
 def _calculate_age(birth_date: str | None) -> int | None:
     """根据出生日期计算年龄。"""
     if not birth_date:
@@ -116,7 +132,9 @@ class HealthBroadcastService:
             {"role": "user", "content": prompt},
         ]
 
-        raw = await doubao_service.chat(messages)
+        raw = await doubao_service.chat(
+            messages, priority=LLMPriority.BROADCAST, feature="broadcast"
+        )
 
         # 解析标题和内容
         title = category
@@ -141,17 +159,19 @@ class HealthBroadcastService:
             text: 要合成的文本。
 
         Returns:
-            (audio_bytes, estimated_duration_seconds)
+            (audio_bytes, duration_seconds)，时长从 MP3 帧头解析得到。
         """
         audio_bytes = await voice_service.text_to_speech(
             text=text,
             speed=0.9,  # 老年人适合稍慢语速
             voice_type="zh_female_cancan",
         )
-        # 估算音频时长：中文约每秒4个字，0.9倍速
-        char_count = len(text)
-        estimated_duration = char_count / (4 * 0.9)
-        return audio_bytes, round(estimated_duration, 1)
+        info = probe(audio_bytes)
+        if info is not None:
+            return audio_bytes, round(info.duration, 1)
+        # 无法解析（如占位音频）时按字数估算：中文约每秒4个字，0.9倍速
+        logger.warning("Broadcast audio could not be probed, estimating duration")
+        return audio_bytes, round(len(text) / (4 * 0.9), 1)
 
 
 # 模块级单例
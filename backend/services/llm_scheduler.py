@@ -0,0 +1,200 @@
+"""Priority-aware concurrency scheduler for Doubao (Ark) LLM calls.
+
+All LLM work competes for a limited number of concurrent Ark requests.  The
+scheduler grants slots in priority order
+
+    emergency > interactive (live chat / intent) > summary > broadcast
+
+with an additional per-class concurrency limit, so a burst of broadcast
+generation can never occupy the slots an elder's live reply needs.  Low
+priority classes carry a queue deadline: when Ark is saturated and a request
+waits longer than that, it is shed with :class:`LLMShedError` instead of
+piling up behind interactive traffic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority(IntEnum):
+    """Work classes for LLM calls; lower value = higher priority."""
+
+    EMERGENCY = 0
+    INTERACTIVE = 1
+    SUMMARY = 2
+    BROADCAST = 3
+
+
+class LLMShedError(RuntimeError):
+    """Raised when queued low-priority LLM work misses its queue deadline."""
+
+
+class _ClassStats:
+    """Per-class counters and queue-time accounting."""
+
+    __slots__ = ("running", "queued", "completed", "shed", "queue_time_total", "queue_time_max")
+
+    def __init__(self) -> None:
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.shed = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+
+    def record_wait(self, waited: float) -> None:
+        self.queue_time_total += waited
+        self.queue_time_max = max(self.queue_time_max, waited)
+
+    def as_dict(self) -> dict[str, float | int]:
+        granted = self.completed + self.running
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "completed": self.completed,
+            "shed": self.shed,
+            "queue_time_avg_ms": round(self.queue_time_total / granted * 1000, 1) if granted else 0.0,
+            "queue_time_max_ms": round(self.queue_time_max * 1000, 1),
+        }
+
+
+class LLMScheduler:
+    """Grants LLM call slots by priority under global and per-class limits."""
+
+    def __init__(
+        self,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+        class_limits: dict[LLMPriority, int] | None = None,
+        queue_deadlines: dict[LLMPriority, float | None] | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.class_limits = class_limits or {
+            LLMPriority.EMERGENCY: settings.LLM_CONCURRENCY_EMERGENCY,
+            LLMPriority.INTERACTIVE: settings.LLM_CONCURRENCY_INTERACTIVE,
+            LLMPriority.SUMMARY: settings.LLM_CONCURRENCY_SUMMARY,
+            LLMPriority.BROADCAST: settings.LLM_CONCURRENCY_BROADCAST,
+        }
+        self.queue_deadlines = queue_deadlines or {
+            LLMPriority.EMERGENCY: None,
+            LLMPriority.INTERACTIVE: None,
+            LLMPriority.SUMMARY: settings.LLM_QUEUE_DEADLINE_SUMMARY_SECONDS,
+            LLMPriority.BROADCAST: settings.LLM_QUEUE_DEADLINE_BROADCAST_SECONDS,
+        }
+        self._running = 0
+        self._seq = itertools.count()
+        # Sorted by (priority, arrival order)
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._stats = {p: _ClassStats() for p in LLMPriority}
+
+    # ------------------------------------------------------------------
+    # Slot management
+    # ------------------------------------------------------------------
+
+    def _has_capacity(self, priority: LLMPriority) -> bool:
+        return (
+            self._running < self.max_concurrency
+            and self._stats[priority].running < self.class_limits.get(priority, self.max_concurrency)
+        )
+
+    def _grant(self, priority: LLMPriority) -> None:
+        self._running += 1
+        self._stats[priority].running += 1
+
+    def _release(self, priority: LLMPriority) -> None:
+        self._running -= 1
+        stats = self._stats[priority]
+        stats.running -= 1
+        stats.completed += 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the highest-priority eligible waiters."""
+        i = 0
+        while i < len(self._waiters) and self._running < self.max_concurrency:
+            priority, _seq, fut = self._waiters[i]
+            if fut.done():
+                self._waiters.pop(i)
+                continue
+            if self._has_capacity(LLMPriority(priority)):
+                self._waiters.pop(i)
+                self._grant(LLMPriority(priority))
+                fut.set_result(None)
+                continue
+            i += 1
+
+    def _remove_waiter(self, fut: asyncio.Future[None]) -> None:
+        for i, (_p, _s, waiter) in enumerate(self._waiters):
+            if waiter is fut:
+                self._waiters.pop(i)
+                return
+
+    @asynccontextmanager
+    async def slot(self, priority: LLMPriority) -> AsyncIterator[None]:
+        """Hold one LLM concurrency slot for the duration of the block.
+
+        Raises:
+            LLMShedError: If the class has a queue deadline and no slot was
+                granted within it.
+        """
+        stats = self._stats[priority]
+        start = time.monotonic()
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiters, (int(priority), next(self._seq), fut), key=lambda w: w[:2])
+        self._dispatch()
+
+        if not fut.done():
+            stats.queued += 1
+            try:
+                await asyncio.wait({fut}, timeout=self.queue_deadlines.get(priority))
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._release(priority)
+                else:
+                    self._remove_waiter(fut)
+                raise
+            finally:
+                stats.queued -= 1
+
+            if not fut.done():
+                self._remove_waiter(fut)
+                fut.cancel()
+                stats.shed += 1
+                logger.warning(
+                    "LLM request shed: class=%s waited=%.2fs running=%d queued=%d",
+                    priority.name,
+                    time.monotonic() - start,
+                    self._running,
+                    len(self._waiters),
+                )
+                raise LLMShedError("豆包LLM服务繁忙，请稍后再试")
+
+        stats.record_wait(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def stats(self) -> dict[str, dict[str, float | int]]:
+        """Return per-class running/queued/shed counts and queue times."""
+        return {p.name.lower(): self._stats[p].as_dict() for p in LLMPriority}
+
+
+# Module-level singleton
+llm_scheduler = LLMScheduler()
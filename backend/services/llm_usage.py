@@ -0,0 +1,237 @@
+"""LLM token-usage and latency accounting.
+
+Every Ark call made by ``DoubaoService`` is recorded with its prompt and
+completion tokens (from the response ``usage`` block, estimated when absent),
+Ark latency, queue time and outcome, tagged by feature (chat, intent,
+summary, broadcast, turn, voice) and user.
+
+Records are aggregated in memory per (feature, user).  A background loop
+flushes the deltas of each window to the ``llm_usage_stats`` table; the
+cumulative view is served by the admin metrics endpoint.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from core.config import settings
+from services.supabase_client import postgrest
+
+logger = logging.getLogger(__name__)
+
+
+class _UsageBucket:
+    """Aggregated usage of one (feature, user) pair."""
+
+    __slots__ = (
+        "calls",
+        "errors",
+        "prompt_tokens",
+        "completion_tokens",
+        "estimated_calls",
+        "latency_ms_total",
+        "latency_ms_max",
+        "queue_ms_total",
+        "outcomes",
+    )
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_calls = 0
+        self.latency_ms_total = 0.0
+        self.latency_ms_max = 0.0
+        self.queue_ms_total = 0.0
+        self.outcomes: dict[str, int] = {}
+
+    def add(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency_ms: float,
+        queue_ms: float,
+        outcome: str,
+        estimated: bool,
+    ) -> None:
+        self.calls += 1
+        if outcome == "error":
+            self.errors += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        if estimated:
+            self.estimated_calls += 1
+        self.latency_ms_total += latency_ms
+        self.latency_ms_max = max(self.latency_ms_max, latency_ms)
+        self.queue_ms_total += queue_ms
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def merge(self, other: "_UsageBucket") -> None:
+        self.calls += other.calls
+        self.errors += other.errors
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.estimated_calls += other.estimated_calls
+        self.latency_ms_total += other.latency_ms_total
+        self.latency_ms_max = max(self.latency_ms_max, other.latency_ms_max)
+        self.queue_ms_total += other.queue_ms_total
+        for outcome, count in other.outcomes.items():
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self) -> dict:
+        # Coalesced waiters never reach Ark; keep them out of the latency mean
+        ark_calls = self.calls - self.outcomes.get("coalesced", 0)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "estimated_calls": self.estimated_calls,
+            "latency_ms_avg": round(self.latency_ms_total / ark_calls, 1) if ark_calls else 0.0,
+            "latency_ms_max": round(self.latency_ms_max, 1),
+            "queue_ms_avg": round(self.queue_ms_total / ark_calls, 1) if ark_calls else 0.0,
+            "outcomes": dict(self.outcomes),
+        }
+
+
+class LLMUsageRecorder:
+    """Aggregates per-call LLM usage and periodically flushes it to the database."""
+
+    def __init__(
+        self,
+        flush_interval: float = settings.LLM_USAGE_FLUSH_INTERVAL_SECONDS,
+        table: str = "llm_usage_stats",
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.table = table
+        self._totals: dict[tuple[str, str], _UsageBucket] = {}
+        self._pending: dict[tuple[str, str], _UsageBucket] = {}
+        self._window_start = datetime.now(timezone.utc)
+        self._task: asyncio.Task | None = None
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def record(
+        self,
+        feature: str,
+        user_id: str | None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency_ms: float = 0.0,
+        queue_ms: float = 0.0,
+        outcome: str = "ok",
+        estimated: bool = False,
+    ) -> None:
+        """Record one LLM call (or coalesced wait) for *feature* and *user_id*."""
+        key = (feature, user_id or "anonymous")
+        for buckets in (self._totals, self._pending):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = _UsageBucket()
+            bucket.add(prompt_tokens, completion_tokens, latency_ms, queue_ms, outcome, estimated)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def snapshot(self, top_users: int = 20) -> dict:
+        """Return cumulative usage by feature, overall and for the top users."""
+        overall = _UsageBucket()
+        by_feature: dict[str, _UsageBucket] = {}
+        by_user: dict[str, _UsageBucket] = {}
+        for (feature, user_id), bucket in self._totals.items():
+            overall.merge(bucket)
+            by_feature.setdefault(feature, _UsageBucket()).merge(bucket)
+            by_user.setdefault(user_id, _UsageBucket()).merge(bucket)
+
+        top = sorted(by_user.items(), key=lambda item: item[1].total_tokens, reverse=True)
+        return {
+            "overall": overall.as_dict(),
+            "by_feature": {feature: b.as_dict() for feature, b in sorted(by_feature.items())},
+            "top_users": [
+                {"user_id": user_id, **b.as_dict()} for user_id, b in top[:top_users]
+            ],
+        }
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Write the current window's deltas to the usage table.
+
+        Returns:
+            Number of rows written.  On failure the deltas are kept and
+            retried with the next window.
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        window_start = self._window_start
+        window_end = datetime.now(timezone.utc)
+        rows = [
+            {
+                "window_start": window_start.isoformat(),
+                "window_end": window_end.isoformat(),
+                "feature": feature,
+                "user_id": None if user_id == "anonymous" else user_id,
+                "calls": b.calls,
+                "errors": b.errors,
+                "prompt_tokens": b.prompt_tokens,
+                "completion_tokens": b.completion_tokens,
+                "latency_ms_total": round(b.latency_ms_total, 1),
+                "latency_ms_max": round(b.latency_ms_max, 1),
+                "queue_ms_total": round(b.queue_ms_total, 1),
+                "outcomes": b.outcomes,
+            }
+            for (feature, user_id), b in pending.items()
+        ]
+
+        try:
+            await asyncio.to_thread(
+                lambda: postgrest.from_(self.table).insert(rows).execute()
+            )
+        except Exception as exc:
+            logger.warning("LLM usage flush failed (%d rows kept): %s", len(rows), exc)
+            for key, bucket in pending.items():
+                self._pending.setdefault(key, _UsageBucket()).merge(bucket)
+            return 0
+
+        self._window_start = window_end
+        return len(rows)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Start the periodic flush loop on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write any remaining deltas."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Module-level singleton
+llm_usage = LLMUsageRecorder()
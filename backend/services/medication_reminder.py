@@ -0,0 +1,188 @@
+"""用药提醒语音服务 — 模板分段合成与 MP3 帧拼接。
+
+提醒语句（如 "张阿姨，该吃{medicine_name}了，{dosage}"）只有少数槽位会变。
+模板的固定片段与每个药名/剂量/称呼的槽位音频各自合成一次并进入 TTS 缓存，
+提醒时按 MP3 帧边界拼接成整句，无需再做整句 TTS。拼接结果也以整句文本写入
+TTS 缓存，之后同一提醒直接命中缓存。
+
+启动时会为所有启用提醒的 medication_plans 预先生成提醒音频。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import string
+
+from core.config import settings
+from services.mp3_frames import splice
+from services.supabase_client import postgrest
+from services.tts_cache import tts_cache
+from services.voice_service import voice_service
+
+logger = logging.getLogger(__name__)
+
+# 模板中允许的槽位
+_SLOTS = ("name", "medicine_name", "dosage")
+
+
+def _speakable(text: str) -> bool:
+    """片段中含有可朗读的文字（纯标点/空白的片段不单独合成）。"""
+    return any(ch.isalnum() for ch in text)
+
+
+class MedicationReminderSpeech:
+    """按模板拼接用药提醒语音。"""
+
+    def __init__(
+        self,
+        template: str = settings.MEDICATION_REMINDER_TEMPLATE,
+        voice_type: str = "zh_female_cancan",
+    ) -> None:
+        parts = list(string.Formatter().parse(template))
+        for _literal, field, _spec, _conv in parts:
+            if field is not None and field not in _SLOTS:
+                raise ValueError(f"unknown reminder template slot: {field}")
+        self.template = template
+        self.voice_type = voice_type
+        self._parts = parts
+        self.renders = 0
+        self.spliced = 0
+        self.fallbacks = 0
+
+    # ------------------------------------------------------------------
+    # 文本
+    # ------------------------------------------------------------------
+
+    def reminder_text(self, **slots: str) -> str:
+        """返回完整提醒文本。"""
+        return self.template.format(**{key: slots.get(key, "") for key in _SLOTS})
+
+    def segments(self, **slots: str) -> list[str]:
+        """返回按固定片段/槽位切分的待合成文本（已去掉纯标点片段）。"""
+        segments: list[str] = []
+        for literal, field, _spec, _conv in self._parts:
+            if literal and _speakable(literal):
+                segments.append(literal)
+            if field is not None:
+                value = (slots.get(field) or "").strip()
+                if _speakable(value):
+                    segments.append(value)
+        return segments
+
+    # ------------------------------------------------------------------
+    # 音频
+    # ------------------------------------------------------------------
+
+    async def render(
+        self,
+        *,
+        name: str,
+        medicine_name: str,
+        dosage: str,
+        speed: float = 1.0,
+    ) -> bytes:
+        """生成一条提醒的 MP3 音频。
+
+        优先命中整句缓存；否则合成（或从缓存取）各片段并按帧拼接。片段
+        参数不一致无法拼接时，退回整句合成。
+        """
+        slots = {"name": name, "medicine_name": medicine_name, "dosage": dosage}
+        text = self.reminder_text(**slots)
+        self.renders += 1
+
+        configured = voice_service.tts_configured
+        if configured:
+            cached = tts_cache.get(text, speed, self.voice_type)
+            if cached is not None:
+                return cached
+
+        clips = await asyncio.gather(*(
+            voice_service.text_to_speech(segment, speed=speed, voice_type=self.voice_type)
+            for segment in self.segments(**slots)
+        ))
+        try:
+            audio = splice(list(clips))
+            self.spliced += 1
+        except ValueError as exc:
+            logger.warning("Reminder splice failed, synthesising whole sentence: %s", exc)
+            self.fallbacks += 1
+            audio = await voice_service.text_to_speech(text, speed=speed, voice_type=self.voice_type)
+
+        # 未配置 TTS 时片段是占位音频，不写入缓存
+        if configured:
+            tts_cache.put(text, speed, self.voice_type, audio)
+        return audio
+
+    async def render_plan(self, plan: dict, user: dict | None = None) -> bytes:
+        """为一条 medication_plans 记录生成提醒音频。"""
+        user = user or {}
+        dosage = plan.get("dosage") or ""
+        unit = plan.get("unit") or ""
+        if unit and unit not in dosage:
+            dosage = f"{dosage}{unit}"
+        speed = user.get("voice_speed") or 1.0
+        return await self.render(
+            name=user.get("name") or "",
+            medicine_name=plan.get("medicine_name") or "",
+            dosage=dosage,
+            speed=min(max(float(speed), 0.5), 2.0),
+        )
+
+    async def prewarm_active_plans(self, concurrency: int = 4) -> int:
+        """为所有启用提醒的用药计划预生成提醒音频。
+
+        Returns:
+            成功生成的提醒数。
+        """
+        try:
+            plans = await asyncio.to_thread(
+                lambda: postgrest.from_("medication_plans")
+                .select("id, user_id, medicine_name, dosage, unit")
+                .eq("is_active", True)
+                .eq("remind_enabled", True)
+                .execute()
+                .data
+                or []
+            )
+            user_ids = sorted({p["user_id"] for p in plans if p.get("user_id")})
+            users = await asyncio.to_thread(
+                lambda: postgrest.from_("users")
+                .select("id, name, voice_speed")
+                .in_("id", user_ids)
+                .execute()
+                .data
+                or []
+            ) if user_ids else []
+        except Exception as exc:
+            logger.warning("Medication reminder prewarm skipped: %s", exc)
+            return 0
+
+        users_by_id = {u["id"]: u for u in users}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(plan: dict) -> bool:
+            async with semaphore:
+                try:
+                    await self.render_plan(plan, users_by_id.get(plan.get("user_id")))
+                    return True
+                except Exception as exc:
+                    logger.warning("Reminder prewarm failed: plan=%s error=%s", plan.get("id"), exc)
+                    return False
+
+        results = await asyncio.gather(*(_one(plan) for plan in plans))
+        done = sum(results)
+        logger.info("Medication reminders prewarmed: %d/%d", done, len(plans))
+        return done
+
+    def stats(self) -> dict[str, int]:
+        """返回生成/拼接/整句回退次数。"""
+        return {
+            "renders": self.renders,
+            "spliced": self.spliced,
+            "fallbacks": self.fallbacks,
+        }
+
+
+# Module-level singleton
+medication_reminder_speech = MedicationReminderSpeech()
@@ -0,0 +1,200 @@
+"""MPEG audio frame parsing and frame-boundary splicing.
+
+MP3 streams are sequences of self-contained frames, so clips encoded with
+the same parameters can be joined by concatenating their frames.  Container
+metadata has to go first: an ID3v2 tag at the start, an ID3v1 tag at the
+end, and the Xing/Info (LAME) or VBRI frame whose frame count would describe
+only the first clip.
+"""
+
+from __future__ import annotations
+
+import struct
+from typing import Iterator, NamedTuple
+
+# Bitrates (kbps) by [version is MPEG-1][layer][index]
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates (Hz) by version bits: 0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1
+_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+
+class FrameHeader(NamedTuple):
+    """Decoded fields of one MPEG audio frame header."""
+
+    version: int  # 1, 2 or 25 (MPEG-2.5)
+    layer: int
+    bitrate: int  # bits per second
+    sample_rate: int
+    channels: int
+    length: int  # frame length in bytes, header included
+    samples: int  # samples per channel in this frame
+
+
+def parse_frame_header(data: bytes | memoryview, offset: int = 0) -> FrameHeader | None:
+    """Decode the frame header at *offset*, or return None if there is none."""
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None  # reserved / free-format / bad values
+
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 0x03 else 2
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    version = 1 if mpeg1 else (2 if version_bits == 2 else 25)
+    return FrameHeader(version, layer, bitrate, sample_rate, channels, length, samples)
+
+
+def id3v2_size(data: bytes | memoryview) -> int:
+    """Return the size of a leading ID3v2 tag (0 if absent)."""
+    if len(data) < 10 or bytes(data[:3]) != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _side_info_size(header: FrameHeader) -> int:
+    if header.version == 1:
+        return 17 if header.channels == 1 else 32
+    return 9 if header.channels == 1 else 17
+
+
+def is_info_frame(data: bytes | memoryview, offset: int, header: FrameHeader) -> bool:
+    """Return True if the frame at *offset* is a Xing/Info or VBRI tag frame."""
+    xing = offset + 4 + _side_info_size(header)
+    if bytes(data[xing:xing + 4]) in (b"Xing", b"Info"):
+        return True
+    return bytes(data[offset + 36:offset + 40]) == b"VBRI"
+
+
+class InfoTag(NamedTuple):
+    """Stream totals recorded in a Xing/Info (LAME) or VBRI frame."""
+
+    frames: int | None  # audio frames, the tag frame itself excluded
+    size: int | None  # stream bytes
+    delay: int  # encoder delay in samples (LAME only)
+    padding: int  # end padding in samples (LAME only)
+
+
+def read_info_tag(data: bytes | memoryview, offset: int, header: FrameHeader) -> InfoTag | None:
+    """Decode the Xing/Info or VBRI tag in the frame at *offset*, if any."""
+    view = memoryview(data)
+    pos = offset + 4 + _side_info_size(header)
+    if view[pos:pos + 4] in (b"Xing", b"Info") and pos + 8 <= len(view):
+        (flags,) = struct.unpack_from(">I", view, pos + 4)
+        pos += 8
+        fields: dict[int, int] = {}
+        for flag, width in ((0x1, 4), (0x2, 4), (0x4, 100), (0x8, 4)):
+            if flags & flag:
+                if pos + width > len(view):
+                    return None
+                if width == 4:
+                    (fields[flag],) = struct.unpack_from(">I", view, pos)
+                pos += width
+        delay = padding = 0
+        # LAME extension: 12-bit encoder delay and padding 21 bytes in
+        if view[pos:pos + 4] == b"LAME" and pos + 24 <= len(view):
+            b0, b1, b2 = view[pos + 21], view[pos + 22], view[pos + 23]
+            delay = (b0 << 4) | (b1 >> 4)
+            padding = ((b1 & 0x0F) << 8) | b2
+        return InfoTag(fields.get(0x1), fields.get(0x2), delay, padding)
+
+    pos = offset + 36
+    if view[pos:pos + 4] == b"VBRI" and pos + 18 <= len(view):
+        size, frames = struct.unpack_from(">II", view, pos + 10)
+        return InfoTag(frames, size, 0, 0)
+    return None
+
+
+def iter_frames(data: bytes | memoryview) -> Iterator[tuple[int, FrameHeader]]:
+    """Yield ``(offset, header)`` for each audio frame in an MP3 stream.
+
+    Leading ID3v2 data is skipped and junk between frames is resynchronised
+    byte by byte; a trailing ID3v1 tag or truncated last frame ends the walk.
+    """
+    view = memoryview(data)
+    offset = id3v2_size(view)
+    end = len(view)
+    if end >= 128 and bytes(view[end - 128:end - 125]) == b"TAG":
+        end -= 128
+    while offset + 4 <= end:
+        header = parse_frame_header(view, offset)
+        if header is None or header.length < 4:
+            offset += 1
+            continue
+        if offset + header.length > end:
+            break
+        yield offset, header
+        offset += header.length
+
+
+def audio_frames(data: bytes) -> tuple[bytes, FrameHeader | None]:
+    """Return only the audio frames of *data* and the first frame's header.
+
+    Tags and the Xing/Info/VBRI frame are dropped.
+    """
+    view = memoryview(data)
+    parts: list[memoryview] = []
+    first: FrameHeader | None = None
+    for index, (offset, header) in enumerate(iter_frames(view)):
+        if index == 0 and is_info_frame(view, offset, header):
+            continue
+        if first is None:
+            first = header
+        parts.append(view[offset:offset + header.length])
+    return b"".join(parts), first
+
+
+def splice(clips: list[bytes]) -> bytes:
+    """Join MP3 clips at frame boundaries into one stream.
+
+    Raises:
+        ValueError: If a clip contains no frames or the clips differ in
+            sample rate or channel count (they would not play back as one
+            stream).
+    """
+    parts: list[bytes] = []
+    reference: FrameHeader | None = None
+    for clip in clips:
+        frames, header = audio_frames(clip)
+        if header is None:
+            raise ValueError("clip contains no MPEG audio frames")
+        if reference is None:
+            reference = header
+        elif (header.sample_rate, header.channels) != (reference.sample_rate, reference.channels):
+            raise ValueError("clips use different sample rates or channel layouts")
+        parts.append(frames)
+    return b"".join(parts)
@@ -0,0 +1,273 @@
+"""健康广播推荐缓存 — 按人群分段缓存排序结果，按用户过滤已播放内容。
+
+推荐结果只取决于人群分段（季节、年龄段、慢性病组合）和每个用户少量的已播放
+列表，成千上万的老人共享同一分段。因此分三层缓存，命中时推荐请求不访问数据库：
+
+- 分段排序：每个分段缓存前 ``RADIO_SEGMENT_DEPTH`` 个候选 ID，有效期
+  ``RADIO_SEGMENT_CACHE_TTL_SECONDS``；推荐索引内容变化（发布、下架、重建）后
+  自动失效；
+- 用户画像：出生日期、慢性病推导出的推荐过滤条件，用户修改资料时失效；
+- 已播放列表：首次加载后由播放记录接口增量追加。
+
+用户级过滤（精确年龄区间、排除已播放）在分段结果之上进行；过滤后不足
+``limit`` 条且分段结果被截断时，回退到索引全量排序。
+
+用户有收听记录时，再与协同过滤（见 services.broadcast_cf）融合：由最近收听的
+广播查近邻得到 CF 分，只保留通过季节/年龄过滤的广播，最终得分为
+内容得分 + ``RADIO_CF_WEIGHT`` × 归一化 CF 分。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+
+from core.config import settings
+from services.broadcast_cf import CollaborativeFilter, broadcast_cf, play_weight
+from services.broadcast_index import BroadcastIndex, age_band, age_matches, broadcast_index
+from services.health_broadcast import health_broadcast_service
+from services.supabase_client import postgrest
+
+_SEGMENT_STATS_TOP = 20
+
+Segment = tuple[str | None, int | None, frozenset[str]]
+
+
+def segment_of(filters: dict) -> Segment:
+    """推荐过滤条件所属的人群分段。"""
+    age = filters.get("age")
+    return (
+        filters.get("season"),
+        None if age is None else age_band(age),
+        frozenset(filters.get("diseases") or ()),
+    )
+
+
+def _segment_label(segment: Segment) -> str:
+    season, band, diseases = segment
+    ages = "any" if band is None else f"{band * 10}-{band * 10 + 9}"
+    return f"{season or 'any'}|{ages}|{','.join(sorted(diseases)) or 'none'}"
+
+
+@dataclass
+class _SegmentEntry:
+    ranked: list[tuple[str, float]]
+    version: int
+    expires: float
+
+
+@dataclass
+class _UserEntry:
+    filters: dict
+    played: set[str]
+    # 最近收听（协同过滤种子）：广播 ID -> 反馈权重，最新的在后
+    seeds: dict[str, float]
+    expires: float
+
+
+@dataclass
+class _SegmentCounts:
+    hits: int = 0
+    misses: int = 0
+
+
+class RadioRecommender:
+    """带分段缓存的广播推荐。"""
+
+    def __init__(
+        self,
+        index: BroadcastIndex = broadcast_index,
+        segment_ttl: float = settings.RADIO_SEGMENT_CACHE_TTL_SECONDS,
+        depth: int = settings.RADIO_SEGMENT_DEPTH,
+        max_segments: int = settings.RADIO_SEGMENT_CACHE_MAX,
+        user_ttl: float = settings.RADIO_USER_CACHE_TTL_SECONDS,
+        max_users: int = settings.RADIO_USER_CACHE_MAX,
+        cf: CollaborativeFilter = broadcast_cf,
+        cf_weight: float = settings.RADIO_CF_WEIGHT,
+        max_seeds: int = settings.RADIO_CF_SEEDS,
+    ) -> None:
+        self.index = index
+        self.cf = cf
+        self.cf_weight = cf_weight
+        self.max_seeds = max_seeds
+        self.segment_ttl = segment_ttl
+        self.depth = depth
+        self.max_segments = max_segments
+        self.user_ttl = user_ttl
+        self.max_users = max_users
+
+        self._segments: OrderedDict[Segment, _SegmentEntry] = OrderedDict()
+        self._users: OrderedDict[str, _UserEntry] = OrderedDict()
+        self._segment_counts: dict[Segment, _SegmentCounts] = defaultdict(_SegmentCounts)
+        self.user_hits = 0
+        self.user_misses = 0
+        self.fallbacks = 0
+        self.blended = 0
+
+    # ------------------------------------------------------------------
+    # 推荐
+    # ------------------------------------------------------------------
+
+    async def recommend(self, user_id: str, limit: int) -> list[dict]:
+        """返回用户的前 *limit* 条推荐广播（已排除播放过的）。"""
+        user = await self._user(user_id)
+        await self.index.ensure_loaded()
+
+        filters = user.filters
+        age = filters.get("age")
+        ranked = self._segment(filters)
+        content = {
+            broadcast_id: score
+            for broadcast_id, score in ranked
+            if broadcast_id not in user.played
+            and (row := self.index.row(broadcast_id)) is not None
+            and (age is None or age_matches(row, age))
+        }
+        cf = self.cf.scores(user.seeds) if user.seeds else {}
+        if cf:
+            self.blended += 1
+            self._add_cf_candidates(content, cf, user)
+            top_cf = max(cf.values())
+            best = heapq.nlargest(
+                limit, content, key=lambda i: content[i] + self.cf_weight * cf.get(i, 0.0) / top_cf
+            )
+        else:
+            best = list(content)[:limit]
+
+        if len(best) < limit and len(ranked) >= self.depth:
+            # 分段结果被用户过滤耗尽，退回全量排序
+            self.fallbacks += 1
+            return self.index.rank(filters, exclude=user.played, limit=limit)
+        return [self.index.row(broadcast_id) for broadcast_id in best]
+
+    def _add_cf_candidates(self, content: dict[str, float], cf: dict[str, float], user: _UserEntry) -> None:
+        """加入分段结果之外、通过内容过滤的协同过滤候选及其内容得分。"""
+        season, age = user.filters.get("season"), user.filters.get("age")
+        extra = {
+            broadcast_id
+            for broadcast_id in cf
+            if broadcast_id not in content
+            and broadcast_id not in user.played
+            and self.index.eligible(broadcast_id, season, age)
+        }
+        content.update(self.index.top_scored(extra, user.filters, len(extra)))
+
+    def _segment(self, filters: dict) -> list[tuple[str, float]]:
+        key = segment_of(filters)
+        counts = self._segment_counts[key]
+        entry = self._segments.get(key)
+        now = time.monotonic()
+        if entry is not None and entry.version == self.index.version and entry.expires > now:
+            self._segments.move_to_end(key)
+            counts.hits += 1
+            return entry.ranked
+
+        counts.misses += 1
+        season, band, _diseases = key
+        ranked = self.index.top_scored(self.index.segment_candidates(season, band), filters, self.depth)
+        self._segments[key] = _SegmentEntry(ranked, self.index.version, now + self.segment_ttl)
+        self._segments.move_to_end(key)
+        while len(self._segments) > self.max_segments:
+            self._segments.popitem(last=False)
+        return ranked
+
+    # ------------------------------------------------------------------
+    # 用户画像与播放记录
+    # ------------------------------------------------------------------
+
+    async def _user(self, user_id: str) -> _UserEntry:
+        entry = self._users.get(user_id)
+        if entry is not None and entry.expires > time.monotonic():
+            self._users.move_to_end(user_id)
+            self.user_hits += 1
+            return entry
+
+        self.user_misses += 1
+        user_info, history = await asyncio.to_thread(self._fetch_user, user_id)
+        entry = _UserEntry(
+            filters=health_broadcast_service.build_recommend_filters(user_info),
+            played={row["broadcast_id"] for row in history},
+            seeds={},
+            expires=time.monotonic() + self.user_ttl,
+        )
+        # history 按播放时间倒序
+        for row in reversed(history[: self.max_seeds]):
+            self._add_seed(entry, row["broadcast_id"], row.get("completed"), row.get("liked"))
+        self._users[user_id] = entry
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _fetch_user(user_id: str) -> tuple[dict, list[dict]]:
+        user_rows = (
+            postgrest.from_("users")
+            .select("id,name,birth_date,chronic_diseases,role")
+            .eq("id", user_id)
+            .execute()
+            .data
+            or []
+        )
+        played_rows = (
+            postgrest.from_("broadcast_play_history")
+            .select("broadcast_id,completed,liked")
+            .eq("user_id", user_id)
+            .order("played_at", desc=True)
+            .limit(settings.RADIO_PLAYED_HISTORY_LIMIT)
+            .execute()
+            .data
+            or []
+        )
+        return (user_rows[0] if user_rows else {}), played_rows
+
+    def _add_seed(self, entry: _UserEntry, broadcast_id: str, completed, liked) -> None:
+        weight = max(entry.seeds.pop(broadcast_id, 0.0), play_weight(completed, liked))
+        entry.seeds[broadcast_id] = weight
+        while len(entry.seeds) > self.max_seeds:
+            del entry.seeds[next(iter(entry.seeds))]
+
+    def record_play(
+        self, user_id: str, broadcast_id: str, completed: bool = False, liked: bool = False
+    ) -> None:
+        """播放记录写入后，从该用户后续推荐中排除这条广播，并作为协同过滤种子。"""
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.played.add(broadcast_id)
+            self._add_seed(entry, broadcast_id, completed, liked)
+
+    def forget_user(self, user_id: str) -> None:
+        """用户资料变化后丢弃其缓存画像。"""
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """返回各分段（按请求数取前 20）及用户缓存的命中率。"""
+
+        def rate(hits: int, misses: int) -> float | None:
+            return round(hits / (hits + misses), 3) if hits + misses else None
+
+        busiest = sorted(
+            self._segment_counts.items(),
+            key=lambda item: item[1].hits + item[1].misses,
+            reverse=True,
+        )[:_SEGMENT_STATS_TOP]
+        hits = sum(c.hits for c in self._segment_counts.values())
+        misses = sum(c.misses for c in self._segment_counts.values())
+        return {
+            "segments_cached": len(self._segments),
+            "segment_hit_rate": rate(hits, misses),
+            "segments": {
+                _segment_label(key): {"hits": c.hits, "misses": c.misses, "hit_rate": rate(c.hits, c.misses)}
+                for key, c in busiest
+            },
+            "users_cached": len(self._users),
+            "user_hit_rate": rate(self.user_hits, self.user_misses),
+            "fallbacks": self.fallbacks,
+            "cf_blended": self.blended,
+        }
+
+
+# Module-level singleton
+radio_recommender = RadioRecommender()
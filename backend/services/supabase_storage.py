@@ -0,0 +1,92 @@
+"""Minimal Supabase Storage access over its REST API.
+
+Only objects in this project's Storage (``SUPABASE_URL``) are read or
+written; URLs elsewhere are never fetched server-side.  Object URLs have the
+form ``{SUPABASE_URL}/storage/v1/object/[public/]{bucket}/{path}``.
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import httpx
+
+from core.config import settings
+
+_UPLOAD_TIMEOUT = 30.0
+
+
+class StorageObject(NamedTuple):
+    """Location of an object in Supabase Storage."""
+
+    bucket: str
+    path: str
+    public: bool
+
+    def url(self) -> str:
+        visibility = "public/" if self.public else ""
+        return f"{_object_base()}/{visibility}{self.bucket}/{self.path}"
+
+
+def _object_base() -> str:
+    return f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/object"
+
+
+def storage_object_url(url: str) -> bool:
+    """Return True if *url* points into this project's Supabase Storage."""
+    return bool(settings.SUPABASE_URL) and url.startswith(f"{_object_base()}/")
+
+
+def parse_object_url(url: str) -> StorageObject | None:
+    """Split a Storage object URL into bucket and path."""
+    if not storage_object_url(url):
+        return None
+    rest = url[len(_object_base()) + 1:].split("?", 1)[0]
+    public = rest.startswith("public/")
+    if public:
+        rest = rest[len("public/"):]
+    bucket, _, path = rest.partition("/")
+    if not bucket or not path:
+        return None
+    return StorageObject(bucket, path, public)
+
+
+def storage_headers() -> dict[str, str]:
+    """Request headers for reading (possibly private) Storage objects."""
+    if settings.SUPABASE_SERVICE_ROLE_KEY:
+        return {"Authorization": f"Bearer {settings.SUPABASE_SERVICE_ROLE_KEY}"}
+    return {}
+
+
+async def download(url: str, max_bytes: int) -> bytes:
+    """Read a Storage object into memory.
+
+    Raises:
+        ValueError: If *url* is not a Storage URL or the object is larger
+            than *max_bytes*.
+        httpx.HTTPError: On request failure.
+    """
+    if not storage_object_url(url):
+        raise ValueError("not a Supabase Storage URL")
+    data = bytearray()
+    async with httpx.AsyncClient(timeout=_UPLOAD_TIMEOUT) as client:
+        async with client.stream("GET", url, headers=storage_headers()) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > max_bytes:
+                    raise ValueError("Storage object exceeds the size limit")
+    return bytes(data)
+
+
+async def upload(obj: StorageObject, data: bytes, content_type: str) -> str:
+    """Create or replace an object and return its URL.
+
+    Raises:
+        httpx.HTTPError: On request failure.
+    """
+    headers = {**storage_headers(), "Content-Type": content_type, "x-upsert": "true"}
+    async with httpx.AsyncClient(timeout=_UPLOAD_TIMEOUT) as client:
+        response = await client.post(f"{_object_base()}/{obj.bucket}/{obj.path}", headers=headers, content=data)
+        response.raise_for_status()
+    return obj.url()
@@ -0,0 +1,322 @@
+"""全文搜索 — 基于字二元组 (bigram) 的内存倒排索引与 BM25 排序。
+
+中文不需要分词器：连续汉字切成相邻两字的二元组（同时保留单字，以支持单字
+查询），字母数字按整词小写。查询切出的词项在倒排表中求 BM25 得分：
+
+    score(d) = Σ_t idf(t) · tf·(k1 + 1) / (tf + k1·(1 − b + b·|d| / avgdl))
+
+两个语料分别建索引，均增量维护，查询不再对 PostgREST 做 LIKE 扫描：
+
+- 对话记录 (:class:`ConversationSearch`)：每位用户一个索引，首次搜索时从
+  ai_conversations 读取最近 ``SEARCH_CONVERSATION_HISTORY_LIMIT`` 条建立，之后
+  每保存一轮对话就写入；按 LRU 最多保留 ``SEARCH_CONVERSATION_USERS_MAX`` 位用户。
+- 广播目录 (:class:`BroadcastSearch`)：跟随推荐索引 (services.broadcast_index)，
+  不单独查询数据库。推荐索引内容变化（含定时重建）后，下一次搜索只重新切分
+  文本有变化的广播；返回的记录也取自推荐索引，因此下架、Opus 版本回填与
+  播放计数都会反映在搜索结果中。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Iterable
+
+from core.config import settings
+from services.broadcast_index import BroadcastIndex, broadcast_index
+from services.supabase_client import postgrest
+
+_PAGE_SIZE = 1000
+_SNIPPET_CHARS = 60
+
+# 汉字（含扩展 A 区）连续片段，或字母数字词
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9]+")
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+
+
+def _normalize(text: str) -> str:
+    # NFKC 统一全角字母数字和兼容字符
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str) -> list[str]:
+    """文档词项：汉字二元组与单字，字母数字整词。"""
+    terms: list[str] = []
+    for run in _TOKEN_RE.findall(_normalize(text)):
+        if _CJK_RE.match(run):
+            terms.extend(run)
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+def query_terms(query: str) -> list[str]:
+    """查询词项：多字片段只取二元组，单字片段取单字；去重保序。"""
+    terms: list[str] = []
+    for run in _TOKEN_RE.findall(_normalize(query)):
+        if _CJK_RE.match(run) and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))
+
+
+def snippet(text: str, query: str, width: int = _SNIPPET_CHARS) -> str:
+    """截取命中位置附近的一段文字。"""
+    normalized = _normalize(text)
+    positions = [p for p in (normalized.find(t) for t in query_terms(query)) if p >= 0]
+    if len(text) <= width:
+        return text
+    start = max(min(positions, default=0) - width // 4, 0)
+    end = min(start + width, len(text))
+    start = max(end - width, 0)
+    return ("…" if start > 0 else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+class InvertedIndex:
+    """单个语料的倒排索引，支持增量增删与 BM25 查询。"""
+
+    def __init__(self, k1: float = settings.SEARCH_BM25_K1, b: float = settings.SEARCH_BM25_B) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[str, int]] = {}
+        self._doc_terms: dict[str, tuple[str, ...]] = {}
+        self._doc_len: dict[str, int] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: str, text: str) -> None:
+        """写入（或替换）一篇文档。"""
+        self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = tuple(counts)
+        length = sum(counts.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def search(self, query: str, limit: int = 20) -> list[tuple[str, float]]:
+        """返回 BM25 得分最高的 *limit* 篇文档 (doc_id, score)。"""
+        n = len(self._doc_len)
+        if n == 0:
+            return []
+        avgdl = self._total_len / n or 1.0
+        k1, b = self.k1, self.b
+        scores: dict[str, float] = {}
+        for term in query_terms(query):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings.items():
+                norm = k1 * (1 - b + b * self._doc_len[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:limit]
+
+    def stats(self) -> dict:
+        return {"documents": len(self._doc_len), "terms": len(self._postings)}
+
+
+# ---------------------------------------------------------------------------
+# 对话记录
+# ---------------------------------------------------------------------------
+
+
+def conversation_text(row: dict) -> str:
+    """对话记录的可搜索文本（兼容 role/content 与 user_input/ai_response 两种记录）。"""
+    if row.get("content"):
+        return row["content"]
+    return "\n".join(part for part in (row.get("user_input"), row.get("ai_response")) if part)
+
+
+class _UserCorpus:
+    def __init__(self) -> None:
+        self.index = InvertedIndex()
+        self.rows: dict[str, dict] = {}
+
+    def add(self, row: dict) -> None:
+        self.rows[row["id"]] = row
+        self.index.add(row["id"], conversation_text(row))
+
+
+class ConversationSearch:
+    """按用户划分的对话记录索引。"""
+
+    def __init__(
+        self,
+        max_users: int = settings.SEARCH_CONVERSATION_USERS_MAX,
+        history_limit: int = settings.SEARCH_CONVERSATION_HISTORY_LIMIT,
+    ) -> None:
+        self.max_users = max_users
+        self.history_limit = history_limit
+        self._users: OrderedDict[str, _UserCorpus] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        # 加载期间保存的记录，加载完成后补写，避免漏掉
+        self._pending: dict[str, list[dict]] = {}
+        self.searches = 0
+        self.loads = 0
+        self.added = 0
+
+    def add(self, user_id: str, rows: Iterable[dict]) -> None:
+        """写入新保存的对话记录；该用户的索引尚未加载时忽略（加载时会读到）。"""
+        rows = [row for row in rows if isinstance(row, dict) and row.get("id")]
+        if user_id in self._pending:
+            self._pending[user_id].extend(rows)
+            return
+        corpus = self._users.get(user_id)
+        if corpus is None:
+            return
+        for row in rows:
+            corpus.add(row)
+            self.added += 1
+
+    async def _corpus(self, user_id: str) -> _UserCorpus:
+        corpus = self._users.get(user_id)
+        if corpus is None:
+            lock = self._locks.setdefault(user_id, asyncio.Lock())
+            async with lock:
+                corpus = self._users.get(user_id)
+                if corpus is None:
+                    self._pending[user_id] = []
+                    try:
+                        rows = await asyncio.to_thread(self._fetch, user_id)
+                    finally:
+                        pending = self._pending.pop(user_id)
+                    corpus = _UserCorpus()
+                    for row in [*rows, *pending]:
+                        corpus.add(row)
+                    self._users[user_id] = corpus
+                    self.loads += 1
+                    while len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+            self._locks.pop(user_id, None)
+        self._users.move_to_end(user_id)
+        return corpus
+
+    def _fetch(self, user_id: str) -> list[dict]:
+        rows: list[dict] = []
+        while len(rows) < self.history_limit:
+            size = min(_PAGE_SIZE, self.history_limit - len(rows))
+            page = (
+                postgrest.from_("ai_conversations")
+                .select("*")
+                .eq("user_id", user_id)
+                .order("created_at", desc=True)
+                .range(len(rows), len(rows) + size - 1)
+                .execute()
+                .data
+                or []
+            )
+            rows.extend(page)
+            if len(page) < size:
+                break
+        return rows
+
+    async def search(self, user_id: str, query: str, limit: int = 20) -> list[tuple[dict, float]]:
+        """在用户的对话记录中搜索，返回 (记录, 得分)。"""
+        corpus = await self._corpus(user_id)
+        self.searches += 1
+        return [(corpus.rows[doc_id], score) for doc_id, score in corpus.index.search(query, limit)]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "documents": sum(len(c.index) for c in self._users.values()),
+            "searches": self.searches,
+            "loads": self.loads,
+            "added": self.added,
+        }
+
+
+# ---------------------------------------------------------------------------
+# 广播目录
+# ---------------------------------------------------------------------------
+
+
+def broadcast_text(row: dict) -> str:
+    """广播的可搜索文本：标题（计两次以加权）、分类、慢性病与正文。"""
+    title = row.get("title") or ""
+    return "\n".join([
+        title,
+        title,
+        row.get("category") or "",
+        " ".join(row.get("target_diseases") or []),
+        row.get("content") or "",
+    ])
+
+
+class BroadcastSearch:
+    """已发布广播的全文索引，与推荐索引同步。"""
+
+    def __init__(self, source: BroadcastIndex = broadcast_index) -> None:
+        self.source = source
+        self.index = InvertedIndex()
+        self._texts: dict[str, str] = {}
+        self._version: int | None = None
+        self.searches = 0
+        self.syncs = 0
+
+    async def ensure_loaded(self) -> None:
+        """加载推荐索引（过期时它在后台重建），并同步其变化。
+
+        Raises:
+            Exception: 推荐索引首次加载时数据库查询失败。
+        """
+        await self.source.ensure_loaded()
+        if self._version != self.source.version:
+            self._sync()
+
+    def _sync(self) -> None:
+        rows = {row["id"]: row for row in self.source.rows()}
+        for broadcast_id in [b for b in self._texts if b not in rows]:
+            del self._texts[broadcast_id]
+            self.index.remove(broadcast_id)
+        for broadcast_id, row in rows.items():
+            text = broadcast_text(row)
+            if self._texts.get(broadcast_id) != text:
+                self._texts[broadcast_id] = text
+                self.index.add(broadcast_id, text)
+        self._version = self.source.version
+        self.syncs += 1
+
+    async def search(self, query: str, limit: int = 20) -> list[tuple[dict, float]]:
+        """搜索广播目录，返回 (推荐索引中的最新记录, 得分)。"""
+        await self.ensure_loaded()
+        self.searches += 1
+        hits = []
+        for doc_id, score in self.index.search(query, limit):
+            row = self.source.row(doc_id)
+            if row is not None:
+                hits.append((row, score))
+        return hits
+
+    def stats(self) -> dict:
+        return {**self.index.stats(), "searches": self.searches, "syncs": self.syncs}
+
+
+# Module-level singletons
+conversation_search = ConversationSearch()
+broadcast_search = BroadcastSearch()
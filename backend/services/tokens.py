@@ -0,0 +1,39 @@
+"""Approximate token counting for Doubao prompts.
+
+A real tokenizer is not available offline; these estimates are close enough
+for context budgeting and usage accounting of mostly-Chinese text.
+"""
+
+from __future__ import annotations
+
+# Per-message framing overhead (role markers, separators) in tokens
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _is_cjk(ch: str) -> bool:
+    """Return True for CJK ideographs and full-width punctuation."""
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # CJK Unified Ideographs
+        or 0x3400 <= code <= 0x4DBF   # Extension A
+        or 0x3000 <= code <= 0x303F   # CJK punctuation
+        or 0xFF00 <= code <= 0xFFEF   # Full-width forms
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the token count of *text* for the Doubao tokenizer.
+
+    Chinese characters are counted as roughly one token each; other text
+    (latin letters, digits, spaces) as roughly four characters per token.
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def estimate_message_tokens(message: dict[str, str]) -> int:
+    """Approximate token cost of a single chat message including framing."""
+    return estimate_tokens(message.get("content", "")) + _MESSAGE_OVERHEAD_TOKENS
@@ -0,0 +1,182 @@
+"""Low-bitrate Opus renditions of voice messages and broadcast audio.
+
+Voice messages and TTS output are 128 kbps MP3.  Speech encodes well as
+mono Opus at ``TRANSCODE_OPUS_BITRATE`` (24 kbps by default, about 5x
+smaller), which matters for elders on weak rural mobile links.
+
+Transcoding runs in a background worker pool (an ``ffmpeg`` subprocess per
+job, ``TRANSCODE_WORKERS`` at a time) so sending a message or generating a
+broadcast never waits for it; the caller's completion handler stores the
+rendition.  Responses then pick the rendition from the client's capability
+headers with :func:`client_accepts_opus`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import shutil
+from typing import Awaitable, Callable, Mapping
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+OPUS_CONTENT_TYPE = "audio/ogg"
+
+# Response header for endpoints whose audio URLs depend on client capability
+RENDITION_VARY = "Accept, X-Audio-Codecs"
+
+Source = bytes | Callable[[], Awaitable[bytes]]
+
+
+class TranscodeError(RuntimeError):
+    """ffmpeg failed to produce a rendition."""
+
+
+def client_accepts_opus(headers: Mapping[str, str]) -> bool:
+    """Return True if the client declared it can play Ogg Opus.
+
+    Apps send ``X-Audio-Codecs: opus,mp3``; browsers express it through
+    ``Accept: audio/ogg; codecs=opus``.
+    """
+    codecs = headers.get("x-audio-codecs", "")
+    if "opus" in {codec.strip().lower() for codec in codecs.split(",")}:
+        return True
+    accept = headers.get("accept", "").lower()
+    return "codecs=opus" in accept or "audio/opus" in accept or "audio/ogg" in accept
+
+
+def pick_audio_url(row: Mapping, opus: bool) -> str | None:
+    """The Opus rendition when the client takes it and one exists."""
+    if opus and row.get("audio_opus_url"):
+        return row["audio_opus_url"]
+    return row.get("audio_url")
+
+
+class OpusTranscoder:
+    """Bounded background pool of ffmpeg Opus encodes."""
+
+    def __init__(
+        self,
+        ffmpeg: str | None = None,
+        workers: int = settings.TRANSCODE_WORKERS,
+        queue_size: int = settings.TRANSCODE_QUEUE_SIZE,
+        bitrate: str = settings.TRANSCODE_OPUS_BITRATE,
+    ) -> None:
+        if ffmpeg is None and settings.TRANSCODE_ENABLED and settings.AUDIO_FFMPEG_PATH:
+            ffmpeg = shutil.which(settings.AUDIO_FFMPEG_PATH)
+        self.ffmpeg = ffmpeg
+        self.workers = workers
+        self.queue_size = queue_size
+        self.bitrate = bitrate
+
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: set[str] = set()
+        self._running = 0
+        self._counts = {"done": 0, "failed": 0, "rejected": 0}
+        self._bytes_in = 0
+        self._bytes_out = 0
+
+    @property
+    def available(self) -> bool:
+        return bool(self.ffmpeg)
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def enqueue(self, key: str, source: Source, on_done: Callable[[bytes], Awaitable[None]]) -> bool:
+        """Queue a transcode without waiting for it.
+
+        Args:
+            key: Identifies the rendition; a key already queued is skipped.
+            source: The original audio, or a coroutine function that
+                fetches it when a worker picks the job up.
+            on_done: Awaited with the Opus bytes to store the rendition.
+
+        Returns:
+            False if ffmpeg is unavailable, the key is already queued or the
+            queue is full.
+        """
+        if not self.available or key in self._pending:
+            return False
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((key, source, on_done))
+        except asyncio.QueueFull:
+            self._counts["rejected"] += 1
+            logger.warning("Transcode queue full, skipping %s", key)
+            return False
+        self._pending.add(key)
+        return True
+
+    async def transcode(self, data: bytes) -> bytes:
+        """Encode *data* (any ffmpeg-readable audio) as mono Ogg Opus."""
+        process = await asyncio.create_subprocess_exec(
+            self.ffmpeg, "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-vn", "-ac", "1", "-c:a", "libopus", "-b:a", self.bitrate,
+            "-application", "voip", "-f", "ogg", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate(data)
+        if process.returncode != 0 or not stdout:
+            raise TranscodeError(stderr.decode("utf-8", "replace").strip() or "empty output")
+        return stdout
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not all(task.done() for task in self._tasks):
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pending.clear()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        while True:
+            key, source, on_done = await self._queue.get()
+            self._running += 1
+            try:
+                data = source if isinstance(source, bytes) else await source()
+                opus = await self.transcode(data)
+                await on_done(opus)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._counts["failed"] += 1
+                logger.warning("Opus transcode failed for %s: %s", key, exc)
+            else:
+                self._counts["done"] += 1
+                self._bytes_in += len(data)
+                self._bytes_out += len(opus)
+            finally:
+                self._running -= 1
+                self._pending.discard(key)
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued jobs are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            **self._counts,
+            "size_ratio": round(self._bytes_in / self._bytes_out, 2) if self._bytes_out else None,
+        }
+
+
+# Module-level singleton
+opus_transcoder = OpusTranscoder()
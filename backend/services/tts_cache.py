@@ -0,0 +1,243 @@
+"""Content-addressed cache for synthesised TTS audio.
+
+The same sentences (medication reminders, greetings, broadcast scripts) are
+synthesised over and over.  Audio is cached under a SHA-256 of
+``(text, speed, voice_type)`` in two tiers:
+
+- memory: a byte-bounded LRU of small clips, served without any I/O;
+- disk:   one file per clip under ``TTS_CACHE_DIR``, byte-bounded with LRU
+  eviction.  Disk hits are returned as paths so the API can hand them to
+  ``FileResponse`` (which uses the server's ``pathsend`` zero-copy transfer
+  when available) instead of reading them into Python.
+
+Clips are written to the disk tier while they stream (see
+:meth:`TTSCache.writer`), so caching never requires buffering a whole clip.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def tts_cache_key(text: str, speed: float, voice_type: str) -> str:
+    """Return the content address of one synthesis request."""
+    canonical = json.dumps(
+        [text.strip(), round(float(speed), 2), voice_type],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _CacheWriter:
+    """Streams one clip into a temp file and publishes it on commit."""
+
+    def __init__(self, cache: "TTSCache", key: str) -> None:
+        self._cache = cache
+        self._key = key
+        cache.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache.directory, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._tmp = Path(tmp)
+        self._size = 0
+        self._done = False
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._size += len(chunk)
+
+    def commit(self) -> None:
+        """Publish the clip into the cache (atomic rename)."""
+        if self._done:
+            return
+        self._done = True
+        self._file.close()
+        if self._size == 0:
+            self._tmp.unlink(missing_ok=True)
+            return
+        self._cache._publish(self._key, self._tmp, self._size)
+
+    def discard(self) -> None:
+        """Drop a partial clip (no-op after :meth:`commit`)."""
+        if self._done:
+            return
+        self._done = True
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class TTSCache:
+    """Two-tier (memory LRU + disk) content-addressed TTS audio cache."""
+
+    def __init__(
+        self,
+        directory: str | Path = settings.TTS_CACHE_DIR,
+        memory_max_bytes: int = settings.TTS_CACHE_MEMORY_MAX_BYTES,
+        memory_item_max_bytes: int = settings.TTS_CACHE_MEMORY_ITEM_MAX_BYTES,
+        disk_max_bytes: int = settings.TTS_CACHE_DISK_MAX_BYTES,
+    ) -> None:
+        self.directory = Path(directory)
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_item_max_bytes = memory_item_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, int] | None = None  # key -> size, loaded lazily
+        self._disk_bytes = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions_memory = 0
+        self.evictions_disk = 0
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def lookup(self, text: str, speed: float, voice_type: str) -> bytes | Path | None:
+        """Return cached audio as bytes (memory tier), a file path (disk
+        tier) or None on a miss."""
+        key = tts_cache_key(text, speed, voice_type)
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.hits_memory += 1
+            return audio
+
+        disk = self._disk_index()
+        if key in disk:
+            path = self._path(key)
+            if path.exists():
+                disk.move_to_end(key)
+                self.hits_disk += 1
+                return path
+            # Removed behind our back
+            self._disk_bytes -= disk.pop(key)
+
+        self.misses += 1
+        return None
+
+    def get(self, text: str, speed: float, voice_type: str) -> bytes | None:
+        """Return cached audio bytes, promoting small disk hits to memory."""
+        found = self.lookup(text, speed, voice_type)
+        if isinstance(found, Path):
+            try:
+                audio = found.read_bytes()
+            except OSError:
+                return None
+            self._remember(found.stem, audio)
+            return audio
+        return found
+
+    # ------------------------------------------------------------------
+    # Storing
+    # ------------------------------------------------------------------
+
+    def writer(self, text: str, speed: float, voice_type: str) -> _CacheWriter:
+        """Return a writer that streams a freshly synthesised clip to disk."""
+        return _CacheWriter(self, tts_cache_key(text, speed, voice_type))
+
+    def put(self, text: str, speed: float, voice_type: str, audio: bytes) -> None:
+        """Cache a complete clip."""
+        writer = self.writer(text, speed, voice_type)
+        try:
+            writer.write(audio)
+            writer.commit()
+        finally:
+            writer.discard()
+
+    def _publish(self, key: str, tmp: Path, size: int) -> None:
+        path = self._path(key)
+        os.replace(tmp, path)
+        disk = self._disk_index()
+        self._disk_bytes += size - disk.pop(key, 0)
+        disk[key] = size
+        self._evict_disk()
+        if size <= self.memory_item_max_bytes:
+            try:
+                self._remember(key, path.read_bytes())
+            except OSError:
+                pass
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_item_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions_memory += 1
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.mp3"
+
+    def _disk_index(self) -> OrderedDict[str, int]:
+        """Return the disk index, scanning the directory on first use."""
+        if self._disk is None:
+            entries: list[tuple[float, str, int]] = []
+            if self.directory.is_dir():
+                for path in self.directory.glob("*.mp3"):
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, path.stem, st.st_size))
+            entries.sort()
+            self._disk = OrderedDict((key, size) for _mtime, key, size in entries)
+            self._disk_bytes = sum(size for _m, _k, size in entries)
+        return self._disk
+
+    def _evict_disk(self) -> None:
+        disk = self._disk_index()
+        while self._disk_bytes > self.disk_max_bytes and len(disk) > 1:
+            key, size = disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions_disk += 1
+            self._memory_bytes -= len(self._memory.pop(key, b""))
+            try:
+                self._path(key).unlink()
+            except OSError as exc:
+                logger.warning("TTS cache eviction failed: key=%s error=%s", key[:12], exc)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def stats(self) -> dict[str, float | int]:
+        """Return tier occupancy and hit-rate metrics."""
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        disk = self._disk_index()
+        return {
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_items": len(disk),
+            "disk_bytes": self._disk_bytes,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+            "evictions_memory": self.evictions_memory,
+            "evictions_disk": self.evictions_disk,
+        }
+
+
+# Module-level singleton
+tts_cache = TTSCache()
@@ -0,0 +1,198 @@
+"""Energy / zero-crossing voice activity detection on 16-bit PCM.
+
+Audio is cut into fixed frames (20 ms by default) and every frame is
+classified in one vectorized pass: a frame is speech when its RMS level is
+above a threshold, or slightly below it with a high zero-crossing rate
+(quiet unvoiced consonants such as "s" and "sh").
+
+:class:`StreamingVAD` turns the per-frame decisions into the audio that is
+worth sending to ASR:
+
+- leading silence is dropped, except for a short pre-roll before speech;
+- pauses inside speech are kept up to ``max_pause_ms``, longer ones are
+  compacted to that length;
+- trailing silence is dropped, except for a short tail after speech;
+- after ``endpoint_ms`` of silence following speech a ``speech_end`` event
+  is emitted so a streaming session can be finalized early.
+
+Decisions are made per run of equal frames, not per frame, so the Python
+work per chunk is proportional to the number of speech/silence switches.
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterator
+
+import numpy as np
+
+from core.config import settings
+
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+
+# Bytes per 16-bit sample
+_SAMPLE_WIDTH = 2
+
+# Frames this far below the energy threshold still count as speech when
+# their zero-crossing rate is high
+_ZCR_ENERGY_MARGIN_DB = 10.0
+
+
+def frame_activity(
+    pcm: bytes | np.ndarray,
+    sample_rate: int = 16000,
+    frame_ms: int = settings.VAD_FRAME_MS,
+    threshold_db: float = settings.VAD_ENERGY_THRESHOLD_DB,
+    zcr_threshold: float = 0.25,
+) -> np.ndarray:
+    """Classify each complete frame of 16-bit mono PCM as speech or silence.
+
+    Returns:
+        Boolean array with one entry per complete frame; a trailing partial
+        frame is ignored.
+    """
+    samples = np.frombuffer(pcm, dtype="<i2") if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+    frame_len = sample_rate * frame_ms // 1000
+    n_frames = len(samples) // frame_len
+    if not n_frames:
+        return np.zeros(0, dtype=bool)
+
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    level_db = 20 * np.log10(rms / 32768.0 + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+
+    loud = level_db > threshold_db
+    fricative = (level_db > threshold_db - _ZCR_ENERGY_MARGIN_DB) & (zcr > zcr_threshold)
+    return loud | fricative
+
+
+def _runs(active: np.ndarray) -> list[tuple[bool, int, int]]:
+    """Split *active* into ``(is_speech, start, end)`` runs of equal frames."""
+    if not len(active):
+        return []
+    edges = np.flatnonzero(np.diff(active.view(np.int8))) + 1
+    starts = np.concatenate(([0], edges))
+    ends = np.concatenate((edges, [len(active)]))
+    return [(bool(active[s]), int(s), int(e)) for s, e in zip(starts, ends)]
+
+
+class StreamingVAD:
+    """Incremental silence trimming and endpointing for 16-bit mono PCM."""
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = settings.VAD_FRAME_MS,
+        threshold_db: float = settings.VAD_ENERGY_THRESHOLD_DB,
+        padding_ms: int = settings.VAD_PADDING_MS,
+        max_pause_ms: int = settings.VAD_MAX_PAUSE_MS,
+        endpoint_ms: int = settings.VAD_ENDPOINT_SILENCE_MS,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.threshold_db = threshold_db
+        self.frame_bytes = sample_rate * frame_ms // 1000 * _SAMPLE_WIDTH
+        self._padding_bytes = padding_ms // frame_ms * self.frame_bytes
+        self._max_pause_bytes = max(max_pause_ms // frame_ms * self.frame_bytes, self._padding_bytes)
+        self._endpoint_frames = max(endpoint_ms // frame_ms, 1)
+
+        self._remainder = b""
+        self._preroll = bytearray()  # silence before speech, last padding_ms only
+        self._pause = bytearray()  # silence inside speech, capped at max_pause_ms
+        self._silent_frames = 0
+        self.in_speech = False
+        self.frames_in = 0
+        self.frames_out = 0
+
+    @property
+    def seconds_in(self) -> float:
+        return self.frames_in * self.frame_ms / 1000
+
+    @property
+    def seconds_out(self) -> float:
+        return self.frames_out * self.frame_ms / 1000
+
+    def process(self, chunk: bytes) -> tuple[bytes, list[str]]:
+        """Feed one chunk; return the audio to forward and any events."""
+        data = self._remainder + chunk if self._remainder else chunk
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = bytes(data[usable:])
+        if not usable:
+            return b"", []
+
+        view = memoryview(data)[:usable]
+        active = frame_activity(
+            view, self.sample_rate, self.frame_ms, self.threshold_db,
+        )
+        self.frames_in += len(active)
+
+        out = bytearray()
+        events: list[str] = []
+        for is_speech, start, end in _runs(active):
+            block = view[start * self.frame_bytes:end * self.frame_bytes]
+            if is_speech:
+                if not self.in_speech:
+                    events.append(SPEECH_START)
+                    out += self._preroll
+                    self.in_speech = True
+                else:
+                    out += self._pause
+                self._preroll.clear()
+                self._pause.clear()
+                self._silent_frames = 0
+                out += block
+            elif self.in_speech:
+                room = self._max_pause_bytes - len(self._pause)
+                if room > 0:
+                    self._pause += block[:room]
+                self._silent_frames += end - start
+                if self._silent_frames >= self._endpoint_frames:
+                    events.append(SPEECH_END)
+                    out += self._end_speech()
+            else:
+                self._preroll += block
+                del self._preroll[:max(len(self._preroll) - self._padding_bytes, 0)]
+
+        self.frames_out += len(out) // self.frame_bytes
+        return bytes(out), events
+
+    def finish(self) -> tuple[bytes, list[str]]:
+        """Flush at the end of the audio; trailing silence is trimmed."""
+        self._remainder = b""
+        if not self.in_speech:
+            return b"", []
+        tail = self._end_speech()
+        self.frames_out += len(tail) // self.frame_bytes
+        return tail, [SPEECH_END]
+
+    def _end_speech(self) -> bytes:
+        tail = bytes(self._pause[:self._padding_bytes])
+        self._pause.clear()
+        self._preroll.clear()
+        self._silent_frames = 0
+        self.in_speech = False
+        return tail
+
+
+def trim_silence(pcm: bytes, sample_rate: int = 16000, **options) -> bytes:
+    """Return *pcm* with leading/trailing silence trimmed and long pauses compacted."""
+    vad = StreamingVAD(sample_rate, **options)
+    audio, _events = vad.process(pcm)
+    tail, _events = vad.finish()
+    return audio + tail
+
+
+async def trim_silence_stream(
+    chunks: AsyncIterator[bytes],
+    vad: StreamingVAD,
+) -> AsyncIterator[bytes]:
+    """Yield the speech in a PCM chunk stream, dropping silence as it arrives."""
+    async for chunk in chunks:
+        audio, _events = vad.process(chunk)
+        if audio:
+            yield audio
+    tail, _events = vad.finish()
+    if tail:
+        yield tail
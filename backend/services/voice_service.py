@@ -1,28 +1,38 @@
 """Voice processing service wrapping Volcano Engine (火山引擎) Doubao APIs.
 
 Provides:
-- TTS: text-to-speech via Volcano Engine TTS API
+- TTS: text-to-speech via the Volcano Engine TTS WebSocket (binary) protocol,
+  streamed chunk by chunk as audio is synthesised
 - ASR file transcription: audio file → text via 录音文件识别2.0
 - Streaming ASR: real-time audio stream → text via WebSocket
 
-Current implementation uses placeholder/mock responses where actual API
-integration is complex.  The public interface is stable and ready for
-real integration.
+TTS falls back to a placeholder MP3 frame when the app id / access token are
+not configured; ASR still uses placeholder responses.  The public interface
+is stable and ready for real integration.
 """
 
 from __future__ import annotations
 
-import asyncio
-import json
 import logging
 import uuid
-from typing import AsyncIterator
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+import websockets
 
 from core.config import settings
+from services.asr_pipeline import PlaceholderRecognizer, StreamingASRPipeline, VolcanoRecognizer
+from services.tts_cache import tts_cache
+from services.vad import StreamingVAD, trim_silence_stream
+from services.volcano_protocol import (
+    MSG_AUDIO_ONLY_RESPONSE,
+    VolcanoProtocolError,
+    decode_frame,
+    encode_json_request,
+)
 
 logger = logging.getLogger(__name__)
 
-
 class VoiceService:
     """Encapsulates Volcano Engine voice API calls."""
 
@@ -34,6 +44,11 @@ class VoiceService:
         self.tts_ws_url = settings.VOLCANO_TTS_WS_URL
         self.asr_ws_url = settings.VOLCANO_ASR_WS_URL
 
+    @property
+    def tts_configured(self) -> bool:
+        """Return True when the TTS app id and access token are set."""
+        return bool(self.app_id) and bool(self.access_token)
+
     # ------------------------------------------------------------------
     # TTS – Text-to-Speech
     # ------------------------------------------------------------------
@@ -46,9 +61,9 @@ class VoiceService:
     ) -> bytes:
         """Convert *text* to audio bytes (MP3).
 
-        In production this would POST to the Volcano Engine TTS WebSocket
-        or HTTP endpoint.  For now returns a minimal valid MP3 frame so
-        callers can exercise the full request/response cycle.
+        Collects :meth:`stream_text_to_speech` into one buffer, for callers
+        that need the whole clip (e.g. storage upload).  Prefer the
+        streaming variant when the audio is sent on to a client.
 
         Args:
             text: The text to synthesise.
@@ -58,6 +73,63 @@ class VoiceService:
         Returns:
             Raw audio bytes (MP3).
         """
+        chunks = [
+            chunk
+            async for chunk in self.stream_text_to_speech(text, speed, voice_type)
+        ]
+        return b"".join(chunks)
+
+    async def stream_text_to_speech(
+        self,
+        text: str,
+        speed: float = 1.0,
+        voice_type: str = "zh_female_cancan",
+    ) -> AsyncIterator[bytes]:
+        """Synthesise *text* and yield MP3 chunks as they are produced.
+
+        Iterating form of :meth:`open_text_to_speech`; disk-cached clips
+        are read back in chunks.
+
+        Raises:
+            ValueError: If *text* is empty or *speed* out of range (raised
+                on the first iteration).
+            RuntimeError: If the TTS service reports an error or is unreachable.
+        """
+        source = await self.open_text_to_speech(text, speed, voice_type)
+        if isinstance(source, Path):
+            for chunk in self._iter_file(source):
+                yield chunk
+            return
+        async for chunk in source:
+            yield chunk
+
+    async def open_text_to_speech(
+        self,
+        text: str,
+        speed: float = 1.0,
+        voice_type: str = "zh_female_cancan",
+    ) -> Path | AsyncIterator[bytes]:
+        """Resolve the audio source for *text*.
+
+        Cached clips (see ``tts_cache``) are returned without contacting the
+        TTS service: a disk-tier hit as a file path the caller can send
+        without reading it, a memory-tier hit as a one-chunk iterator.  On
+        a miss the iterator yields frames as the service produces them and
+        writes them through to the cache's disk tier; the clip is only
+        published once the stream completes.  Without credentials the
+        iterator yields a single placeholder frame.
+
+        Args:
+            text: The text to synthesise.
+            speed: Playback speed ratio (0.5 – 2.0).
+            voice_type: Volcano Engine voice identifier.
+
+        Returns:
+            A cached file path, or an async iterator of MP3 chunks.
+
+        Raises:
+            ValueError: If *text* is empty or *speed* out of range.
+        """
         if not text or not text.strip():
             raise ValueError("text must not be empty")
 
@@ -71,12 +143,85 @@ class VoiceService:
             voice_type,
         )
 
-        # --- Placeholder: return a minimal silent MP3 frame ---
-        # A real implementation would call:
-        #   POST wss://openspeech.bytedance.com/api/v1/tts/ws
-        # with app_id, access_token, text, speed, voice_type, etc.
-        audio_bytes = self._generate_placeholder_audio(text)
-        return audio_bytes
+        if not self.tts_configured:
+            logger.warning("Volcano TTS not configured. Returning placeholder audio.")
+            return self._single_chunk(self._generate_placeholder_audio(text))
+
+        cached = tts_cache.lookup(text, speed, voice_type)
+        if isinstance(cached, Path):
+            return cached
+        if cached is not None:
+            return self._single_chunk(cached)
+        return self._synthesize_through_cache(text, speed, voice_type)
+
+    async def _synthesize_through_cache(
+        self,
+        text: str,
+        speed: float,
+        voice_type: str,
+    ) -> AsyncIterator[bytes]:
+        """Yield freshly synthesised audio while writing it to the cache."""
+        writer = tts_cache.writer(text, speed, voice_type)
+        try:
+            async for chunk in self._synthesize(text, speed, voice_type):
+                writer.write(chunk)
+                yield chunk
+            writer.commit()
+        finally:
+            writer.discard()
+
+    async def _synthesize(
+        self,
+        text: str,
+        speed: float,
+        voice_type: str,
+    ) -> AsyncIterator[bytes]:
+        """Run one request against the Volcano TTS WebSocket.
+
+        Submits one full client request to ``VOLCANO_TTS_WS_URL`` and yields
+        each audio-only response frame until the server marks the last one.
+        """
+        request = encode_json_request({
+            "app": {
+                "appid": self.app_id,
+                "token": self.access_token,
+                "cluster": self.tts_resource_id or "volcano_tts",
+            },
+            "user": {"uid": "sangzi_care"},
+            "audio": {
+                "voice_type": voice_type,
+                "encoding": "mp3",
+                "speed_ratio": speed,
+            },
+            "request": {
+                "reqid": str(uuid.uuid4()),
+                "text": text,
+                "text_type": "plain",
+                "operation": "submit",
+            },
+        })
+
+        try:
+            async with websockets.connect(
+                self.tts_ws_url,
+                additional_headers={"Authorization": f"Bearer; {self.access_token}"},
+                max_size=None,
+            ) as ws:
+                await ws.send(request)
+                async for frame in ws:
+                    if isinstance(frame, str):
+                        continue
+                    decoded = decode_frame(frame)
+                    if decoded.message_type == MSG_AUDIO_ONLY_RESPONSE and decoded.payload:
+                        yield decoded.payload
+                    if decoded.is_last:
+                        return
+        except VolcanoProtocolError as exc:
+            logger.error("Volcano TTS error: code=%d message=%s", exc.code, exc.message)
+            raise RuntimeError(f"语音合成服务请求失败: {exc.code}") from exc
+        except (OSError, websockets.exceptions.WebSocketException) as exc:
+            logger.error("Volcano TTS connection error: %s", exc)
+            raise RuntimeError("语音合成服务不可用") from exc
 
     # ------------------------------------------------------------------
     # ASR – File Transcription (录音文件识别 2.0)
@@ -88,10 +233,10 @@ class VoiceService:
         audio_format: str = "mp3",
         language: str = "zh-CN",
     ) -> str:
-        """Transcribe an audio file to text.
+        """Transcribe an in-memory audio file to text.
 
-        In production this would POST to the Volcano Engine batch ASR
-        endpoint (录音文件识别 2.0).
+        Convenience wrapper around :meth:`transcribe_stream` for callers
+        that already hold the whole file.
 
         Args:
             audio_data: Raw audio file bytes.
@@ -104,16 +249,59 @@ class VoiceService:
         if not audio_data:
             raise ValueError("audio_data must not be empty")
 
+        async def _single():
+            yield audio_data
+
+        return await self.transcribe_stream(_single(), audio_format, language)
+
+    async def transcribe_stream(
+        self,
+        audio_chunks: AsyncIterator[bytes],
+        audio_format: str = "mp3",
+        language: str = "zh-CN",
+    ) -> str:
+        """Transcribe an audio file delivered as a stream of chunks.
+
+        The file is never assembled in memory; chunks are forwarded to the
+        ASR backend as they are read.  Raw PCM has its leading/trailing
+        silence trimmed and long pauses compacted on the way.  In production
+        this would upload to the Volcano Engine batch ASR endpoint
+        (录音文件识别 2.0).
+
+        Args:
+            audio_chunks: Async iterator over the file's bytes.
+            audio_format: Audio format (mp3, wav, pcm, etc.).
+            language: BCP-47 language tag.
+
+        Returns:
+            Transcribed text string.
+        """
+        vad = None
+        if settings.VAD_ENABLED and audio_format == "pcm":
+            vad = StreamingVAD()
+            audio_chunks = trim_silence_stream(audio_chunks, vad)
+
+        size = 0
+        async for chunk in audio_chunks:
+            # --- Placeholder: a real implementation streams each chunk
+            # into the ASR upload request body ---
+            size += len(chunk)
+
+        if not size and (vad is None or not vad.frames_in):
+            raise ValueError("audio_data must not be empty")
+        if vad is not None:
+            logger.info("ASR VAD kept %.1fs of %.1fs", vad.seconds_out, vad.seconds_in)
+
         logger.info(
             "ASR file transcription: format=%s lang=%s size=%d bytes",
             audio_format,
             language,
-            len(audio_data),
+            size,
         )
 
         # --- Placeholder response ---
         # A real implementation would:
-        # 1. POST audio to Volcano Engine ASR batch endpoint
+        # 1. Stream the audio to Volcano Engine ASR batch endpoint
         # 2. Poll for result or use callback
         # 3. Return the transcribed text
         return "这是语音转写的占位文本"
@@ -128,17 +316,26 @@ class VoiceService:
         audio_format: str = "pcm",
         sample_rate: int = 16000,
         language: str = "zh-CN",
+        vad: bool = True,
     ) -> AsyncIterator[dict]:
         """Stream audio chunks and yield partial/final transcription results.
 
-        In production this would open a WebSocket to the Volcano Engine
-        streaming ASR endpoint and forward audio frames.
+        Runs a :class:`StreamingASRPipeline` against the Volcano Engine
+        streaming ASR WebSocket (or a placeholder recognizer when Volcano
+        credentials are not configured).  Partial results may be merged
+        when the caller falls behind; final results are always delivered.
+
+        PCM input passes through a :class:`StreamingVAD`: only speech is
+        forwarded, and the utterance is finalized once the speaker has been
+        silent for ``VAD_ENDPOINT_SILENCE_MS`` without waiting for END.
 
         Args:
             audio_chunks: Async iterator of raw audio bytes.
             audio_format: Audio encoding (pcm, opus, etc.).
             sample_rate: Sample rate in Hz.
             language: BCP-47 language tag.
+            vad: Trim silence and endpoint PCM input; callers that already
+                run their own VAD pass False.
 
         Yields:
             Dicts with keys ``{"text": str, "is_final": bool, "sequence": int}``.
@@ -150,31 +347,40 @@ class VoiceService:
             language,
         )
 
-        sequence = 0
-        async for chunk in audio_chunks:
-            if not chunk:
-                continue
-            sequence += 1
-            # --- Placeholder: echo a dummy partial result per chunk ---
-            yield {
-                "text": f"识别中... (片段 {sequence})",
-                "is_final": False,
-                "sequence": sequence,
-            }
-            # Small delay to simulate processing
-            await asyncio.sleep(0.05)
-
-        # Final result
-        yield {
-            "text": "这是流式语音识别的占位结果",
-            "is_final": True,
-            "sequence": sequence + 1,
-        }
+        if self.app_id and self.access_token:
+            recognizer = VolcanoRecognizer(
+                url=self.asr_ws_url,
+                app_id=self.app_id,
+                access_token=self.access_token,
+                cluster=self.asr_stream_resource_id or "volcengine_streaming_common",
+                audio_format=audio_format,
+                sample_rate=sample_rate,
+                language=language,
+            )
+        else:
+            recognizer = PlaceholderRecognizer()
+
+        # Silence trimming and endpointing need raw PCM
+        use_vad = vad and settings.VAD_ENABLED and audio_format == "pcm"
+        pipeline = StreamingASRPipeline(recognizer, vad=StreamingVAD(sample_rate) if use_vad else None)
+        async for result in pipeline.results(audio_chunks):
+            yield result
 
     # ------------------------------------------------------------------
     # Internal helpers
     # ------------------------------------------------------------------
 
+    @staticmethod
+    async def _single_chunk(audio: bytes) -> AsyncIterator[bytes]:
+        yield audio
+
+    @staticmethod
+    def _iter_file(path: Path, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield a cached clip from disk in *chunk_size* pieces."""
+        with path.open("rb") as fh:
+            while chunk := fh.read(chunk_size):
+                yield chunk
+
     @staticmethod
     def _generate_placeholder_audio(text: str) -> bytes:
         """Return a minimal valid MP3 frame (silent) for placeholder use.
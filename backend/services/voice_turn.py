@@ -0,0 +1,363 @@
+"""全双工语音轮次服务 — 在同一条 WebSocket 上完成 识别 → 意图/LLM → 合成。
+
+客户端持续发送 16kHz 单声道 16-bit PCM 音频帧。服务端 VAD 检测到开口即开启
+一轮流式识别，识别中间结果实时回传；静音超过端点阈值（或客户端发送
+audio_end）后得到最终文本，随即并发执行意图识别与 LLM 流式生成：
+
+- 意图可执行（记录血压、呼叫家属等）时取消 LLM，只下发意图由客户端执行；
+- 否则 LLM token 边生成边下发，按句切分后逐句送入 TTS，音频以二进制帧
+  在同一条连接上推回客户端。
+
+插话（barge-in）：助手回复期间检测到新的语音，立即取消进行中的 LLM 流与
+TTS，并通知客户端停止播放。被打断的一轮照常保存用户文本与已生成的部分回复；
+被打断前尚未应答的识别文本会并入下一轮。
+
+每轮记录各阶段延迟（均以毫秒计）：
+
+- asr_final: 说话结束 → 最终识别文本
+- intent: 最终文本 → 意图结果
+- llm_first_token: 最终文本 → 第一个 LLM token
+- tts_first_audio: 最终文本 → 第一帧回复音频
+- turn_total: 说话结束 → 本轮回复完毕
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Any, Awaitable, Callable
+
+from services.asr_pipeline import StageStats
+from services.conversation_memory import conversation_memory
+from services.doubao_service import doubao_service
+from services.vad import SPEECH_END, SPEECH_START, StreamingVAD
+from services.voice_service import voice_service
+
+logger = logging.getLogger(__name__)
+
+# 句末标点：遇到即切句送 TTS
+_SENTENCE_ENDS = "。！？；!?;\n"
+# 句子过长时在这些标点处提前切分，尽早出声
+_SOFT_BREAKS = "，,、：:"
+_MAX_SENTENCE_CHARS = 30
+
+
+def split_sentences(buffer: str) -> tuple[list[str], str]:
+    """从累积的 LLM 输出中切出完整句子。
+
+    Returns:
+        (可送 TTS 的句子列表, 尚未成句的剩余文本)
+    """
+    sentences: list[str] = []
+    start = 0
+    for i, ch in enumerate(buffer):
+        if ch in _SENTENCE_ENDS or (
+            ch in _SOFT_BREAKS and i + 1 - start >= _MAX_SENTENCE_CHARS
+        ):
+            sentence = buffer[start:i + 1].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = i + 1
+    return sentences, buffer[start:]
+
+
+def _speakable(text: str) -> bool:
+    return any(ch.isalnum() for ch in text)
+
+
+def _ms_since(start: float) -> float:
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+class VoiceTurnMetrics:
+    """语音轮次各阶段延迟与插话次数。"""
+
+    STAGES = ("asr_final", "intent", "llm_first_token", "tts_first_audio", "turn_total")
+
+    def __init__(self) -> None:
+        self._stages = {name: StageStats() for name in self.STAGES}
+        self.turns = 0
+        self.actions = 0
+        self.barge_ins = 0
+        self.errors = 0
+
+    def observe(self, stage: str, ms: float) -> None:
+        self._stages[stage].add(ms)
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turns,
+            "actions": self.actions,
+            "barge_ins": self.barge_ins,
+            "errors": self.errors,
+            "stages": {name: s.as_dict() for name, s in self._stages.items()},
+        }
+
+
+class VoiceTurnSession:
+    """一条全双工语音会话。
+
+    Args:
+        send_json: 向客户端发送 JSON 消息。
+        send_bytes: 向客户端发送回复音频（MP3）。
+        session_id: 对话记忆的会话 ID。
+        user_id: 已认证用户（可稍后赋值）。
+        on_turn_complete: 每轮结束时以 (用户文本, 回复) 调用，用于持久化；
+            意图可执行时回复为 None。
+    """
+
+    def __init__(
+        self,
+        send_json: Callable[[dict], Awaitable[None]],
+        send_bytes: Callable[[bytes], Awaitable[None]],
+        session_id: str,
+        user_id: str | None = None,
+        on_turn_complete: Callable[[str, str | None], Any] | None = None,
+        sample_rate: int = 16000,
+        tts_speed: float = 1.0,
+        metrics: VoiceTurnMetrics | None = None,
+    ) -> None:
+        self._send_json = send_json
+        self._send_bytes = send_bytes
+        self.session_id = session_id
+        self.user_id = user_id
+        self.on_turn_complete = on_turn_complete
+        self.sample_rate = sample_rate
+        self.tts_speed = tts_speed
+        self.metrics = metrics or voice_turn_metrics
+
+        self._vad = StreamingVAD(sample_rate)
+        self._send_lock = asyncio.Lock()
+        self._generation = 0
+        self._utterance: asyncio.Queue[bytes | None] | None = None
+        self._speech_end_at: float | None = None
+        self._carry_text = ""
+        self._tasks: set[asyncio.Task] = set()
+        self._respond_task: asyncio.Task | None = None
+
+    # ------------------------------------------------------------------
+    # 输入
+    # ------------------------------------------------------------------
+
+    async def feed_audio(self, chunk: bytes) -> None:
+        """处理客户端的一帧 PCM 音频。"""
+        audio, events = self._vad.process(chunk)
+        if SPEECH_START in events:
+            await self._start_utterance()
+        if audio and self._utterance is not None:
+            await self._utterance.put(audio)
+        if SPEECH_END in events:
+            await self._end_utterance()
+
+    async def end_utterance(self) -> None:
+        """客户端主动结束本轮说话（不等 VAD 端点）。"""
+        tail, _events = self._vad.finish()
+        if self._utterance is not None:
+            if tail:
+                await self._utterance.put(tail)
+            await self._end_utterance()
+
+    async def close(self) -> None:
+        """取消所有进行中的识别、生成与合成。"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ------------------------------------------------------------------
+    # 识别
+    # ------------------------------------------------------------------
+
+    async def _start_utterance(self) -> None:
+        self._generation += 1
+        # 客户端据此停止播放上一轮回复
+        await self._send({"type": "speech_start"})
+        if self._respond_task is not None and not self._respond_task.done():
+            await self._barge_in()
+        self._utterance = asyncio.Queue(maxsize=32)
+        self._speech_end_at = None
+        self._spawn(self._recognize(self._utterance, self._generation))
+
+    async def _end_utterance(self) -> None:
+        self._speech_end_at = time.monotonic()
+        await self._utterance.put(None)
+        self._utterance = None
+
+    async def _recognize(self, queue: asyncio.Queue, generation: int) -> None:
+        async def _audio():
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+
+        final = ""
+        async for result in voice_service.stream_asr(_audio(), sample_rate=self.sample_rate, vad=False):
+            if result["is_final"]:
+                final = result["text"]
+            if generation == self._generation:
+                await self._send({"type": "asr", "text": result["text"], "is_final": result["is_final"]})
+
+        if generation != self._generation:
+            # 用户又开口了：这段文本并入下一轮
+            self._carry_text += final
+            return
+
+        text = (self._carry_text + final).strip()
+        self._carry_text = ""
+        if not text:
+            return
+        if self._speech_end_at is not None:
+            self.metrics.observe("asr_final", _ms_since(self._speech_end_at))
+        self._respond_task = self._spawn(self._respond(text, self._speech_end_at))
+
+    async def _barge_in(self) -> None:
+        task, self._respond_task = self._respond_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.metrics.barge_ins += 1
+        logger.info("Voice turn barge-in: session=%s", self.session_id)
+        await self._send({"type": "barge_in"})
+
+    # ------------------------------------------------------------------
+    # 回复
+    # ------------------------------------------------------------------
+
+    async def _respond(self, text: str, speech_end_at: float | None) -> None:
+        final_at = time.monotonic()
+        latency: dict[str, float] = {}
+        memory_key = (self.user_id, self.session_id)
+        conversation_memory.append(memory_key, "user", text)
+        messages = conversation_memory.build_context(memory_key)
+        summary = conversation_memory.summary(memory_key)
+
+        tokens: asyncio.Queue = asyncio.Queue()
+        llm_task = asyncio.create_task(self._pump_llm(messages, summary, tokens))
+        parts: list[str] = []
+        try:
+            try:
+                intent = await doubao_service.recognize_intent(text, self.user_id)
+            except Exception as exc:
+                logger.warning("Voice turn intent failed, replying as chat: %s", exc)
+                intent = {"intent": "general_chat", "entities": {}, "confidence": 0.0}
+            latency["intent"] = _ms_since(final_at)
+            await self._send({"type": "intent", **intent})
+
+            if doubao_service.is_actionable(intent):
+                llm_task.cancel()
+                self.metrics.actions += 1
+                reply = None
+            else:
+                reply = await self._speak(tokens, final_at, latency, parts)
+        except asyncio.CancelledError:
+            # 被插话打断：照常保存用户文本与已生成的部分回复
+            self._complete_turn(memory_key, text, "".join(parts) or None)
+            raise
+        finally:
+            llm_task.cancel()
+            await asyncio.gather(llm_task, return_exceptions=True)
+
+        self._complete_turn(memory_key, text, reply)
+
+        if speech_end_at is not None:
+            latency["turn_total"] = _ms_since(speech_end_at)
+        for stage, ms in latency.items():
+            self.metrics.observe(stage, ms)
+        self.metrics.turns += 1
+        await self._send({"type": "turn_end", "reply": reply, "latency_ms": latency})
+
+    def _complete_turn(self, memory_key: tuple, text: str, reply: str | None) -> None:
+        """把回复写入对话记忆，并交给 on_turn_complete 持久化。"""
+        if reply:
+            conversation_memory.append(memory_key, "assistant", reply)
+        if self.on_turn_complete is not None:
+            try:
+                self.on_turn_complete(text, reply)
+            except Exception as exc:
+                logger.warning("Voice turn persistence failed: %s", exc)
+
+    async def _pump_llm(self, messages: list[dict], summary: str, tokens: asyncio.Queue) -> None:
+        try:
+            async with aclosing(doubao_service.chat_stream(
+                messages, self.user_id, summary=summary, feature="voice",
+            )) as stream:
+                async for delta in stream:
+                    tokens.put_nowait(delta)
+            tokens.put_nowait(None)
+        except Exception as exc:
+            tokens.put_nowait(exc)
+
+    async def _speak(
+        self, tokens: asyncio.Queue, final_at: float, latency: dict, parts: list[str],
+    ) -> str:
+        """下发 LLM token，并按句交给 TTS 协程合成。
+
+        已下发的 token 追加到 *parts*，被取消时调用方据此保存部分回复。
+        """
+        sentences: asyncio.Queue[str | None] = asyncio.Queue()
+        tts_task = asyncio.create_task(self._synthesize(sentences, final_at, latency))
+        buffer = ""
+        try:
+            while (item := await tokens.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                if not parts:
+                    latency["llm_first_token"] = _ms_since(final_at)
+                parts.append(item)
+                await self._send({"type": "llm_token", "content": item})
+                done, buffer = split_sentences(buffer + item)
+                for sentence in done:
+                    sentences.put_nowait(sentence)
+            if buffer.strip():
+                sentences.put_nowait(buffer.strip())
+            sentences.put_nowait(None)
+            await tts_task
+        finally:
+            tts_task.cancel()
+            await asyncio.gather(tts_task, return_exceptions=True)
+        return "".join(parts)
+
+    async def _synthesize(self, sentences: asyncio.Queue, final_at: float, latency: dict) -> None:
+        while (sentence := await sentences.get()) is not None:
+            if not _speakable(sentence):
+                continue
+            await self._send({"type": "tts_start", "text": sentence})
+            async with aclosing(voice_service.stream_text_to_speech(
+                sentence, speed=self.tts_speed,
+            )) as audio:
+                async for chunk in audio:
+                    if "tts_first_audio" not in latency:
+                        latency["tts_first_audio"] = _ms_since(final_at)
+                    async with self._send_lock:
+                        await self._send_bytes(chunk)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    async def _send(self, message: dict) -> None:
+        async with self._send_lock:
+            await self._send_json(message)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(self._guard(coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _guard(self, coro) -> None:
+        """任务内异常记录并告知客户端，不影响会话继续接收音频。"""
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.metrics.errors += 1
+            logger.exception("Voice turn error: session=%s", self.session_id)
+            try:
+                await self._send({"type": "error", "message": str(exc)})
+            except Exception:
+                pass
+
+
+# Module-level singleton
+voice_turn_metrics = VoiceTurnMetrics()
@@ -0,0 +1,132 @@
+"""Volcano Engine speech WebSocket binary protocol (TTS and streaming ASR).
+
+Every frame starts with a 4-byte header:
+
+    byte 0: protocol version (4 bits) | header size in 4-byte words (4 bits)
+    byte 1: message type (4 bits)     | message type flags (4 bits)
+    byte 2: serialization (4 bits)    | compression (4 bits)
+    byte 3: reserved
+
+followed by an optional 4-byte sequence number and a 4-byte payload size
+plus payload.  Error frames carry a 4-byte error code instead.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import struct
+from typing import NamedTuple
+
+PROTOCOL_VERSION = 0b0001
+HEADER_WORDS = 0b0001
+
+# Message types
+MSG_FULL_CLIENT_REQUEST = 0b0001
+MSG_AUDIO_ONLY_REQUEST = 0b0010
+MSG_FULL_SERVER_RESPONSE = 0b1001
+MSG_AUDIO_ONLY_RESPONSE = 0b1011
+MSG_FRONTEND_RESPONSE = 0b1100
+MSG_ERROR = 0b1111
+
+# Message type flags
+FLAG_NONE = 0b0000
+FLAG_SEQUENCE = 0b0001
+FLAG_LAST = 0b0010
+
+SERIALIZATION_NONE = 0b0000
+SERIALIZATION_JSON = 0b0001
+COMPRESSION_NONE = 0b0000
+COMPRESSION_GZIP = 0b0001
+
+
+class VolcanoProtocolError(RuntimeError):
+    """An error frame sent by the Volcano speech service."""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class Frame(NamedTuple):
+    """One decoded server frame."""
+
+    message_type: int
+    is_last: bool
+    sequence: int | None
+    payload: bytes
+
+    def json(self) -> dict:
+        return json.loads(self.payload) if self.payload else {}
+
+
+def encode_frame(
+    message_type: int,
+    payload: bytes,
+    flags: int = FLAG_NONE,
+    serialization: int = SERIALIZATION_NONE,
+    compression: int = COMPRESSION_NONE,
+) -> bytes:
+    """Encode one client frame."""
+    header = bytes([
+        (PROTOCOL_VERSION << 4) | HEADER_WORDS,
+        (message_type << 4) | flags,
+        (serialization << 4) | compression,
+        0x00,
+    ])
+    return header + struct.pack(">I", len(payload)) + payload
+
+
+def encode_json_request(payload: dict) -> bytes:
+    """Encode a full-client-request frame carrying a JSON *payload*."""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return encode_frame(MSG_FULL_CLIENT_REQUEST, body, serialization=SERIALIZATION_JSON)
+
+
+def encode_audio(chunk: bytes, last: bool = False) -> bytes:
+    """Encode an audio-only client frame; *last* marks the end of the audio."""
+    return encode_frame(MSG_AUDIO_ONLY_REQUEST, chunk, flags=FLAG_LAST if last else FLAG_NONE)
+
+
+def decode_frame(frame: bytes) -> Frame:
+    """Decode one server frame.
+
+    Raises:
+        VolcanoProtocolError: On an error frame from the server.
+        ValueError: On a truncated or malformed frame.
+    """
+    if len(frame) < 4:
+        raise ValueError("frame too short")
+    header_size = (frame[0] & 0x0F) * 4
+    message_type = frame[1] >> 4
+    flags = frame[1] & 0x0F
+    compression = frame[2] & 0x0F
+    view = memoryview(frame)[header_size:]
+
+    if message_type == MSG_ERROR:
+        code, size = struct.unpack(">II", view[:8])
+        body = bytes(view[8:8 + size])
+        if compression == COMPRESSION_GZIP:
+            body = gzip.decompress(body)
+        raise VolcanoProtocolError(code, body.decode("utf-8", "replace"))
+
+    # Audio responses carry a sequence whenever flags are set; other
+    # responses only with the sequence bit.
+    has_sequence = bool(flags) if message_type == MSG_AUDIO_ONLY_RESPONSE else bool(flags & FLAG_SEQUENCE)
+    sequence = None
+    if has_sequence:
+        (sequence,) = struct.unpack(">i", view[:4])
+        view = view[4:]
+    is_last = bool(flags & FLAG_LAST) or (sequence is not None and sequence < 0)
+
+    if len(view) < 4:
+        # Ack frame without a payload
+        return Frame(message_type, is_last, sequence, b"")
+    (size,) = struct.unpack(">I", view[:4])
+    payload = bytes(view[4:4 + size])
+    if len(payload) != size:
+        raise ValueError("frame truncated")
+    if compression == COMPRESSION_GZIP:
+        payload = gzip.decompress(payload)
+    return Frame(message_type, is_last, sequence, payload)
@@ -0,0 +1,113 @@
+"""Waveform peaks for voice messages.
+
+Message lists draw a waveform for every voice message.  Instead of each
+client downloading and decoding the audio, the backend decodes it once when
+the message is sent and stores a compact peaks array: the audio is split
+into ``VOICE_WAVEFORM_BUCKETS`` equal spans and each span's absolute peak is
+scaled to 0..127 (int8) relative to the loudest span.
+
+Peaks are accumulated per 10 ms window while the audio streams through the
+decoder, so memory does not grow with the recording beyond one float per
+window.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import AsyncIterator
+
+import httpx
+import numpy as np
+
+from core.config import settings
+from services.audio_normalize import TARGET_RATE, AudioDecodeError, decode_mono
+from services.supabase_storage import storage_headers, storage_object_url
+
+logger = logging.getLogger(__name__)
+
+_WINDOW_MS = 10
+_INT8_MAX = 127
+
+
+class PeakAccumulator:
+    """Collects per-window absolute peaks of a mono sample stream."""
+
+    def __init__(self, sample_rate: int = TARGET_RATE, window_ms: int = _WINDOW_MS) -> None:
+        self.window = max(1, sample_rate * window_ms // 1000)
+        self._maxima: list[np.ndarray] = []
+        self._carry = np.empty(0, dtype=np.float32)
+
+    def add(self, block: np.ndarray) -> None:
+        x = np.abs(block)
+        if len(self._carry):
+            x = np.concatenate([self._carry, x])
+        usable = len(x) - len(x) % self.window
+        if usable:
+            self._maxima.append(x[:usable].reshape(-1, self.window).max(axis=1))
+        self._carry = x[usable:]
+
+    def peaks(self, buckets: int) -> list[int]:
+        """Return at most *buckets* peaks scaled to 0..127."""
+        parts = list(self._maxima)
+        if len(self._carry):
+            parts.append(self._carry.max(keepdims=True))
+        if not parts:
+            return []
+        maxima = np.concatenate(parts)
+        count = min(buckets, len(maxima))
+        edges = np.linspace(0, len(maxima), count + 1).astype(np.int64)[:-1]
+        bucket_peaks = np.maximum.reduceat(maxima, edges)
+        top = float(bucket_peaks.max())
+        if top <= 0:
+            return [0] * count
+        return np.round(bucket_peaks / top * _INT8_MAX).astype(np.int8).tolist()
+
+
+async def compute_peaks(
+    chunks: AsyncIterator[bytes],
+    declared_format: str = "mp3",
+    buckets: int = settings.VOICE_WAVEFORM_BUCKETS,
+) -> list[int]:
+    """Decode an audio stream and return its waveform peaks.
+
+    Raises:
+        AudioDecodeError: If the audio cannot be decoded.
+    """
+    accumulator = PeakAccumulator()
+    async for block in await decode_mono(chunks, declared_format):
+        accumulator.add(block)
+    return accumulator.peaks(buckets)
+
+
+async def storage_waveform(url: str) -> list[int] | None:
+    """Waveform peaks of an audio file in Supabase Storage.
+
+    The file is streamed straight into the decoder.  Returns None (and
+    logs) for URLs outside Storage, download or decode failures, and when
+    ``VOICE_WAVEFORM_TIMEOUT_SECONDS`` is exceeded.
+    """
+    if not storage_object_url(url):
+        return None
+    declared = url.rsplit(".", 1)[-1].lower() if "." in url.rsplit("/", 1)[-1] else "mp3"
+
+    async def _download() -> list[int]:
+        async with httpx.AsyncClient(timeout=settings.VOICE_WAVEFORM_TIMEOUT_SECONDS) as client:
+            async with client.stream("GET", url, headers=storage_headers()) as response:
+                response.raise_for_status()
+                return await compute_peaks(_limited(response.aiter_bytes()), declared)
+
+    try:
+        return await asyncio.wait_for(_download(), settings.VOICE_WAVEFORM_TIMEOUT_SECONDS)
+    except (httpx.HTTPError, AudioDecodeError, asyncio.TimeoutError) as exc:
+        logger.warning("Waveform not computed for %s: %r", url, exc)
+        return None
+
+
+async def _limited(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > settings.VOICE_UPLOAD_MAX_BYTES:
+            raise AudioDecodeError("音频文件超过大小上限")
+        yield chunk
@@ -300,6 +300,82 @@ class TestAIIntent:
         assert resp.status_code == 401
 
 
+# ---------------------------------------------------------------------------
+# POST /api/v1/ai/turn
+# ---------------------------------------------------------------------------
+
+
+class TestAITurn:
+    @patch("api.v1.ai_chat.postgrest")
+    @patch("api.v1.ai_chat.doubao_service")
+    def test_turn_combined(self, mock_doubao, mock_pg):
+        mock_doubao.chat_with_intent = AsyncMock(return_value={
+            "intent": "health_record",
+            "entities": {"record_type": "blood_pressure"},
+            "confidence": 0.9,
+            "reply": "好的，已为您记录血压。",
+        })
+        pg_mock = _mock_postgrest_insert()
+        mock_pg.from_ = pg_mock.from_
+
+        resp = client.post(
+            "/api/v1/ai/turn",
+            json={"messages": [{"role": "user", "content": "高压130低压85"}]},
+            headers=_auth_headers(),
+        )
+
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["intent"] == "health_record"
+        assert data["reply"] == "好的，已为您记录血压。"
+        assert data["session_id"]
+        mock_doubao.chat_with_intent.assert_called_once()
+        assert pg_mock.from_.return_value.insert.call_count == 2
+
+    @patch("api.v1.ai_chat.postgrest")
+    @patch("api.v1.ai_chat.doubao_service")
+    def test_turn_speculative_actionable(self, mock_doubao, mock_pg):
+        mock_doubao.speculative_turn = AsyncMock(return_value={
+            "intent": "make_call",
+            "entities": {"target_relation": "女儿"},
+            "confidence": 0.95,
+            "reply": None,
+        })
+        pg_mock = _mock_postgrest_insert()
+        mock_pg.from_ = pg_mock.from_
+
+        resp = client.post(
+            "/api/v1/ai/turn",
+            json={
+                "messages": [{"role": "user", "content": "给女儿打电话"}],
+                "mode": "speculative",
+            },
+            headers=_auth_headers(),
+        )
+
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["intent"] == "make_call"
+        assert data["reply"] is None
+        # Only the user message is saved — there is no assistant reply
+        assert pg_mock.from_.return_value.insert.call_count == 1
+
+    def test_turn_invalid_mode(self):
+        resp = client.post(
+            "/api/v1/ai/turn",
+            json={"messages": [{"role": "user", "content": "你好"}], "mode": "bogus"},
+            headers=_auth_headers(),
+        )
+        assert resp.status_code == 422
+
+    def test_turn_requires_auth(self):
+        resp = client.post(
+            "/api/v1/ai/turn",
+            json={"messages": [{"role": "user", "content": "你好"}]},
+        )
+        assert resp.status_code == 401
+
+
 # ---------------------------------------------------------------------------
 # GET /api/v1/ai/summary/{user_id}
 # ---------------------------------------------------------------------------
@@ -425,3 +501,24 @@ class TestAIVoiceSession:
             data = ws.receive_json()
             assert data["type"] == "session_end"
             assert "session_id" in data
+
+    @patch("api.v1.ai_chat.postgrest")
+    @patch("api.v1.ai_chat.doubao_service")
+    def test_websocket_combined_mode(self, mock_doubao, mock_pg):
+        mock_doubao.chat_with_intent = AsyncMock(return_value={
+            "intent": "general_chat",
+            "entities": {},
+            "confidence": 0.8,
+            "reply": "今天天气很好。",
+        })
+        mock_pg.from_ = _mock_postgrest_insert().from_
+
+        with client.websocket_connect("/api/v1/ai/voice-session") as ws:
+            ws.send_json({"type": "text", "content": "天气怎么样", "mode": "combined"})
+            data = ws.receive_json()
+            assert data["type"] == "reply"
+            assert data["content"] == "今天天气很好。"
+            assert data["intent"] == "general_chat"
+
+            ws.send_json({"type": "end"})
+            ws.receive_json()
@@ -0,0 +1,404 @@
+"""验证录音文件转写任务队列 (BatchASRQueue)
+
+Tests:
+- fast tier transcribes inline audio in one request
+- standard/idle jobs are submitted, then polled with backoff
+- the completion callback wakes the poller; a wrong token is refused
+- per-tier concurrency limits; a full idle backlog does not delay fast jobs
+- failures, timeouts and queue overflow
+- Volcano big-model API headers, payload and status codes
+- POST/GET /voice/transcribe-jobs and idle transcription of voice messages
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from core.middleware import require_auth
+from main import app
+from services.asr_jobs import (
+    ASRJob,
+    ASRQueueFull,
+    ASRTier,
+    BatchASRError,
+    BatchASRQueue,
+    PlaceholderBatchASRClient,
+    VolcanoBatchASRClient,
+)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    """Factory for temporary upload files handed to fast-tier jobs."""
+    counter = iter(range(1000))
+
+    def make(data: bytes = b"x"):
+        path = tmp_path / f"upload-{next(counter)}"
+        path.write_bytes(data)
+        return path
+
+    return make
+
+
+class _FakeClient:
+    """Finishes after *pending* queries; records concurrency."""
+
+    def __init__(self, pending: int = 0, hold: float = 0.0, error: Exception | None = None):
+        self.pending = pending
+        self.hold = hold
+        self.error = error
+        self.submitted: list[tuple[str, str | None]] = []
+        self.query_times: list[float] = []
+        self.active = 0
+        self.max_active = 0
+
+    async def _work(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.hold)
+        finally:
+            self.active -= 1
+        if self.error is not None:
+            raise self.error
+
+    async def recognize(self, job):
+        await self._work()
+        return f"text:{job.audio_format}"
+
+    async def submit(self, job, callback_url=None):
+        self.submitted.append((job.id, callback_url))
+        await self._work()
+
+    async def query(self, job):
+        self.query_times.append(time.monotonic())
+        if len(self.query_times) <= self.pending:
+            return None
+        return "你好"
+
+
+def _queue(clients=None, **kwargs) -> BatchASRQueue:
+    options = {
+        "concurrency": {ASRTier.FAST: 2, ASRTier.STANDARD: 1, ASRTier.IDLE: 1},
+        "queue_size": 10,
+        "poll_initial": 0.01,
+        "poll_max": 0.04,
+        "timeout": 5.0,
+        "callback_url": "",
+    }
+    options.update(kwargs)
+    clients = clients or {tier: PlaceholderBatchASRClient() for tier in ASRTier}
+    return BatchASRQueue(clients=clients, **options)
+
+
+# ===================================================================
+# Queue behaviour
+# ===================================================================
+
+
+class TestBatchASRQueue:
+    def test_fast_tier_inline_audio(self, audio_file):
+        fake = _FakeClient()
+        completed = []
+        path = audio_file(b"RIFF")
+
+        async def go():
+            q = _queue({ASRTier.FAST: fake})
+            job = q.submit(ASRTier.FAST, audio_path=path, audio_format="wav",
+                           on_complete=completed.append)
+            assert job.status == "queued"
+            await q.wait(job.id, 1)
+            await q.stop()
+            return job
+
+        job = _run(go())
+        assert (job.status, job.text) == ("done", "text:wav")
+        assert job.audio_path is None
+        assert not path.exists()  # the upload is deleted once the job has run
+        assert completed == [job]
+
+    def test_poll_with_backoff(self):
+        fake = _FakeClient(pending=3)
+
+        async def go():
+            q = _queue({ASRTier.IDLE: fake})
+            job = q.submit(ASRTier.IDLE, audio_url="https://x/a.mp3")
+            await q.wait(job.id, 2)
+            await q.stop()
+            return job
+
+        job = _run(go())
+        assert job.text == "你好"
+        assert job.polls == 4
+        gaps = [b - a for a, b in zip(fake.query_times, fake.query_times[1:])]
+        # 0.01 s, doubled each time, capped at 0.04 s
+        assert gaps[0] < gaps[1] < gaps[2]
+        assert gaps[2] < 0.04 + 0.03
+
+    def test_callback_wakes_poller(self):
+        fake = _FakeClient(pending=1)
+
+        async def go():
+            q = _queue({ASRTier.STANDARD: fake}, poll_initial=30, callback_url="https://api.example/cb/")
+            job = q.submit(ASRTier.STANDARD, audio_url="https://x/a.mp3")
+            while not fake.query_times:
+                await asyncio.sleep(0.005)
+            assert not q.notify(job.id, "wrong-token")
+            assert not q.notify("no-such-job", job.callback_token)
+            assert q.notify(job.id, job.callback_token)
+            await q.wait(job.id, 1)
+            await q.stop()
+            return job
+
+        job = _run(go())
+        assert job.status == "done"
+        assert fake.submitted == [(job.id, f"https://api.example/cb/{job.id}?token={job.callback_token}")]
+
+    def test_per_tier_concurrency(self, audio_file):
+        fast = _FakeClient(hold=0.05)
+        idle = _FakeClient(hold=0.5)
+
+        async def go():
+            q = _queue({ASRTier.FAST: fast, ASRTier.IDLE: idle})
+            idle_jobs = [q.submit(ASRTier.IDLE, audio_url=f"https://x/{i}.mp3") for i in range(3)]
+            fast_jobs = [q.submit(ASRTier.FAST, audio_path=audio_file()) for _ in range(5)]
+            start = time.monotonic()
+            for job in fast_jobs:
+                await q.wait(job.id, 2)
+            elapsed = time.monotonic() - start
+            stats = q.stats()
+            await q.stop()
+            return elapsed, stats, idle_jobs
+
+        elapsed, stats, idle_jobs = _run(go())
+        assert fast.max_active == 2
+        assert idle.max_active == 1
+        # 5 fast jobs two at a time: three rounds, not stuck behind idle work
+        assert elapsed < 0.4
+        assert stats["fast"]["done"] == 5
+        assert stats["idle"]["running"] == 1
+        assert all(job.status != "done" for job in idle_jobs)
+
+    def test_failure_and_timeout(self, audio_file):
+        async def go():
+            q = _queue({
+                ASRTier.FAST: _FakeClient(error=BatchASRError("45000001", "bad audio")),
+                ASRTier.IDLE: _FakeClient(pending=1000),
+            }, timeout=0.1)
+            failed = q.submit(ASRTier.FAST, audio_path=audio_file())
+            slow = q.submit(ASRTier.IDLE, audio_url="https://x/a.mp3")
+            await q.wait(failed.id, 1)
+            await q.wait(slow.id, 1)
+            stats = q.stats()
+            await q.stop()
+            return failed, slow, stats
+
+        failed, slow, stats = _run(go())
+        assert (failed.status, failed.error) == ("failed", "45000001: bad audio")
+        assert (slow.status, slow.error) == ("failed", "timed out")
+        assert stats["fast"]["failed"] == stats["idle"]["failed"] == 1
+
+    def test_queue_full_and_validation(self, audio_file):
+        async def go():
+            q = _queue({ASRTier.IDLE: _FakeClient(hold=1)}, queue_size=1)
+            q.submit(ASRTier.IDLE, audio_url="https://x/1.mp3")
+            await asyncio.sleep(0.01)  # the worker takes the first job
+            q.submit(ASRTier.IDLE, audio_url="https://x/2.mp3")
+            with pytest.raises(ASRQueueFull):
+                q.submit(ASRTier.IDLE, audio_url="https://x/3.mp3")
+            with pytest.raises(ValueError):
+                q.submit(ASRTier.IDLE, audio_path=audio_file())
+            with pytest.raises(ValueError):
+                q.submit(ASRTier.FAST)
+            stats = q.stats()
+            await q.stop()
+            return stats
+
+        assert _run(go())["idle"]["rejected"] == 1
+
+    def test_rejected_upload_is_deleted(self, audio_file):
+        path = audio_file()
+
+        async def go():
+            q = _queue(concurrency={tier: 0 for tier in ASRTier}, queue_size=1)
+            q.submit(ASRTier.FAST, audio_url="https://x/1.mp3")
+            with pytest.raises(ASRQueueFull):
+                q.submit(ASRTier.FAST, audio_path=path)
+
+        _run(go())
+        assert not path.exists()
+
+    def test_queued_jobs_are_kept_or_failed(self, audio_file):
+        q = _queue(concurrency={tier: 0 for tier in ASRTier})
+        path = audio_file()
+
+        async def first():
+            jobs = [q.submit(ASRTier.IDLE, audio_url=f"https://x/{i}.mp3") for i in range(2)]
+            jobs.append(q.submit(ASRTier.FAST, audio_path=path))
+            return jobs, q.stats()
+
+        jobs, stats = _run(first())
+        # respawning workers on the same loop keeps the queued jobs
+        assert (stats["idle"]["queued"], stats["fast"]["queued"]) == (2, 1)
+
+        async def on_new_loop():
+            q.submit(ASRTier.IDLE, audio_url="https://x/new.mp3")
+            return q.stats()
+
+        stats = _run(on_new_loop())
+        # jobs queued on a previous loop can never run: they fail instead of vanishing
+        assert [(job.status, job.error) for job in jobs] == [("failed", "transcription service restarted")] * 3
+        assert all(job.done.is_set() for job in jobs)
+        assert not path.exists()
+        assert (stats["idle"]["queued"], stats["idle"]["failed"], stats["fast"]["failed"]) == (1, 2, 1)
+
+    def test_stop_fails_running_and_queued_jobs(self):
+        async def go():
+            q = _queue({ASRTier.IDLE: _FakeClient(hold=10)})
+            running = q.submit(ASRTier.IDLE, audio_url="https://x/1.mp3")
+            queued = q.submit(ASRTier.IDLE, audio_url="https://x/2.mp3")
+            await asyncio.sleep(0.01)
+            await q.stop()
+            return running, queued
+
+        running, queued = _run(go())
+        assert (running.status, queued.status) == ("failed", "failed")
+        assert queued.error == "transcription service stopped"
+
+
+# ===================================================================
+# Volcano client
+# ===================================================================
+
+
+def _volcano(handler):
+    real_client = httpx.AsyncClient
+    return patch(
+        "services.asr_jobs.httpx.AsyncClient",
+        side_effect=lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw),
+    )
+
+
+class TestVolcanoClient:
+    def test_flash_recognize(self, audio_file):
+        seen = {}
+
+        def handler(request):
+            seen["path"] = request.url.path
+            seen["headers"] = request.headers
+            seen["body"] = json.loads(request.content)
+            return httpx.Response(200, json={"result": {"text": "测试"}},
+                                  headers={"X-Api-Status-Code": "20000000"})
+
+        job = ASRJob(ASRTier.FAST, audio_path=audio_file(b"\x01\x02"), audio_format="wav", user_id="u1")
+        with _volcano(handler), patch("services.asr_jobs.settings.VOLCANO_APP_ID", "app"):
+            text = _run(VolcanoBatchASRClient("res-fast", "https://asr.example/api").recognize(job))
+
+        assert text == "测试"
+        assert seen["path"] == "/api/recognize/flash"
+        assert seen["headers"]["X-Api-Resource-Id"] == "res-fast"
+        assert seen["headers"]["X-Api-Request-Id"] == job.id
+        assert seen["headers"]["X-Api-App-Key"] == "app"
+        assert seen["body"]["audio"] == {"format": "wav", "data": base64.b64encode(b"\x01\x02").decode()}
+
+    def test_query_status_codes(self):
+        codes = iter(["20000002", "20000001", "20000000", "20000003", "45000151"])
+
+        def handler(request):
+            return httpx.Response(200, json={"result": {"text": "好"}},
+                                  headers={"X-Api-Status-Code": next(codes), "X-Api-Message": "invalid"})
+
+        client = VolcanoBatchASRClient("res-idle", "https://asr.example/api")
+        job = ASRJob(ASRTier.IDLE, audio_url="https://x/a.mp3")
+        with _volcano(handler):
+            assert _run(client.query(job)) is None
+            assert _run(client.query(job)) is None
+            assert _run(client.query(job)) == "好"
+            assert _run(client.query(job)) == ""  # silent audio
+            with pytest.raises(BatchASRError) as exc:
+                _run(client.query(job))
+        assert exc.value.code == "45000151"
+
+
+# ===================================================================
+# API
+# ===================================================================
+
+
+_USER = {"user_id": "user-asr-jobs", "role": "elder"}
+
+
+async def _auth():
+    return _USER
+
+
+class TestTranscribeJobsAPI:
+    def test_submit_and_poll(self):
+        q = _queue()
+        app.dependency_overrides[require_auth] = _auth
+        try:
+            with patch("main.settings.MEDICATION_REMINDER_PREWARM", False), \
+                    patch("api.v1.ai_voice.asr_jobs", q), TestClient(app) as c:
+                resp = c.post(
+                    "/api/v1/voice/transcribe-jobs",
+                    files={"file": ("a.mp3", b"RIFF\x00\x00\x00\x00WAVEfmt " + b"\x00" * 64, "audio/wav")},
+                )
+                assert resp.status_code == 202
+                job_id = resp.json()["job_id"]
+                assert resp.json()["tier"] == "fast"
+                for _ in range(100):
+                    body = c.get(f"/api/v1/voice/transcribe-jobs/{job_id}").json()
+                    if body["status"] == "done":
+                        break
+                    time.sleep(0.01)
+                assert body["text"] == "这是语音转写的占位文本"
+                assert q.get(job_id).audio_path is None
+                assert q.get(job_id).audio_format == "wav"  # sniffed, not from the filename
+
+                q.get(job_id).user_id = "someone-else"
+                assert c.get(f"/api/v1/voice/transcribe-jobs/{job_id}").status_code == 404
+
+                assert c.post(f"/api/v1/voice/asr-callback/{job_id}?token=bad").status_code == 404
+                token = q.get(job_id).callback_token
+                assert c.post(f"/api/v1/voice/asr-callback/{job_id}?token={token}").status_code == 204
+        finally:
+            app.dependency_overrides.pop(require_auth, None)
+
+    def test_voice_message_transcribed_on_idle_tier(self):
+        from api.v1.messages import send_voice_message
+        from models.message import VoiceMessageCreate
+
+        row = {"id": "msg-1", "sender_id": "u1", "receiver_id": "u2", "type": "voice"}
+        mock_pg = MagicMock()
+        mock_pg.from_.return_value.insert.return_value.execute.return_value = MagicMock(data=[row])
+        idle = _FakeClient()
+        body = VoiceMessageCreate(sender_id="u1", receiver_id="u2", type="voice",
+                                  audio_url="https://cdn.example/voice/a.ogg")
+
+        async def go():
+            q = _queue({ASRTier.IDLE: idle, ASRTier.FAST: PlaceholderBatchASRClient(),
+                        ASRTier.STANDARD: PlaceholderBatchASRClient()})
+            with patch("api.v1.messages.postgrest", mock_pg), patch("api.v1.messages.asr_jobs", q):
+                await send_voice_message(body, {"user_id": "u1"})
+                (job,) = q._jobs.values()
+                await q.wait(job.id, 1)
+                await asyncio.sleep(0.05)  # completion handler writes the text
+                await q.stop()
+            return job
+
+        job = _run(go())
+        assert (job.tier, job.audio_format) == (ASRTier.IDLE, "ogg")
+        mock_pg.from_.return_value.update.assert_called_once_with({"content": "你好"})
+        mock_pg.from_.return_value.update.return_value.eq.assert_called_once_with("id", "msg-1")
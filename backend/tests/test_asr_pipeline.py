@@ -0,0 +1,275 @@
+"""验证流式识别流水线 (StreamingASRPipeline)
+
+Tests:
+- Volcano binary protocol frames round-trip
+- bounded audio queue pushes back on the receive stage
+- partial results merge when the caller falls behind; finals are kept
+- recognizer errors propagate to the caller
+- VolcanoRecognizer against a fake ASR socket
+- per-stage metrics, including end of speech to final text
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import struct
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from services.asr_pipeline import (
+    ASRMetrics,
+    PlaceholderRecognizer,
+    StreamingASRPipeline,
+    VolcanoRecognizer,
+)
+from services.volcano_protocol import (
+    MSG_AUDIO_ONLY_REQUEST,
+    VolcanoProtocolError,
+    decode_frame,
+    encode_audio,
+)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _server_frame(body: dict, last: bool = False) -> bytes:
+    payload = gzip.compress(json.dumps(body).encode())
+    header = bytes([0x11, 0x93 if last else 0x91, 0x11, 0x00])
+    return header + struct.pack(">i", -2 if last else 2) + struct.pack(">I", len(payload)) + payload
+
+
+async def _chunks(n: int, size: int = 320):
+    for _ in range(n):
+        yield b"\x00" * size
+
+
+class _ScriptedRecognizer:
+    """Recognizer that emits one partial per chunk with cumulative text."""
+
+    def __init__(self, fail_after: int | None = None, send_delay: float = 0.0):
+        self.sent: list[bytes] = []
+        self.fail_after = fail_after
+        self.send_delay = send_delay
+        self._results: asyncio.Queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+    async def send(self, chunk):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.sent.append(chunk)
+        if self.fail_after is not None and len(self.sent) > self.fail_after:
+            await self._results.put(RuntimeError("recognizer failed"))
+            return
+        await self._results.put({"text": "字" * len(self.sent), "is_final": False})
+
+    async def finish(self):
+        await self._results.put({"text": "字" * len(self.sent) + "。", "is_final": True})
+
+    async def results(self):
+        while True:
+            item = await self._results.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            if item["is_final"]:
+                return
+
+
+# ===================================================================
+# Protocol
+# ===================================================================
+
+
+class TestVolcanoProtocol:
+    def test_audio_frame_flags(self):
+        frame = encode_audio(b"abc", last=True)
+        assert frame[1] >> 4 == MSG_AUDIO_ONLY_REQUEST
+        assert frame[1] & 0x0F == 0b0010
+        assert frame[4:] == struct.pack(">I", 3) + b"abc"
+
+    def test_decode_gzip_response(self):
+        frame = decode_frame(_server_frame({"code": 1000}, last=True))
+        assert frame.is_last
+        assert frame.sequence == -2
+        assert frame.json() == {"code": 1000}
+
+    def test_error_frame(self):
+        message = b"bad request"
+        raw = bytes([0x11, 0xF0, 0x10, 0x00]) + struct.pack(">II", 45000001, len(message)) + message
+        with pytest.raises(VolcanoProtocolError) as info:
+            decode_frame(raw)
+        assert info.value.code == 45000001
+
+
+# ===================================================================
+# Pipeline
+# ===================================================================
+
+
+class TestPipeline:
+    def test_placeholder_flow(self):
+        pipeline = StreamingASRPipeline(PlaceholderRecognizer(), metrics=ASRMetrics())
+
+        async def collect():
+            return [r async for r in pipeline.results(_chunks(3))]
+
+        results = _run(collect())
+        assert results[-1]["is_final"] is True
+        sequences = [r["sequence"] for r in results]
+        assert sequences == sorted(sequences)
+
+    def test_audio_queue_backpressure(self):
+        metrics = ASRMetrics()
+        recognizer = _ScriptedRecognizer(send_delay=0.005)
+        pipeline = StreamingASRPipeline(recognizer, audio_queue_size=2, metrics=metrics)
+        pulled = []
+
+        async def source():
+            for i in range(10):
+                pulled.append(i)
+                yield b"\x00" * 10
+
+        async def collect():
+            first = None
+            async for result in pipeline.results(source()):
+                if first is None:
+                    # Receive stage cannot run far ahead of the recognizer
+                    first = (len(pulled), len(recognizer.sent))
+            return first
+
+        pulled_at_first, sent_at_first = _run(collect())
+        assert pulled_at_first - sent_at_first <= 4
+        assert len(recognizer.sent) == 10
+        assert metrics.stats()["chunks"] == 10
+
+    def test_partials_merge_for_slow_consumer(self):
+        metrics = ASRMetrics()
+        pipeline = StreamingASRPipeline(
+            _ScriptedRecognizer(), result_queue_size=2, metrics=metrics,
+        )
+
+        async def collect():
+            results = []
+            async for result in pipeline.results(_chunks(20)):
+                results.append(result)
+                await asyncio.sleep(0.01)  # slow client socket
+            return results
+
+        results = _run(collect())
+        partials = [r for r in results if not r["is_final"]]
+        assert len(partials) < 20
+        assert results[-1] == {"text": "字" * 20 + "。", "is_final": True, "sequence": 21}
+        assert metrics.partials_merged + metrics.partials_dropped == 20 - len(partials)
+        # Cumulative text never goes backwards after merging
+        lengths = [len(r["text"]) for r in results]
+        assert lengths == sorted(lengths)
+
+    def test_recognizer_error_propagates(self):
+        metrics = ASRMetrics()
+        pipeline = StreamingASRPipeline(_ScriptedRecognizer(fail_after=2), metrics=metrics)
+
+        async def collect():
+            return [r async for r in pipeline.results(_chunks(5))]
+
+        with pytest.raises(RuntimeError, match="recognizer failed"):
+            _run(collect())
+        assert metrics.errors == 1
+
+    def test_stage_metrics(self):
+        metrics = ASRMetrics()
+        pipeline = StreamingASRPipeline(_ScriptedRecognizer(), metrics=metrics)
+
+        async def collect():
+            return [r async for r in pipeline.results(_chunks(3))]
+
+        _run(collect())
+        stages = metrics.stats()["stages"]
+        assert stages["end_to_final"]["count"] == 1
+        assert stages["receive_wait"]["count"] == 3
+        assert stages["recognize"]["count"] >= 1
+        assert stages["send"]["count"] >= 2
+        assert metrics.sessions == 1
+
+
+# ===================================================================
+# VolcanoRecognizer
+# ===================================================================
+
+
+class _FakeASRSocket:
+    def __init__(self, responses):
+        self.responses = responses
+        self.sent: list[bytes] = []
+        self.closed = False
+        self._finished = asyncio.Event()
+
+    async def send(self, data):
+        self.sent.append(data)
+        if data[1] & 0x0F == 0b0010:
+            self._finished.set()
+
+    async def close(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for frame in self.responses[:-1]:
+            yield frame
+        await self._finished.wait()
+        yield self.responses[-1]
+
+
+class TestVolcanoRecognizer:
+    def _recognizer(self):
+        return VolcanoRecognizer(
+            url="wss://asr", app_id="app", access_token="token", cluster="cluster",
+        )
+
+    def test_streams_partials_and_final(self):
+        socket = _FakeASRSocket([
+            _server_frame({"code": 1000, "sequence": 1}),
+            _server_frame({"code": 1000, "sequence": 2, "result": [{"text": "你好"}]}),
+            _server_frame({"code": 1000, "sequence": -3, "result": [{"text": "你好。"}]}, last=True),
+        ])
+        pipeline = StreamingASRPipeline(self._recognizer(), metrics=ASRMetrics())
+
+        async def collect():
+            with patch("services.asr_pipeline.websockets.connect", AsyncMock(return_value=socket)):
+                return [r async for r in pipeline.results(_chunks(2))]
+
+        results = _run(collect())
+
+        assert results[-1]["text"] == "你好。"
+        assert results[-1]["is_final"] is True
+        assert socket.closed
+        request = decode_frame(socket.sent[0]).json()
+        assert request["app"] == {"appid": "app", "cluster": "cluster", "token": "token"}
+        assert request["audio"]["format"] == "raw"
+        assert len(socket.sent) == 4  # request, two audio chunks, last packet
+
+    def test_server_error_code(self):
+        socket = _FakeASRSocket([
+            _server_frame({"code": 1013, "message": "no valid speech"}),
+            _server_frame({"code": 1000}, last=True),
+        ])
+        pipeline = StreamingASRPipeline(self._recognizer(), metrics=ASRMetrics())
+
+        async def collect():
+            with patch("services.asr_pipeline.websockets.connect", AsyncMock(return_value=socket)):
+                return [r async for r in pipeline.results(_chunks(1))]
+
+        with pytest.raises(VolcanoProtocolError) as info:
+            _run(collect())
+        assert info.value.code == 1013
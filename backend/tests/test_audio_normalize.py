@@ -0,0 +1,173 @@
+"""验证上传音频解码与归一化 (prepare_for_asr)
+
+Tests:
+- container sniffed from magic bytes, not the filename
+- WAV 44.1 kHz stereo / 24-bit / float decoded to 16 kHz mono PCM
+- resampler output independent of block boundaries, tone frequency kept
+- loudness normalization lifts quiet speech, leaves silence alone
+- compressed formats via the ffmpeg decoder, passthrough without it
+"""
+
+from __future__ import annotations
+
+import asyncio
+import struct
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from services.audio_normalize import (
+    AudioDecodeError,
+    LoudnessNormalizer,
+    StreamingResampler,
+    prepare_for_asr,
+    sniff_format,
+)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _wav(samples: np.ndarray, rate: int, channels: int = 1, bits: int = 16, tag: int = 1) -> bytes:
+    if tag == 3:
+        data = samples.astype("<f4").tobytes()
+    elif bits == 24:
+        ints = (samples * 8388607).astype("<i4").tobytes()
+        data = b"".join(ints[i:i + 3] for i in range(0, len(ints), 4))
+    else:
+        data = (samples * 32767).astype("<i2").tobytes()
+    block_align = channels * bits // 8
+    return (
+        b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, tag, channels, rate, rate * block_align, block_align, bits)
+        + b"data" + struct.pack("<I", len(data)) + data
+    )
+
+
+def _tone(freq: float, seconds: float, rate: int, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+
+async def _pieces(data: bytes, size: int = 4096):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _decode(data: bytes, declared: str = "mp3", **kwargs) -> tuple[bytes, str]:
+    async def go():
+        stream, fmt = await prepare_for_asr(_pieces(data), declared, **kwargs)
+        return b"".join([c async for c in stream]), fmt
+
+    return _run(go())
+
+
+def _dominant_freq(pcm: bytes, rate: int = 16000) -> float:
+    x = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(x))
+    return float(np.argmax(spectrum) * rate / len(x))
+
+
+class TestSniff:
+    @pytest.mark.parametrize("head, expected", [
+        (b"RIFF\x00\x00\x00\x00WAVEfmt ", "wav"),
+        (b"OggS\x00\x02", "ogg"),
+        (b"\x1a\x45\xdf\xa3\x9f", "webm"),
+        (b"ID3\x04\x00", "mp3"),
+        (bytes([0xFF, 0xFB, 0x90, 0x00]), "mp3"),
+        (b"fLaC\x00", "flac"),
+        (b"\x00\x01\x02\x03", None),
+    ])
+    def test_magic_bytes(self, head, expected):
+        assert sniff_format(head) == expected
+
+
+class TestWavDecode:
+    def test_stereo_44k_to_16k_mono(self):
+        stereo = np.repeat(_tone(440, 1.0, 44100), 2)
+        pcm, fmt = _decode(_wav(stereo, 44100, channels=2), declared="mp3")
+        assert fmt == "pcm"
+        assert len(pcm) == pytest.approx(16000 * 2, abs=8)
+        assert _dominant_freq(pcm) == pytest.approx(440, abs=2)
+
+    def test_24_bit_and_float(self):
+        for wav in (_wav(_tone(300, 0.5, 16000), 16000, bits=24),
+                    _wav(_tone(300, 0.5, 16000), 16000, bits=32, tag=3)):
+            pcm, _fmt = _decode(wav)
+            assert len(pcm) == 16000
+            assert _dominant_freq(pcm) == pytest.approx(300, abs=2)
+
+    def test_unsupported_encoding(self):
+        with pytest.raises(AudioDecodeError):
+            _decode(_wav(_tone(300, 0.1, 8000), 8000, tag=6, bits=8))
+
+    def test_garbage_wav(self):
+        with pytest.raises(AudioDecodeError):
+            _decode(b"RIFF\x00\x00\x00\x00WAVE" + b"\x00" * 70000)
+
+
+class TestResampler:
+    def test_block_boundaries_do_not_matter(self):
+        x = _tone(1000, 0.5, 48000).astype(np.float32)
+        whole = StreamingResampler(48000).process(x)
+        r = StreamingResampler(48000)
+        parts = np.concatenate([r.process(x[i:i + 777]) for i in range(0, len(x), 777)])
+        assert len(parts) == len(whole)
+        assert np.allclose(parts, whole, atol=1e-5)
+
+    def test_aliasing_suppressed(self):
+        # 12 kHz is above the 8 kHz output Nyquist and must be filtered out
+        x = _tone(12000, 0.5, 48000).astype(np.float32)
+        out = StreamingResampler(48000).process(x)
+        assert np.sqrt(np.mean(out[100:] ** 2)) < 0.01
+
+    def test_upsampling(self):
+        out = StreamingResampler(8000).process(_tone(300, 1.0, 8000).astype(np.float32))
+        assert len(out) == pytest.approx(16000, abs=2)
+
+
+class TestLoudness:
+    def test_quiet_speech_raised(self):
+        quiet = _tone(300, 2.0, 16000, amplitude=0.01).astype(np.float32)
+        out = LoudnessNormalizer(target_db=-20, max_gain_db=30).process(quiet)
+        level_db = 20 * np.log10(np.sqrt(np.mean(out[8000:] ** 2)))
+        assert level_db == pytest.approx(-20, abs=1)
+
+    def test_gain_capped(self):
+        quiet = _tone(300, 1.0, 16000, amplitude=0.01).astype(np.float32)
+        out = LoudnessNormalizer(target_db=-20, max_gain_db=6).process(quiet)
+        assert np.max(np.abs(out)) == pytest.approx(0.02, rel=0.05)
+
+    def test_noise_below_gate_untouched(self):
+        normalizer = LoudnessNormalizer(target_db=-20, max_gain_db=30)
+        normalizer.process(_tone(300, 1.0, 16000, amplitude=0.01).astype(np.float32))
+        noise = np.full(3200, 0.001, dtype=np.float32)
+        assert np.allclose(normalizer.process(noise), noise)
+
+
+class TestCompressed:
+    def test_passthrough_without_decoder(self):
+        mp3 = bytes([0xFF, 0xFB, 0x90, 0x00]) + b"\x00" * 413
+        with patch("services.audio_normalize.settings.AUDIO_FFMPEG_PATH", ""):
+            data, fmt = _decode(mp3 * 3, declared="ogg")
+        assert fmt == "mp3"
+        assert data == mp3 * 3
+
+    def test_ffmpeg_decoder(self, tmp_path):
+        # Stand-in decoder that echoes stdin as s16le output
+        fake = tmp_path / "ffmpeg"
+        fake.write_text("#!/bin/sh\ncat\n")
+        fake.chmod(0o755)
+        ogg = b"OggS" + b"\x00" * 3996
+        data, fmt = _decode(ogg, ffmpeg=str(fake))
+        assert fmt == "pcm"
+        assert len(data) == len(ogg)
+
+    def test_ffmpeg_failure(self, tmp_path):
+        fake = tmp_path / "ffmpeg"
+        fake.write_text("#!/bin/sh\ncat > /dev/null\necho broken >&2\nexit 1\n")
+        fake.chmod(0o755)
+        with pytest.raises(AudioDecodeError):
+            _decode(b"OggS" + b"\x00" * 100, ffmpeg=str(fake))
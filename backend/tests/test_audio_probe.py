@@ -0,0 +1,240 @@
+"""验证音频时长探测 (audio_probe)
+
+Tests:
+- MP3: frame walk, Xing/LAME and VBRI frame counts, CBR estimate from the head
+- WAV: data chunk over byte rate, streaming (unknown) data size
+- Ogg: Opus pre-skip and Vorbis rate, last page granule from the tail
+- probe_url fetches only the head and tail with range requests
+- broadcasts store the probed duration
+"""
+
+from __future__ import annotations
+
+import asyncio
+import struct
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from services.audio_probe import probe, probe_storage_url, probe_url
+from services.health_broadcast import HealthBroadcastService
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417-byte frames of 1152 samples
+_FRAME = bytes([0xFF, 0xFB, 0x90, 0x00]) + b"\x00" * 413
+_FRAME_SECONDS = 1152 / 44100
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _xing_frame(frames: int, delay: int = 0, padding: int = 0) -> bytes:
+    body = bytearray(_FRAME)
+    tag = b"Info" + struct.pack(">II", 0x1, frames)
+    tag += b"LAME3.100" + b"\x00" * 12
+    tag += bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8), padding & 0xFF])
+    body[36:36 + len(tag)] = tag
+    return bytes(body)
+
+
+def _vbri_frame(frames: int) -> bytes:
+    body = bytearray(_FRAME)
+    tag = b"VBRI" + struct.pack(">HHHII", 1, 0, 75, 417 * frames, frames)
+    body[36:36 + len(tag)] = tag
+    return bytes(body)
+
+
+def _wav(seconds: float, rate: int = 16000, data_size: int | None = None) -> bytes:
+    data = b"\x00" * int(rate * 2 * seconds)
+    size = len(data) if data_size is None else data_size
+    return (
+        b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16)
+        + b"LIST" + struct.pack("<I", 3) + b"abc\x00"
+        + b"data" + struct.pack("<I", size) + data
+    )
+
+
+def _ogg_page(payload: bytes, granule: int, seq: int, serial: int = 7, flags: int = 0) -> bytes:
+    segments = [255] * (len(payload) // 255) + [len(payload) % 255]
+    return (
+        b"OggS" + struct.pack("<BBqIII", 0, flags, granule, serial, seq, 0)
+        + bytes([len(segments)]) + bytes(segments) + payload
+    )
+
+
+def _opus(seconds: float, pre_skip: int = 312, pages: int = 20) -> bytes:
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, pre_skip, 16000, 0, 0)
+    out = _ogg_page(head, 0, 0, flags=0x02) + _ogg_page(b"OpusTags" + b"\x00" * 8, 0, 1)
+    total = int(48000 * seconds) + pre_skip
+    for i in range(1, pages + 1):
+        out += _ogg_page(b"\x55" * 4000, total * i // pages, i + 1, flags=0x04 if i == pages else 0)
+    return out
+
+
+def _vorbis(seconds: float, rate: int = 44100) -> bytes:
+    ident = b"\x01vorbis" + struct.pack("<IBIiiiB", 0, 2, rate, 0, 128000, 0, 0xB8) + b"\x01"
+    samples = int(rate * seconds)
+    return _ogg_page(ident, 0, 0, flags=0x02) + _ogg_page(b"\x00" * 3000, samples, 1, flags=0x04)
+
+
+# ===================================================================
+# MP3
+# ===================================================================
+
+
+class TestMp3:
+    def test_cbr_frame_walk(self):
+        info = probe(_FRAME * 50)
+        assert info.format == "mp3"
+        assert info.duration == pytest.approx(50 * _FRAME_SECONDS)
+        assert (info.sample_rate, info.channels) == (44100, 2)
+        assert info.bitrate == pytest.approx(128000, rel=0.01)
+
+    def test_id3_and_junk_skipped(self):
+        id3 = b"ID3\x04\x00\x00" + bytes([0, 0, 0, 20]) + b"\x00" * 20
+        info = probe(id3 + b"\xff\x00junk" + _FRAME * 10 + b"TAG" + b"\x00" * 125)
+        assert info.duration == pytest.approx(10 * _FRAME_SECONDS)
+
+    def test_xing_frame_count_with_lame_gapless(self):
+        # Only the head is present, but the Info tag gives the total
+        data = _xing_frame(1000, delay=576, padding=1000) + _FRAME * 5
+        info = probe(data, total_size=417 * 1001)
+        assert info.duration == pytest.approx((1000 * 1152 - 1576) / 44100)
+
+    def test_vbri_frame_count(self):
+        info = probe(_vbri_frame(200) + _FRAME * 5, total_size=417 * 201)
+        assert info.duration == pytest.approx(200 * _FRAME_SECONDS)
+
+    def test_head_only_cbr_estimate(self):
+        info = probe(_FRAME * 5, total_size=417 * 300)
+        # Sized from the nominal bitrate; these frames omit the padding byte
+        assert info.duration == pytest.approx(300 * _FRAME_SECONDS, rel=0.005)
+
+    def test_not_audio(self):
+        assert probe(b"hello world" * 100) is None
+
+
+# ===================================================================
+# WAV / Ogg
+# ===================================================================
+
+
+class TestWav:
+    def test_data_chunk_after_other_chunks(self):
+        info = probe(_wav(1.5))
+        assert (info.format, info.duration, info.sample_rate, info.channels) == ("wav", 1.5, 16000, 1)
+
+    def test_streaming_size_uses_file_size(self):
+        wav = _wav(2.0, data_size=0xFFFFFFFF)
+        assert probe(wav[:4096], total_size=len(wav)).duration == pytest.approx(2.0)
+
+
+class TestOgg:
+    def test_opus_pre_skip(self):
+        info = probe(_opus(2.5))
+        assert (info.format, info.sample_rate, info.channels) == ("ogg", 48000, 1)
+        assert info.duration == pytest.approx(2.5)
+
+    def test_vorbis_rate(self):
+        info = probe(_vorbis(3.0))
+        assert (info.sample_rate, info.channels) == (44100, 2)
+        assert info.duration == pytest.approx(3.0)
+
+    def test_head_needs_tail(self):
+        ogg = _opus(4.0)
+        assert probe(ogg[:8192], total_size=len(ogg)) is None
+        info = probe(ogg[:8192], total_size=len(ogg), tail=ogg[-6000:])
+        assert info.duration == pytest.approx(4.0)
+
+    def test_truncated_last_page_ignored(self):
+        ogg = _opus(2.0, pages=4)
+        info = probe(ogg[:-100])
+        assert info.duration == pytest.approx((96000 * 3 // 4 + 312 * 3 // 4 - 312) / 48000)
+
+
+# ===================================================================
+# Remote files
+# ===================================================================
+
+
+def _range_server(data: bytes, requests: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        spec = request.headers["range"].removeprefix("bytes=")
+        requests.append(spec)
+        first, last = spec.split("-")
+        if first == "":
+            start, end = max(len(data) - int(last), 0), len(data)
+        else:
+            start, end = int(first), min(int(last) + 1, len(data))
+        return httpx.Response(
+            206, content=data[start:end],
+            headers={"Content-Range": f"bytes {start}-{end - 1}/{len(data)}"},
+        )
+
+    transport = httpx.MockTransport(handler)
+    real_client = httpx.AsyncClient
+
+    def factory(**kwargs):
+        return real_client(transport=transport, **kwargs)
+
+    return patch("services.audio_probe.httpx.AsyncClient", side_effect=factory)
+
+
+class TestProbeUrl:
+    def test_ogg_head_and_tail_only(self):
+        ogg = _opus(60.0, pages=200)
+        requests: list = []
+        with _range_server(ogg, requests):
+            info = _run(probe_url("https://files.example/a.opus"))
+        assert info.duration == pytest.approx(60.0)
+        assert requests == ["0-65535", "-65536"]
+        assert len(ogg) > 2 * 65536
+
+    def test_mp3_single_request(self):
+        mp3 = _xing_frame(2000) + _FRAME * 300
+        requests: list = []
+        with _range_server(mp3, requests):
+            info = _run(probe_url("https://files.example/a.mp3"))
+        assert info.duration == pytest.approx(2000 * _FRAME_SECONDS)
+        assert requests == ["0-65535"]
+
+    def test_fetch_error_returns_none(self):
+        def handler(request):
+            return httpx.Response(404)
+
+        real_client = httpx.AsyncClient
+        with patch(
+            "services.audio_probe.httpx.AsyncClient",
+            side_effect=lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw),
+        ):
+            assert _run(probe_url("https://files.example/missing.mp3")) is None
+
+    def test_storage_only(self):
+        requests: list = []
+        with _range_server(_FRAME * 10, requests), \
+                patch("services.supabase_storage.settings.SUPABASE_URL", "https://proj.supabase.co"):
+            assert _run(probe_storage_url("http://169.254.169.254/latest")) is None
+            info = _run(probe_storage_url("https://proj.supabase.co/storage/v1/object/public/voice/a.mp3"))
+        assert info.duration == pytest.approx(10 * _FRAME_SECONDS)
+        assert len(requests) == 1
+
+
+# ===================================================================
+# Broadcast audio
+# ===================================================================
+
+
+class TestBroadcastDuration:
+    def test_duration_probed_from_tts_audio(self):
+        mp3 = _FRAME * 383  # ~10 s
+        with patch("services.health_broadcast.voice_service.text_to_speech", AsyncMock(return_value=mp3)):
+            audio, duration = _run(HealthBroadcastService().generate_audio("短文本"))
+        assert audio == mp3
+        assert duration == 10.0
+
+    def test_estimate_when_unparseable(self):
+        with patch("services.health_broadcast.voice_service.text_to_speech", AsyncMock(return_value=b"xx")):
+            _audio, duration = _run(HealthBroadcastService().generate_audio("字" * 36))
+        assert duration == 10.0
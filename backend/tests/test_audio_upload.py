@@ -0,0 +1,222 @@
+"""验证音频上传流式落盘 (spool_audio_upload)
+
+Tests:
+- multipart file part streamed into a spool; memory below threshold, disk above
+- the spool can be copied to a named file for queued work
+- size limit enforced from Content-Length before reading and while streaming
+- duration limit from WAV header / MP3 bitrate
+- content-type and missing-part validation
+- /voice/transcribe streams the spooled audio to the ASR backend as PCM
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import struct
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from core.middleware import require_auth
+from main import app
+from services.audio_upload import (
+    AudioUploadError,
+    AudioUploadTooLarge,
+    estimate_byte_rate,
+    spool_audio_upload,
+)
+
+client = TestClient(app)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _wav(seconds: float, byte_rate: int = 32000) -> bytes:
+    data_size = int(seconds * byte_rate)
+    header = (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, byte_rate // 2, byte_rate, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+    return header + b"\x00" * data_size
+
+
+def _request(
+    content: bytes,
+    filename: str = "a.wav",
+    content_type: str = "audio/wav",
+    chunk_size: int = 8192,
+    declare_length: bool = True,
+    field: str = "file",
+) -> Request:
+    """Build a Starlette request whose body arrives in *chunk_size* pieces."""
+    encoded = httpx.Request(
+        "POST", "http://test/upload", files={field: (filename, content, content_type)}
+    )
+    body = encoded.read()
+    headers = [(b"content-type", encoded.headers["content-type"].encode())]
+    if declare_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    pieces = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    received = []
+
+    async def receive():
+        if pieces:
+            piece = pieces.pop(0)
+            received.append(piece)
+            return {"type": "http.request", "body": piece, "more_body": bool(pieces)}
+        return {"type": "http.disconnect"}
+
+    request = Request({"type": "http", "method": "POST", "headers": headers}, receive)
+    request.received_chunks = received  # for assertions
+    return request
+
+
+# ===================================================================
+# spool_audio_upload
+# ===================================================================
+
+
+class TestSpool:
+    def test_small_upload_stays_in_memory(self):
+        content = _wav(0.5)
+        audio = _run(spool_audio_upload(_request(content), spool_threshold=1024 * 1024))
+        try:
+            assert audio.size == len(content)
+            assert audio.filename == "a.wav"
+            assert audio.audio_format == "wav"
+            assert not audio.file._rolled
+            audio.file.seek(0)
+            assert audio.file.read() == content
+        finally:
+            audio.close()
+
+    def test_large_upload_rolls_to_disk(self):
+        content = _wav(3)
+        audio = _run(spool_audio_upload(_request(content), spool_threshold=16 * 1024))
+        try:
+            assert audio.file._rolled
+            assert audio.duration == pytest.approx(3, abs=0.01)
+
+            async def collect():
+                return b"".join([c async for c in audio.chunks(chunk_size=10000)])
+
+            assert _run(collect()) == content
+        finally:
+            audio.close()
+
+    def test_persist_to_named_file(self):
+        content = _wav(0.5)
+        audio = _run(spool_audio_upload(_request(content), spool_threshold=1024 * 1024))
+        try:
+            path = _run(audio.persist())
+        finally:
+            audio.close()
+        try:
+            assert path.read_bytes() == content  # outlives the spool
+        finally:
+            path.unlink()
+
+    def test_declared_length_rejected_before_reading(self):
+        request = _request(b"\x00" * 200_000, filename="a.pcm", content_type="audio/pcm")
+        with pytest.raises(AudioUploadTooLarge):
+            _run(spool_audio_upload(request, max_bytes=50_000))
+        assert request.received_chunks == []
+
+    def test_streamed_size_limit_without_content_length(self):
+        request = _request(
+            b"\x00" * 200_000, filename="a.ogg", content_type="audio/ogg",
+            declare_length=False,
+        )
+        with pytest.raises(AudioUploadTooLarge):
+            _run(spool_audio_upload(request, max_bytes=50_000))
+        # Rejected mid-stream, not after the whole body was read
+        assert sum(len(c) for c in request.received_chunks) < 100_000
+
+    def test_duration_limit_from_wav_header(self):
+        request = _request(_wav(10))
+        with pytest.raises(AudioUploadTooLarge, match="时长"):
+            _run(spool_audio_upload(request, max_seconds=5))
+        assert len(request.received_chunks) == 1
+
+    def test_unsupported_type(self):
+        with pytest.raises(AudioUploadError, match="不支持"):
+            _run(spool_audio_upload(
+                _request(b"data", filename="a.pdf", content_type="application/pdf"),
+                allowed_types=frozenset({"audio/wav"}),
+            ))
+
+    def test_missing_part(self):
+        with pytest.raises(AudioUploadError, match="缺少"):
+            _run(spool_audio_upload(_request(b"data", field="other")))
+
+
+class TestByteRate:
+    def test_wav(self):
+        assert estimate_byte_rate(_wav(0.1, byte_rate=88200), "wav") == 88200
+
+    def test_mp3_first_frame(self):
+        frame = bytes([0xFF, 0xFB, 0x90, 0x00]) + b"\x00" * 413
+        assert estimate_byte_rate(frame * 2, "mp3") == 16000
+
+    def test_pcm(self):
+        assert estimate_byte_rate(b"\x00" * 10, "pcm") == 32000
+
+    def test_unknown(self):
+        assert estimate_byte_rate(b"OggS" + b"\x00" * 100, "ogg") is None
+
+
+# ===================================================================
+# /voice/transcribe
+# ===================================================================
+
+
+class TestTranscribeStreaming:
+    @pytest.fixture(autouse=True)
+    def _auth(self):
+        app.dependency_overrides[require_auth] = lambda: {"user_id": "u1", "role": "elder"}
+        yield
+        app.dependency_overrides.pop(require_auth, None)
+
+    def test_chunks_reach_asr(self):
+        content = _wav(5)
+        received = []
+
+        formats = []
+
+        async def fake_transcribe(chunks, audio_format="mp3", language="zh-CN"):
+            formats.append(audio_format)
+            async for chunk in chunks:
+                received.append(chunk)
+            return "你好"
+
+        with patch("api.v1.ai_voice.voice_service.transcribe_stream", side_effect=fake_transcribe):
+            resp = client.post(
+                "/api/v1/voice/transcribe",
+                files={"file": ("long.wav", io.BytesIO(content), "audio/wav")},
+            )
+
+        assert resp.status_code == 200
+        assert resp.json()["text"] == "你好"
+        # Decoded to 16 kHz mono PCM: the WAV header is stripped
+        assert formats == ["pcm"]
+        assert len(received) > 1
+        assert b"".join(received) == content[44:]
+
+    def test_oversized_upload_returns_413(self):
+        with patch(
+            "api.v1.ai_voice.spool_audio_upload",
+            side_effect=AudioUploadTooLarge("音频时长超过上限 (1秒)"),
+        ):
+            resp = client.post(
+                "/api/v1/voice/transcribe",
+                files={"file": ("long.wav", io.BytesIO(_wav(2)), "audio/wav")},
+            )
+        assert resp.status_code == 413
+        assert "时长" in resp.json()["detail"]
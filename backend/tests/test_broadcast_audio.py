@@ -0,0 +1,139 @@
+"""验证广播音频存储与播放接口 (GET /radio/audio/{key})
+
+Tests:
+- the local store writes whole files and rejects keys outside its directory
+- full responses carry ETag / Last-Modified / Accept-Ranges
+- Range and If-Range requests (seek and resume); unsatisfiable ranges
+- If-None-Match / If-Modified-Since answer 304
+- the Supabase store redirects to the public object
+"""
+
+from __future__ import annotations
+
+import asyncio
+from email.utils import formatdate
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.broadcast_audio import LocalAudioStore, SupabaseAudioStore, not_modified
+
+client = TestClient(app)
+
+_AUDIO = bytes(range(256)) * 40  # 10 KiB
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalAudioStore(tmp_path, "/api/v1/radio/audio")
+    with patch("api.v1.radio.broadcast_audio_store", store):
+        yield store
+
+
+class TestLocalAudioStore:
+    def test_put_and_locate(self, tmp_path):
+        store = LocalAudioStore(tmp_path, "/api/v1/radio/audio/")
+        url = _run(store.put("b1.mp3", b"mp3", "audio/mpeg"))
+        assert url == "/api/v1/radio/audio/b1.mp3"
+        assert [p.name for p in tmp_path.iterdir()] == ["b1.mp3"]  # no temp file left behind
+        assert _run(store.locate("b1.mp3")) == tmp_path / "b1.mp3"
+        assert _run(store.locate("b2.mp3")) is None
+
+    @pytest.mark.parametrize("key", ["../secret", ".hidden", "a/b.mp3", ""])
+    def test_invalid_keys(self, tmp_path, key):
+        store = LocalAudioStore(tmp_path)
+        with pytest.raises(ValueError):
+            _run(store.put(key, b"x", "audio/mpeg"))
+
+    def test_not_modified(self):
+        etag, modified = '"a-1"', 1_700_000_000.5
+        assert not_modified({"if-none-match": '"x", W/"a-1"'}, etag, modified)
+        assert not_modified({"if-none-match": "*"}, etag, modified)
+        assert not not_modified({"if-none-match": '"b-2"'}, etag, modified)
+        # If-None-Match 优先于 If-Modified-Since
+        later = formatdate(modified + 60, usegmt=True)
+        assert not not_modified({"if-none-match": '"b-2"', "if-modified-since": later}, etag, modified)
+        assert not_modified({"if-modified-since": formatdate(modified, usegmt=True)}, etag, modified)
+        assert not not_modified({"if-modified-since": formatdate(modified - 60, usegmt=True)}, etag, modified)
+        assert not not_modified({"if-modified-since": "garbage"}, etag, modified)
+
+
+class TestServeAudio:
+    def test_full_and_head(self, store):
+        _run(store.put("b1.mp3", _AUDIO, "audio/mpeg"))
+
+        resp = client.get("/api/v1/radio/audio/b1.mp3")
+        assert resp.status_code == 200
+        assert resp.content == _AUDIO
+        assert resp.headers["content-type"] == "audio/mpeg"
+        assert resp.headers["accept-ranges"] == "bytes"
+        assert resp.headers["etag"].startswith('"')
+        assert "last-modified" in resp.headers
+        assert "max-age=" in resp.headers["cache-control"]
+
+        head = client.head("/api/v1/radio/audio/b1.mp3")
+        assert head.status_code == 200
+        assert head.content == b""
+        assert head.headers["content-length"] == str(len(_AUDIO))
+
+    def test_range_requests(self, store):
+        _run(store.put("b1.opus.ogg", _AUDIO, "audio/ogg"))
+        url = "/api/v1/radio/audio/b1.opus.ogg"
+        etag = client.head(url).headers["etag"]
+
+        seek = client.get(url, headers={"Range": "bytes=1000-1999"})
+        assert seek.status_code == 206
+        assert seek.content == _AUDIO[1000:2000]
+        assert seek.headers["content-range"] == f"bytes 1000-1999/{len(_AUDIO)}"
+        assert seek.headers["content-type"] == "audio/ogg"
+
+        resume = client.get(url, headers={"Range": "bytes=9000-", "If-Range": etag})
+        assert resume.status_code == 206
+        assert resume.content == _AUDIO[9000:]
+
+        # 文件已变化：If-Range 不匹配时返回完整内容
+        changed = client.get(url, headers={"Range": "bytes=9000-", "If-Range": '"stale"'})
+        assert changed.status_code == 200
+        assert changed.content == _AUDIO
+
+        beyond = client.get(url, headers={"Range": f"bytes={len(_AUDIO)}-"})
+        assert beyond.status_code == 416
+
+    def test_conditional_requests(self, store):
+        _run(store.put("b1.mp3", _AUDIO, "audio/mpeg"))
+        url = "/api/v1/radio/audio/b1.mp3"
+        first = client.get(url)
+
+        cached = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == first.headers["etag"]
+
+        since = client.get(url, headers={"If-Modified-Since": first.headers["last-modified"]})
+        assert since.status_code == 304
+
+        # 重新写入后 ETag 改变
+        _run(store.put("b1.mp3", _AUDIO[:100], "audio/mpeg"))
+        fresh = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+        assert fresh.status_code == 200
+        assert fresh.content == _AUDIO[:100]
+
+    def test_missing_and_invalid(self, store):
+        assert client.get("/api/v1/radio/audio/nope.mp3").status_code == 404
+        assert client.get("/api/v1/radio/audio/.hidden").status_code == 404
+
+    def test_supabase_store_redirects(self):
+        store = SupabaseAudioStore("health-broadcast-audio")
+        with patch("services.supabase_storage.settings.SUPABASE_URL", "https://x.supabase.co"), \
+                patch("api.v1.radio.broadcast_audio_store", store):
+            resp = client.get("/api/v1/radio/audio/b1.mp3", follow_redirects=False)
+        assert resp.status_code == 307
+        assert resp.headers["location"] == (
+            "https://x.supabase.co/storage/v1/object/public/health-broadcast-audio/b1.mp3"
+        )
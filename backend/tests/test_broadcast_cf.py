@@ -0,0 +1,192 @@
+"""验证广播协同过滤 (CollaborativeFilter)
+
+Tests:
+- vectorized co-occurrence equals the dense XᵀX, also when split into chunks
+- top-k cosine neighbours match a dense computation
+- incremental updates give the same matrix as one full build; replays are idempotent
+- refresh reads new plays after the watermark
+- recommendations blend CF scores with the content filters
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from services.broadcast_cf import (
+    _COL_BITS,
+    _COL_MASK,
+    CollaborativeFilter,
+    cooccurrence,
+    play_weight,
+    top_neighbors,
+)
+from services.broadcast_index import BroadcastIndex
+from services.radio_recommender import RadioRecommender
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _random_plays(seed: int = 0, users: int = 40, items: int = 25) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.random((users, items)) < 0.25) * rng.integers(1, 5, (users, items)).astype(float)
+
+
+def _dense(keys: np.ndarray, vals: np.ndarray, size: int) -> np.ndarray:
+    dense = np.zeros((size, size))
+    dense[keys >> _COL_BITS, keys & _COL_MASK] = vals
+    return dense
+
+
+class TestSparseMath:
+    def test_cooccurrence_matches_dense(self):
+        x = _random_plays()
+        users, items = np.nonzero(x)
+        expected = x.T @ x
+
+        keys, vals = cooccurrence(users, items, x[users, items])
+        assert np.allclose(_dense(keys, vals, x.shape[1]), expected)
+
+        with patch("services.broadcast_cf._MAX_PAIRS_PER_CHUNK", 30):
+            keys, vals = cooccurrence(users, items, x[users, items])
+        assert np.allclose(_dense(keys, vals, x.shape[1]), expected)
+
+    def test_top_neighbors_match_dense_cosine(self):
+        x = _random_plays(seed=1)
+        users, items = np.nonzero(x)
+        keys, vals = cooccurrence(users, items, x[users, items])
+
+        c = x.T @ x
+        norms = np.sqrt(np.diag(c))
+        sims = c / np.outer(norms, norms)
+        np.fill_diagonal(sims, 0)
+
+        neighbors = top_neighbors(keys, vals, 3)
+        for item, near in neighbors.items():
+            assert [other for other, _ in near] == list(np.argsort(-sims[item], kind="stable")[:3])
+            assert np.allclose([sim for _, sim in near], np.sort(sims[item])[::-1][:3])
+
+
+def _plays(x: np.ndarray) -> list[dict]:
+    plays = []
+    for user, item in zip(*np.nonzero(x)):
+        weight = x[user, item]
+        plays.append({
+            "user_id": f"u{user}",
+            "broadcast_id": f"b{item}",
+            "completed": weight >= 2,
+            "liked": weight >= 3,
+        })
+    return plays
+
+
+class TestIncremental:
+    def test_incremental_equals_full_build(self):
+        plays = _plays(_random_plays(seed=2))
+        full = CollaborativeFilter(neighbors=5)
+        full.apply(plays)
+
+        incremental = CollaborativeFilter(neighbors=5)
+        for start in range(0, len(plays), 17):
+            incremental.apply(plays[start:start + 17])
+        assert incremental.apply(plays[:30]) == 0  # replayed rows change nothing
+
+        assert np.array_equal(full._keys, incremental._keys)
+        assert np.allclose(full._vals, incremental._vals)
+        assert full._neighbors.keys() == incremental._neighbors.keys()
+
+    def test_weight_upgrade_and_history_cap(self):
+        cf = CollaborativeFilter(neighbors=5, user_history=2)
+        cf.apply([{"user_id": "u", "broadcast_id": "a"}, {"user_id": "u", "broadcast_id": "b"}])
+        cf.apply([{"user_id": "u", "broadcast_id": "a", "liked": True}])
+        assert cf._profiles["u"] == {cf._item("b"): 1.0, cf._item("a"): play_weight(False, True)}
+
+        cf.apply([{"user_id": "u", "broadcast_id": "c"}])  # b 最早，被移出
+        assert set(cf._profiles["u"]) == {cf._item("a"), cf._item("c")}
+        assert [other for other, _ in cf.neighbors("a")] == ["c"]
+        assert cf.neighbors("b") == []
+
+    @patch("services.broadcast_cf.postgrest")
+    def test_refresh_uses_watermark(self, mock_pg):
+        select = mock_pg.from_.return_value.select.return_value
+        first = [{"user_id": "u1", "broadcast_id": "a", "created_at": "2026-10-01T00:00:00+00:00"},
+                 {"user_id": "u1", "broadcast_id": "b", "created_at": "2026-10-02T00:00:00+00:00"}]
+        select.order.return_value.range.return_value.execute.return_value = MagicMock(data=first)
+        second = [{"user_id": "u2", "broadcast_id": "a", "created_at": "2026-10-03T00:00:00+00:00"}]
+        select.gte.return_value.order.return_value.range.return_value.execute.return_value = MagicMock(data=second)
+
+        cf = CollaborativeFilter()
+        assert _run(cf.refresh()) == 1
+        assert _run(cf.refresh()) == 1
+
+        select.gte.assert_called_once_with("created_at", "2026-10-02T00:00:00+00:00")
+        assert cf.stats()["users"] == 2
+        assert cf.scores({"a": 1.0}) == {"b": cf.neighbors("a")[0][1]}
+
+
+def _row(broadcast_id: str, **fields) -> dict:
+    return {
+        "id": broadcast_id,
+        "title": broadcast_id,
+        "content": "...",
+        "category": "养生保健",
+        "is_published": True,
+        "play_count": 0,
+        "created_at": "2025-06-15T00:00:00+00:00",
+        **fields,
+    }
+
+
+@patch("services.health_broadcast._get_current_season", return_value="夏季")
+class TestBlending:
+    def test_cf_neighbours_rank_higher_within_filters(self, _season):
+        index = BroadcastIndex(weights=(0.0, 1.0, 0.0))
+        index.load([
+            _row("seed"),
+            _row("popular", play_count=100),
+            _row("similar"),
+            _row("similar-winter", target_season="冬季"),
+        ])
+        cf = CollaborativeFilter()
+        cf.apply([
+            {"user_id": f"other{i}", "broadcast_id": b}
+            for i in range(3) for b in ("seed", "similar", "similar-winter")
+        ])
+        rec = RadioRecommender(index=index, cf=cf, cf_weight=2.0)
+
+        pg = MagicMock()
+        pg.from_.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+        pg.from_.return_value.select.return_value.eq.return_value.order.return_value.limit.return_value \
+            .execute.return_value = MagicMock(data=[{"broadcast_id": "seed", "completed": True, "liked": False}])
+        with patch("services.radio_recommender.postgrest", pg):
+            rows = _run(rec.recommend("u1", 10))
+
+        assert [row["id"] for row in rows] == ["similar", "popular"]
+        assert rec.stats()["cf_blended"] == 1
+
+    def test_record_play_seeds_cf(self, _season):
+        index = BroadcastIndex(weights=(0.0, 1.0, 0.0))
+        index.load([_row("a"), _row("b"), _row("popular", play_count=100)])
+        cf = CollaborativeFilter()
+        cf.apply([{"user_id": f"o{i}", "broadcast_id": b} for i in range(2) for b in ("a", "b")])
+        rec = RadioRecommender(index=index, cf=cf, cf_weight=2.0)
+
+        pg = MagicMock()
+        pg.from_.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+        pg.from_.return_value.select.return_value.eq.return_value.order.return_value.limit.return_value \
+            .execute.return_value = MagicMock(data=[])
+
+        async def go():
+            with patch("services.radio_recommender.postgrest", pg):
+                before = await rec.recommend("u1", 1)
+                rec.record_play("u1", "a", liked=True)
+                after = await rec.recommend("u1", 1)
+            return before, after
+
+        before, after = _run(go())
+        assert before[0]["id"] == "popular"
+        assert after[0]["id"] == "b"
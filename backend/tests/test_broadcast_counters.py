@@ -0,0 +1,127 @@
+"""验证广播播放计数批量累加 (BroadcastCounters)
+
+Tests:
+- plays, completions and likes aggregate per broadcast between flushes
+- one increment RPC per flush; log segments are removed after it succeeds
+- a failed flush keeps the deltas and the log for the next attempt
+- a new process replays segments of stopped processes (ignoring a torn last line)
+- processes sharing the log directory never replay each other's live segments
+- flushed deltas reach the recommendation index without invalidating it
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+from services.broadcast_counters import BroadcastCounters
+from services.broadcast_index import BroadcastIndex
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _segments(counters: BroadcastCounters) -> list:
+    return sorted(counters.own_dir.glob("counters-*.log"))
+
+
+class TestBroadcastCounters:
+    @patch("services.broadcast_counters.postgrest")
+    def test_aggregate_and_flush(self, mock_pg, tmp_path):
+        counters = BroadcastCounters(log_dir=tmp_path)
+        counters.record("b1", completed=True)
+        counters.record("b1", liked=True)
+        counters.record("b2")
+        assert counters.pending() == {"b1": [2, 1, 1], "b2": [1, 0, 0]}
+        assert len(_segments(counters)) == 1
+
+        with patch("services.broadcast_counters.broadcast_index", MagicMock()):
+            assert _run(counters.flush()) == 2
+
+        mock_pg.rpc.assert_called_once_with("increment_broadcast_counters", {"deltas": [
+            {"id": "b1", "plays": 2, "completions": 1, "likes": 1},
+            {"id": "b2", "plays": 1, "completions": 0, "likes": 0},
+        ]})
+        assert counters.pending() == {}
+        assert _segments(counters) == []
+        assert _run(counters.flush()) == 0  # nothing to write
+        assert mock_pg.rpc.call_count == 1
+
+    @patch("services.broadcast_counters.postgrest")
+    def test_failed_flush_is_retried(self, mock_pg, tmp_path):
+        mock_pg.rpc.return_value.execute.side_effect = [RuntimeError("db down"), MagicMock()]
+        counters = BroadcastCounters(log_dir=tmp_path)
+        counters.record("b1")
+
+        async def go():
+            with patch("services.broadcast_counters.broadcast_index", MagicMock()):
+                assert await counters.flush() == 0
+                counters.record("b1", completed=True)
+                assert counters.pending() == {"b1": [2, 1, 0]}
+                assert len(_segments(counters)) == 2  # sealed + current segment
+                return await counters.flush()
+
+        assert _run(go()) == 1
+        assert mock_pg.rpc.call_args.args[1] == {"deltas": [{"id": "b1", "plays": 2, "completions": 1, "likes": 0}]}
+        assert _segments(counters) == []
+        assert counters.stats()["failures"] == 1
+
+    @patch("services.broadcast_counters.postgrest")
+    def test_replay_after_restart(self, mock_pg, tmp_path):
+        crashed = BroadcastCounters(log_dir=tmp_path)
+        crashed.record("b1", liked=True)
+        crashed.record("b2")
+        with _segments(crashed)[0].open("a") as f:
+            f.write('["b1", 1, ')  # torn write
+        crashed.close()  # the lock goes away with the process
+        (tmp_path / "counters-0000000001.log").write_text('["b2", 1, 0, 0]\n')  # older layout
+
+        restarted = BroadcastCounters(log_dir=tmp_path)
+        restarted.record("b1")
+        with patch("services.broadcast_counters.broadcast_index", MagicMock()):
+            assert _run(restarted.flush()) == 2
+
+        assert mock_pg.rpc.call_args.args[1] == {"deltas": [
+            {"id": "b1", "plays": 2, "completions": 0, "likes": 1},
+            {"id": "b2", "plays": 2, "completions": 0, "likes": 0},
+        ]}
+        assert list(tmp_path.iterdir()) == [restarted.own_dir]
+        assert _segments(restarted) == []
+
+    @patch("services.broadcast_counters.postgrest")
+    def test_live_processes_share_log_dir(self, mock_pg, tmp_path):
+        first = BroadcastCounters(log_dir=tmp_path)
+        second = BroadcastCounters(log_dir=tmp_path)
+        first.record("b1")
+
+        with patch("services.broadcast_counters.broadcast_index", MagicMock()):
+            assert _run(second.flush()) == 0  # first is still running
+            assert len(_segments(first)) == 1
+            assert _run(first.flush()) == 1
+            assert _run(second.flush()) == 0
+
+        mock_pg.rpc.assert_called_once_with("increment_broadcast_counters", {"deltas": [
+            {"id": "b1", "plays": 1, "completions": 0, "likes": 0},
+        ]})
+
+    @patch("services.broadcast_counters.postgrest")
+    def test_flushed_counts_reach_index(self, _mock_pg, tmp_path):
+        index = BroadcastIndex()
+        index.load([
+            {"id": "b1", "is_published": True, "play_count": 3, "created_at": None},
+            {"id": "b2", "is_published": True, "play_count": 1, "created_at": None},
+        ])
+        version = index.version
+        counters = BroadcastCounters(log_dir=tmp_path)
+        for _ in range(5):
+            counters.record("b2", completed=True)
+        counters.record("gone")
+
+        with patch("services.broadcast_counters.broadcast_index", index):
+            _run(counters.flush())
+
+        assert index.row("b2")["play_count"] == 6
+        assert index.row("b2")["completion_count"] == 5
+        assert [row["id"] for row in index.rank({}, limit=2)][0] == "b2"
+        assert index.version == version
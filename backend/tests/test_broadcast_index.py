@@ -0,0 +1,166 @@
+"""验证健康广播推荐索引 (BroadcastIndex)
+
+Tests:
+- season / age-band candidate buckets, including open-ended age ranges
+- scoring: disease match, popularity and recency
+- incremental publish, unpublish and field updates
+- paged initial load and background refresh when stale
+- changes made while a rebuild is reading survive it
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+from services.broadcast_index import BroadcastIndex
+
+_DAY = 86400.0
+_NOW = 1_750_000_000.0
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _row(broadcast_id: str, **fields) -> dict:
+    row = {
+        "id": broadcast_id,
+        "title": broadcast_id,
+        "content": "...",
+        "category": "养生保健",
+        "is_published": True,
+        "play_count": 0,
+        "target_age_min": None,
+        "target_age_max": None,
+        "target_diseases": None,
+        "target_season": None,
+        "created_at": "2025-06-15T00:00:00+00:00",
+    }
+    row.update(fields)
+    return row
+
+
+def _ids(rows) -> list[str]:
+    return [row["id"] for row in rows]
+
+
+class TestCandidates:
+    def test_season_and_age_buckets(self):
+        index = BroadcastIndex()
+        index.load([
+            _row("any"),
+            _row("summer", target_season="夏季"),
+            _row("winter", target_season="冬季"),
+            _row("60-69", target_age_min=60, target_age_max=69),
+            _row("70+", target_age_min=70),
+            _row("upto-75", target_age_max=75),
+        ])
+
+        assert index.candidates("夏季", 72) == {"any", "summer", "70+", "upto-75"}
+        assert index.candidates("夏季", 69) == {"any", "summer", "60-69", "upto-75"}
+        assert index.candidates("冬季", 90) == {"any", "winter", "70+"}
+        # 年龄未知时不按年龄过滤
+        assert index.candidates(None, None) == {"any", "summer", "winter", "60-69", "70+", "upto-75"}
+
+
+class TestRanking:
+    def test_disease_match_ranks_first(self):
+        index = BroadcastIndex(weights=(1.0, 0.0, 0.0))
+        index.load([
+            _row("generic"),
+            _row("hypertension", target_diseases=["高血压"]),
+            _row("both", target_diseases=["高血压", "糖尿病"]),
+            _row("half", target_diseases=["高血压", "冠心病"]),
+        ])
+        filters = {"age": 70, "diseases": ["高血压", "糖尿病"], "season": "夏季"}
+
+        ranked = index.rank(filters, limit=10, now=_NOW)
+        assert _ids(ranked)[:2] in (["hypertension", "both"], ["both", "hypertension"])
+        assert _ids(ranked)[2:] == ["half", "generic"]
+        assert _ids(index.rank(filters, exclude={"both", "hypertension"}, limit=1, now=_NOW)) == ["half"]
+
+    def test_popularity_and_recency(self):
+        def created(days):
+            return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(_NOW - days * _DAY))
+
+        filters = {"age": None, "diseases": [], "season": None}
+
+        index = BroadcastIndex(weights=(0.0, 1.0, 0.0))
+        index.load([_row("cold", play_count=1), _row("hot", play_count=500), _row("warm", play_count=20)])
+        assert _ids(index.rank(filters, now=_NOW)) == ["hot", "warm", "cold"]
+
+        index = BroadcastIndex(weights=(0.0, 0.0, 1.0), half_life_days=30)
+        index.load([_row("old", created_at=created(90)), _row("new", created_at=created(1)),
+                    _row("mid", created_at=created(30))])
+        assert _ids(index.rank(filters, now=_NOW)) == ["new", "mid", "old"]
+
+
+class TestIncrementalUpdates:
+    def test_upsert_update_and_unpublish(self):
+        index = BroadcastIndex()
+        index.load([_row("a", target_season="夏季")])
+
+        index.upsert(_row("b", target_season="冬季", target_diseases=["糖尿病"]))
+        assert index.candidates("冬季", None) == {"b"}
+
+        # 修改分桶字段后旧桶中不再出现
+        index.upsert(_row("b", target_season="夏季", target_diseases=["糖尿病"]))
+        assert index.candidates("冬季", None) == set()
+        assert index.candidates("夏季", None) == {"a", "b"}
+
+        index.update("b", audio_opus_url="https://x/b.opus.ogg")
+        (top,) = index.rank({"season": "夏季", "diseases": ["糖尿病"]}, limit=1)
+        assert top["audio_opus_url"] == "https://x/b.opus.ogg"
+        index.update("missing", audio_opus_url="ignored")
+
+        index.upsert(_row("a", is_published=False))
+        assert index.candidates("夏季", None) == {"b"}
+        assert index.stats()["broadcasts"] == 1
+
+
+class TestLoading:
+    @patch("services.broadcast_index._PAGE_SIZE", 2)
+    @patch("services.broadcast_index.postgrest")
+    def test_paged_load_then_background_refresh(self, mock_pg):
+        pages = [[_row("a"), _row("b")], [_row("c")], [_row("a")]]
+        query = mock_pg.from_.return_value.select.return_value.eq.return_value.order.return_value
+        query.range.return_value.execute.side_effect = [MagicMock(data=page) for page in pages]
+
+        async def go():
+            index = BroadcastIndex(refresh_seconds=0.05)
+            await index.ensure_loaded()
+            first = set(index.candidates(None, None))
+            await index.ensure_loaded()  # still fresh: no query
+            await asyncio.sleep(0.06)
+            await index.ensure_loaded()  # stale: rebuilt in the background
+            still_served = set(index.candidates(None, None))
+            await index._refresh
+            return first, still_served, set(index.candidates(None, None)), index.stats()
+
+        first, still_served, refreshed, stats = _run(go())
+        assert first == still_served == {"a", "b", "c"}
+        assert refreshed == {"a"}
+        assert stats["loads"] == 2
+        query.range.assert_any_call(0, 1)
+        query.range.assert_any_call(2, 3)
+
+    def test_changes_during_reload_survive(self):
+        index = BroadcastIndex()
+        index.load([_row("a"), _row("b")])
+
+        def fetch():
+            # 读取快照期间发布、转码、下架
+            index.upsert(_row("c"))
+            index.update("a", audio_opus_url="https://x/a.opus.ogg")
+            index.upsert(_row("b", is_published=False))
+            return [_row("a", play_count=7), _row("b")]
+
+        with patch.object(index, "_fetch_published", side_effect=fetch):
+            _run(index.reload())
+
+        assert index.candidates(None, None) == {"a", "c"}
+        assert index.row("a")["audio_opus_url"] == "https://x/a.opus.ogg"
+        assert index.row("a")["play_count"] == 7
+        assert index._reloads == []
@@ -0,0 +1,220 @@
+"""验证健康广播预生成流水线 (BroadcastPipeline)
+
+Tests:
+- catalogue gaps per (season, disease) are ordered by reach and capped per run
+- the next season is planned ahead; queued jobs count towards coverage
+- interactive jobs run before planned ones; bounded concurrency
+- generated audio (and its Opus rendition) is stored before the broadcast is published
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.broadcast_audio import LocalAudioStore
+from services.broadcast_index import BroadcastIndex
+from services.broadcast_pipeline import BroadcastPipeline, BroadcastQueueFull
+from services.health_broadcast import upcoming_seasons
+
+_JULY = datetime(2026, 7, 10, tzinfo=timezone.utc)
+_LATE_AUGUST = datetime(2026, 8, 20, tzinfo=timezone.utc)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _elders(*diseases: list[str]) -> MagicMock:
+    pg = MagicMock()
+    pg.from_.return_value.select.return_value.eq.return_value.range.return_value.execute.return_value = (
+        MagicMock(data=[{"chronic_diseases": d} for d in diseases])
+    )
+    return pg
+
+
+def _index(*rows: dict) -> BroadcastIndex:
+    index = BroadcastIndex()
+    index.load([{"id": f"b{i}", "is_published": True, "created_at": None, **row} for i, row in enumerate(rows)])
+    return index
+
+
+class TestPlanning:
+    def test_upcoming_seasons(self):
+        assert upcoming_seasons(30, _JULY) == ["夏季"]
+        assert upcoming_seasons(30, _LATE_AUGUST) == ["夏季", "秋季"]
+
+    def test_gaps_ordered_by_reach(self):
+        pg = _elders(["高血压", "糖尿病"], ["高血压"], ["高血压"], [], ["关节炎"])
+        index = _index(
+            {"target_season": "夏季"},
+            {"target_season": "夏季", "target_diseases": ["高血压"]},
+            {"target_season": "夏季", "target_diseases": ["高血压"]},
+            {"target_season": "冬季", "target_diseases": ["糖尿病"]},  # 其他季节不计
+        )
+        pipeline = BroadcastPipeline(top_diseases=2, per_slot=2, max_per_run=10)
+
+        with patch("services.broadcast_pipeline.postgrest", pg), \
+                patch("services.broadcast_pipeline.broadcast_index", index):
+            planned = _run(pipeline.plan(_JULY))
+
+        # 通用 5 人 × 缺 1；糖尿病 1 人 × 缺 2；高血压已满
+        assert [slot for slot, _ in planned] == [("夏季", None), ("夏季", "糖尿病"), ("夏季", "糖尿病")]
+        general, diabetes = planned[0][1], planned[1][1]
+        assert general["target_season"] == "夏季" and "target_diseases" not in general
+        assert diabetes["category"] == "慢病管理"
+        assert diabetes["target_diseases"] == ["糖尿病"]
+
+    def test_round_robin_cap_and_inflight(self):
+        pg = _elders(["高血压"], ["高血压"], ["糖尿病"])
+        pipeline = BroadcastPipeline(concurrency=1, top_diseases=2, per_slot=3, max_per_run=4)
+        service = MagicMock()
+
+        async def never_finishes(**_):
+            await asyncio.Event().wait()
+
+        service.generate_broadcast_text = AsyncMock(side_effect=never_finishes)
+
+        async def go():
+            with patch("services.broadcast_pipeline.postgrest", pg), \
+                    patch("services.broadcast_pipeline.broadcast_index", _index()), \
+                    patch("services.broadcast_pipeline.health_broadcast_service", service), \
+                    patch("services.broadcast_pipeline._backends_configured", return_value=True):
+                first = await pipeline.plan(_LATE_AUGUST)
+                submitted = await pipeline.run_once(_LATE_AUGUST)
+                second = await pipeline.plan(_LATE_AUGUST)
+                await pipeline.stop()
+            return first, submitted, second
+
+        first, submitted, second = _run(go())
+        # 两个季节各 3 个缺口，按 影响人数 × 缺口数 排序，每轮各取一条，最多 4 条
+        expected = [("夏季", None), ("秋季", None), ("夏季", "高血压"), ("秋季", "高血压")]
+        assert [slot for slot, _ in first] == expected
+        assert submitted == 4
+        # 已排队 / 生成中的任务计入现有数量，下一条通用内容换一个分类
+        assert [slot for slot, _ in second] == expected
+        assert first[0][1]["category"] != second[0][1]["category"]
+
+    def test_no_planning_without_llm_and_tts(self):
+        pg = _elders(["高血压"])
+        pipeline = BroadcastPipeline()
+
+        with patch("services.broadcast_pipeline.postgrest", pg), \
+                patch("services.broadcast_pipeline.broadcast_index", _index()), \
+                patch("services.broadcast_pipeline.voice_service", MagicMock(tts_configured=False)):
+            assert _run(pipeline.run_once(_JULY)) == 0
+        pg.from_.assert_not_called()
+        assert pipeline.stats()["submitted"] == 0
+
+
+def _service(calls: list[str], delay: float = 0.0) -> MagicMock:
+    service = MagicMock()
+
+    async def text(category, topic=None, target_diseases=None):
+        calls.append(topic)
+        await asyncio.sleep(delay)
+        return {"title": topic, "content": "内容", "ai_prompt": "prompt"}
+
+    service.generate_broadcast_text = AsyncMock(side_effect=text)
+    service.generate_audio = AsyncMock(return_value=(b"mp3", 12.5))
+    return service
+
+
+def _inserting_pg() -> MagicMock:
+    pg = MagicMock()
+    pg.from_.return_value.insert.side_effect = lambda record: MagicMock(
+        execute=MagicMock(return_value=MagicMock(data=[record]))
+    )
+    return pg
+
+
+class TestGeneration:
+    def test_interactive_jobs_run_first(self, tmp_path):
+        calls: list[str] = []
+        pipeline = BroadcastPipeline(concurrency=1)
+
+        async def go():
+            with patch("services.broadcast_pipeline.health_broadcast_service", _service(calls)), \
+                    patch("services.broadcast_pipeline.postgrest", _inserting_pg()), \
+                    patch("services.broadcast_pipeline.broadcast_index", BroadcastIndex()), \
+                    patch("services.broadcast_pipeline.broadcast_audio_store", LocalAudioStore(tmp_path)):
+                planned = [pipeline.submit({"category": "季节养生", "topic": f"p{i}"}, slot=("夏季", None))
+                           for i in range(3)]
+                interactive = pipeline.submit({"category": "养生保健", "topic": "mine"}, user_id="u1")
+                for job in [*planned, interactive]:
+                    await pipeline.wait(job.id, 1)
+            return interactive
+
+        interactive = _run(go())
+        assert calls == ["mine", "p0", "p1", "p2"]
+        assert interactive.status == "done"
+        stats = pipeline.stats()
+        assert (stats["done"], stats["planned"], stats["planned_inflight"]) == (4, 3, 0)
+
+    def test_bounded_concurrency_and_queue(self, tmp_path):
+        running, peak = 0, 0
+        pipeline = BroadcastPipeline(concurrency=2, queue_size=3)
+
+        async def text(category, topic=None, target_diseases=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"title": "t", "content": "c", "ai_prompt": "p"}
+
+        service = _service([])
+        service.generate_broadcast_text = AsyncMock(side_effect=text)
+
+        async def go():
+            with patch("services.broadcast_pipeline.health_broadcast_service", service), \
+                    patch("services.broadcast_pipeline.postgrest", _inserting_pg()), \
+                    patch("services.broadcast_pipeline.broadcast_index", BroadcastIndex()), \
+                    patch("services.broadcast_pipeline.broadcast_audio_store", LocalAudioStore(tmp_path)):
+                jobs = [pipeline.submit({"category": "养生保健"}) for _ in range(3)]
+                try:
+                    pipeline.submit({"category": "养生保健"})
+                except BroadcastQueueFull:
+                    rejected = True
+                else:
+                    rejected = False
+                for job in jobs:
+                    await pipeline.wait(job.id, 1)
+                await pipeline.stop()
+            return rejected
+
+        assert _run(go()) is True
+        assert peak == 2
+        assert pipeline.stats()["rejected"] == 1
+
+    def test_audio_stored_before_publishing(self, tmp_path):
+        index = BroadcastIndex()
+        pg = _inserting_pg()
+        store = LocalAudioStore(tmp_path, "/api/v1/radio/audio")
+        transcoder = MagicMock()
+        pipeline = BroadcastPipeline()
+
+        async def go():
+            with patch("services.broadcast_pipeline.health_broadcast_service", _service([])), \
+                    patch("services.broadcast_pipeline.postgrest", pg), \
+                    patch("services.broadcast_pipeline.broadcast_index", index), \
+                    patch("services.broadcast_pipeline.broadcast_audio_store", store), \
+                    patch("services.broadcast_pipeline.opus_transcoder", transcoder):
+                row = await pipeline.produce({"category": "季节养生", "target_season": "夏季"})
+                _key, _audio, store_opus = transcoder.enqueue.call_args.args
+                await store_opus(b"opus")
+            return row
+
+        row = _run(go())
+        assert (tmp_path / f"{row['id']}.mp3").read_bytes() == b"mp3"
+        assert row["audio_url"] == f"/api/v1/radio/audio/{row['id']}.mp3"
+        assert row["audio_duration"] == 12.5
+        assert row["target_season"] == "夏季"
+        assert index.coverage("夏季") == 1
+        assert transcoder.enqueue.call_args.args[:2] == (f"broadcast:{row['id']}", b"mp3")
+        # Opus 版本写入同一存储并回填到数据库和索引
+        assert (tmp_path / f"{row['id']}.opus.ogg").read_bytes() == b"opus"
+        opus_url = f"/api/v1/radio/audio/{row['id']}.opus.ogg"
+        pg.from_.return_value.update.assert_called_once_with({"audio_opus_url": opus_url})
+        assert index.row(row["id"])["audio_opus_url"] == opus_url
@@ -0,0 +1,257 @@
+"""验证服务端对话记忆 (ConversationMemory)
+
+Tests:
+- estimate_tokens(): approximate Chinese / latin token counting
+- ring buffer bounds, LRU session eviction and lazy hydration
+- merge_incoming(): de-duplicating clients that resend full history
+- build_context(): token-budgeted truncation and background summary
+- /ai/voice-session and /ai/chat carry history across turns
+- sessions are keyed by user, so a foreign session_id never exposes history
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from core.security import create_access_token
+from main import app
+from services.conversation_memory import ConversationMemory
+from services.tokens import estimate_message_tokens, estimate_tokens
+
+client = TestClient(app)
+
+
+def _turn(role: str, content: str) -> dict:
+    return {"role": role, "content": content}
+
+
+# ===================================================================
+# Token estimation
+# ===================================================================
+
+
+class TestEstimateTokens:
+    def test_empty(self):
+        assert estimate_tokens("") == 0
+
+    def test_chinese_one_token_per_char(self):
+        assert estimate_tokens("今天血压正常") == 6
+
+    def test_latin_four_chars_per_token(self):
+        assert estimate_tokens("abcdefgh") == 2
+
+    def test_mixed(self):
+        assert estimate_tokens("血压120") == 3
+
+    def test_message_overhead(self):
+        assert estimate_message_tokens(_turn("user", "你好")) > estimate_tokens("你好")
+
+
+# ===================================================================
+# Buffer / sessions
+# ===================================================================
+
+
+class TestBuffer:
+    def test_ring_buffer_is_bounded(self):
+        mem = ConversationMemory(max_turns=3, summarize=False)
+        for i in range(5):
+            mem.append("s1", "user", f"消息{i}")
+        history = mem.history("s1")
+        assert [t["content"] for t in history] == ["消息2", "消息3", "消息4"]
+
+    def test_lru_session_eviction(self):
+        mem = ConversationMemory(max_sessions=2, summarize=False)
+        mem.append("a", "user", "1")
+        mem.append("b", "user", "2")
+        mem.append("a", "user", "3")  # a becomes most recent
+        mem.append("c", "user", "4")
+        assert mem.has_session("a")
+        assert not mem.has_session("b")
+        assert mem.has_session("c")
+
+    def test_load_filters_rows(self):
+        mem = ConversationMemory(summarize=False)
+        mem.load("s1", [
+            _turn("user", "你好"),
+            {"role": "assistant", "content": None},
+            _turn("tool", "x"),
+            _turn("assistant", "您好"),
+        ])
+        assert mem.history("s1") == [_turn("user", "你好"), _turn("assistant", "您好")]
+
+    def test_merge_incoming_skips_overlap(self):
+        mem = ConversationMemory(summarize=False)
+        mem.append("s1", "user", "你好")
+        mem.append("s1", "assistant", "您好")
+        full = [_turn("user", "你好"), _turn("assistant", "您好"), _turn("user", "吃药了吗")]
+        assert mem.merge_incoming("s1", full) == [_turn("user", "吃药了吗")]
+
+    def test_merge_incoming_new_turn_only(self):
+        mem = ConversationMemory(summarize=False)
+        mem.append("s1", "user", "你好")
+        mem.append("s1", "assistant", "您好")
+        assert mem.merge_incoming("s1", [_turn("user", "再见")]) == [_turn("user", "再见")]
+
+
+# ===================================================================
+# Context window
+# ===================================================================
+
+
+class TestBuildContext:
+    def test_fits_budget(self):
+        mem = ConversationMemory(token_budget=1000, summarize=False)
+        mem.append("s1", "user", "你好")
+        mem.append("s1", "assistant", "您好")
+        assert len(mem.build_context("s1")) == 2
+
+    def test_truncates_oldest_turns(self):
+        mem = ConversationMemory(token_budget=30, summarize=False)
+        for i in range(10):
+            mem.append("s1", "user", f"第{i}条消息内容")
+        context = mem.build_context("s1")
+        assert 0 < len(context) < 10
+        assert context[-1]["content"] == "第9条消息内容"
+        assert sum(estimate_message_tokens(t) for t in context) <= 30
+
+    def test_newest_turn_always_kept(self):
+        mem = ConversationMemory(token_budget=1, summarize=False)
+        mem.append("s1", "user", "这是一条很长的消息" * 10)
+        assert len(mem.build_context("s1")) == 1
+
+    def test_unknown_session(self):
+        assert ConversationMemory().build_context("missing") == []
+
+    def test_overflow_is_summarised(self):
+        mem = ConversationMemory(token_budget=30, summarize=True)
+        for i in range(10):
+            mem.append("s1", "user", f"第{i}条消息内容")
+
+        async def run():
+            with patch(
+                "services.conversation_memory.doubao_service.generate_summary",
+                new_callable=AsyncMock,
+                return_value="老人聊了用药情况",
+            ) as mock_summary:
+                context = mem.build_context("s1")
+                await asyncio.gather(*mem._tasks)
+                return context, mock_summary
+
+        context, mock_summary = asyncio.run(run())
+        mock_summary.assert_called_once()
+        assert mem.summary("s1") == "老人聊了用药情况"
+        # Summarised turns are dropped, the window is kept
+        assert mem.history("s1") == context
+
+    def test_summary_failure_keeps_turns(self):
+        mem = ConversationMemory(token_budget=30, summarize=True)
+        for i in range(10):
+            mem.append("s1", "user", f"第{i}条消息内容")
+
+        async def run():
+            with patch(
+                "services.conversation_memory.doubao_service.generate_summary",
+                new_callable=AsyncMock,
+                side_effect=RuntimeError("boom"),
+            ):
+                mem.build_context("s1")
+                await asyncio.gather(*mem._tasks)
+
+        asyncio.run(run())
+        assert mem.summary("s1") == ""
+        assert len(mem.history("s1")) == 10
+
+
+# ===================================================================
+# Endpoints
+# ===================================================================
+
+
+def _mock_postgrest():
+    mock = MagicMock()
+    mock.from_.return_value.insert.return_value.execute.return_value.data = [{"id": "c"}]
+    (
+        mock.from_.return_value
+        .select.return_value
+        .eq.return_value
+        .eq.return_value
+        .order.return_value
+        .limit.return_value
+        .execute.return_value
+    ).data = [
+        {"role": "assistant", "content": "您好"},
+        {"role": "user", "content": "你好"},
+    ]
+    return mock
+
+
+class TestEndpointsUseMemory:
+    @patch("api.v1.ai_chat.conversation_memory", ConversationMemory(summarize=False))
+    @patch("api.v1.ai_chat.postgrest")
+    @patch("api.v1.ai_chat.doubao_service")
+    def test_voice_session_remembers_turns(self, mock_doubao, mock_pg):
+        mock_doubao.chat = AsyncMock(side_effect=["回复一", "回复二"])
+        mock_pg.from_ = _mock_postgrest().from_
+
+        with client.websocket_connect("/api/v1/ai/voice-session") as ws:
+            ws.send_json({"type": "text", "content": "第一句"})
+            ws.receive_json()
+            ws.send_json({"type": "text", "content": "第二句"})
+            ws.receive_json()
+            ws.send_json({"type": "end"})
+            ws.receive_json()
+
+        second_call_messages = mock_doubao.chat.call_args_list[1][0][0]
+        assert [m["content"] for m in second_call_messages] == ["第一句", "回复一", "第二句"]
+
+    @patch("api.v1.ai_chat.conversation_memory", ConversationMemory(summarize=False))
+    @patch("api.v1.ai_chat.postgrest")
+    @patch("api.v1.ai_chat.doubao_service")
+    def test_chat_hydrates_known_session(self, mock_doubao, mock_pg):
+        mock_doubao.chat = AsyncMock(return_value="好的")
+        mock_pg.from_ = _mock_postgrest().from_
+
+        resp = client.post(
+            "/api/v1/ai/chat",
+            json={
+                "messages": [{"role": "user", "content": "吃药了吗"}],
+                "session_id": "existing-session",
+            },
+            headers={"Authorization": f"Bearer {create_access_token('u1', 'elder')}"},
+        )
+
+        assert resp.status_code == 200
+        messages = mock_doubao.chat.call_args[0][0]
+        assert [m["content"] for m in messages] == ["你好", "您好", "吃药了吗"]
+
+    @patch("api.v1.ai_chat.postgrest")
+    @patch("api.v1.ai_chat.doubao_service")
+    def test_session_id_of_another_user_is_isolated(self, mock_doubao, mock_pg):
+        mock_doubao.chat = AsyncMock(return_value="好的")
+        mock_pg.from_ = _mock_postgrest().from_
+        memory = ConversationMemory(summarize=False)
+
+        def chat(user_id: str, content: str):
+            return client.post(
+                "/api/v1/ai/chat",
+                json={"messages": [{"role": "user", "content": content}], "session_id": "s-owner"},
+                headers={"Authorization": f"Bearer {create_access_token(user_id, 'elder')}"},
+            )
+
+        with patch("api.v1.ai_chat.conversation_memory", memory):
+            assert chat("owner", "我的血压是150").status_code == 200
+            # The intruder's history is loaded from their own (empty) rows
+            mock_pg.from_.return_value.select.return_value.eq.return_value.eq.return_value \
+                .order.return_value.limit.return_value.execute.return_value.data = []
+            assert chat("intruder", "刚才说了什么").status_code == 200
+
+        messages = mock_doubao.chat.call_args[0][0]
+        assert [m["content"] for m in messages] == ["刚才说了什么"]
+        assert [t["content"] for t in memory.history(("owner", "s-owner"))][-2:] == ["我的血压是150", "好的"]
+        assert memory.history(("intruder", "s-owner")) == [
+            _turn("user", "刚才说了什么"), _turn("assistant", "好的"),
+        ]
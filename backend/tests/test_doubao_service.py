@@ -368,3 +368,232 @@ class TestConfiguration:
         svc.api_key = ""
         svc.model_endpoint = "some-endpoint"
         assert svc._is_configured is False
+
+
+# ===================================================================
+# Single-flight coalescing tests
+# ===================================================================
+
+
+class TestCoalescing:
+    """Tests for single-flight coalescing of identical in-flight calls."""
+
+    @staticmethod
+    def _slow_post(calls: list, content: str = "共享回复", delay: float = 0.05):
+        async def mock_post(url, *, headers=None, json=None):
+            calls.append(json)
+            await asyncio.sleep(delay)
+            mock_resp = MagicMock()
+            mock_resp.raise_for_status = MagicMock()
+            mock_resp.json.return_value = {"choices": [{"message": {"content": content}}]}
+            return mock_resp
+        return mock_post
+
+    def test_identical_concurrent_calls_share_one_request(self):
+        svc = _make_service(configured=True)
+        calls: list = []
+        messages = [{"role": "user", "content": "你好"}]
+
+        async def run():
+            return await asyncio.gather(*(svc._call_llm(messages) for _ in range(5)))
+
+        with patch("httpx.AsyncClient.post", side_effect=self._slow_post(calls)):
+            results = _run(run())
+
+        assert len(calls) == 1
+        assert results == ["共享回复"] * 5
+        stats = svc.coalescing_stats()
+        assert stats["llm_calls_total"] == 5
+        assert stats["llm_calls_coalesced"] == 4
+        assert stats["llm_calls_inflight"] == 0
+
+    def test_different_parameters_not_coalesced(self):
+        svc = _make_service(configured=True)
+        calls: list = []
+        messages = [{"role": "user", "content": "你好"}]
+
+        async def run():
+            await asyncio.gather(
+                svc._call_llm(messages, temperature=0.1),
+                svc._call_llm(messages, temperature=0.7),
+                svc._call_llm(messages, temperature=0.7, max_tokens=256),
+            )
+
+        with patch("httpx.AsyncClient.post", side_effect=self._slow_post(calls)):
+            _run(run())
+
+        assert len(calls) == 3
+        assert svc.coalescing_stats()["llm_calls_coalesced"] == 0
+
+    def test_sequential_calls_not_coalesced(self):
+        svc = _make_service(configured=True)
+        calls: list = []
+        messages = [{"role": "user", "content": "你好"}]
+
+        with patch("httpx.AsyncClient.post", side_effect=self._slow_post(calls, delay=0)):
+            _run(svc._call_llm(messages))
+            _run(svc._call_llm(messages))
+
+        assert len(calls) == 2
+
+    def test_key_ignores_whitespace_and_dict_order(self):
+        a = DoubaoService._coalesce_key([{"role": "user", "content": " 你好 "}], 0.7, 1024)
+        b = DoubaoService._coalesce_key([{"content": "你好", "role": "user"}], 0.7, 1024)
+        assert a == b
+
+    def test_error_shared_by_all_waiters(self):
+        svc = _make_service(configured=True)
+
+        import httpx
+
+        async def mock_post(url, *, headers=None, json=None):
+            await asyncio.sleep(0.02)
+            raise httpx.ConnectError("connection refused")
+
+        async def run():
+            return await asyncio.gather(
+                svc._call_llm([{"role": "user", "content": "x"}]),
+                svc._call_llm([{"role": "user", "content": "x"}]),
+                return_exceptions=True,
+            )
+
+        with patch("httpx.AsyncClient.post", side_effect=mock_post):
+            results = _run(run())
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert svc.coalescing_stats()["llm_calls_inflight"] == 0
+
+
+# ===================================================================
+# Combined / speculative turn tests
+# ===================================================================
+
+
+def _json_post(content_for):
+    """Build a mock httpx post whose reply depends on the request messages."""
+
+    async def mock_post(url, *, headers=None, json=None):
+        delay, content = content_for(json["messages"])
+        await asyncio.sleep(delay)
+        mock_resp = MagicMock()
+        mock_resp.raise_for_status = MagicMock()
+        mock_resp.json.return_value = {"choices": [{"message": {"content": content}}]}
+        return mock_resp
+
+    return mock_post
+
+
+class TestCombinedTurn:
+    """Tests for DoubaoService.chat_with_intent()."""
+
+    def test_single_call_returns_intent_and_reply(self):
+        svc = _make_service(configured=True)
+        calls = []
+        llm_json = json.dumps({
+            "intent": "medication_confirm",
+            "entities": {"medicine_name": "降压药"},
+            "confidence": 0.9,
+            "reply": "好的，已经帮您记下吃了降压药。",
+        }, ensure_ascii=False)
+
+        def content_for(messages):
+            calls.append(messages)
+            return 0, llm_json
+
+        with patch("httpx.AsyncClient.post", side_effect=_json_post(content_for)):
+            result = _run(svc.chat_with_intent([{"role": "user", "content": "降压药吃过了"}]))
+
+        assert len(calls) == 1
+        assert calls[0][0]["content"] == _SYSTEM_PROMPT
+        assert calls[0][1]["role"] == "system"
+        assert result["intent"] == "medication_confirm"
+        assert result["entities"] == {"medicine_name": "降压药"}
+        assert result["reply"] == "好的，已经帮您记下吃了降压药。"
+
+    def test_non_json_output_becomes_reply(self):
+        result = DoubaoService._parse_turn_response("您好，今天天气不错。")
+        assert result["intent"] == "general_chat"
+        assert result["confidence"] == 0.0
+        assert result["reply"] == "您好，今天天气不错。"
+
+    def test_turn_response_normalised(self):
+        raw = '```json\n{"intent": "bogus", "entities": [], "confidence": 3, "reply": 5}\n```'
+        result = DoubaoService._parse_turn_response(raw)
+        assert result == {"intent": "general_chat", "entities": {}, "confidence": 1.0, "reply": ""}
+
+    def test_placeholder_when_not_configured(self):
+        svc = _make_service(configured=False)
+        result = _run(svc.chat_with_intent([{"role": "user", "content": "你好"}]))
+        assert result["intent"] == "general_chat"
+        assert "你好" in result["reply"]
+
+
+class TestSpeculativeTurn:
+    """Tests for DoubaoService.speculative_turn()."""
+
+    @staticmethod
+    def _content_for(intent_json, chat_delay=0.2):
+        def content_for(messages):
+            if "意图识别引擎" in messages[0]["content"]:
+                return 0.01, intent_json
+            return chat_delay, "聊天回复"
+        return content_for
+
+    def test_actionable_intent_cancels_chat(self):
+        svc = _make_service(configured=True)
+        intent_json = json.dumps({"intent": "make_call", "entities": {}, "confidence": 0.9})
+
+        with patch("httpx.AsyncClient.post", side_effect=_json_post(self._content_for(intent_json))):
+            result = _run(svc.speculative_turn([{"role": "user", "content": "给女儿打电话"}]))
+
+        assert result["intent"] == "make_call"
+        assert result["reply"] is None
+        assert svc.coalescing_stats()["llm_calls_inflight"] == 0
+
+    def test_general_chat_waits_for_reply(self):
+        svc = _make_service(configured=True)
+        intent_json = json.dumps({"intent": "general_chat", "entities": {}, "confidence": 0.9})
+
+        with patch(
+            "httpx.AsyncClient.post",
+            side_effect=_json_post(self._content_for(intent_json, chat_delay=0.02)),
+        ):
+            result = _run(svc.speculative_turn([{"role": "user", "content": "今天天气真好"}]))
+
+        assert result["intent"] == "general_chat"
+        assert result["reply"] == "聊天回复"
+
+    def test_low_confidence_intent_keeps_reply(self):
+        svc = _make_service(configured=True)
+        intent_json = json.dumps({"intent": "make_call", "entities": {}, "confidence": 0.3})
+
+        with patch(
+            "httpx.AsyncClient.post",
+            side_effect=_json_post(self._content_for(intent_json, chat_delay=0.02)),
+        ):
+            result = _run(svc.speculative_turn([{"role": "user", "content": "打电话好麻烦"}]))
+
+        assert result["reply"] == "聊天回复"
+
+    def test_runs_concurrently(self):
+        """Intent and chat requests are in flight at the same time."""
+        svc = _make_service(configured=True)
+        intent_json = json.dumps({"intent": "general_chat", "entities": {}, "confidence": 0.9})
+        active = {"now": 0, "peak": 0}
+
+        async def mock_post(url, *, headers=None, json=None):
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            await asyncio.sleep(0.05)
+            active["now"] -= 1
+            is_intent = "意图识别引擎" in json["messages"][0]["content"]
+            mock_resp = MagicMock()
+            mock_resp.raise_for_status = MagicMock()
+            mock_resp.json.return_value = {
+                "choices": [{"message": {"content": intent_json if is_intent else "回复"}}]
+            }
+            return mock_resp
+
+        with patch("httpx.AsyncClient.post", side_effect=mock_post):
+            _run(svc.speculative_turn([{"role": "user", "content": "你好"}]))
+        assert active["peak"] == 2
@@ -0,0 +1,193 @@
+"""验证LLM优先级调度器 (LLMScheduler)
+
+Tests:
+- slots are granted in priority order when saturated
+- per-class concurrency limits
+- deadline-based shedding of low-priority work
+- cancellation while queued / metrics
+- DoubaoService tags calls with the right priority
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from services.doubao_service import DoubaoService
+from services.llm_scheduler import LLMPriority, LLMScheduler, LLMShedError
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _scheduler(max_concurrency=1, limits=None, deadlines=None) -> LLMScheduler:
+    return LLMScheduler(
+        max_concurrency=max_concurrency,
+        class_limits=limits or {p: max_concurrency for p in LLMPriority},
+        queue_deadlines=deadlines or {p: None for p in LLMPriority},
+    )
+
+
+class TestPriorityOrder:
+    def test_higher_priority_served_first(self):
+        sched = _scheduler(max_concurrency=1)
+        order: list[str] = []
+
+        async def job(name, priority, hold=0.01):
+            async with sched.slot(priority):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        async def run():
+            blocker = asyncio.create_task(job("blocker", LLMPriority.INTERACTIVE, hold=0.05))
+            await asyncio.sleep(0)
+            tasks = [
+                asyncio.create_task(job("broadcast", LLMPriority.BROADCAST)),
+                asyncio.create_task(job("summary", LLMPriority.SUMMARY)),
+                asyncio.create_task(job("chat", LLMPriority.INTERACTIVE)),
+                asyncio.create_task(job("emergency", LLMPriority.EMERGENCY)),
+            ]
+            await asyncio.gather(blocker, *tasks)
+
+        _run(run())
+        assert order == ["blocker", "emergency", "chat", "summary", "broadcast"]
+
+    def test_class_limit_does_not_block_other_classes(self):
+        sched = _scheduler(
+            max_concurrency=4,
+            limits={
+                LLMPriority.EMERGENCY: 4,
+                LLMPriority.INTERACTIVE: 4,
+                LLMPriority.SUMMARY: 4,
+                LLMPriority.BROADCAST: 1,
+            },
+        )
+        peak = {"broadcast": 0, "running": 0}
+
+        async def job(priority):
+            async with sched.slot(priority):
+                if priority == LLMPriority.BROADCAST:
+                    peak["broadcast"] = max(peak["broadcast"], sched.stats()["broadcast"]["running"])
+                await asyncio.sleep(0.01)
+
+        async def run():
+            jobs = [job(LLMPriority.BROADCAST) for _ in range(4)]
+            jobs.append(job(LLMPriority.INTERACTIVE))
+            await asyncio.gather(*jobs)
+
+        _run(run())
+        assert peak["broadcast"] == 1
+        assert sched.stats()["interactive"]["completed"] == 1
+        assert sched.stats()["broadcast"]["completed"] == 4
+
+
+class TestShedding:
+    def test_low_priority_shed_after_deadline(self):
+        sched = _scheduler(
+            max_concurrency=1,
+            deadlines={
+                LLMPriority.EMERGENCY: None,
+                LLMPriority.INTERACTIVE: None,
+                LLMPriority.SUMMARY: None,
+                LLMPriority.BROADCAST: 0.02,
+            },
+        )
+
+        async def hold():
+            async with sched.slot(LLMPriority.INTERACTIVE):
+                await asyncio.sleep(0.1)
+
+        async def broadcast():
+            async with sched.slot(LLMPriority.BROADCAST):
+                pass
+
+        async def run():
+            blocker = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            with pytest.raises(LLMShedError):
+                await broadcast()
+            await blocker
+
+        _run(run())
+        stats = sched.stats()["broadcast"]
+        assert stats["shed"] == 1
+        assert stats["queued"] == 0
+        assert sched._running == 0
+
+    def test_no_shedding_when_capacity_free(self):
+        sched = _scheduler(
+            max_concurrency=2,
+            deadlines={p: 0.0 for p in LLMPriority},
+        )
+
+        async def run():
+            async with sched.slot(LLMPriority.BROADCAST):
+                pass
+
+        _run(run())
+        assert sched.stats()["broadcast"]["shed"] == 0
+
+    def test_cancelled_waiter_is_removed(self):
+        sched = _scheduler(max_concurrency=1)
+
+        async def run():
+            async def hold():
+                async with sched.slot(LLMPriority.INTERACTIVE):
+                    await asyncio.sleep(0.05)
+
+            async def wait_slot():
+                async with sched.slot(LLMPriority.SUMMARY):
+                    pass
+
+            blocker = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(wait_slot())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            await blocker
+
+        _run(run())
+        assert sched._waiters == []
+        assert sched._running == 0
+
+
+class TestDoubaoPriorities:
+    def _svc(self):
+        svc = DoubaoService()
+        svc.api_key = "k"
+        svc.model_endpoint = "e"
+        return svc
+
+    def test_intent_with_emergency_words_is_emergency(self):
+        svc = self._svc()
+        with patch.object(svc, "_call_llm", new_callable=AsyncMock, return_value="{}") as mock_call:
+            _run(svc.recognize_intent("我摔倒了，救命"))
+        assert mock_call.call_args.kwargs["priority"] == LLMPriority.EMERGENCY
+
+    def test_normal_intent_is_interactive(self):
+        svc = self._svc()
+        with patch.object(svc, "_call_llm", new_callable=AsyncMock, return_value="{}") as mock_call:
+            _run(svc.recognize_intent("今天吃什么药"))
+        assert mock_call.call_args.kwargs["priority"] == LLMPriority.INTERACTIVE
+
+    def test_summary_is_summary_priority(self):
+        svc = self._svc()
+        with patch.object(svc, "_call_llm", new_callable=AsyncMock, return_value="摘要") as mock_call:
+            _run(svc.generate_summary([{"role": "user", "content": "你好"}]))
+        assert mock_call.call_args.kwargs["priority"] == LLMPriority.SUMMARY
+
+    def test_broadcast_generation_is_broadcast_priority(self):
+        from services.health_broadcast import health_broadcast_service
+
+        with patch(
+            "services.health_broadcast.doubao_service.chat",
+            new_callable=AsyncMock,
+            return_value="标题：测试\n内容：正文",
+        ) as mock_chat:
+            _run(health_broadcast_service.generate_broadcast_text(category="养生保健"))
+        assert mock_chat.call_args.kwargs["priority"] == LLMPriority.BROADCAST
@@ -0,0 +1,203 @@
+"""验证 LLM 用量统计 (LLMUsageRecorder) 与 /admin/metrics
+
+Tests:
+- record() / snapshot(): per-feature and per-user aggregation
+- flush(): window deltas written to llm_usage_stats, kept on failure
+- DoubaoService records Ark ``usage`` (or an estimate) per feature and user
+- /admin/metrics is staff-only
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+from core.security import create_access_token
+from main import app
+from services.doubao_service import DoubaoService
+from services.llm_usage import LLMUsageRecorder
+
+client = TestClient(app)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _configured_service() -> DoubaoService:
+    svc = DoubaoService()
+    svc.api_key = "k"
+    svc.model_endpoint = "e"
+    return svc
+
+
+def _ark_response(content: str, usage: dict | None = None):
+    async def mock_post(url, *, headers=None, json=None):
+        resp = MagicMock()
+        resp.raise_for_status = MagicMock()
+        data = {"choices": [{"message": {"content": content}}]}
+        if usage is not None:
+            data["usage"] = usage
+        resp.json.return_value = data
+        return resp
+
+    return mock_post
+
+
+# ===================================================================
+# Recorder
+# ===================================================================
+
+
+class TestRecorder:
+    def test_snapshot_aggregates_by_feature_and_user(self):
+        rec = LLMUsageRecorder()
+        rec.record("chat", "u1", prompt_tokens=100, completion_tokens=20, latency_ms=300)
+        rec.record("chat", "u2", prompt_tokens=10, completion_tokens=5, latency_ms=100)
+        rec.record("intent", "u1", prompt_tokens=50, completion_tokens=10, latency_ms=200)
+        rec.record("chat", "u1", outcome="error")
+
+        snap = rec.snapshot()
+        assert snap["overall"]["calls"] == 4
+        assert snap["overall"]["errors"] == 1
+        assert snap["by_feature"]["chat"]["prompt_tokens"] == 110
+        assert snap["by_feature"]["intent"]["total_tokens"] == 60
+        assert snap["top_users"][0]["user_id"] == "u1"
+        assert snap["top_users"][0]["total_tokens"] == 180
+        assert snap["by_feature"]["chat"]["latency_ms_max"] == 300
+
+    def test_coalesced_calls_excluded_from_latency_mean(self):
+        rec = LLMUsageRecorder()
+        rec.record("chat", "u1", latency_ms=400)
+        rec.record("chat", "u1", outcome="coalesced")
+        stats = rec.snapshot()["by_feature"]["chat"]
+        assert stats["latency_ms_avg"] == 400
+        assert stats["outcomes"] == {"ok": 1, "coalesced": 1}
+
+    def test_flush_writes_window_deltas(self):
+        rec = LLMUsageRecorder()
+        rec.record("chat", "u1", prompt_tokens=10, completion_tokens=2)
+        rec.record("broadcast", None, prompt_tokens=30, completion_tokens=200)
+
+        with patch("services.llm_usage.postgrest") as mock_pg:
+            written = _run(rec.flush())
+            rows = mock_pg.from_.return_value.insert.call_args[0][0]
+
+        assert written == 2
+        mock_pg.from_.assert_called_with("llm_usage_stats")
+        by_feature = {r["feature"]: r for r in rows}
+        assert by_feature["chat"]["user_id"] == "u1"
+        assert by_feature["broadcast"]["user_id"] is None
+        assert by_feature["broadcast"]["completion_tokens"] == 200
+        # Nothing pending after a successful flush; totals are kept
+        assert _run(rec.flush()) == 0
+        assert rec.snapshot()["overall"]["calls"] == 2
+
+    def test_flush_failure_keeps_deltas(self):
+        rec = LLMUsageRecorder()
+        rec.record("chat", "u1", prompt_tokens=10)
+
+        with patch("services.llm_usage.postgrest") as mock_pg:
+            mock_pg.from_.return_value.insert.return_value.execute.side_effect = RuntimeError("db down")
+            assert _run(rec.flush()) == 0
+        rec.record("chat", "u1", prompt_tokens=5)
+
+        with patch("services.llm_usage.postgrest") as mock_pg:
+            assert _run(rec.flush()) == 1
+            row = mock_pg.from_.return_value.insert.call_args[0][0][0]
+        assert row["calls"] == 2
+        assert row["prompt_tokens"] == 15
+
+
+# ===================================================================
+# DoubaoService integration
+# ===================================================================
+
+
+class TestDoubaoAccounting:
+    def test_records_ark_usage_block(self):
+        rec = LLMUsageRecorder()
+        svc = _configured_service()
+        usage = {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150}
+        with patch("services.doubao_service.llm_usage", rec), \
+                patch("httpx.AsyncClient.post", side_effect=_ark_response("好的", usage)):
+            _run(svc.chat([{"role": "user", "content": "你好"}], user_id="u1"))
+
+        stats = rec.snapshot()["by_feature"]["chat"]
+        assert stats["prompt_tokens"] == 120
+        assert stats["completion_tokens"] == 30
+        assert stats["estimated_calls"] == 0
+        assert rec.snapshot()["top_users"][0]["user_id"] == "u1"
+
+    def test_estimates_when_usage_missing(self):
+        rec = LLMUsageRecorder()
+        svc = _configured_service()
+        with patch("services.doubao_service.llm_usage", rec), \
+                patch("httpx.AsyncClient.post", side_effect=_ark_response("您好呀")):
+            _run(svc.chat([{"role": "user", "content": "你好"}], user_id="u1"))
+
+        stats = rec.snapshot()["by_feature"]["chat"]
+        assert stats["estimated_calls"] == 1
+        assert stats["completion_tokens"] == 3
+        assert stats["prompt_tokens"] > 0
+
+    def test_features_are_tagged(self):
+        rec = LLMUsageRecorder()
+        svc = _configured_service()
+        with patch("services.doubao_service.llm_usage", rec), \
+                patch("httpx.AsyncClient.post", side_effect=_ark_response('{"intent": "general_chat"}')):
+            _run(svc.recognize_intent("你好", user_id="u1"))
+            _run(svc.generate_summary([{"role": "user", "content": "你好"}], user_id="u1"))
+
+        assert set(rec.snapshot()["by_feature"]) == {"intent", "summary"}
+
+    def test_error_outcome_recorded(self):
+        rec = LLMUsageRecorder()
+        svc = _configured_service()
+
+        async def mock_post(url, *, headers=None, json=None):
+            raise httpx.ConnectError("connection refused")
+
+        with patch("services.doubao_service.llm_usage", rec), \
+                patch("httpx.AsyncClient.post", side_effect=mock_post):
+            try:
+                _run(svc.chat([{"role": "user", "content": "你好"}], user_id="u1"))
+            except RuntimeError:
+                pass
+
+        stats = rec.snapshot()["by_feature"]["chat"]
+        assert stats["errors"] == 1
+        assert stats["total_tokens"] == 0
+
+
+# ===================================================================
+# /admin/metrics
+# ===================================================================
+
+
+class TestAdminMetrics:
+    def _headers(self, role: str) -> dict:
+        return {"Authorization": f"Bearer {create_access_token('u-admin', role)}"}
+
+    def test_requires_auth(self):
+        assert client.get("/api/v1/admin/metrics").status_code == 401
+
+    def test_forbidden_for_non_staff(self):
+        resp = client.get("/api/v1/admin/metrics", headers=self._headers("elder"))
+        assert resp.status_code == 403
+
+    def test_staff_gets_metrics(self):
+        rec = LLMUsageRecorder()
+        rec.record("chat", "u1", prompt_tokens=10, completion_tokens=5)
+        with patch("api.v1.admin.llm_usage", rec):
+            resp = client.get("/api/v1/admin/metrics", headers=self._headers("staff"))
+
+        assert resp.status_code == 200
+        body = resp.json()
+        assert body["llm_usage"]["overall"]["total_tokens"] == 15
+        assert "interactive" in body["llm_scheduler"]
+        assert "llm_calls_total" in body["llm_coalescing"]
+        assert "sessions" in body["conversation_memory"]
@@ -0,0 +1,208 @@
+"""验证用药提醒语音 (MedicationReminderSpeech) 与 MP3 帧拼接
+
+Tests:
+- mp3_frames: frame parsing, tag/Xing stripping, splicing
+- template segmentation into fixed and slot segments
+- render(): per-segment synthesis, splice, sentence cache, fallback
+- prewarm_active_plans(): renders every active plan
+- GET /api/v1/medicine/plans/{id}/reminder-audio
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.security import create_access_token
+from main import app
+from services.medication_reminder import MedicationReminderSpeech
+from services.mp3_frames import audio_frames, iter_frames, parse_frame_header, splice
+from services.tts_cache import TTSCache
+
+client = TestClient(app)
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo -> 417-byte frames
+_STEREO = bytes([0xFF, 0xFB, 0x90, 0x00])
+_MONO = bytes([0xFF, 0xFB, 0x90, 0xC0])
+
+
+def _frame(header: bytes = _STEREO, fill: int = 0) -> bytes:
+    return header + bytes([fill]) * 413
+
+
+def _xing_frame() -> bytes:
+    body = b"\x00" * 32 + b"Xing" + b"\x00" * 377
+    return _STEREO + body
+
+
+def _clip(n: int, fill: int, header: bytes = _STEREO) -> bytes:
+    return b"".join(_frame(header, fill) for _ in range(n))
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+# ===================================================================
+# MP3 frames
+# ===================================================================
+
+
+class TestMp3Frames:
+    def test_parse_header(self):
+        header = parse_frame_header(_frame())
+        assert header.version == 1
+        assert header.layer == 3
+        assert header.bitrate == 128000
+        assert header.sample_rate == 44100
+        assert header.length == 417
+        assert header.samples == 1152
+
+    def test_rejects_non_frame(self):
+        assert parse_frame_header(b"\x00\x00\x00\x00") is None
+
+    def test_iter_skips_id3_and_junk(self):
+        id3 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"abcde"
+        data = id3 + _frame() + b"junk" + _frame()
+        offsets = [offset for offset, _h in iter_frames(data)]
+        assert offsets == [15, 15 + 417 + 4]
+
+    def test_audio_frames_drops_xing_and_id3v1(self):
+        data = _xing_frame() + _clip(2, 1) + b"TAG" + b"\x00" * 125
+        frames, header = audio_frames(data)
+        assert frames == _clip(2, 1)
+        assert header.sample_rate == 44100
+
+    def test_splice_concatenates_frames(self):
+        spliced = splice([_xing_frame() + _clip(2, 1), _clip(1, 2)])
+        assert spliced == _clip(2, 1) + _clip(1, 2)
+        assert len(list(iter_frames(spliced))) == 3
+
+    def test_splice_rejects_mismatched_channels(self):
+        with pytest.raises(ValueError):
+            splice([_clip(1, 1), _clip(1, 1, header=_MONO)])
+
+
+# ===================================================================
+# Reminder engine
+# ===================================================================
+
+
+class TestSegments:
+    def test_fixed_and_slot_segments(self):
+        speech = MedicationReminderSpeech()
+        assert speech.segments(name="张阿姨", medicine_name="阿司匹林", dosage="1片") == [
+            "张阿姨", "，该吃", "阿司匹林", "了，", "1片",
+        ]
+
+    def test_empty_slot_skipped(self):
+        speech = MedicationReminderSpeech("{name}，该吃{medicine_name}了")
+        assert speech.segments(name="", medicine_name="降压药") == ["，该吃", "降压药", "了"]
+
+    def test_unknown_slot_rejected(self):
+        with pytest.raises(ValueError):
+            MedicationReminderSpeech("{name}{unknown}")
+
+
+class TestRender:
+    def _patched(self, tmp_path, tts):
+        return (
+            patch("services.medication_reminder.tts_cache", TTSCache(directory=tmp_path)),
+            patch("services.medication_reminder.voice_service.text_to_speech", tts),
+            patch("services.medication_reminder.voice_service.app_id", "app"),
+            patch("services.medication_reminder.voice_service.access_token", "token"),
+        )
+
+    def test_splices_segments_and_caches_sentence(self, tmp_path):
+        fills = {"张阿姨": 1, "，该吃": 2, "阿司匹林": 3, "了，": 4, "1片": 5}
+        tts = AsyncMock(side_effect=lambda text, **_kw: _clip(1, fills[text]))
+        speech = MedicationReminderSpeech()
+
+        p1, p2, p3, p4 = self._patched(tmp_path, tts)
+        with p1, p2, p3, p4:
+            audio = _run(speech.render(name="张阿姨", medicine_name="阿司匹林", dosage="1片"))
+            again = _run(speech.render(name="张阿姨", medicine_name="阿司匹林", dosage="1片"))
+
+        assert audio == b"".join(_clip(1, f) for f in (1, 2, 3, 4, 5))
+        assert again == audio
+        # Second render is a sentence-cache hit: no further TTS calls
+        assert tts.await_count == 5
+        assert speech.stats()["spliced"] == 1
+
+    def test_falls_back_to_full_sentence(self, tmp_path):
+        def fake_tts(text, **_kw):
+            if text == "张阿姨，该吃阿司匹林了，1片":
+                return _clip(3, 9)
+            return _clip(1, 1, header=_MONO if text == "1片" else _STEREO)
+
+        tts = AsyncMock(side_effect=fake_tts)
+        speech = MedicationReminderSpeech()
+
+        p1, p2, p3, p4 = self._patched(tmp_path, tts)
+        with p1, p2, p3, p4:
+            audio = _run(speech.render(name="张阿姨", medicine_name="阿司匹林", dosage="1片"))
+
+        assert audio == _clip(3, 9)
+        assert speech.stats()["fallbacks"] == 1
+
+    def test_render_plan_uses_unit_and_voice_speed(self):
+        speech = MedicationReminderSpeech()
+        with patch.object(speech, "render", new_callable=AsyncMock, return_value=b"x") as mock_render:
+            _run(speech.render_plan(
+                {"medicine_name": "降压药", "dosage": "2", "unit": "片"},
+                {"name": "李大爷", "voice_speed": 0.8},
+            ))
+        mock_render.assert_awaited_once_with(
+            name="李大爷", medicine_name="降压药", dosage="2片", speed=0.8,
+        )
+
+    def test_prewarm_renders_active_plans(self):
+        speech = MedicationReminderSpeech()
+        mock_pg = MagicMock()
+        plans_query = mock_pg.from_.return_value.select.return_value.eq.return_value.eq.return_value
+        plans_query.execute.return_value.data = [
+            {"id": "p1", "user_id": "u1", "medicine_name": "A", "dosage": "1片"},
+            {"id": "p2", "user_id": "u1", "medicine_name": "B", "dosage": "2片"},
+        ]
+        users_query = mock_pg.from_.return_value.select.return_value.in_.return_value
+        users_query.execute.return_value.data = [{"id": "u1", "name": "张阿姨"}]
+
+        with patch("services.medication_reminder.postgrest", mock_pg), \
+                patch.object(speech, "render", new_callable=AsyncMock, return_value=b"x") as mock_render:
+            assert _run(speech.prewarm_active_plans()) == 2
+
+        names = {call.kwargs["medicine_name"] for call in mock_render.await_args_list}
+        assert names == {"A", "B"}
+
+
+# ===================================================================
+# Endpoint
+# ===================================================================
+
+
+class TestReminderAudioEndpoint:
+    def _headers(self):
+        return {"Authorization": f"Bearer {create_access_token('u1', 'elder')}"}
+
+    @patch("api.v1.medicine.medication_reminder_speech")
+    @patch("api.v1.medicine.postgrest")
+    def test_returns_audio(self, mock_pg, mock_speech):
+        mock_pg.from_.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {"id": "p1", "user_id": "u1", "medicine_name": "A", "dosage": "1片"},
+        ]
+        mock_speech.render_plan = AsyncMock(return_value=_clip(1, 1))
+
+        resp = client.get("/api/v1/medicine/plans/p1/reminder-audio", headers=self._headers())
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "audio/mpeg"
+        assert resp.content == _clip(1, 1)
+
+    @patch("api.v1.medicine.postgrest")
+    def test_unknown_plan(self, mock_pg):
+        mock_pg.from_.return_value.select.return_value.eq.return_value.execute.return_value.data = []
+        resp = client.get("/api/v1/medicine/plans/missing/reminder-audio", headers=self._headers())
+        assert resp.status_code == 404
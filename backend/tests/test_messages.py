@@ -10,12 +10,14 @@ Tests:
 Requirements: 9.3, 9.4, 9.9
 """
 
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import pytest
 from fastapi.testclient import TestClient
 
 from core.security import create_access_token
 from main import app
+from services.audio_probe import AudioInfo
 
 client = TestClient(app)
 
@@ -26,6 +28,8 @@ client = TestClient(app)
 _ELDER_ID = "elder-001"
 _FAMILY_ID = "family-001"
 _MSG_ID = "msg-001"
+_SUPABASE = "https://proj.supabase.co"
+_OWN_AUDIO_URL = f"{_SUPABASE}/storage/v1/object/public/voice-messages/{_ELDER_ID}/abc.wav"
 _NOW_ISO = "2024-06-01T10:00:00+00:00"
 
 _TEXT_MSG_ROW = {
@@ -311,6 +315,11 @@ class TestSendMessage:
 
 
 class TestSendVoiceMessage:
+    @pytest.fixture(autouse=True)
+    def _supabase(self):
+        with patch("services.supabase_storage.settings.SUPABASE_URL", _SUPABASE):
+            yield
+
     def test_unauthenticated(self):
         resp = client.post("/api/v1/messages/send-voice", json={
             "sender_id": _ELDER_ID,
@@ -389,6 +398,83 @@ class TestSendVoiceMessage:
         )
         assert resp.status_code == 201
 
+    @patch("api.v1.messages.storage_waveform", new_callable=AsyncMock, return_value=None)
+    @patch("api.v1.messages.probe_storage_url", new_callable=AsyncMock)
+    @patch("api.v1.messages.postgrest")
+    def test_send_voice_uses_probed_duration(self, mock_pg, mock_probe, _mock_waveform):
+        """存储中的音频时长由服务端解析，覆盖客户端上报的值。"""
+        mock_probe.return_value = AudioInfo("wav", 7.84, 16000, 1, 256000)
+        mock_tbl = MagicMock()
+        mock_tbl.insert.return_value.execute.return_value = _make_execute([_VOICE_MSG_ROW])
+        mock_pg.from_.return_value = mock_tbl
+
+        resp = client.post(
+            "/api/v1/messages/send-voice",
+            json={
+                "sender_id": _ELDER_ID,
+                "receiver_id": _FAMILY_ID,
+                "type": "voice",
+                "audio_url": _OWN_AUDIO_URL,
+                "audio_duration": 60.0,
+            },
+            headers=_auth_header(),
+        )
+        assert resp.status_code == 201
+        mock_probe.assert_awaited_once_with(_OWN_AUDIO_URL)
+        assert mock_tbl.insert.call_args[0][0]["audio_duration"] == 7.8
+
+    @patch("api.v1.messages.probe_storage_url", new_callable=AsyncMock, return_value=None)
+    @patch("api.v1.messages.storage_waveform", new_callable=AsyncMock)
+    @patch("api.v1.messages.postgrest")
+    def test_send_voice_stores_waveform_peaks(self, mock_pg, mock_waveform, _mock_probe):
+        """发送时生成波形峰值并随消息返回。"""
+        mock_waveform.return_value = [0, 64, 127, 32]
+        mock_tbl = MagicMock()
+        mock_tbl.insert.return_value.execute.return_value = _make_execute(
+            [{**_VOICE_MSG_ROW, "waveform_peaks": [0, 64, 127, 32]}]
+        )
+        mock_pg.from_.return_value = mock_tbl
+
+        resp = client.post(
+            "/api/v1/messages/send-voice",
+            json={
+                "sender_id": _ELDER_ID,
+                "receiver_id": _FAMILY_ID,
+                "type": "voice",
+                "audio_url": _OWN_AUDIO_URL,
+            },
+            headers=_auth_header(),
+        )
+        assert resp.status_code == 201
+        assert mock_tbl.insert.call_args[0][0]["waveform_peaks"] == [0, 64, 127, 32]
+        assert resp.json()["waveform_peaks"] == [0, 64, 127, 32]
+
+    @pytest.mark.parametrize("audio_url", [
+        f"{_SUPABASE}/storage/v1/object/private-records/{_ELDER_ID}/a.mp3",  # 其他桶
+        f"{_SUPABASE}/storage/v1/object/public/voice-messages/{_FAMILY_ID}/a.mp3",  # 他人目录
+        f"{_SUPABASE}/storage/v1/object/voice-messages/{_ELDER_ID}/../{_FAMILY_ID}/a.mp3",
+        f"{_SUPABASE}/storage/v1/object/voice-messages/{_ELDER_ID}%2F..%2F{_FAMILY_ID}/a.mp3",
+        f"{_SUPABASE}/storage/v1/object/voice-messages/a.mp3",
+    ])
+    @patch("api.v1.messages.opus_transcoder")
+    @patch("api.v1.messages.storage_waveform", new_callable=AsyncMock)
+    @patch("api.v1.messages.probe_storage_url", new_callable=AsyncMock)
+    @patch("api.v1.messages.postgrest")
+    def test_send_voice_rejects_foreign_storage_objects(
+        self, mock_pg, mock_probe, mock_waveform, mock_transcoder, audio_url,
+    ):
+        """存储中的语音文件须位于语音消息桶内发送者自己的目录下。"""
+        resp = client.post(
+            "/api/v1/messages/send-voice",
+            json={"sender_id": _ELDER_ID, "receiver_id": _FAMILY_ID, "type": "voice", "audio_url": audio_url},
+            headers=_auth_header(user_id=_ELDER_ID),
+        )
+        assert resp.status_code == 403
+        mock_probe.assert_not_awaited()
+        mock_waveform.assert_not_awaited()
+        mock_transcoder.enqueue.assert_not_called()
+        mock_pg.from_.assert_not_called()
+
     @patch("api.v1.messages.postgrest")
     def test_send_voice_db_failure(self, mock_pg):
         """数据库插入失败返回500。"""
@@ -0,0 +1,122 @@
+"""验证 Mock Ark 服务 (tools.mock_ark)
+
+Tests:
+- non-streaming chat/completions response shape and usage block
+- canned intent / summary / broadcast replies parse like real Ark output
+- SSE streaming chunks and [DONE] terminator
+- error injection and latency distribution specs
+- CLI options default to the MOCK_ARK_* environment
+"""
+
+import json
+import random
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.doubao_service import DoubaoService, _INTENT_PROMPT, _SUMMARY_PROMPT
+from tools.mock_ark import LatencyDistribution, MockArkConfig, create_app, main
+
+
+def _client(**kwargs) -> TestClient:
+    config = MockArkConfig(latency="fixed:0", tokens_per_second=0, seed=1, **kwargs)
+    return TestClient(create_app(config))
+
+
+def _post(client, messages, **extra):
+    return client.post(
+        "/chat/completions",
+        json={"model": "mock", "messages": messages, **extra},
+    )
+
+
+class TestCompletions:
+    def test_chat_response_shape(self):
+        resp = _post(_client(), [{"role": "user", "content": "你好"}])
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["choices"][0]["message"]["role"] == "assistant"
+        assert "你好" in data["choices"][0]["message"]["content"]
+        usage = data["usage"]
+        assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+
+    def test_api_v3_prefix(self):
+        resp = _client().post(
+            "/api/v3/chat/completions",
+            json={"messages": [{"role": "user", "content": "你好"}]},
+        )
+        assert resp.status_code == 200
+
+    def test_intent_json_is_parseable(self):
+        resp = _post(_client(), [
+            {"role": "system", "content": _INTENT_PROMPT},
+            {"role": "user", "content": "我摔倒了，救命啊"},
+        ])
+        raw = resp.json()["choices"][0]["message"]["content"]
+        result = DoubaoService._parse_intent_response(raw)
+        assert result["intent"] == "emergency"
+        assert result["confidence"] > 0.5
+
+    def test_summary_flow(self):
+        resp = _post(_client(), [
+            {"role": "system", "content": _SUMMARY_PROMPT.format(conversations="user: 你好")},
+            {"role": "user", "content": "请生成对话摘要。"},
+        ])
+        assert resp.json()["mock_flow"] == "summary"
+
+    def test_broadcast_flow_has_title_and_content(self):
+        resp = _post(_client(), [{"role": "user", "content": "请为老年人生成一段健康广播内容"}])
+        content = resp.json()["choices"][0]["message"]["content"]
+        assert content.startswith("标题：")
+        assert "内容：" in content
+
+    def test_max_tokens_truncates(self):
+        resp = _post(_client(), [{"role": "user", "content": "你好"}], max_tokens=5)
+        assert resp.json()["usage"]["completion_tokens"] <= 5
+
+
+class TestStreaming:
+    def test_sse_chunks(self):
+        resp = _post(_client(), [{"role": "user", "content": "你好"}], stream=True)
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = [line[6:] for line in resp.text.split("\n") if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        chunks = [json.loads(e) for e in events[:-1]]
+        text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+        assert "你好" in text
+        assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+        assert "usage" in chunks[-1]
+
+
+class TestInjection:
+    def test_error_injection(self):
+        client = _client(error_rate=1.0, error_statuses=(503,))
+        resp = _post(client, [{"role": "user", "content": "你好"}])
+        assert resp.status_code == 503
+        stats = client.get("/mock/stats").json()
+        assert stats["errors"] == 1
+
+
+class TestLatencyDistribution:
+    @pytest.mark.parametrize("spec", ["fixed:0.1", "uniform:0:1", "normal:0.5:0.1", "lognormal:0.6:0.4"])
+    def test_samples_non_negative(self, spec):
+        dist = LatencyDistribution(spec, random.Random(0))
+        assert all(dist.sample() >= 0 for _ in range(50))
+
+    def test_fixed(self):
+        assert LatencyDistribution("fixed:0.25").sample() == 0.25
+
+    @pytest.mark.parametrize("spec", ["gamma:1", "uniform:1", "fixed"])
+    def test_invalid_spec(self, spec):
+        with pytest.raises(ValueError):
+            LatencyDistribution(spec)
+
+
+class TestCli:
+    def test_seed_from_env(self, monkeypatch):
+        monkeypatch.setenv("MOCK_ARK_SEED", "7")
+        with patch("tools.mock_ark.create_app") as mock_create, patch("uvicorn.run"):
+            main([])
+        config = mock_create.call_args.args[0]
+        assert config.rng.random() == random.Random(7).random()
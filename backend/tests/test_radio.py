@@ -4,11 +4,12 @@ Tests:
 - GET  /api/v1/radio/recommend: 获取个性化推荐广播
 - GET  /api/v1/radio/categories: 获取广播分类
 - POST /api/v1/radio/play-record: 记录播放历史
-- POST /api/v1/radio/generate: 生成个性化广播内容
+- POST /api/v1/radio/generate, GET /api/v1/radio/generate/{job_id}: 广播生成任务
 
 需求: 11.1, 11.2, 11.3, 11.4, 11.8
 """
 
+import time
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
@@ -16,6 +17,9 @@ from fastapi.testclient import TestClient
 
 from core.security import create_access_token
 from main import app
+from services.broadcast_audio import LocalAudioStore
+from services.broadcast_index import BroadcastIndex
+from services.broadcast_pipeline import BroadcastPipeline
 
 client = TestClient(app)
 
@@ -123,37 +127,43 @@ class TestGetCategories:
 # ---------------------------------------------------------------------------
 
 
+def _recommend_pg(mock_pg, user_rows, played_ids=()):
+    """按表名返回用户信息与播放历史查询结果。"""
+    users = MagicMock()
+    users.select.return_value.eq.return_value.execute.return_value = _make_execute(user_rows)
+    history = MagicMock()
+    history.select.return_value.eq.return_value.order.return_value.limit.return_value.execute.return_value = (
+        _make_execute([{"broadcast_id": i} for i in played_ids])
+    )
+    tables = {"users": users, "broadcast_play_history": history}
+    mock_pg.from_.side_effect = lambda table_name: tables[table_name]
+
+
+def _recommender(*rows):
+    from services.broadcast_index import BroadcastIndex
+    from services.radio_recommender import RadioRecommender
+
+    index = BroadcastIndex()
+    index.load(rows)
+    return RadioRecommender(index=index)
+
+
+@patch("services.health_broadcast._get_current_season", return_value="夏季")
 class TestGetRecommendations:
-    def test_unauthenticated(self):
+    def test_unauthenticated(self, _season):
         resp = client.get("/api/v1/radio/recommend")
         assert resp.status_code == 401
 
-    @patch("api.v1.radio.postgrest")
-    def test_recommend_success(self, mock_pg):
+    @patch("services.radio_recommender.postgrest")
+    def test_recommend_success(self, mock_pg, _season):
         """获取个性化推荐广播成功。"""
-        call_count = {"n": 0}
-
-        def from_side_effect(table_name):
-            call_count["n"] += 1
-            tbl = MagicMock()
-            if call_count["n"] == 1:
-                # 查询用户信息
-                tbl.select.return_value.eq.return_value.execute.return_value = (
-                    _make_execute([_USER_ROW])
-                )
-            else:
-                # 查询广播列表
-                tbl.select.return_value.eq.return_value.or_.return_value.order.return_value.limit.return_value.execute.return_value = (
-                    _make_execute([_BROADCAST_ROW])
-                )
-            return tbl
-
-        mock_pg.from_.side_effect = from_side_effect
-
-        resp = client.get(
-            "/api/v1/radio/recommend",
-            headers=_auth_header(),
-        )
+        _recommend_pg(mock_pg, [_USER_ROW])
+
+        with patch("api.v1.radio.radio_recommender", _recommender(_BROADCAST_ROW)):
+            resp = client.get(
+                "/api/v1/radio/recommend",
+                headers=_auth_header(),
+            )
         assert resp.status_code == 200
         data = resp.json()
         assert isinstance(data, list)
@@ -161,60 +171,52 @@ class TestGetRecommendations:
         assert data[0]["title"] == "夏季养生小贴士"
         assert data[0]["category"] == "季节养生"
 
-    @patch("api.v1.radio.postgrest")
-    def test_recommend_empty(self, mock_pg):
+    @patch("services.radio_recommender.postgrest")
+    def test_recommend_empty(self, mock_pg, _season):
         """无推荐广播时返回空列表。"""
-        call_count = {"n": 0}
-
-        def from_side_effect(table_name):
-            call_count["n"] += 1
-            tbl = MagicMock()
-            if call_count["n"] == 1:
-                tbl.select.return_value.eq.return_value.execute.return_value = (
-                    _make_execute([_USER_ROW])
-                )
-            else:
-                tbl.select.return_value.eq.return_value.or_.return_value.order.return_value.limit.return_value.execute.return_value = (
-                    _make_execute([])
-                )
-            return tbl
-
-        mock_pg.from_.side_effect = from_side_effect
-
-        resp = client.get(
-            "/api/v1/radio/recommend",
-            headers=_auth_header(),
-        )
+        _recommend_pg(mock_pg, [_USER_ROW])
+
+        with patch("api.v1.radio.radio_recommender", _recommender()):
+            resp = client.get(
+                "/api/v1/radio/recommend",
+                headers=_auth_header(),
+            )
         assert resp.status_code == 200
         assert resp.json() == []
 
-    @patch("api.v1.radio.postgrest")
-    def test_recommend_user_not_found(self, mock_pg):
+    @patch("services.radio_recommender.postgrest")
+    def test_recommend_user_not_found(self, mock_pg, _season):
         """用户信息不存在时仍返回广播（无个性化过滤）。"""
-        call_count = {"n": 0}
-
-        def from_side_effect(table_name):
-            call_count["n"] += 1
-            tbl = MagicMock()
-            if call_count["n"] == 1:
-                tbl.select.return_value.eq.return_value.execute.return_value = (
-                    _make_execute([])
-                )
-            else:
-                tbl.select.return_value.eq.return_value.or_.return_value.order.return_value.limit.return_value.execute.return_value = (
-                    _make_execute([_BROADCAST_ROW])
-                )
-            return tbl
-
-        mock_pg.from_.side_effect = from_side_effect
-
-        resp = client.get(
-            "/api/v1/radio/recommend",
-            headers=_auth_header(),
-        )
+        _recommend_pg(mock_pg, [])
+
+        with patch("api.v1.radio.radio_recommender", _recommender(_BROADCAST_ROW)):
+            resp = client.get(
+                "/api/v1/radio/recommend",
+                headers=_auth_header(),
+            )
         assert resp.status_code == 200
         assert len(resp.json()) == 1
 
+    @patch("services.radio_recommender.postgrest")
+    def test_recommend_filters_and_ranks(self, mock_pg, _season):
+        """按季节、年龄过滤，慢性病匹配优先，排除已播放。"""
+        rows = [
+            {**_BROADCAST_ROW, "id": "winter", "target_season": "冬季"},
+            {**_BROADCAST_ROW, "id": "young", "target_age_min": 40, "target_age_max": 59},
+            {**_BROADCAST_ROW, "id": "played"},
+            {**_BROADCAST_ROW, "id": "generic", "target_diseases": None, "target_season": None},
+            {**_BROADCAST_ROW, "id": "diabetes", "target_diseases": ["糖尿病"]},
+        ]
+        _recommend_pg(mock_pg, [_USER_ROW], played_ids=["played"])
+
+        with patch("api.v1.radio.radio_recommender", _recommender(*rows)):
+            resp = client.get(
+                "/api/v1/radio/recommend",
+                headers=_auth_header(),
+            )
+        assert resp.status_code == 200
+        assert [b["id"] for b in resp.json()] == ["diabetes", "generic"]
+
 
 # ---------------------------------------------------------------------------
 # POST /api/v1/radio/play-record
@@ -228,27 +230,13 @@ class TestCreatePlayRecord:
         })
         assert resp.status_code == 401
 
+    @patch("api.v1.radio.broadcast_counters")
     @patch("api.v1.radio.postgrest")
-    def test_play_record_success(self, mock_pg):
-        """记录播放历史成功。"""
-        call_count = {"n": 0}
-
-        def from_side_effect(table_name):
-            call_count["n"] += 1
-            tbl = MagicMock()
-            if call_count["n"] == 1:
-                # 插入播放记录
-                tbl.insert.return_value.execute.return_value = (
-                    _make_execute([_PLAY_RECORD_ROW])
-                )
-            else:
-                # 更新播放次数
-                tbl.update.return_value.eq.return_value.execute.return_value = (
-                    _make_execute([])
-                )
-            return tbl
-
-        mock_pg.from_.side_effect = from_side_effect
+    def test_play_record_success(self, mock_pg, mock_counters):
+        """记录播放历史成功，播放计数交给批量计数器。"""
+        mock_tbl = MagicMock()
+        mock_tbl.insert.return_value.execute.return_value = _make_execute([_PLAY_RECORD_ROW])
+        mock_pg.from_.return_value = mock_tbl
 
         resp = client.post(
             "/api/v1/radio/play-record",
@@ -265,26 +253,17 @@ class TestCreatePlayRecord:
         assert data["broadcast_id"] == _BROADCAST_ID
         assert data["user_id"] == _USER_ID
         assert data["liked"] is True
+        mock_counters.record.assert_called_once_with(_BROADCAST_ID, completed=False, liked=True)
+        # 不再逐条更新 health_broadcasts
+        mock_tbl.update.assert_not_called()
 
+    @patch("api.v1.radio.broadcast_counters")
     @patch("api.v1.radio.postgrest")
-    def test_play_record_uses_auth_user_id(self, mock_pg):
+    def test_play_record_uses_auth_user_id(self, mock_pg, _counters):
         """user_id 从 Token 获取，不信任客户端。"""
-        call_count = {"n": 0}
-
-        def from_side_effect(table_name):
-            call_count["n"] += 1
-            tbl = MagicMock()
-            if call_count["n"] == 1:
-                tbl.insert.return_value.execute.return_value = (
-                    _make_execute([_PLAY_RECORD_ROW])
-                )
-            else:
-                tbl.update.return_value.eq.return_value.execute.return_value = (
-                    _make_execute([])
-                )
-            return tbl
-
-        mock_pg.from_.side_effect = from_side_effect
+        mock_tbl = MagicMock()
+        mock_tbl.insert.return_value.execute.return_value = _make_execute([_PLAY_RECORD_ROW])
+        mock_pg.from_.return_value = mock_tbl
 
         resp = client.post(
             "/api/v1/radio/play-record",
@@ -293,8 +272,7 @@ class TestCreatePlayRecord:
         )
         assert resp.status_code == 201
         # 验证插入时使用了认证用户的ID
-        insert_call = mock_pg.from_.return_value.insert.call_args
-        # 通过 side_effect 无法直接检查，但响应中 user_id 正确即可
+        assert mock_tbl.insert.call_args.args[0]["user_id"] == _USER_ID
         assert resp.json()["user_id"] == _USER_ID
 
     @patch("api.v1.radio.postgrest")
@@ -317,6 +295,33 @@ class TestCreatePlayRecord:
 # ---------------------------------------------------------------------------
 
 
+def _generate(c: TestClient, body: dict, headers: dict) -> dict:
+    """提交生成任务并轮询到结束。"""
+    resp = c.post("/api/v1/radio/generate", json=body, headers=headers)
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+    for _ in range(200):
+        data = c.get(f"/api/v1/radio/generate/{job_id}", headers=headers).json()
+        if data["status"] in ("done", "failed"):
+            return data
+        time.sleep(0.01)
+    raise AssertionError("generation job did not finish")
+
+
+@pytest.fixture
+def pipeline_client(tmp_path):
+    """挂上独立生成流水线的 TestClient（保持事件循环，后台任务可运行）。"""
+    pipeline = BroadcastPipeline(concurrency=1)
+    with patch("main.settings.MEDICATION_REMINDER_PREWARM", False), \
+            patch("main.settings.BROADCAST_PIPELINE_ENABLED", False), \
+            patch("api.v1.radio.broadcast_pipeline", pipeline), \
+            patch("services.broadcast_pipeline.broadcast_index", BroadcastIndex()), \
+            patch("services.broadcast_pipeline.broadcast_audio_store", LocalAudioStore(tmp_path)), \
+            patch("services.broadcast_pipeline.opus_transcoder", MagicMock()), \
+            TestClient(app) as c:
+        yield c
+
+
 class TestGenerateBroadcast:
     def test_unauthenticated(self):
         resp = client.post("/api/v1/radio/generate", json={
@@ -324,11 +329,11 @@ class TestGenerateBroadcast:
         })
         assert resp.status_code == 401
 
-    @patch("api.v1.radio.postgrest")
+    @patch("services.broadcast_pipeline.postgrest")
     @patch("services.health_broadcast.voice_service")
     @patch("services.health_broadcast.doubao_service")
-    def test_generate_success(self, mock_doubao, mock_voice, mock_pg):
-        """生成个性化广播内容成功。"""
+    def test_generate_success(self, mock_doubao, mock_voice, mock_pg, pipeline_client):
+        """提交生成任务，轮询得到生成的广播。"""
         # Mock LLM 生成文本
         mock_doubao.chat = AsyncMock(
             return_value="标题：高血压患者饮食指南\n内容：高血压患者在日常饮食中应注意低盐低脂..."
@@ -343,28 +348,47 @@ class TestGenerateBroadcast:
         )
         mock_pg.from_.return_value = mock_tbl
 
-        resp = client.post(
-            "/api/v1/radio/generate",
-            json={
+        data = _generate(
+            pipeline_client,
+            {
                 "category": "慢病管理",
                 "topic": "高血压饮食",
                 "target_age_min": 60,
                 "target_age_max": 80,
                 "target_diseases": ["高血压"],
             },
-            headers=_auth_header(),
+            _auth_header(),
+        )
+        assert data["status"] == "done"
+        assert data["broadcast"]["title"] == "高血压患者饮食指南"
+        assert data["broadcast"]["category"] == "慢病管理"
+        assert data["broadcast"]["generated_by"] == "doubao"
+        record = mock_tbl.insert.call_args.args[0]
+        assert record["target_diseases"] == ["高血压"]
+        assert record["audio_url"] == f"/api/v1/radio/audio/{record['id']}.mp3"
+
+    @patch("services.broadcast_pipeline.postgrest")
+    @patch("services.health_broadcast.voice_service")
+    @patch("services.health_broadcast.doubao_service")
+    def test_job_visible_to_owner_only(self, mock_doubao, mock_voice, mock_pg, pipeline_client):
+        mock_doubao.chat = AsyncMock(return_value="标题：测试\n内容：测试内容")
+        mock_voice.text_to_speech = AsyncMock(return_value=b"\xff\xfb\x90\x00")
+        mock_pg.from_.return_value.insert.return_value.execute.return_value = (
+            _make_execute([_GENERATED_BROADCAST_ROW])
         )
-        assert resp.status_code == 201
-        data = resp.json()
-        assert data["title"] == "高血压患者饮食指南"
-        assert data["category"] == "慢病管理"
-        assert data["generated_by"] == "doubao"
 
-    @patch("api.v1.radio.postgrest")
+        resp = pipeline_client.post("/api/v1/radio/generate", json={"category": "养生保健"}, headers=_auth_header())
+        job_id = resp.json()["job_id"]
+        other = pipeline_client.get(f"/api/v1/radio/generate/{job_id}", headers=_auth_header("user-002"))
+        assert other.status_code == 404
+        missing = pipeline_client.get("/api/v1/radio/generate/unknown", headers=_auth_header())
+        assert missing.status_code == 404
+
+    @patch("services.broadcast_pipeline.postgrest")
     @patch("services.health_broadcast.voice_service")
     @patch("services.health_broadcast.doubao_service")
-    def test_generate_db_failure(self, mock_doubao, mock_voice, mock_pg):
-        """数据库保存失败返回500。"""
+    def test_generate_db_failure(self, mock_doubao, mock_voice, mock_pg, pipeline_client):
+        """数据库保存失败时任务失败。"""
         mock_doubao.chat = AsyncMock(return_value="标题：测试\n内容：测试内容")
         mock_voice.text_to_speech = AsyncMock(return_value=b"\xff\xfb\x90\x00")
 
@@ -372,12 +396,29 @@ class TestGenerateBroadcast:
         mock_tbl.insert.return_value.execute.return_value = _make_execute([])
         mock_pg.from_.return_value = mock_tbl
 
-        resp = client.post(
-            "/api/v1/radio/generate",
-            json={"category": "养生保健"},
-            headers=_auth_header(),
-        )
-        assert resp.status_code == 500
+        data = _generate(pipeline_client, {"category": "养生保健"}, _auth_header())
+        assert data["status"] == "failed"
+        assert data["error"] == "保存广播内容失败"
+
+    @patch("services.health_broadcast.doubao_service")
+    def test_generate_shed_when_llm_busy(self, mock_doubao, pipeline_client):
+        """LLM繁忙、低优先级请求被丢弃时任务失败并返回原因。"""
+        from services.llm_scheduler import LLMShedError
+
+        mock_doubao.chat = AsyncMock(side_effect=LLMShedError("豆包LLM服务繁忙，请稍后再试"))
+
+        data = _generate(pipeline_client, {"category": "养生保健"}, _auth_header())
+        assert data["status"] == "failed"
+        assert data["error"] == "豆包LLM服务繁忙，请稍后再试"
+
+    @patch("api.v1.radio.broadcast_pipeline")
+    def test_queue_full(self, mock_pipeline):
+        """生成队列已满时返回503。"""
+        from services.broadcast_pipeline import BroadcastQueueFull
+
+        mock_pipeline.submit.side_effect = BroadcastQueueFull("broadcast generation queue is full")
+        resp = client.post("/api/v1/radio/generate", json={"category": "养生保健"}, headers=_auth_header())
+        assert resp.status_code == 503
 
 
 # ---------------------------------------------------------------------------
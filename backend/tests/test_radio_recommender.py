@@ -0,0 +1,184 @@
+"""验证广播推荐分段缓存 (RadioRecommender)
+
+Tests:
+- a warm cache serves /radio/recommend without any database query
+- users in the same segment share one ranking; per-user age and played filters
+- publishing a broadcast invalidates segments; TTL expiry
+- play records and profile updates reach the per-user cache
+- falling back to a full ranking when a segment is exhausted
+- per-segment hit rates
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from core.security import create_access_token
+from main import app
+from services.broadcast_index import BroadcastIndex
+from services.radio_recommender import RadioRecommender, segment_of
+
+client = TestClient(app)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _row(broadcast_id: str, **fields) -> dict:
+    row = {
+        "id": broadcast_id,
+        "title": broadcast_id,
+        "content": "...",
+        "category": "养生保健",
+        "is_published": True,
+        "play_count": 0,
+        "target_age_min": None,
+        "target_age_max": None,
+        "target_diseases": None,
+        "target_season": None,
+        "created_at": "2025-06-15T00:00:00+00:00",
+    }
+    row.update(fields)
+    return row
+
+
+_USERS = {
+    "u72": {"id": "u72", "birth_date": "1953-01-01", "chronic_diseases": ["高血压"]},
+    "u75": {"id": "u75", "birth_date": "1950-01-01", "chronic_diseases": ["高血压"]},
+}
+
+
+def _fake_db(played: dict[str, list[str]] | None = None) -> MagicMock:
+    """users / broadcast_play_history 查询，按 user_id 返回。"""
+    played = played or {}
+    pg = MagicMock()
+
+    def from_(table_name):
+        table = MagicMock()
+        if table_name == "users":
+            table.select.return_value.eq.side_effect = lambda _col, user_id: MagicMock(
+                execute=MagicMock(return_value=MagicMock(data=[_USERS[user_id]] if user_id in _USERS else []))
+            )
+        else:
+            def history(_col, user_id):
+                rows = [{"broadcast_id": i} for i in played.get(user_id, [])]
+                query = MagicMock()
+                query.order.return_value.limit.return_value.execute.return_value = MagicMock(data=rows)
+                return query
+
+            table.select.return_value.eq.side_effect = history
+        return table
+
+    pg.from_.side_effect = from_
+    return pg
+
+
+def _recommender(rows, **kwargs) -> RadioRecommender:
+    index = BroadcastIndex()
+    index.load(rows)
+    return RadioRecommender(index=index, **kwargs)
+
+
+def _ids(rows) -> list[str]:
+    return [row["id"] for row in rows]
+
+
+@patch("services.health_broadcast._get_current_season", return_value="夏季")
+class TestRadioRecommender:
+    def test_segment_shared_and_user_filters(self, _season):
+        rows = [
+            _row("general"),
+            _row("bp", target_diseases=["高血压"]),
+            _row("over-74", target_age_min=74, target_diseases=["高血压"]),
+        ]
+        rec = _recommender(rows)
+        pg = _fake_db({"u75": ["bp"]})
+
+        with patch("services.radio_recommender.postgrest", pg):
+            u72 = _run(rec.recommend("u72", 10))
+            u75 = _run(rec.recommend("u75", 10))
+
+        assert segment_of(rec._users["u72"].filters) == segment_of(rec._users["u75"].filters)
+        assert set(_ids(u72)) == {"bp", "general"}  # 72 岁不在 74+ 区间
+        assert set(_ids(u75)) == {"over-74", "general"}  # 已播放 bp
+        stats = rec.stats()
+        assert stats["segment_hit_rate"] == 0.5
+        assert stats["segments"] == {"夏季|70-79|高血压": {"hits": 1, "misses": 1, "hit_rate": 0.5}}
+
+    def test_warm_cache_makes_no_queries(self, _season):
+        rec = _recommender([_row("a"), _row("b")])
+        pg = _fake_db()
+        auth = {"Authorization": f"Bearer {create_access_token('u72', 'elder')}"}
+
+        with patch("services.radio_recommender.postgrest", pg), \
+                patch("api.v1.radio.radio_recommender", rec):
+            assert client.get("/api/v1/radio/recommend", headers=auth).status_code == 200
+            pg.from_.reset_mock()
+            resp = client.get("/api/v1/radio/recommend", headers=auth)
+
+        assert len(resp.json()) == 2
+        pg.from_.assert_not_called()
+
+    def test_publish_and_ttl_invalidate_segments(self, _season):
+        rec = _recommender([_row("a")], segment_ttl=60)
+
+        async def go():
+            with patch("services.radio_recommender.postgrest", _fake_db()):
+                first = await rec.recommend("u72", 10)
+                rec.index.upsert(_row("new", target_diseases=["高血压"]))
+                second = await rec.recommend("u72", 10)
+                third = await rec.recommend("u72", 10)
+                rec._segments[segment_of(rec._users["u72"].filters)].expires = 0
+                await rec.recommend("u72", 10)
+            return first, second, third
+
+        first, second, third = _run(go())
+        assert _ids(first) == ["a"]
+        assert _ids(second) == _ids(third) == ["new", "a"]
+        counts = rec.stats()["segments"]["夏季|70-79|高血压"]
+        assert (counts["hits"], counts["misses"]) == (1, 3)
+
+    def test_play_record_and_profile_update(self, _season):
+        rec = _recommender([_row("a"), _row("b")])
+
+        async def go():
+            with patch("services.radio_recommender.postgrest", _fake_db()):
+                await rec.recommend("u72", 10)
+                rec.record_play("u72", "a")
+                after_play = await rec.recommend("u72", 10)
+                rec.forget_user("u72")
+                reloaded = await rec.recommend("u72", 10)
+            return after_play, reloaded
+
+        after_play, reloaded = _run(go())
+        assert _ids(after_play) == ["b"]
+        assert set(_ids(reloaded)) == {"a", "b"}  # 数据库里没有这条播放记录
+        assert rec.stats()["user_hit_rate"] == 0.333
+
+    def test_exhausted_segment_falls_back(self, _season):
+        rows = [_row(f"b{i}", play_count=100 - i) for i in range(5)]
+        rec = _recommender(rows, depth=2)
+
+        with patch("services.radio_recommender.postgrest", _fake_db({"u72": ["b0", "b1"]})):
+            result = _run(rec.recommend("u72", 2))
+
+        assert _ids(result) == ["b2", "b3"]
+        assert rec.stats()["fallbacks"] == 1
+
+
+class TestProfileUpdate:
+    @patch("api.v1.users.radio_recommender")
+    @patch("api.v1.users.postgrest")
+    def test_update_me_forgets_cached_profile(self, mock_pg, mock_rec):
+        row = {"id": "u72", "name": "王奶奶", "phone": "13800000000", "role": "elder", "chronic_diseases": ["糖尿病"]}
+        mock_pg.from_.return_value.update.return_value.eq.return_value.execute.return_value = MagicMock(data=[row])
+        auth = {"Authorization": f"Bearer {create_access_token('u72', 'elder')}"}
+
+        resp = client.patch("/api/v1/users/me", json={"chronic_diseases": ["糖尿病"]}, headers=auth)
+
+        assert resp.status_code == 200
+        mock_rec.forget_user.assert_called_once_with("u72")
@@ -0,0 +1,289 @@
+"""验证全文搜索 (services.text_search, /search/*)
+
+Tests:
+- character bigram tokenization of Chinese, NFKC-normalized words
+- BM25 scores match a direct computation; incremental add/remove equals a rebuild
+- per-user conversation indexes load once, pick up saved turns, LRU eviction
+- the broadcast index follows the recommendation index (publish, unpublish, rebuild)
+- GET /search/broadcasts (audio rendition) and GET /search/conversations (family permission)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from collections import Counter
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.security import create_access_token
+from main import app
+from services.broadcast_index import BroadcastIndex
+from services.text_search import (
+    BroadcastSearch,
+    ConversationSearch,
+    InvertedIndex,
+    query_terms,
+    snippet,
+    tokenize,
+)
+from services.transcode import RENDITION_VARY
+
+client = TestClient(app)
+
+_DOCS = {
+    "d1": "高血压患者要低盐饮食，每天食盐不超过五克。",
+    "d2": "糖尿病患者饮食要控制主食，少吃甜食。",
+    "d3": "秋季养生：早睡早起，适当运动，预防高血压和感冒。",
+    "d4": "每天散步三十分钟，对血压和血糖都有好处。BMI 要控制在正常范围。",
+}
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _auth(user_id: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(user_id, 'family')}"}
+
+
+class TestTokenize:
+    def test_bigrams_and_words(self):
+        assert tokenize("高血压，ＢＭＩ 24") == ["高", "血", "压", "高血", "血压", "bmi", "24"]
+        assert query_terms("高血压 血压") == ["高血", "血压"]
+        assert query_terms("盐") == ["盐"]
+
+    def test_snippet(self):
+        text = "前言" * 40 + "高血压患者要低盐饮食" + "结尾" * 40
+        cut = snippet(text, "低盐", width=20)
+        assert "低盐" in cut
+        assert cut.startswith("…") and cut.endswith("…")
+        assert snippet("短文本", "文本") == "短文本"
+
+
+def _bm25(docs: dict[str, str], query: str, k1: float = 1.2, b: float = 0.75) -> dict[str, float]:
+    tokens = {doc_id: Counter(tokenize(text)) for doc_id, text in docs.items()}
+    avgdl = sum(sum(c.values()) for c in tokens.values()) / len(docs)
+    scores: dict[str, float] = {}
+    for term in query_terms(query):
+        df = sum(1 for c in tokens.values() if term in c)
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for doc_id, c in tokens.items():
+            if term in c:
+                tf, dl = c[term], sum(c.values())
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    return scores
+
+
+class TestInvertedIndex:
+    @pytest.mark.parametrize("query", ["高血压", "饮食", "血糖 BMI", "盐"])
+    def test_scores_match_bm25(self, query):
+        index = InvertedIndex()
+        for doc_id, text in _DOCS.items():
+            index.add(doc_id, text)
+        results = index.search(query, limit=10)
+        expected = _bm25(_DOCS, query)
+        assert dict(results) == pytest.approx(expected)
+        assert [doc_id for doc_id, _ in results] == sorted(expected, key=lambda d: -expected[d])
+
+    def test_ranking(self):
+        index = InvertedIndex()
+        for doc_id, text in _DOCS.items():
+            index.add(doc_id, text)
+        assert [doc_id for doc_id, _ in index.search("高血压")][:2] == ["d1", "d3"]
+        assert index.search("骨质疏松") == []
+
+    def test_incremental_equals_rebuild(self):
+        incremental = InvertedIndex()
+        for doc_id, text in _DOCS.items():
+            incremental.add(doc_id, text)
+        incremental.add("d2", "替换后的内容：高血压")
+        incremental.remove("d4")
+        incremental.remove("missing")
+
+        rebuilt = InvertedIndex()
+        for doc_id, text in {**_DOCS, "d2": "替换后的内容：高血压"}.items():
+            if doc_id != "d4":
+                rebuilt.add(doc_id, text)
+
+        assert incremental.search("高血压 血糖") == pytest.approx(rebuilt.search("高血压 血糖"))
+        assert incremental.stats() == rebuilt.stats()
+        assert "bmi" not in incremental._postings
+
+
+def _conversation_pg(rows_by_user: dict[str, list[dict]]) -> MagicMock:
+    pg = MagicMock()
+
+    def eq(_col, user_id):
+        query = MagicMock()
+        query.order.return_value.range.return_value.execute.return_value = MagicMock(
+            data=rows_by_user.get(user_id, [])
+        )
+        return query
+
+    pg.from_.return_value.select.return_value.eq.side_effect = eq
+    return pg
+
+
+def _turn(row_id: str, content: str, user_id: str = "elder-1") -> dict:
+    return {"id": row_id, "user_id": user_id, "role": "user", "content": content, "session_id": "s1"}
+
+
+class TestConversationSearch:
+    def test_loads_once_and_adds_saved_turns(self):
+        pg = _conversation_pg({"elder-1": [_turn("c1", "我今天血压有点高"), _turn("c2", "晚饭吃了面条")]})
+        search = ConversationSearch()
+
+        async def go():
+            with patch("services.text_search.postgrest", pg):
+                search.add("elder-1", [_turn("ignored", "血压")])  # 尚未加载，不建索引
+                first = await search.search("elder-1", "血压")
+                search.add("elder-1", [_turn("c3", "医生说血压控制得不错")])
+                second = await search.search("elder-1", "血压")
+            return first, second
+
+        first, second = _run(go())
+        assert [row["id"] for row, _ in first] == ["c1"]
+        assert {row["id"] for row, _ in second} == {"c1", "c3"}
+        assert pg.from_.call_count == 1
+        assert search.stats()["added"] == 1
+
+    def test_turns_saved_while_loading_are_kept(self):
+        search = ConversationSearch()
+
+        def fetch(user_id):
+            search.add(user_id, [_turn("late", "刚保存的血压记录")])
+            return [_turn("c1", "早上量了血压")]
+
+        with patch.object(search, "_fetch", side_effect=fetch):
+            results = _run(search.search("elder-1", "血压"))
+        assert {row["id"] for row, _ in results} == {"c1", "late"}
+
+    def test_lru_eviction(self):
+        search = ConversationSearch(max_users=2)
+        pg = _conversation_pg({})
+
+        async def go():
+            with patch("services.text_search.postgrest", pg):
+                for user_id in ("a", "b", "a", "c"):
+                    await search.search(user_id, "血压")
+
+        _run(go())
+        assert list(search._users) == ["a", "c"]
+
+
+_BROADCASTS = [
+    {"id": "b1", "title": "高血压饮食指南", "content": "低盐低脂，多吃蔬菜。", "category": "慢病管理",
+     "is_published": True, "target_diseases": ["高血压"]},
+    {"id": "b2", "title": "秋季养生", "content": "早睡早起，注意保暖，预防高血压波动。", "category": "季节养生",
+     "is_published": True},
+]
+
+
+class TestBroadcastSearch:
+    def test_follows_broadcast_index(self):
+        index = BroadcastIndex()
+        index.load([dict(row) for row in _BROADCASTS])
+        search = BroadcastSearch(index)
+
+        assert [row["id"] for row, _ in _run(search.search("高血压"))] == ["b1", "b2"]
+
+        index.upsert({**_BROADCASTS[0], "id": "b3", "title": "新发布：高血压运动", "content": "散步"})
+        index.upsert({**_BROADCASTS[1], "is_published": False})  # 在流水线之外下架
+        index.update("b1", audio_opus_url="https://x/b1.opus.ogg")
+        index.add_counts({"b1": [5, 2, 1]})
+        hits = {row["id"]: row for row, _ in _run(search.search("高血压"))}
+
+        assert set(hits) == {"b1", "b3"}
+        assert hits["b1"]["audio_opus_url"] == "https://x/b1.opus.ogg"
+        assert hits["b1"]["play_count"] == 5
+        assert search.stats()["documents"] == 2
+
+    def test_index_rebuild_drops_removed_broadcasts(self):
+        index = BroadcastIndex(refresh_seconds=0)
+        pg = MagicMock()
+        published = pg.from_.return_value.select.return_value.eq.return_value.order.return_value \
+            .range.return_value.execute
+        published.return_value = MagicMock(data=[dict(row) for row in _BROADCASTS])
+        search = BroadcastSearch(index)
+
+        async def go():
+            with patch("services.broadcast_index.postgrest", pg):
+                first = await search.search("高血压")
+                published.return_value = MagicMock(data=[dict(_BROADCASTS[0])])
+                await search.search("高血压")  # 过期：推荐索引在后台重建
+                await index._refresh
+                return first, await search.search("高血压")
+
+        first, rebuilt = _run(go())
+        assert [row["id"] for row, _ in first] == ["b1", "b2"]
+        assert [row["id"] for row, _ in rebuilt] == ["b1"]
+
+
+class TestSearchEndpoints:
+    def test_search_broadcasts(self):
+        index = BroadcastIndex()
+        index.load([{**_BROADCASTS[0], "audio_url": "https://x/b1.mp3", "audio_opus_url": "https://x/b1.opus.ogg"},
+                    {**_BROADCASTS[1], "audio_url": "https://x/b2.mp3"}])
+        search = BroadcastSearch(index)
+
+        with patch("api.v1.search.broadcast_search", search):
+            resp = client.get("/api/v1/search/broadcasts", params={"q": "高血压"}, headers=_auth("u1"))
+            opus = client.get("/api/v1/search/broadcasts", params={"q": "高血压"},
+                              headers={**_auth("u1"), "X-Audio-Codecs": "opus,mp3"})
+
+        assert resp.status_code == 200
+        hits = resp.json()
+        assert [hit["broadcast"]["id"] for hit in hits] == ["b1", "b2"]  # 标题命中排在前面
+        assert hits[0]["score"] > hits[1]["score"]
+        assert "高血压" in hits[1]["snippet"]
+        assert [hit["broadcast"]["audio_url"] for hit in hits] == ["https://x/b1.mp3", "https://x/b2.mp3"]
+        assert [hit["broadcast"]["audio_url"] for hit in opus.json()] == ["https://x/b1.opus.ogg", "https://x/b2.mp3"]
+        assert resp.headers["vary"] == opus.headers["vary"] == RENDITION_VARY
+
+    def test_search_requires_query(self):
+        assert client.get("/api/v1/search/broadcasts", headers=_auth("u1")).status_code == 422
+
+    @patch("api.v1.search.postgrest")
+    def test_family_searches_elder_conversations(self, mock_pg):
+        binds = mock_pg.from_.return_value.select.return_value.eq.return_value.eq.return_value.eq.return_value
+        search = ConversationSearch()
+        pg = _conversation_pg({"elder-1": [_turn("c1", "我今天血压有点高")]})
+
+        with patch("services.text_search.postgrest", pg), patch("api.v1.search.conversation_search", search):
+            binds.execute.return_value = MagicMock(data=[{"permissions": {"view_health_data": True}}])
+            allowed = client.get(
+                "/api/v1/search/conversations", params={"q": "血压", "user_id": "elder-1"}, headers=_auth("fam-1")
+            )
+            binds.execute.return_value = MagicMock(data=[{"permissions": {"view_health_data": False}}])
+            denied = client.get(
+                "/api/v1/search/conversations", params={"q": "血压", "user_id": "elder-1"}, headers=_auth("fam-2")
+            )
+            own = client.get("/api/v1/search/conversations", params={"q": "血压"}, headers=_auth("elder-1"))
+
+        assert allowed.status_code == 200
+        assert allowed.json()[0]["id"] == "c1"
+        assert allowed.json()[0]["content"] == "我今天血压有点高"
+        assert denied.status_code == 403
+        assert own.status_code == 200 and len(own.json()) == 1
+
+    def test_saved_turns_reach_loaded_index(self):
+        from api.v1.ai_chat import _save_turn
+
+        search = ConversationSearch()
+        pg = MagicMock()
+        pg.from_.return_value.insert.side_effect = lambda record: MagicMock(
+            execute=MagicMock(return_value=MagicMock(data=[{**record, "id": record["role"]}]))
+        )
+
+        with patch("services.text_search.postgrest", _conversation_pg({})), \
+                patch("api.v1.ai_chat.postgrest", pg), patch("api.v1.ai_chat.conversation_search", search):
+            _run(search.search("elder-1", "血压"))
+            _save_turn("elder-1", "s1", "最近血压怎么样", "您的血压很平稳")
+            results = _run(search.search("elder-1", "血压"))
+
+        assert {row["id"] for row, _ in results} == {"user", "assistant"}
@@ -0,0 +1,254 @@
+"""验证 Opus 转码 (OpusTranscoder) 与音频版本选择
+
+Tests:
+- client capability detection from X-Audio-Codecs / Accept
+- rendition choice falls back to the original URL
+- the background pool runs ffmpeg, dedupes keys, counts failures and overflow
+- Supabase Storage URL parsing, upload and size-limited download
+- message lists return the Opus rendition to capable clients, with Vary
+- sending a voice message queues a rendition next to the original
+"""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from core.security import create_access_token
+from main import app
+from services.supabase_storage import StorageObject, download, parse_object_url, upload
+from services.transcode import (
+    RENDITION_VARY,
+    OpusTranscoder,
+    TranscodeError,
+    client_accepts_opus,
+    pick_audio_url,
+)
+
+_SUPABASE = "https://proj.supabase.co"
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _fake_ffmpeg(tmp_path, body: str = "cat") -> str:
+    """A stand-in ffmpeg that copies stdin to stdout (or fails)."""
+    script = tmp_path / "ffmpeg"
+    script.write_text(f"#!/bin/sh\n{body}\n")
+    script.chmod(0o755)
+    return str(script)
+
+
+# ===================================================================
+# Capability detection
+# ===================================================================
+
+
+class TestRenditionChoice:
+    @pytest.mark.parametrize("headers, expected", [
+        ({"x-audio-codecs": "opus,mp3"}, True),
+        ({"x-audio-codecs": " MP3 , Opus "}, True),
+        ({"x-audio-codecs": "mp3"}, False),
+        ({"accept": "audio/ogg; codecs=opus, audio/mpeg;q=0.8"}, True),
+        ({"accept": "audio/opus"}, True),
+        ({"accept": "application/json"}, False),
+        ({}, False),
+    ])
+    def test_client_accepts_opus(self, headers, expected):
+        assert client_accepts_opus(headers) is expected
+
+    def test_pick_audio_url(self):
+        row = {"audio_url": "a.mp3", "audio_opus_url": "a.opus.ogg"}
+        assert pick_audio_url(row, True) == "a.opus.ogg"
+        assert pick_audio_url(row, False) == "a.mp3"
+        assert pick_audio_url({"audio_url": "a.mp3", "audio_opus_url": None}, True) == "a.mp3"
+        assert pick_audio_url({}, True) is None
+
+
+# ===================================================================
+# Worker pool
+# ===================================================================
+
+
+class TestOpusTranscoder:
+    def test_transcode_in_background(self, tmp_path):
+        stored = []
+
+        async def on_done(opus):
+            stored.append(opus)
+
+        async def go():
+            pool = OpusTranscoder(ffmpeg=_fake_ffmpeg(tmp_path), workers=2, queue_size=4)
+            assert pool.enqueue("a", b"x" * 10, on_done)
+            assert not pool.enqueue("a", b"x" * 10, on_done)  # already queued
+
+            async def fetch():
+                return b"fetched"
+
+            assert pool.enqueue("b", fetch, on_done)
+            while pool.stats()["done"] < 2:
+                await asyncio.sleep(0.01)
+            stats = pool.stats()
+            await pool.stop()
+            return stats
+
+        stats = _run(go())
+        assert sorted(stored) == [b"fetched", b"x" * 10]
+        assert stats["failed"] == 0
+        assert stats["size_ratio"] == 1.0
+        assert stats["queued"] == stats["running"] == 0
+
+    def test_failure_is_counted(self, tmp_path):
+        async def go():
+            pool = OpusTranscoder(ffmpeg=_fake_ffmpeg(tmp_path, "echo boom >&2; exit 1"), workers=1)
+            with pytest.raises(TranscodeError, match="boom"):
+                await pool.transcode(b"x")
+            pool.enqueue("a", b"x", MagicMock())
+            while pool.stats()["failed"] < 1:
+                await asyncio.sleep(0.01)
+            await pool.stop()
+            return pool.stats()
+
+        assert _run(go())["done"] == 0
+
+    def test_queue_full_and_unavailable(self, tmp_path):
+        async def slow(_opus):
+            await asyncio.sleep(1)
+
+        async def go():
+            pool = OpusTranscoder(ffmpeg=_fake_ffmpeg(tmp_path), workers=1, queue_size=1)
+            pool.enqueue("a", b"x", slow)
+            await asyncio.sleep(0.1)  # the worker takes the first job
+            assert pool.enqueue("b", b"x", slow)
+            assert not pool.enqueue("c", b"x", slow)
+            stats = pool.stats()
+            await pool.stop()
+            return stats
+
+        assert _run(go())["rejected"] == 1
+        assert not OpusTranscoder(ffmpeg="").enqueue("a", b"x", slow)
+
+
+# ===================================================================
+# Supabase Storage
+# ===================================================================
+
+
+def _storage(handler):
+    real_client = httpx.AsyncClient
+    return patch(
+        "services.supabase_storage.httpx.AsyncClient",
+        side_effect=lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw),
+    )
+
+
+@patch("services.supabase_storage.settings.SUPABASE_URL", _SUPABASE)
+class TestSupabaseStorage:
+    def test_parse_object_url(self):
+        base = f"{_SUPABASE}/storage/v1/object"
+        assert parse_object_url(f"{base}/public/voice/u1/a.mp3?t=1") == StorageObject("voice", "u1/a.mp3", True)
+        assert parse_object_url(f"{base}/voice/a.mp3") == StorageObject("voice", "a.mp3", False)
+        assert parse_object_url(f"{base}/voice") is None
+        assert parse_object_url("https://cdn.example/voice/a.mp3") is None
+
+    def test_upload(self):
+        seen = {}
+
+        def handler(request):
+            seen.update(path=request.url.path, headers=request.headers, body=request.content)
+            return httpx.Response(200, json={"Key": "voice/a.opus.ogg"})
+
+        with _storage(handler), patch("services.supabase_storage.settings.SUPABASE_SERVICE_ROLE_KEY", "svc"):
+            url = _run(upload(StorageObject("voice", "a.opus.ogg", True), b"OggS", "audio/ogg"))
+
+        assert url == f"{_SUPABASE}/storage/v1/object/public/voice/a.opus.ogg"
+        assert seen["path"] == "/storage/v1/object/voice/a.opus.ogg"
+        assert seen["headers"]["x-upsert"] == "true"
+        assert seen["headers"]["authorization"] == "Bearer svc"
+        assert seen["body"] == b"OggS"
+
+    def test_download_limits(self):
+        url = f"{_SUPABASE}/storage/v1/object/public/voice/a.mp3"
+        with _storage(lambda request: httpx.Response(200, content=b"x" * 100)):
+            assert _run(download(url, 100)) == b"x" * 100
+            with pytest.raises(ValueError):
+                _run(download(url, 99))
+        with pytest.raises(ValueError):
+            _run(download("https://cdn.example/a.mp3", 100))
+
+
+# ===================================================================
+# API
+# ===================================================================
+
+
+_VOICE_ROW = {
+    "id": "msg-opus",
+    "sender_id": "elder-001",
+    "receiver_id": "family-001",
+    "type": "voice",
+    "content": "周末来看我",
+    "audio_url": f"{_SUPABASE}/storage/v1/object/public/voice-messages/elder-001/abc.mp3",
+    "audio_opus_url": f"{_SUPABASE}/storage/v1/object/public/voice-messages/elder-001/abc.opus.ogg",
+    "audio_duration": 5.2,
+    "is_ai_generated": False,
+    "is_read": False,
+    "read_at": None,
+    "created_at": "2024-06-01T10:00:00+00:00",
+}
+
+
+class TestRenditionAPI:
+    @patch("api.v1.messages.postgrest")
+    def test_message_list_serves_opus_to_capable_clients(self, mock_pg):
+        mock_pg.from_.return_value.select.return_value.or_.return_value.order.return_value.range.return_value \
+            .execute.return_value = MagicMock(data=[_VOICE_ROW])
+        client = TestClient(app)
+        auth = {"Authorization": f"Bearer {create_access_token('elder-001', 'elder')}"}
+
+        opus = client.get("/api/v1/messages/family-001", headers={**auth, "X-Audio-Codecs": "opus,mp3"})
+        legacy = client.get("/api/v1/messages/family-001", headers=auth)
+
+        assert opus.json()[0]["audio_url"] == _VOICE_ROW["audio_opus_url"]
+        assert legacy.json()[0]["audio_url"] == _VOICE_ROW["audio_url"]
+        assert "audio_opus_url" not in legacy.json()[0]
+        assert opus.headers["vary"] == legacy.headers["vary"] == RENDITION_VARY
+
+    def test_send_voice_queues_rendition(self):
+        from api.v1.messages import send_voice_message
+        from models.message import VoiceMessageCreate
+
+        row = {**_VOICE_ROW, "audio_opus_url": None}
+        mock_pg = MagicMock()
+        mock_pg.from_.return_value.insert.return_value.execute.return_value = MagicMock(data=[row])
+        body = VoiceMessageCreate(sender_id="elder-001", receiver_id="family-001", type="voice",
+                                  content="周末来看我", audio_url=row["audio_url"])
+        transcoder = MagicMock()
+        uploads = []
+
+        async def fake_upload(obj, data, content_type):
+            uploads.append((obj, data, content_type))
+            return obj.url()
+
+        async def go():
+            with patch("api.v1.messages.postgrest", mock_pg), \
+                    patch("api.v1.messages.opus_transcoder", transcoder), \
+                    patch("api.v1.messages.probe_storage_url", return_value=None), \
+                    patch("api.v1.messages.storage_waveform", return_value=None), \
+                    patch("api.v1.messages.upload", fake_upload), \
+                    patch("services.supabase_storage.settings.SUPABASE_URL", _SUPABASE):
+                await send_voice_message(body, {"user_id": "elder-001"})
+                key, _fetch, store = transcoder.enqueue.call_args.args
+                await store(b"OggS")
+            return key
+
+        assert _run(go()) == "message:msg-opus"
+        assert uploads == [
+            (StorageObject("voice-messages", "elder-001/abc.opus.ogg", True), b"OggS", "audio/ogg"),
+        ]
+        mock_pg.from_.return_value.update.assert_called_once_with({"audio_opus_url": _VOICE_ROW["audio_opus_url"]})
@@ -0,0 +1,173 @@
+"""验证 TTS 音频缓存 (TTSCache)
+
+Tests:
+- content addressing of (text, speed, voice_type)
+- memory LRU tier and disk tier, size-based eviction
+- streamed write-through: partial clips are never published
+- VoiceService serves repeated phrases from the cache
+- /voice/tts sends disk-cached clips as files
+"""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.middleware import require_auth
+from main import app
+from services.tts_cache import TTSCache, tts_cache_key
+from services.voice_service import VoiceService
+
+client = TestClient(app)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _cache(tmp_path, **kwargs) -> TTSCache:
+    kwargs.setdefault("memory_max_bytes", 1024)
+    kwargs.setdefault("memory_item_max_bytes", 512)
+    kwargs.setdefault("disk_max_bytes", 4096)
+    return TTSCache(directory=tmp_path, **kwargs)
+
+
+# ===================================================================
+# Keys and tiers
+# ===================================================================
+
+
+class TestCacheKey:
+    def test_key_covers_all_parameters(self):
+        base = tts_cache_key("该吃药了", 1.0, "zh_female_cancan")
+        assert tts_cache_key("该吃药了 ", 1.0, "zh_female_cancan") == base
+        assert tts_cache_key("该吃药了", 0.8, "zh_female_cancan") != base
+        assert tts_cache_key("该吃药了", 1.0, "zh_male") != base
+
+
+class TestTiers:
+    def test_miss_then_memory_hit(self, tmp_path):
+        cache = _cache(tmp_path)
+        assert cache.lookup("你好", 1.0, "v") is None
+        cache.put("你好", 1.0, "v", b"audio")
+        assert cache.lookup("你好", 1.0, "v") == b"audio"
+        stats = cache.stats()
+        assert stats["misses"] == 1
+        assert stats["hits_memory"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_large_clip_is_disk_only(self, tmp_path):
+        cache = _cache(tmp_path)
+        cache.put("长句", 1.0, "v", b"x" * 1000)
+        found = cache.lookup("长句", 1.0, "v")
+        assert found == tmp_path / f"{tts_cache_key('长句', 1.0, 'v')}.mp3"
+        assert cache.stats()["hits_disk"] == 1
+
+    def test_memory_lru_eviction(self, tmp_path):
+        cache = _cache(tmp_path, memory_max_bytes=800)
+        cache.put("a", 1.0, "v", b"a" * 400)
+        cache.put("b", 1.0, "v", b"b" * 400)
+        cache.lookup("a", 1.0, "v")  # a becomes most recent
+        cache.put("c", 1.0, "v", b"c" * 400)
+        # b evicted from memory but still on disk
+        assert isinstance(cache.lookup("b", 1.0, "v"), Path)
+        assert cache.lookup("a", 1.0, "v") == b"a" * 400
+        assert cache.stats()["evictions_memory"] == 1
+
+    def test_disk_eviction_by_size(self, tmp_path):
+        cache = _cache(tmp_path, disk_max_bytes=2500)
+        for name in ("a", "b", "c"):
+            cache.put(name, 1.0, "v", name.encode() * 1000)
+        assert cache.lookup("a", 1.0, "v") is None
+        assert cache.lookup("c", 1.0, "v") is not None
+        stats = cache.stats()
+        assert stats["disk_items"] == 2
+        assert stats["disk_bytes"] == 2000
+        assert stats["evictions_disk"] == 1
+
+    def test_get_promotes_disk_hits(self, tmp_path):
+        cache = _cache(tmp_path)
+        cache.put("你好", 1.0, "v", b"audio")
+        # New process: memory tier empty, disk index rebuilt from files
+        fresh = _cache(tmp_path)
+        assert fresh.get("你好", 1.0, "v") == b"audio"
+        assert fresh.lookup("你好", 1.0, "v") == b"audio"
+
+    def test_discarded_writer_publishes_nothing(self, tmp_path):
+        cache = _cache(tmp_path)
+        writer = cache.writer("你好", 1.0, "v")
+        writer.write(b"partial")
+        writer.discard()
+        assert cache.lookup("你好", 1.0, "v") is None
+        assert list(tmp_path.iterdir()) == []
+
+
+# ===================================================================
+# VoiceService / endpoint integration
+# ===================================================================
+
+
+class TestVoiceServiceCache:
+    def _service(self):
+        svc = VoiceService()
+        svc.app_id = "app"
+        svc.access_token = "token"
+        return svc
+
+    def test_repeated_phrase_hits_cache(self, tmp_path):
+        svc = self._service()
+        calls = []
+
+        async def fake_synthesize(text, speed, voice_type):
+            calls.append(text)
+            yield b"ab"
+            yield b"cd"
+
+        with patch("services.voice_service.tts_cache", _cache(tmp_path)), \
+                patch.object(svc, "_synthesize", fake_synthesize):
+            first = _run(svc.text_to_speech("该吃药了"))
+            second = _run(svc.text_to_speech("该吃药了"))
+
+        assert first == second == b"abcd"
+        assert calls == ["该吃药了"]
+
+    def test_failed_synthesis_is_not_cached(self, tmp_path):
+        svc = self._service()
+        cache = _cache(tmp_path)
+
+        async def broken(text, speed, voice_type):
+            yield b"ab"
+            raise RuntimeError("语音合成服务不可用")
+
+        with patch("services.voice_service.tts_cache", cache), \
+                patch.object(svc, "_synthesize", broken):
+            with pytest.raises(RuntimeError):
+                _run(svc.text_to_speech("该吃药了"))
+
+        assert cache.lookup("该吃药了", 1.0, "zh_female_cancan") is None
+
+
+class TestTTSEndpointCache:
+    @pytest.fixture(autouse=True)
+    def _auth(self):
+        app.dependency_overrides[require_auth] = lambda: {"user_id": "u1", "role": "elder"}
+        yield
+        app.dependency_overrides.pop(require_auth, None)
+
+    def test_disk_hit_served_as_file(self, tmp_path):
+        cache = _cache(tmp_path, memory_item_max_bytes=0)
+        cache.put("早上好", 1.0, "zh_female_cancan", b"\xff\xfb" + b"\x00" * 600)
+
+        with patch("services.voice_service.tts_cache", cache), \
+                patch("api.v1.ai_voice.voice_service.app_id", "app"), \
+                patch("api.v1.ai_voice.voice_service.access_token", "token"):
+            resp = client.post("/api/v1/voice/tts", json={"text": "早上好"})
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "audio/mpeg"
+        assert resp.headers["content-length"] == "602"
+        assert resp.content[:2] == b"\xff\xfb"
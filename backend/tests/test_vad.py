@@ -0,0 +1,129 @@
+"""验证语音活动检测 (StreamingVAD) 与静音裁剪
+
+Tests:
+- per-frame classification of tone, silence and quiet noise
+- leading/trailing silence trimmed with padding kept
+- long internal pauses compacted
+- speech_end endpoint ends a streaming ASR session before END
+- transcribe_stream trims PCM before the ASR backend
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+
+from services.asr_pipeline import ASRMetrics, PlaceholderRecognizer, StreamingASRPipeline
+from services.vad import (
+    SPEECH_END,
+    SPEECH_START,
+    StreamingVAD,
+    frame_activity,
+    trim_silence,
+)
+
+RATE = 16000
+BYTES_PER_MS = RATE * 2 // 1000
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _tone(ms: int, amplitude: float = 8000) -> bytes:
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (amplitude * np.sin(2 * np.pi * 300 * t)).astype("<i2").tobytes()
+
+
+def _silence(ms: int) -> bytes:
+    return b"\x00" * (ms * BYTES_PER_MS)
+
+
+_OPTIONS = {"padding_ms": 100, "max_pause_ms": 400, "endpoint_ms": 1000}
+
+
+def _vad() -> StreamingVAD:
+    return StreamingVAD(RATE, **_OPTIONS)
+
+
+class TestFrameActivity:
+    def test_tone_and_silence(self):
+        active = frame_activity(_silence(100) + _tone(100) + _silence(100))
+        assert active.tolist() == [False] * 5 + [True] * 5 + [False] * 5
+
+    def test_quiet_noise_is_silence(self):
+        noise = np.random.default_rng(0).normal(0, 5, RATE // 10).astype("<i2").tobytes()
+        assert not frame_activity(noise).any()
+
+    def test_partial_frame_ignored(self):
+        assert len(frame_activity(_tone(30))) == 1
+
+
+class TestTrim:
+    def test_leading_and_trailing_silence(self):
+        speech = _tone(500)
+        trimmed = trim_silence(_silence(2000) + speech + _silence(3000), **_OPTIONS)
+        # 100 ms padding on each side
+        assert len(trimmed) == len(speech) + 2 * 100 * BYTES_PER_MS
+        assert trimmed[100 * BYTES_PER_MS:-100 * BYTES_PER_MS] == speech
+
+    def test_long_pause_compacted(self):
+        audio = _tone(300) + _silence(800) + _tone(300)
+        trimmed = trim_silence(audio, **_OPTIONS)
+        assert len(trimmed) == (300 + 400 + 300) * BYTES_PER_MS
+
+    def test_short_pause_kept(self):
+        audio = _tone(300) + _silence(200) + _tone(300)
+        assert trim_silence(audio, **_OPTIONS) == audio
+
+    def test_all_silence(self):
+        assert trim_silence(_silence(1000), **_OPTIONS) == b""
+
+
+class TestStreamingEvents:
+    def test_events_across_chunks(self):
+        vad = _vad()
+        audio = _silence(500) + _tone(400) + _silence(1500)
+        events = []
+        out = b""
+        # Odd chunk size: frames straddle chunk boundaries
+        for i in range(0, len(audio), 1234):
+            piece, evs = vad.process(audio[i:i + 1234])
+            out += piece
+            events += evs
+        assert events == [SPEECH_START, SPEECH_END]
+        assert len(out) == (100 + 400 + 100) * BYTES_PER_MS
+        assert vad.finish() == (b"", [])
+
+    def test_endpoint_finalizes_session(self):
+        metrics = ASRMetrics()
+        pulled = []
+
+        async def client():
+            # Speech, then silence the client never ends with END
+            for piece in (_tone(400), *[_silence(200)] * 50):
+                pulled.append(piece)
+                yield piece
+
+        pipeline = StreamingASRPipeline(PlaceholderRecognizer(), metrics=metrics, vad=_vad())
+
+        async def collect():
+            return [r async for r in pipeline.results(client())]
+
+        results = _run(collect())
+        assert results[-1]["is_final"] is True
+        assert metrics.endpoints == 1
+        assert len(pulled) < 20
+        assert metrics.stats()["stages"]["end_to_final"]["count"] == 1
+
+
+class TestTranscribeTrimming:
+    def test_pcm_trimmed_before_asr(self, caplog):
+        from services.voice_service import VoiceService
+
+        svc = VoiceService()
+        audio = _silence(3000) + _tone(500) + _silence(3000)
+        with caplog.at_level("INFO", logger="services.voice_service"):
+            assert _run(svc.transcribe_file(audio, audio_format="pcm"))
+        assert "ASR VAD kept 0.9s of 6.5s" in caplog.text
@@ -11,8 +11,11 @@ Requirements: 5.6, 5.7, 19.4
 
 import asyncio
 import io
+import json
+import struct
 from unittest.mock import AsyncMock, patch
 
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 
@@ -40,6 +43,18 @@ def _bypass_auth():
     app.dependency_overrides.pop(require_auth, None)
 
 
+def _tts_stream(*chunks, error=None):
+    """Return a mock for open_text_to_speech streaming *chunks*."""
+
+    async def _gen():
+        for chunk in chunks:
+            yield chunk
+        if error is not None:
+            raise error
+
+    return AsyncMock(side_effect=lambda *_args, **_kwargs: _gen())
+
+
 # ===================================================================
 # POST /api/v1/voice/tts
 # ===================================================================
@@ -51,9 +66,8 @@ class TestTTS:
     def test_tts_success(self):
         """Valid TTS request returns audio/mpeg content."""
         with patch(
-            "api.v1.ai_voice.voice_service.text_to_speech",
-            new_callable=AsyncMock,
-            return_value=b"\xff\xfb\x90\x00" + b"\x00" * 100,
+            "api.v1.ai_voice.voice_service.open_text_to_speech",
+            _tts_stream(b"\xff\xfb\x90\x00" + b"\x00" * 100),
         ):
             resp = client.post(
                 "/api/v1/voice/tts",
@@ -66,9 +80,8 @@ class TestTTS:
     def test_tts_default_speed(self):
         """Speed defaults to 1.0 when omitted."""
         with patch(
-            "api.v1.ai_voice.voice_service.text_to_speech",
-            new_callable=AsyncMock,
-            return_value=b"\xff\xfb\x90\x00",
+            "api.v1.ai_voice.voice_service.open_text_to_speech",
+            _tts_stream(b"\xff\xfb\x90\x00"),
         ) as mock_tts:
             resp = client.post(
                 "/api/v1/voice/tts",
@@ -80,9 +93,8 @@ class TestTTS:
     def test_tts_custom_speed(self):
         """Custom speed value is forwarded to the service."""
         with patch(
-            "api.v1.ai_voice.voice_service.text_to_speech",
-            new_callable=AsyncMock,
-            return_value=b"\xff\xfb\x90\x00",
+            "api.v1.ai_voice.voice_service.open_text_to_speech",
+            _tts_stream(b"\xff\xfb\x90\x00"),
         ) as mock_tts:
             resp = client.post(
                 "/api/v1/voice/tts",
@@ -110,9 +122,8 @@ class TestTTS:
     def test_tts_service_error_returns_500(self):
         """Internal service error returns 500."""
         with patch(
-            "api.v1.ai_voice.voice_service.text_to_speech",
-            new_callable=AsyncMock,
-            side_effect=RuntimeError("boom"),
+            "api.v1.ai_voice.voice_service.open_text_to_speech",
+            _tts_stream(error=RuntimeError("boom")),
         ):
             resp = client.post(
                 "/api/v1/voice/tts",
@@ -121,6 +132,25 @@ class TestTTS:
         assert resp.status_code == 500
         assert "不可用" in resp.json()["detail"]
 
+    def test_tts_streams_chunks_in_order(self):
+        """Chunks are passed through as they are synthesised."""
+        with patch(
+            "api.v1.ai_voice.voice_service.open_text_to_speech",
+            _tts_stream(b"one-", b"two-", b"three"),
+        ):
+            resp = client.post("/api/v1/voice/tts", json={"text": "分段"})
+        assert resp.status_code == 200
+        assert resp.content == b"one-two-three"
+
+    def test_tts_validation_error_returns_400(self):
+        """ValueError raised by the service maps to 400."""
+        with patch(
+            "api.v1.ai_voice.voice_service.open_text_to_speech",
+            _tts_stream(error=ValueError("text must not be empty")),
+        ):
+            resp = client.post("/api/v1/voice/tts", json={"text": "x"})
+        assert resp.status_code == 400
+
 
 # ===================================================================
 # POST /api/v1/voice/transcribe
@@ -133,7 +163,7 @@ class TestTranscribe:
     def test_transcribe_success(self):
         """Valid audio upload returns transcribed text."""
         with patch(
-            "api.v1.ai_voice.voice_service.transcribe_file",
+            "api.v1.ai_voice.voice_service.transcribe_stream",
             new_callable=AsyncMock,
             return_value="你好世界",
         ):
@@ -147,20 +177,24 @@ class TestTranscribe:
         assert data["text"] == "你好世界"
 
     def test_transcribe_wav_format(self):
-        """WAV files are accepted."""
+        """WAV files are accepted and decoded to PCM."""
         with patch(
-            "api.v1.ai_voice.voice_service.transcribe_file",
+            "api.v1.ai_voice.voice_service.transcribe_stream",
             new_callable=AsyncMock,
             return_value="测试结果",
         ) as mock_asr:
-            audio_content = b"\x00" * 512
+            audio_content = (
+                b"RIFF" + struct.pack("<I", 36 + 512) + b"WAVE"
+                + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, 16000, 32000, 2, 16)
+                + b"data" + struct.pack("<I", 512) + b"\x00" * 512
+            )
             resp = client.post(
                 "/api/v1/voice/transcribe",
                 files={"file": ("recording.wav", io.BytesIO(audio_content), "audio/wav")},
             )
         assert resp.status_code == 200
         mock_asr.assert_called_once()
-        assert mock_asr.call_args.kwargs["audio_format"] == "wav"
+        assert mock_asr.call_args.kwargs["audio_format"] == "pcm"
 
     def test_transcribe_empty_file_rejected(self):
         """Empty audio file returns 400."""
@@ -183,7 +217,7 @@ class TestTranscribe:
     def test_transcribe_service_error_returns_500(self):
         """Internal service error returns 500."""
         with patch(
-            "api.v1.ai_voice.voice_service.transcribe_file",
+            "api.v1.ai_voice.voice_service.transcribe_stream",
             new_callable=AsyncMock,
             side_effect=RuntimeError("service down"),
         ):
@@ -320,9 +354,12 @@ class TestVoiceService:
         svc = VoiceService()
 
         async def _run_stream():
+            # 440 Hz tone: silence would be trimmed by the VAD
+            tone = (8000 * np.sin(2 * np.pi * 440 * np.arange(320) / 16000)).astype("<i2").tobytes()
+
             async def _chunks():
-                yield b"\x00" * 320
-                yield b"\x00" * 320
+                yield tone
+                yield tone
 
             results = []
             async for r in svc.stream_asr(_chunks()):
@@ -339,3 +376,110 @@ class TestVoiceService:
             assert "text" in r
             assert "is_final" in r
             assert "sequence" in r
+
+
+# ===================================================================
+# Volcano TTS WebSocket protocol
+# ===================================================================
+
+
+def _audio_frame(payload: bytes, sequence: int) -> bytes:
+    flags = 0b0011 if sequence < 0 else 0b0001
+    header = bytes([0x11, (0b1011 << 4) | flags, 0x10, 0x00])
+    return header + struct.pack(">iI", sequence, len(payload)) + payload
+
+
+def _error_frame(code: int, message: str) -> bytes:
+    body = message.encode("utf-8")
+    return bytes([0x11, 0xF0, 0x10, 0x00]) + struct.pack(">II", code, len(body)) + body
+
+
+class _FakeTTSSocket:
+    def __init__(self, frames):
+        self.frames = frames
+        self.sent = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for frame in self.frames:
+            yield frame
+
+
+class TestTTSProtocol:
+    """VoiceService.stream_text_to_speech against a fake TTS socket."""
+
+    @pytest.fixture(autouse=True)
+    def _fresh_cache(self, tmp_path):
+        from services.tts_cache import TTSCache
+
+        with patch("services.voice_service.tts_cache", TTSCache(directory=tmp_path)):
+            yield
+
+    def _service(self):
+        from services.voice_service import VoiceService
+
+        svc = VoiceService()
+        svc.app_id = "app"
+        svc.access_token = "token"
+        return svc
+
+    def _collect(self, svc, frames):
+        sock = _FakeTTSSocket(frames)
+
+        async def run():
+            return [c async for c in svc.stream_text_to_speech("你好", speed=1.2)]
+
+        with patch("services.voice_service.websockets.connect", return_value=sock):
+            return _run(run()), sock
+
+    def test_yields_chunks_until_last_frame(self):
+        frames = [
+            _audio_frame(b"aaa", 1),
+            _audio_frame(b"bbb", 2),
+            _audio_frame(b"ccc", -3),
+            _audio_frame(b"never", 4),
+        ]
+        chunks, sock = self._collect(self._service(), frames)
+        assert chunks == [b"aaa", b"bbb", b"ccc"]
+
+        request = sock.sent[0]
+        assert request[:4] == bytes([0x11, 0x10, 0x10, 0x00])
+        (size,) = struct.unpack(">I", request[4:8])
+        payload = json.loads(request[8:8 + size])
+        assert payload["request"]["text"] == "你好"
+        assert payload["audio"]["speed_ratio"] == 1.2
+        assert payload["audio"]["encoding"] == "mp3"
+
+    def test_error_frame_raises(self):
+        with pytest.raises(RuntimeError, match="3001"):
+            self._collect(self._service(), [_error_frame(3001, "invalid text")])
+
+    def test_text_to_speech_joins_stream(self):
+        svc = self._service()
+        sock = _FakeTTSSocket([_audio_frame(b"ab", 1), _audio_frame(b"cd", -2)])
+        with patch("services.voice_service.websockets.connect", return_value=sock):
+            assert _run(svc.text_to_speech("你好")) == b"abcd"
+
+    def test_unconfigured_yields_placeholder(self):
+        from services.voice_service import VoiceService
+
+        svc = VoiceService()
+        svc.app_id = ""
+
+        async def run():
+            return [c async for c in svc.stream_text_to_speech("你好")]
+
+        chunks = _run(run())
+        assert len(chunks) == 1
+        assert chunks[0][:2] == b"\xff\xfb"
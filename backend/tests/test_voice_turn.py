@@ -0,0 +1,322 @@
+"""验证全双工语音轮次 (VoiceTurnSession) 与 LLM 流式输出
+
+Tests:
+- split_sentences(): sentence and long-clause chunking
+- DoubaoService.chat_stream(): Ark SSE deltas, usage, cancellation
+- one spoken turn: ASR partials -> intent -> LLM tokens -> per-sentence TTS
+- actionable intent cancels the LLM stream
+- barge-in cancels the in-flight LLM and TTS, keeping the interrupted turn
+- WebSocket /ai/voice-session carries a spoken turn end to end
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import numpy as np
+from fastapi.testclient import TestClient
+
+from main import app
+from services.conversation_memory import conversation_memory
+from services.doubao_service import DoubaoService
+from services.llm_usage import LLMUsageRecorder
+from services.voice_turn import VoiceTurnMetrics, VoiceTurnSession, split_sentences
+from tools.mock_ark import MockArkConfig, create_app
+
+client = TestClient(app)
+
+RATE = 16000
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _tone(ms: int) -> bytes:
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (8000 * np.sin(2 * np.pi * 300 * t)).astype("<i2").tobytes()
+
+
+def _silence(ms: int) -> bytes:
+    return b"\x00" * (RATE * 2 * ms // 1000)
+
+
+async def _fake_asr(audio_chunks, **_kwargs):
+    size = 0
+    async for chunk in audio_chunks:
+        size += len(chunk)
+        yield {"text": "今天", "is_final": False, "sequence": 1}
+    yield {"text": "今天天气怎么样", "is_final": True, "sequence": 2}
+
+
+def _chat_stream(tokens, delay=0.0, closed=None):
+    async def stream(messages, user_id=None, summary=None, **_kwargs):
+        try:
+            for token in tokens:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield token
+        finally:
+            if closed is not None:
+                closed.append(True)
+
+    return stream
+
+
+async def _fake_tts(text, speed=1.0, voice_type="zh_female_cancan"):
+    yield f"mp3:{text}".encode()
+
+
+_GENERAL = {"intent": "general_chat", "entities": {}, "confidence": 0.9}
+
+
+class _Client:
+    """Collects what the session sends to the client."""
+
+    def __init__(self):
+        self.messages: list = []
+        self.turn_end = asyncio.Event()
+
+    async def send_json(self, message):
+        self.messages.append(message)
+        if message["type"] == "turn_end":
+            self.turn_end.set()
+
+    async def send_bytes(self, data):
+        self.messages.append(data)
+
+    def types(self):
+        return [m["type"] if isinstance(m, dict) else "audio" for m in self.messages]
+
+
+def _patches(tokens=("好的，", "今天晴。", "适合散步！"), intent=_GENERAL, delay=0.0, closed=None):
+    return (
+        patch("services.voice_turn.voice_service.stream_asr", side_effect=_fake_asr),
+        patch("services.voice_turn.voice_service.stream_text_to_speech", side_effect=_fake_tts),
+        patch("services.voice_turn.doubao_service.recognize_intent", AsyncMock(return_value=intent)),
+        patch("services.voice_turn.doubao_service.chat_stream", side_effect=_chat_stream(tokens, delay, closed)),
+    )
+
+
+# ===================================================================
+# Sentence chunking
+# ===================================================================
+
+
+class TestSplitSentences:
+    def test_sentence_ends(self):
+        assert split_sentences("好的。今天晴！明") == (["好的。", "今天晴！"], "明")
+
+    def test_long_clause_split_at_comma(self):
+        long = "天" * 30 + "，还有"
+        assert split_sentences(long) == (["天" * 30 + "，"], "还有")
+
+    def test_short_clause_kept(self):
+        assert split_sentences("好的，") == ([], "好的，")
+
+
+# ===================================================================
+# chat_stream
+# ===================================================================
+
+
+class TestChatStream:
+    def _service(self):
+        svc = DoubaoService()
+        svc.api_key = "key"
+        svc.model_endpoint = "ep"
+        svc.base_url = "http://mock-ark"
+        return svc
+
+    def _mock_client(self):
+        mock_app = create_app(MockArkConfig(latency="fixed:0", tokens_per_second=0, seed=1))
+        real_client = httpx.AsyncClient
+
+        def factory(**kwargs):
+            return real_client(transport=httpx.ASGITransport(app=mock_app), **kwargs)
+
+        return patch("services.doubao_service.httpx.AsyncClient", side_effect=factory)
+
+    def test_streams_deltas_and_records_usage(self):
+        rec = LLMUsageRecorder()
+        svc = self._service()
+
+        async def collect():
+            return [d async for d in svc.chat_stream([{"role": "user", "content": "你好"}], "u1", feature="voice")]
+
+        with self._mock_client(), patch("services.doubao_service.llm_usage", rec):
+            deltas = _run(collect())
+
+        assert len(deltas) > 1
+        assert "你好" in "".join(deltas)
+        stats = rec.snapshot()["by_feature"]["voice"]
+        assert stats["calls"] == 1
+        assert stats["estimated_calls"] == 0
+        assert stats["completion_tokens"] > 0
+
+    def test_closing_early_records_cancelled(self):
+        rec = LLMUsageRecorder()
+        svc = self._service()
+
+        async def first_only():
+            stream = svc.chat_stream([{"role": "user", "content": "你好"}], "u1", feature="voice")
+            first = await stream.__anext__()
+            await stream.aclose()
+            return first
+
+        with self._mock_client(), patch("services.doubao_service.llm_usage", rec):
+            assert _run(first_only())
+
+        assert rec.snapshot()["by_feature"]["voice"]["outcomes"] == {"cancelled": 1}
+
+    def test_placeholder_when_unconfigured(self):
+        svc = DoubaoService()
+        svc.api_key = ""
+
+        async def collect():
+            return [d async for d in svc.chat_stream([{"role": "user", "content": "你好"}])]
+
+        assert "".join(_run(collect()))
+
+
+# ===================================================================
+# VoiceTurnSession
+# ===================================================================
+
+
+async def _speak(session, ms=400):
+    for piece in (_tone(ms), _silence(2000)):
+        for i in range(0, len(piece), 3200):
+            await session.feed_audio(piece[i:i + 3200])
+
+
+class TestVoiceTurnSession:
+    def test_spoken_turn(self):
+        completed = []
+
+        async def go():
+            fake = _Client()
+            metrics = VoiceTurnMetrics()
+            session = VoiceTurnSession(
+                fake.send_json, fake.send_bytes, session_id="vt-1", user_id="u1",
+                on_turn_complete=lambda text, reply: completed.append((text, reply)),
+                metrics=metrics,
+            )
+            await _speak(session)
+            await asyncio.wait_for(fake.turn_end.wait(), 2)
+            await session.close()
+            return fake, metrics
+
+        p1, p2, p3, p4 = _patches()
+        with p1, p2, p3, p4:
+            fake, metrics = _run(go())
+
+        types = fake.types()
+        assert types[0] == "speech_start"
+        assert types.index("asr") < types.index("intent") < types.index("llm_token")
+        assert types[-1] == "turn_end"
+        # Sentence-chunked TTS: "好的，" is too short to split on its own
+        spoken = [m["text"] for m in fake.messages if isinstance(m, dict) and m["type"] == "tts_start"]
+        assert spoken == ["好的，今天晴。", "适合散步！"]
+        assert [m for m in fake.messages if isinstance(m, bytes)] == [
+            "mp3:好的，今天晴。".encode(), "mp3:适合散步！".encode(),
+        ]
+        end = fake.messages[-1]
+        assert end["reply"] == "好的，今天晴。适合散步！"
+        assert set(end["latency_ms"]) == {"intent", "llm_first_token", "tts_first_audio", "turn_total"}
+        assert completed == [("今天天气怎么样", "好的，今天晴。适合散步！")]
+        assert metrics.turns == 1
+        assert metrics.stats()["stages"]["asr_final"]["count"] == 1
+
+    def test_actionable_intent_skips_reply(self):
+        intent = {"intent": "make_call", "entities": {"target_relation": "女儿"}, "confidence": 0.9}
+
+        async def go():
+            fake = _Client()
+            metrics = VoiceTurnMetrics()
+            session = VoiceTurnSession(
+                fake.send_json, fake.send_bytes, session_id="vt-2", metrics=metrics,
+            )
+            await _speak(session)
+            await asyncio.wait_for(fake.turn_end.wait(), 2)
+            return fake, metrics
+
+        p1, p2, p3, p4 = _patches(intent=intent, delay=0.05)
+        with p1, p2, p3, p4:
+            fake, metrics = _run(go())
+
+        assert "tts_start" not in fake.types()
+        assert "llm_token" not in fake.types()
+        assert fake.messages[-1]["reply"] is None
+        assert metrics.actions == 1
+
+    def test_barge_in_cancels_reply(self):
+        closed = []
+        completed = []
+
+        async def go():
+            fake = _Client()
+            metrics = VoiceTurnMetrics()
+            session = VoiceTurnSession(
+                fake.send_json, fake.send_bytes, session_id="vt-3",
+                on_turn_complete=lambda text, reply: completed.append((text, reply)),
+                metrics=metrics,
+            )
+            await _speak(session)
+            # Wait until the reply is being spoken, then talk over it
+            for _ in range(200):
+                if "audio" in fake.types():
+                    break
+                await asyncio.sleep(0.01)
+            await session.feed_audio(_tone(200))
+            await asyncio.sleep(0.05)
+            await session.close()
+            return fake, metrics
+
+        tokens = ["第一句。"] + ["很长的回复。"] * 50
+        p1, p2, p3, p4 = _patches(tokens=tokens, delay=0.02, closed=closed)
+        with p1, p2, p3, p4:
+            fake, metrics = _run(go())
+
+        types = fake.types()
+        assert "barge_in" in types
+        assert types.index("audio") < types.index("barge_in")
+        assert "turn_end" not in types
+        assert closed == [True]
+        assert metrics.barge_ins == 1
+        # The interrupted turn is still saved, with the part of the reply already spoken
+        [(text, reply)] = completed
+        assert text == "今天天气怎么样"
+        assert reply.startswith("第一句。") and len(reply) < len("".join(tokens))
+        assert [turn["role"] for turn in conversation_memory.history((None, "vt-3"))] == ["user", "assistant"]
+
+
+# ===================================================================
+# WebSocket /ai/voice-session (audio)
+# ===================================================================
+
+
+class TestVoiceSessionAudio:
+    @patch("api.v1.ai_chat.postgrest")
+    def test_spoken_turn_over_websocket(self, mock_pg):
+        p1, p2, p3, p4 = _patches()
+        with p1, p2, p3, p4, client.websocket_connect("/api/v1/ai/voice-session") as ws:
+            ws.send_bytes(_tone(400))
+            ws.send_json({"type": "audio_end"})
+            received = []
+            while True:
+                message = ws.receive()
+                if message.get("bytes") is not None:
+                    received.append(message["bytes"])
+                    continue
+                data = json.loads(message["text"])
+                if data["type"] == "turn_end":
+                    break
+            ws.send_json({"type": "end"})
+            assert ws.receive_json()["type"] == "session_end"
+
+        assert data["reply"] == "好的，今天晴。适合散步！"
+        assert received == ["mp3:好的，今天晴。".encode(), "mp3:适合散步！".encode()]
@@ -0,0 +1,112 @@
+"""验证语音消息波形峰值 (waveform)
+
+Tests:
+- per-bucket peaks scaled to 0..127, independent of block boundaries
+- short audio yields fewer buckets; silence yields zeros
+- WAV decoded and reduced to peaks
+- Storage audio streamed into the decoder; other hosts and bad audio -> None
+"""
+
+from __future__ import annotations
+
+import asyncio
+import struct
+from unittest.mock import patch
+
+import httpx
+import numpy as np
+
+from services.waveform import PeakAccumulator, compute_peaks, storage_waveform
+
+RATE = 16000
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _tone(seconds: float, amplitude: float) -> np.ndarray:
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 250 * t)).astype(np.float32)
+
+
+def _wav(samples: np.ndarray) -> bytes:
+    data = (samples * 32767).astype("<i2").tobytes()
+    return (
+        b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, RATE, RATE * 2, 2, 16)
+        + b"data" + struct.pack("<I", len(data)) + data
+    )
+
+
+async def _pieces(data: bytes, size: int = 5000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class TestPeakAccumulator:
+    def test_buckets_scaled_to_loudest(self):
+        acc = PeakAccumulator()
+        acc.add(np.concatenate([_tone(1.0, 0.5), _tone(1.0, 0.25)]))
+        assert acc.peaks(4) == [127, 127, 64, 64]
+
+    def test_block_boundaries_do_not_matter(self):
+        audio = np.concatenate([_tone(0.7, 0.2), _tone(0.5, 0.9), _tone(0.3, 0.05)])
+        whole = PeakAccumulator()
+        whole.add(audio)
+        split = PeakAccumulator()
+        for i in range(0, len(audio), 333):
+            split.add(audio[i:i + 333])
+        assert split.peaks(64) == whole.peaks(64)
+        assert len(whole.peaks(64)) == 64
+
+    def test_short_audio_and_silence(self):
+        acc = PeakAccumulator()
+        acc.add(_tone(0.05, 0.5))  # five 10 ms windows
+        assert len(acc.peaks(128)) == 5
+        silent = PeakAccumulator()
+        silent.add(np.zeros(RATE, dtype=np.float32))
+        assert silent.peaks(8) == [0] * 8
+        assert PeakAccumulator().peaks(8) == []
+
+
+class TestComputePeaks:
+    def test_wav(self):
+        audio = np.concatenate([np.zeros(RATE, dtype=np.float32), _tone(1.0, 0.6)])
+        peaks = _run(compute_peaks(_pieces(_wav(audio)), "wav", buckets=10))
+        assert peaks[:5] == [0] * 5
+        assert min(peaks[5:]) >= 120
+
+
+def _storage(data: bytes, requests: list):
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(200, content=data)
+
+    real_client = httpx.AsyncClient
+    return patch(
+        "services.waveform.httpx.AsyncClient",
+        side_effect=lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw),
+    )
+
+
+class TestStorageWaveform:
+    _URL = "https://proj.supabase.co/storage/v1/object/public/voice/a.wav"
+
+    def test_streamed_from_storage(self):
+        requests: list = []
+        with _storage(_wav(_tone(2.0, 0.3)), requests), \
+                patch("services.supabase_storage.settings.SUPABASE_URL", "https://proj.supabase.co"):
+            peaks = _run(storage_waveform(self._URL))
+            assert _run(storage_waveform("https://elsewhere.example/a.wav")) is None
+        assert requests == [self._URL]
+        assert len(peaks) == 128
+        assert all(p >= 120 for p in peaks)
+
+    def test_undecodable_returns_none(self):
+        requests: list = []
+        mp3 = self._URL.replace(".wav", ".mp3")
+        with _storage(b"\xff\xfb\x90\x00" + b"\x00" * 413, requests), \
+                patch("services.supabase_storage.settings.SUPABASE_URL", "https://proj.supabase.co"), \
+                patch("services.audio_normalize.settings.AUDIO_FFMPEG_PATH", ""):
+            assert _run(storage_waveform(mp3)) is None
@@ -0,0 +1,341 @@
+"""Mock Volcano Engine Ark (OpenAI-compatible) server for latency and load testing.
+
+Serves ``POST /chat/completions`` (and ``/api/v3/chat/completions``) with
+realistic timing so chat, intent, summary and broadcast flows can be
+exercised offline:
+
+- time-to-first-token drawn from a configurable latency distribution
+- completion streamed (``"stream": true``, SSE) or returned at a token rate
+- error injection (HTTP status codes and hung requests)
+- canned replies per flow: intent JSON, summaries, broadcast scripts, chat
+- an OpenAI-style ``usage`` block on every response
+
+Usage::
+
+    cd backend
+    python -m tools.mock_ark --port 8900 --latency lognormal:0.6:0.4 --tokens-per-second 40
+
+    # point the backend at it (.env)
+    VOLCANO_ARK_BASE_URL=http://127.0.0.1:8900
+    VOLCANO_ARK_API_KEY=mock
+    VOLCANO_ARK_MODEL_ENDPOINT=mock-doubao
+
+Latency specs: ``fixed:S``, ``uniform:LO:HI``, ``normal:MEAN:STD`` and
+``lognormal:MEDIAN:SIGMA`` (seconds).  Every CLI option can also be set via
+the matching ``MOCK_ARK_*`` environment variable.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from typing import AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.tokens import estimate_tokens
+
+# ---------------------------------------------------------------------------
+# Latency distributions
+# ---------------------------------------------------------------------------
+
+
+class LatencyDistribution:
+    """Samples delays (seconds) from a spec such as ``lognormal:0.6:0.4``."""
+
+    _KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, spec: str, rng: random.Random | None = None) -> None:
+        kind, *raw = spec.split(":")
+        if kind not in self._KINDS or len(raw) != self._KINDS[kind]:
+            raise ValueError(f"invalid latency spec: {spec!r}")
+        self.kind = kind
+        self.params = [float(p) for p in raw]
+        self.spec = spec
+        self._rng = rng or random.Random()
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = self._rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = self._rng.gauss(p[0], p[1])
+        else:
+            value = self._rng.lognormvariate(math.log(p[0]) if p[0] > 0 else 0.0, p[1])
+        return max(0.0, value)
+
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+
+class MockArkConfig:
+    """Runtime behaviour of the mock server."""
+
+    def __init__(
+        self,
+        latency: str = "lognormal:0.6:0.4",
+        tokens_per_second: float = 40.0,
+        error_rate: float = 0.0,
+        error_statuses: tuple[int, ...] = (429, 500, 503),
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 60.0,
+        seed: int | None = None,
+    ) -> None:
+        self.rng = random.Random(seed)
+        self.latency = LatencyDistribution(latency, self.rng)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+
+    @classmethod
+    def from_env(cls) -> "MockArkConfig":
+        env = os.environ
+        seed = env.get("MOCK_ARK_SEED")
+        return cls(
+            latency=env.get("MOCK_ARK_LATENCY", "lognormal:0.6:0.4"),
+            tokens_per_second=float(env.get("MOCK_ARK_TOKENS_PER_SECOND", "40")),
+            error_rate=float(env.get("MOCK_ARK_ERROR_RATE", "0")),
+            error_statuses=tuple(
+                int(s) for s in env.get("MOCK_ARK_ERROR_STATUSES", "429,500,503").split(",") if s
+            ),
+            timeout_rate=float(env.get("MOCK_ARK_TIMEOUT_RATE", "0")),
+            timeout_seconds=float(env.get("MOCK_ARK_TIMEOUT_SECONDS", "60")),
+            seed=int(seed) if seed else None,
+        )
+
+
+# ---------------------------------------------------------------------------
+# Canned replies
+# ---------------------------------------------------------------------------
+
+# (keywords, intent, entities) — first match wins
+_INTENT_RULES: list[tuple[tuple[str, ...], str, dict]] = [
+    (("救命", "摔倒", "摔了", "喘不上气", "胸口疼", "急救"), "emergency", {}),
+    (("血压", "血糖", "心率", "体温"), "health_record", {"record_type": "blood_pressure"}),
+    (("吃过药", "吃了药", "药吃了", "已经吃"), "medication_confirm", {}),
+    (("什么药", "吃药", "用药"), "query_medication", {"time_range": "今天"}),
+    (("打电话", "给女儿打", "给儿子打"), "make_call", {"target_relation": "女儿"}),
+    (("告诉", "留言", "捎话"), "send_message", {"target_relation": "女儿"}),
+    (("健康怎么样", "最近身体"), "query_health", {"time_range": "最近"}),
+]
+
+
+def _last_user_text(messages: list[dict]) -> str:
+    for msg in reversed(messages):
+        if msg.get("role") == "user":
+            return str(msg.get("content") or "")
+    return ""
+
+
+def _system_text(messages: list[dict]) -> str:
+    return "\n".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+
+
+def canned_intent(text: str) -> dict:
+    """Return a plausible intent result for *text* using keyword rules."""
+    for keywords, intent, entities in _INTENT_RULES:
+        if any(k in text for k in keywords):
+            return {"intent": intent, "entities": dict(entities), "confidence": 0.92}
+    return {"intent": "general_chat", "entities": {"topic": text[:20]}, "confidence": 0.6}
+
+
+def canned_reply(messages: list[dict]) -> tuple[str, str]:
+    """Return ``(flow, reply_text)`` for a chat/completions request."""
+    system = _system_text(messages)
+    user_text = _last_user_text(messages)
+
+    if "意图识别引擎" in system:
+        return "intent", json.dumps(canned_intent(user_text), ensure_ascii=False)
+    if "对话分析师" in system:
+        return "summary", "老人今天精神不错，关心自己的血压和用药情况，也很想念家人。整体情绪平稳积极。"
+    if "健康广播" in user_text:
+        return "broadcast", (
+            "标题：秋季养生小贴士\n"
+            "内容：秋天天气转凉，早晚温差大，老年朋友要注意添衣保暖。"
+            "饮食上多吃梨、百合、银耳等润燥食物，少吃辛辣。"
+            "每天适当散步，保持心情舒畅，按时服药，定期测量血压。"
+        )
+    return "chat", (
+        f"您好，我听到您说“{user_text[:30]}”。"
+        "小护一直在这里陪着您，有什么需要随时告诉我。记得按时吃药、多喝温水哦。"
+    )
+
+
+def _split_tokens(text: str) -> list[str]:
+    """Split *text* into pseudo-tokens: one CJK char or a short latin run."""
+    tokens: list[str] = []
+    buf = ""
+    for ch in text:
+        if ord(ch) < 0x80 and not ch.isspace():
+            buf += ch
+            if len(buf) >= 4:
+                tokens.append(buf)
+                buf = ""
+            continue
+        if buf:
+            tokens.append(buf)
+            buf = ""
+        tokens.append(ch)
+    if buf:
+        tokens.append(buf)
+    return tokens
+
+
+def _usage(messages: list[dict], completion: str) -> dict[str, int]:
+    prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) + 4 for m in messages)
+    completion_tokens = estimate_tokens(completion)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+# ---------------------------------------------------------------------------
+# App factory
+# ---------------------------------------------------------------------------
+
+
+def create_app(config: MockArkConfig | None = None) -> FastAPI:
+    """Build the mock Ark FastAPI app."""
+    cfg = config or MockArkConfig.from_env()
+    app = FastAPI(title="Mock Ark", version="0.1.0")
+    app.state.config = cfg
+    app.state.stats = {"requests": 0, "errors": 0, "timeouts": 0, "streams": 0}
+
+    async def chat_completions(request: Request):
+        stats = app.state.stats
+        stats["requests"] += 1
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "mock-doubao")
+        max_tokens = int(body.get("max_tokens") or 1024)
+
+        # Error / timeout injection
+        roll = cfg.rng.random()
+        if roll < cfg.timeout_rate:
+            stats["timeouts"] += 1
+            await asyncio.sleep(cfg.timeout_seconds)
+        elif roll < cfg.timeout_rate + cfg.error_rate:
+            stats["errors"] += 1
+            status = cfg.rng.choice(cfg.error_statuses)
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"code": str(status), "message": "mock ark injected error"}},
+            )
+
+        flow, reply = canned_reply(messages)
+        tokens = _split_tokens(reply)[:max_tokens]
+        reply = "".join(tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        per_token = 1.0 / cfg.tokens_per_second if cfg.tokens_per_second > 0 else 0.0
+
+        await asyncio.sleep(cfg.latency.sample())
+
+        if body.get("stream"):
+            stats["streams"] += 1
+
+            async def _events() -> AsyncIterator[bytes]:
+                for i, token in enumerate(tokens):
+                    if i:
+                        await asyncio.sleep(per_token)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+                final = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": _usage(messages, reply),
+                }
+                yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n".encode()
+                yield b"data: [DONE]\n\n"
+
+            return StreamingResponse(_events(), media_type="text/event-stream")
+
+        await asyncio.sleep(per_token * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(messages, reply),
+            "mock_flow": flow,
+        }
+
+    async def mock_stats():
+        return {**app.state.stats, "latency": cfg.latency.spec}
+
+    for path in ("/chat/completions", "/api/v3/chat/completions"):
+        app.add_api_route(path, chat_completions, methods=["POST"])
+    app.add_api_route("/mock/stats", mock_stats, methods=["GET"])
+    return app
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> None:
+    defaults = MockArkConfig.from_env()
+    parser = argparse.ArgumentParser(description="Mock Volcano Engine Ark server")
+    parser.add_argument("--host", default=os.environ.get("MOCK_ARK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MOCK_ARK_PORT", "8900")))
+    parser.add_argument("--latency", default=defaults.latency.spec, help="time-to-first-token spec")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument(
+        "--error-statuses",
+        default=",".join(str(s) for s in defaults.error_statuses),
+        help="comma-separated HTTP statuses to inject",
+    )
+    parser.add_argument("--timeout-rate", type=float, default=defaults.timeout_rate)
+    parser.add_argument("--timeout-seconds", type=float, default=defaults.timeout_seconds)
+    seed = os.environ.get("MOCK_ARK_SEED")
+    parser.add_argument("--seed", type=int, default=int(seed) if seed else None)
+    args = parser.parse_args(argv)
+
+    config = MockArkConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_statuses=tuple(int(s) for s in args.error_statuses.split(",") if s),
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        seed=args.seed,
+    )
+
+    import uvicorn
+
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()